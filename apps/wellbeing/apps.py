@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WellbeingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.wellbeing'
+
+    def ready(self):
+        # Registra los renderizadores de PDF en segundo plano (observador)
+        from .services import pdf_renderers  # noqa: F401
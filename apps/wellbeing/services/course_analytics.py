@@ -0,0 +1,192 @@
+# apps/wellbeing/services/course_analytics.py
+import logging
+
+from django.db.models import Avg, Q
+
+from apps.academics.models import Curso, Matricula, Nota, Periodo
+from tasks.services.academic_summary import NOTA_MINIMA_APROBATORIA
+
+logger = logging.getLogger(__name__)
+
+MATERIA_CONVIVENCIA = "Convivencia"
+MATERIA_COMPORTAMIENTO = "Comportamiento"
+TOP_RANKING = 10
+
+
+class AnaliticaCursosService:
+    """
+    📈 ANALÍTICA INSTITUCIONAL POR CURSOS (BIENESTAR)
+
+    Calcula el radar de riesgo, los promedios académicos/convivencia por curso,
+    la matriz de convivencia estudiante × periodo y el ranking por curso con
+    unos pocos agregados agrupados (`values(...).annotate(...)`) y pivotes en
+    memoria, en lugar de consultas por matrícula, estudiante y periodo.
+    """
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+
+    def _definitivas(self):
+        return Nota.objects.filter(numero_nota=5, tenant=self.tenant)
+
+    def calcular(self):
+        tenant = self.tenant
+
+        matriculas = list(
+            Matricula.objects.filter(activo=True, tenant=tenant)
+            .select_related('estudiante', 'curso').order_by('id')
+        )
+        cursos = list(Curso.objects.filter(activo=True, tenant=tenant).order_by('grado', 'seccion'))
+        ids_cursos = {c.id for c in cursos}
+        ids_cursos_matriculas = {m.curso_id for m in matriculas}
+
+        # Periodo no pertenece a un curso en este modelo: son los periodos activos del colegio
+        periodos = list(Periodo.objects.filter(activo=True, tenant=tenant).order_by('id'))
+
+        radar, total_perdidas = self._radar_riesgo(matriculas, ids_cursos_matriculas)
+
+        # -----------------------------------------------------------
+        # AGREGADOS AGRUPADOS POR CURSO Y POR ESTUDIANTE
+        # -----------------------------------------------------------
+        academicas = self._definitivas().filter(
+            materia__curso_id__in=ids_cursos
+        ).exclude(materia__nombre__icontains=MATERIA_CONVIVENCIA)
+        convivencia = self._definitivas().filter(
+            materia__curso_id__in=ids_cursos, materia__nombre__icontains=MATERIA_CONVIVENCIA
+        )
+
+        prom_acad_por_curso = {
+            fila['materia__curso_id']: fila['avg']
+            for fila in academicas.values('materia__curso_id').annotate(avg=Avg('valor'))
+        }
+        prom_conv_por_curso = {
+            fila['materia__curso_id']: fila['avg']
+            for fila in convivencia.values('materia__curso_id').annotate(avg=Avg('valor'))
+        }
+        prom_por_estudiante = {
+            (fila['estudiante_id'], fila['materia__curso_id']): fila['p']
+            for fila in academicas.values('estudiante_id', 'materia__curso_id').annotate(p=Avg('valor'))
+        }
+
+        # Convivencia por estudiante × periodo (la primera nota, como `.first()`)
+        conv_por_estudiante_periodo = {}
+        for fila in convivencia.filter(periodo__in=periodos).order_by('id').values(
+            'estudiante_id', 'materia__curso_id', 'periodo_id', 'valor'
+        ):
+            llave = (fila['estudiante_id'], fila['materia__curso_id'], fila['periodo_id'])
+            conv_por_estudiante_periodo.setdefault(llave, fila['valor'])
+
+        matriculas_por_curso = {}
+        for m in matriculas:
+            matriculas_por_curso.setdefault(m.curso_id, []).append(m)
+
+        # -----------------------------------------------------------
+        # ENSAMBLAJE POR CURSO
+        # -----------------------------------------------------------
+        suma_promedios_acad = 0.0
+        suma_promedios_conv = 0.0
+        cursos_con_datos_acad = 0
+        cursos_con_datos_conv = 0
+        chart_labels = []
+        chart_data_acad = []
+        chart_data_conv = []
+        vista_cursos = []
+
+        for curso in cursos:
+            mats_curso = matriculas_por_curso.get(curso.id, [])
+            num_alumnos = len(mats_curso)
+
+            val_acad = prom_acad_por_curso.get(curso.id)
+            prom_acad_curso = float(val_acad) if val_acad is not None else 0.0
+            val_conv = prom_conv_por_curso.get(curso.id)
+            prom_conv_curso = float(val_conv) if val_conv is not None else 0.0
+
+            if num_alumnos > 0:
+                chart_labels.append(f"{curso.nombre}")
+                chart_data_acad.append(round(prom_acad_curso, 2))
+                chart_data_conv.append(round(prom_conv_curso, 2) if prom_conv_curso > 0 else 0)
+
+                if prom_acad_curso > 0:
+                    suma_promedios_acad += prom_acad_curso
+                    cursos_con_datos_acad += 1
+                if prom_conv_curso > 0:
+                    suma_promedios_conv += prom_conv_curso
+                    cursos_con_datos_conv += 1
+
+            lista_estudiantes_curso = []
+            ranking_academico_curso = []
+            for m in mats_curso:
+                estudiante = m.estudiante
+                notas_conv_periodo = {
+                    p.id: conv_por_estudiante_periodo.get((estudiante.id, curso.id, p.id), "-")
+                    for p in periodos
+                }
+                lista_estudiantes_curso.append({
+                    'obj': estudiante,
+                    'notas': notas_conv_periodo
+                })
+
+                p_ind = prom_por_estudiante.get((estudiante.id, curso.id))
+                ranking_academico_curso.append({
+                    'nombre': estudiante.get_full_name() or estudiante.username,
+                    'promedio': round(float(p_ind or 0), 2)
+                })
+
+            ranking_academico_curso.sort(key=lambda x: x['promedio'], reverse=True)
+
+            if lista_estudiantes_curso:
+                vista_cursos.append({
+                    'curso': curso,
+                    'estudiantes': lista_estudiantes_curso,
+                    'stats': {
+                        'acad': round(prom_acad_curso, 2),
+                        'conv': round(prom_conv_curso, 2),
+                        'alumnos': num_alumnos
+                    },
+                    'top_10_academico': ranking_academico_curso[:TOP_RANKING]
+                })
+
+        return {
+            'top_riesgo_academico': radar,
+            'total_materias_perdidas': total_perdidas,
+            'vista_cursos': vista_cursos,
+            'periodos': periodos,
+            'total_alumnos': len(matriculas),
+            'total_cursos': len(cursos),
+            'prom_global_acad': round(suma_promedios_acad / cursos_con_datos_acad, 2) if cursos_con_datos_acad > 0 else 0,
+            'prom_global_conv': round(suma_promedios_conv / cursos_con_datos_conv, 2) if cursos_con_datos_conv > 0 else 0,
+            'chart_labels': chart_labels,
+            'chart_data_acad': chart_data_acad,
+            'chart_data_conv': chart_data_conv,
+        }
+
+    def _radar_riesgo(self, matriculas, ids_cursos):
+        """Materias perdidas (definitiva < 3.0) por matrícula activa, sin convivencia/comportamiento."""
+        reprobadas_por_estudiante = {}
+        for fila in self._definitivas().filter(
+            valor__lt=NOTA_MINIMA_APROBATORIA, materia__curso_id__in=ids_cursos
+        ).exclude(
+            Q(materia__nombre__icontains=MATERIA_CONVIVENCIA) |
+            Q(materia__nombre__icontains=MATERIA_COMPORTAMIENTO)
+        ).order_by('id').values_list('estudiante_id', 'materia__curso_id', 'materia__nombre', 'valor'):
+            est_id, curso_id, materia, valor = fila
+            reprobadas_por_estudiante.setdefault((est_id, curso_id), []).append((materia, valor))
+
+        radar = []
+        total_perdidas = 0
+        for mat in matriculas:
+            reprobadas = reprobadas_por_estudiante.get((mat.estudiante_id, mat.curso_id))
+            if not reprobadas:
+                continue
+            total_perdidas += len(reprobadas)
+            prom_reprobacion = sum(valor for _, valor in reprobadas) / len(reprobadas)
+            radar.append({
+                'estudiante': mat.estudiante,
+                'curso': mat.curso,
+                'materias_perdidas': len(reprobadas),
+                'materias_nombres': [materia for materia, _ in reprobadas],
+                'promedio_riesgo': round(float(prom_reprobacion), 2)
+            })
+
+        radar.sort(key=lambda x: (-x['materias_perdidas'], x['promedio_riesgo']))
+        return radar, total_perdidas
@@ -0,0 +1,200 @@
+# apps/wellbeing/services/expediente_batch.py
+import io
+import logging
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import as_completed
+from datetime import date
+
+from django.db.models import Avg, Count, Prefetch
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from apps.academics.models import Matricula, Nota
+from tasks.models import Acudiente
+from tasks.services.boletin_batch import MAX_AVISOS_PROGRESO
+from tasks.services.pdf_jobs import PDFJobService
+
+from ..models import Asistencia, Institucion, Observacion, Seguimiento
+
+logger = logging.getLogger(__name__)
+
+DOC_OBSERVADOR = 'observador'
+DOC_EXPEDIENTE = 'expediente'
+DOC_ACTA = 'acta'
+DOCUMENTOS_LOTE = (DOC_OBSERVADOR, DOC_EXPEDIENTE, DOC_ACTA)
+
+PLANTILLAS = {
+    DOC_OBSERVADOR: 'wellbeing/pdf/observador_template.html',
+    DOC_EXPEDIENTE: 'wellbeing/pdf/reporte_integral_template.html',
+    DOC_ACTA: 'wellbeing/pdf/acta_institucional_weasy.html',
+}
+# Observaciones que se adjuntan al acta consolidada (igual que la vista individual)
+MAX_OBS_ACTA = 10
+
+
+class ExpedientesCursoService:
+    """
+    🗂️ EXPORTACIÓN MASIVA DE OBSERVADORES Y EXPEDIENTES (POR CURSO)
+
+    Mismo contenido que `generar_observador_pdf`, `generar_reporte_integral_bienestar`
+    y `generar_acta_historial_integral`, pero para todo el curso:
+    1. Observaciones, seguimientos, promedios y fallas del curso en consultas
+       fijas (no por estudiante) y agrupados en memoria.
+    2. Cada HTML se arma en este hilo y el `write_pdf` va al pool de procesos.
+    3. Entrega un ZIP con una carpeta por estudiante.
+
+    Debe ejecutarse con el tenant del curso fijado (`set_current_tenant`).
+    """
+
+    def __init__(self, curso, tenant, documentos=DOCUMENTOS_LOTE, generado_por=None,
+                 base_url=None, al_progresar=None):
+        self.curso = curso
+        self.tenant = tenant
+        self.documentos = [d for d in documentos if d in PLANTILLAS] or list(DOCUMENTOS_LOTE)
+        self.generado_por = generado_por
+        self.base_url = base_url
+        self.al_progresar = al_progresar
+
+    def _cargar(self):
+        tenant = self.tenant
+        matriculas = list(
+            Matricula.objects.filter(curso=self.curso, activo=True, tenant=tenant)
+            .select_related('estudiante__perfil')
+            .prefetch_related(Prefetch(
+                'estudiante__acudientes_asignados',
+                queryset=Acudiente.objects.select_related('acudiente').order_by('id')
+            ))
+            .order_by('estudiante__last_name', 'estudiante__first_name')
+        )
+        ids = [m.estudiante_id for m in matriculas]
+
+        observaciones = defaultdict(list)
+        for obs in Observacion.objects.filter(estudiante_id__in=ids, tenant=tenant).select_related(
+            'autor__perfil', 'periodo'
+        ).order_by('periodo__id', 'fecha_creacion'):
+            observaciones[obs.estudiante_id].append(obs)
+
+        seguimientos = defaultdict(list)
+        for seg in Seguimiento.objects.filter(estudiante_id__in=ids, tenant=tenant).select_related(
+            'profesional'
+        ).order_by('-fecha'):
+            seguimientos[seg.estudiante_id].append(seg)
+
+        promedios = dict(
+            Nota.objects.filter(estudiante_id__in=ids, tenant=tenant)
+            .values('estudiante_id').annotate(p=Avg('valor')).values_list('estudiante_id', 'p')
+        )
+        fallas = dict(
+            Asistencia.objects.filter(estudiante_id__in=ids, estado='FALLA', tenant=tenant)
+            .values('estudiante_id').annotate(n=Count('id')).values_list('estudiante_id', 'n')
+        )
+        return matriculas, observaciones, seguimientos, promedios, fallas
+
+    def _contextos(self, estudiante, observaciones, seguimientos, promedio, fallas, institucion):
+        """{tipo_documento: contexto} de un estudiante (mismos contextos que las vistas)."""
+        contextos = {}
+        if DOC_OBSERVADOR in self.documentos:
+            contextos[DOC_OBSERVADOR] = {
+                'estudiante': estudiante, 'observaciones': observaciones,
+                'institucion': institucion, 'curso': self.curso,
+                'fecha_impresion': date.today()
+            }
+
+        recientes = sorted(observaciones, key=lambda o: o.fecha_creacion, reverse=True)
+        if DOC_EXPEDIENTE in self.documentos:
+            resumen = {
+                'total_obs': len(recientes),
+                'total_seg': len(seguimientos),
+                'obs_convivencia': sum(1 for o in recientes if o.tipo == 'CONVIVENCIA'),
+                'promedio_actual': round(promedio or 0.0, 2),
+                'total_fallas': fallas
+            }
+            contextos[DOC_EXPEDIENTE] = {
+                'estudiante': estudiante, 'curso': self.curso,
+                'institucion': institucion, 'observaciones': recientes, 'seguimientos': seguimientos,
+                'resumen': resumen,
+                'concepto_ia': f"El estudiante registra {resumen['total_obs']} observaciones y {resumen['total_seg']} seguimientos.",
+                'fecha_impresion': timezone.now(),
+                'generado_por': self.generado_por.get_full_name() if self.generado_por else ''
+            }
+
+        if DOC_ACTA in self.documentos:
+            acta_virtual = {
+                'consecutivo': 'AUTO-GEN', 'fecha': timezone.now(), 'hora_fin': timezone.now(),
+                'titulo': f"CONSOLIDADO INTEGRAL: {estudiante.get_full_name().upper()}",
+                'get_tipo_display': 'SEGUIMIENTO DISCIPLINARIO', 'tipo': 'SITUACION_ESPECIAL',
+                'creador': self.generado_por, 'implicado': estudiante,
+                'participantes': [self.generado_por] if self.generado_por else [],
+                'orden_dia': "1. Revisión antecedentes.\n2. Análisis.\n3. Expediente.",
+                'contenido': f"Documento oficial del estudiante ID {estudiante.username}.",
+                'compromisos': "Documento informativo.", 'asistentes_externos': "N/A"
+            }
+            contextos[DOC_ACTA] = {
+                'acta': acta_virtual, 'institucion': institucion,
+                'observaciones_adjuntas': recientes[:MAX_OBS_ACTA]
+            }
+        return contextos
+
+    def generar(self):
+        """
+        Retorna [(ruta_en_zip, pdf_bytes)] en orden alfabético de estudiantes.
+        Un documento que falla se registra y se omite; no detiene el lote.
+        """
+        inicio = time.perf_counter()
+        matriculas, observaciones, seguimientos, promedios, fallas = self._cargar()
+        institucion = Institucion.objects.filter(tenant=self.tenant).first()
+        # Para las métricas: la carga por lote se reparte entre los documentos
+        tiempo_contexto = (time.perf_counter() - inicio) / max(1, len(matriculas) * len(self.documentos))
+
+        orden = []
+        pendientes = {}
+        for matricula in matriculas:
+            estudiante = matricula.estudiante
+            contextos = self._contextos(
+                estudiante,
+                observaciones.get(estudiante.id, []),
+                seguimientos.get(estudiante.id, []),
+                promedios.get(estudiante.id),
+                fallas.get(estudiante.id, 0),
+                institucion,
+            )
+            carpeta = f"{estudiante.last_name or ''}_{estudiante.username}".strip('_').replace(' ', '_')
+            for tipo, context in contextos.items():
+                ruta = f"{carpeta}/{tipo}_{estudiante.username}.pdf"
+                try:
+                    inicio = time.perf_counter()
+                    html_string = render_to_string(PLANTILLAS[tipo], context)
+                except Exception as e:
+                    logger.error(f"❌ {tipo} de {estudiante.username}: {e}")
+                    continue
+                orden.append(ruta)
+                futuro = PDFJobService.enviar(
+                    html_string, self.base_url, plantilla=PLANTILLAS[tipo],
+                    tiempo_contexto=tiempo_contexto, tiempo_plantilla=time.perf_counter() - inicio
+                )
+                pendientes[futuro] = ruta
+
+        total = len(pendientes)
+        paso = max(1, total // MAX_AVISOS_PROGRESO)
+        resultados = {}
+        for hechos, futuro in enumerate(as_completed(pendientes), start=1):
+            ruta = pendientes[futuro]
+            try:
+                resultados[ruta] = futuro.result()
+            except Exception as e:
+                logger.error(f"❌ PDF {ruta}: {e}")
+            if self.al_progresar and (hechos == total or hechos % paso == 0):
+                self.al_progresar(hechos, total)
+
+        return [(ruta, resultados[ruta]) for ruta in orden if ruta in resultados]
+
+    @staticmethod
+    def empaquetar_zip(documentos):
+        """ZIP (sin recomprimir los PDF) con una carpeta por estudiante."""
+        salida = io.BytesIO()
+        with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as zf:
+            for ruta, pdf_bytes in documentos:
+                zf.writestr(ruta, pdf_bytes)
+        return salida.getvalue()
@@ -0,0 +1,74 @@
+# apps/wellbeing/services/pdf_renderers.py
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.template.loader import render_to_string
+
+from apps.academics.models import Curso, Matricula
+from apps.tenancy.models import Tenant
+from apps.tenancy.utils import reset_current_tenant, set_current_tenant
+from tasks.services.pdf_jobs import PDFJobService, registrar_renderizador
+
+from ..models import Institucion, Observacion
+from .expediente_batch import DOCUMENTOS_LOTE, ExpedientesCursoService
+
+User = get_user_model()
+
+
+@registrar_renderizador('OBSERVADOR')
+def renderizar_observador(trabajo):
+    """
+    Observador del estudiante (mismo contenido que `generar_observador_pdf`).
+    El hilo del pool no hereda el colegio de la petición: se fija aquí con
+    el tenant guardado en los parámetros del trabajo.
+    """
+    tenant = Tenant.objects.get(id=trabajo.parametros['tenant_id'])
+    token = set_current_tenant(tenant)
+    try:
+        estudiante = User.objects.get(id=trabajo.parametros['estudiante_id'])
+        matricula = Matricula.objects.filter(estudiante=estudiante, activo=True, tenant=tenant).select_related('curso').first()
+        observaciones = Observacion.objects.filter(
+            estudiante=estudiante, tenant=tenant
+        ).select_related('autor__perfil', 'periodo').order_by('periodo__id', 'fecha_creacion')
+        institucion = Institucion.objects.filter(tenant=tenant).first()
+
+        html_string = render_to_string('wellbeing/pdf/observador_template.html', {
+            'estudiante': estudiante, 'observaciones': observaciones,
+            'institucion': institucion, 'curso': matricula.curso if matricula else None,
+            'fecha_impresion': date.today()
+        })
+    finally:
+        reset_current_tenant(token)
+
+    pdf_bytes = PDFJobService.renderizar(
+        html_string, trabajo.parametros.get('base_url'), plantilla='wellbeing/pdf/observador_template.html'
+    )
+    return pdf_bytes, f"observador_{estudiante.username}.pdf"
+
+
+@registrar_renderizador('EXPEDIENTES_CURSO')
+def renderizar_expedientes_curso(trabajo):
+    """
+    Observadores / expedientes / actas consolidadas de todo un curso en un ZIP.
+    Parámetros: `curso_id`, `tenant_id`, `documentos` (subconjunto de
+    DOCUMENTOS_LOTE) y `base_url`.
+    """
+    parametros = trabajo.parametros
+    tenant = Tenant.objects.get(id=parametros['tenant_id'])
+    token = set_current_tenant(tenant)
+    try:
+        curso = Curso.objects.get(id=parametros['curso_id'], tenant=tenant)
+        documentos = ExpedientesCursoService(
+            curso, tenant,
+            documentos=parametros.get('documentos') or DOCUMENTOS_LOTE,
+            generado_por=trabajo.solicitado_por,
+            base_url=parametros.get('base_url'),
+            al_progresar=lambda hechos, total: PDFJobService.reportar_progreso(trabajo, hechos, total)
+        ).generar()
+    finally:
+        reset_current_tenant(token)
+
+    if not documentos:
+        raise ValueError("El curso no tiene estudiantes activos con documentos para exportar.")
+    nombre_curso = (curso.nombre or str(curso.id)).replace(' ', '_')
+    return ExpedientesCursoService.empaquetar_zip(documentos), f"expedientes_{nombre_curso}.zip"
@@ -11,7 +11,6 @@ from django.db import transaction
 from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_protect
-from django.template.loader import render_to_string
 from django.conf import settings
 from django.core.paginator import Paginator
 from django.contrib.auth import get_user_model
@@ -25,6 +24,8 @@ from apps.tenancy.utils import get_current_tenant
 from tasks.decorators import role_required
 # Importamos el Perfil si aún vive en tasks, o lo cambiamos a social
 from tasks.models import Perfil 
+from tasks.services.pdf_jobs import PDFJobService
+from tasks.views_pdf import pagina_espera_trabajo
 
 # ---------------------------------------------------------
 # 📦 2. MODELOS ACADÉMICOS (De su nueva app)
@@ -39,6 +40,9 @@ from .models import (
     ActaInstitucional, ObservadorArchivado, Institucion
 )
 
+# Servicios
+from .services.course_analytics import AnaliticaCursosService
+
 # Formularios (Temporales hasta crear forms.py oficial)
 from django import forms
 class ObservacionForm(forms.ModelForm):
@@ -114,147 +118,8 @@ def dashboard_bienestar(request):
             (Q(username__icontains=query) | Q(first_name__icontains=query) | Q(last_name__icontains=query))
         ).select_related('perfil').distinct()[:25]
 
-    # 2. RADAR DE RIESGO ACADÉMICO
-    matriculas_activas = Matricula.objects.filter(activo=True, tenant=tenant).select_related('estudiante', 'curso')
-    riesgo_academico_total = []
-    total_materias_perdidas_institucional = 0
-
-    for mat in matriculas_activas:
-        est = mat.estudiante
-        notas_reprobadas = Nota.objects.filter(
-            estudiante=est,
-            numero_nota=5,    # Nota definitiva
-            valor__lt=3.0,    # Reprobado
-            materia__curso=mat.curso,
-            tenant=tenant
-        ).exclude(
-            Q(materia__nombre__icontains="Convivencia") | 
-            Q(materia__nombre__icontains="Comportamiento")
-        ).select_related('materia')
-
-        conteo_perdidas = notas_reprobadas.count()
-        
-        if conteo_perdidas > 0:
-            total_materias_perdidas_institucional += conteo_perdidas
-            materias_nombres = [n.materia.nombre for n in notas_reprobadas]
-            prom_reprobacion = notas_reprobadas.aggregate(avg=Avg('valor'))['avg'] or 0
-
-            riesgo_academico_total.append({
-                'estudiante': est,
-                'curso': mat.curso,
-                'materias_perdidas': conteo_perdidas,
-                'materias_nombres': materias_nombres,
-                'promedio_riesgo': round(float(prom_reprobacion), 2)
-            })
-
-    riesgo_academico_total.sort(key=lambda x: (-x['materias_perdidas'], x['promedio_riesgo']))
-
-    # 3. ANALÍTICA DE GESTIÓN POR CURSOS
-    cursos_activos = Curso.objects.filter(activo=True, tenant=tenant).order_by('grado', 'seccion')
-    periodos_header = []
-    if cursos_activos.exists():
-        periodos_header = Periodo.objects.filter(curso=cursos_activos.first(), activo=True, tenant=tenant).order_by('id')
-
-    total_estudiantes_colegio = matriculas_activas.count()
-    suma_promedios_acad = 0.0
-    suma_promedios_conv = 0.0
-    cursos_con_datos_acad = 0
-    cursos_con_datos_conv = 0
-
-    chart_labels = []      
-    chart_data_acad = []   
-    chart_data_conv = []   
-    vista_cursos = []
-    
-    for curso in cursos_activos:
-        mats_curso = matriculas_activas.filter(curso=curso)
-        num_alumnos = mats_curso.count()
-
-        val_acad = Nota.objects.filter(
-            materia__curso=curso,
-            numero_nota=5,
-            tenant=tenant 
-        ).exclude(materia__nombre__icontains="Convivencia").aggregate(avg=Avg('valor'))['avg']
-        
-        prom_acad_curso = float(val_acad) if val_acad is not None else 0.0
-
-        val_conv = Nota.objects.filter(
-            materia__curso=curso,
-            materia__nombre__icontains="Convivencia",
-            numero_nota=5,
-            tenant=tenant
-        ).aggregate(avg=Avg('valor'))['avg']
-
-        prom_conv_curso = float(val_conv) if val_conv is not None else 0.0
-
-        if num_alumnos > 0:
-            chart_labels.append(f"{curso.nombre}")
-            chart_data_acad.append(round(prom_acad_curso, 2))
-            chart_data_conv.append(round(prom_conv_curso, 2) if prom_conv_curso > 0 else 0)
-            
-            if prom_acad_curso > 0:
-                suma_promedios_acad += prom_acad_curso
-                cursos_con_datos_acad += 1
-            if prom_conv_curso > 0:
-                suma_promedios_conv += prom_conv_curso
-                cursos_con_datos_conv += 1
-
-        periodos_del_curso = list(Periodo.objects.filter(curso=curso, activo=True, tenant=tenant).order_by('id'))
-        lista_estudiantes_curso = []
-        ranking_academico_curso = []
-        
-        for m in mats_curso:
-            estudiante = m.estudiante
-            notas_conv_periodo = {}
-            for p in periodos_del_curso:
-                nota_real_obj = Nota.objects.filter(
-                    estudiante=estudiante, 
-                    periodo=p, 
-                    materia__curso=curso,
-                    materia__nombre__icontains="Convivencia",
-                    numero_nota=5,
-                    tenant=tenant
-                ).first()
-                
-                if nota_real_obj:
-                    notas_conv_periodo[p.id] = nota_real_obj.valor
-                else:
-                    notas_conv_periodo[p.id] = "-"
-            
-            lista_estudiantes_curso.append({
-                'obj': estudiante,
-                'notas': notas_conv_periodo
-            })
-
-            p_ind = Nota.objects.filter(
-                estudiante=estudiante, 
-                materia__curso=curso,
-                numero_nota=5,
-                tenant=tenant
-            ).exclude(materia__nombre__icontains="Convivencia").aggregate(p=Avg('valor'))['p']
-            
-            ranking_academico_curso.append({
-                'nombre': estudiante.get_full_name() or estudiante.username,
-                'promedio': round(float(p_ind or 0), 2)
-            })
-
-        ranking_academico_curso.sort(key=lambda x: x['promedio'], reverse=True)
-
-        if lista_estudiantes_curso:
-            vista_cursos.append({
-                'curso': curso,
-                'estudiantes': lista_estudiantes_curso,
-                'stats': {
-                    'acad': round(prom_acad_curso, 2), 
-                    'conv': round(prom_conv_curso, 2), 
-                    'alumnos': num_alumnos
-                },
-                'top_10_academico': ranking_academico_curso[:10]
-            })
-
-    # 4. KPIs GLOBALES
-    prom_global_acad = round(suma_promedios_acad / cursos_con_datos_acad, 2) if cursos_con_datos_acad > 0 else 0
-    prom_global_conv = round(suma_promedios_conv / cursos_con_datos_conv, 2) if cursos_con_datos_conv > 0 else 0
+    # 2-4. RADAR DE RIESGO, ANALÍTICA POR CURSOS Y KPIs (agregados agrupados)
+    analitica = AnaliticaCursosService(tenant).calcular()
 
     stats_asistencia = {
         'asistio': Asistencia.objects.filter(estado='ASISTIO', tenant=tenant).count(),
@@ -306,22 +171,22 @@ def dashboard_bienestar(request):
     context = {
         'estudiantes': estudiantes_busqueda, 
         'query': query,
-        'vista_cursos': vista_cursos,
-        'periodos': periodos_header,
+        'vista_cursos': analitica['vista_cursos'],
+        'periodos': analitica['periodos'],
         'institucion': institucion,
-        'top_riesgo_academico': riesgo_academico_total, 
+        'top_riesgo_academico': analitica['top_riesgo_academico'],
         'kpi': {
             **kpi_obs,
-            'total_alumnos': total_estudiantes_colegio,
-            'prom_global_acad': prom_global_acad,
-            'prom_global_conv': prom_global_conv,
-            'total_cursos': cursos_activos.count(),
-            'total_materias_perdidas': total_materias_perdidas_institucional 
+            'total_alumnos': analitica['total_alumnos'],
+            'prom_global_acad': analitica['prom_global_acad'],
+            'prom_global_conv': analitica['prom_global_conv'],
+            'total_cursos': analitica['total_cursos'],
+            'total_materias_perdidas': analitica['total_materias_perdidas']
         },
         'chart_data': {
-            'labels': json.dumps(chart_labels),
-            'acad': json.dumps(chart_data_acad),
-            'conv': json.dumps(chart_data_conv)
+            'labels': json.dumps(analitica['chart_labels']),
+            'acad': json.dumps(analitica['chart_data_acad']),
+            'conv': json.dumps(analitica['chart_data_conv'])
         },
         'stats_asistencia': json.dumps(list(stats_asistencia.values())),
         'top_fallas': top_fallas,
@@ -584,28 +449,22 @@ def generar_observador_pdf(request, estudiante_id):
     es_staff = request.user.perfil.rol in STAFF_ROLES
     es_acudiente = request.user.perfil.rol == 'ACUDIENTE'
     estudiante = get_object_or_404(User, id=estudiante_id)
-    matricula = Matricula.objects.filter(estudiante=estudiante, activo=True, tenant=tenant).first()
 
     if es_acudiente:
         pass
     elif not es_staff:
         return redirect('home')
 
-    observaciones = Observacion.objects.filter(estudiante=estudiante, tenant=tenant).select_related('autor__perfil', 'periodo').order_by('periodo__id', 'fecha_creacion')
-    institucion = Institucion.objects.filter(tenant=tenant).first()
-
     if HTML is None: return HttpResponse("Error: WeasyPrint no instalado.", status=500)
+    if tenant is None: return HttpResponse("No hay una institución activa.", status=400)
 
-    html_string = render_to_string('wellbeing/pdf/observador_template.html', {
-        'estudiante': estudiante, 'observaciones': observaciones,
-        'institucion': institucion, 'curso': matricula.curso if matricula else None,
-        'fecha_impresion': date.today()
-    })
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="observador_{estudiante.username}.pdf"'
-    HTML(string=html_string, base_url=request.build_absolute_uri('/')).write_pdf(response)
-    return response
+    # Mismo documento que `renderizar_observador`: se encola y la página de espera lo abre al terminar
+    trabajo = PDFJobService.encolar(
+        'OBSERVADOR',
+        {'estudiante_id': estudiante.id, 'tenant_id': tenant.id, 'base_url': request.build_absolute_uri('/')},
+        usuario=request.user
+    )
+    return pagina_espera_trabajo(request, trabajo, f"Observador de {estudiante.get_full_name() or estudiante.username}")
 
 @login_required
 def generar_seguimiento_pdf(request, seguimiento_id):
@@ -616,8 +475,7 @@ def generar_seguimiento_pdf(request, seguimiento_id):
         'seguimiento': seguimiento, 'estudiante': seguimiento.estudiante,
         'profesional': seguimiento.profesional, 'institucion': institucion, 'request': request,
     }
-    html_string = render_to_string('wellbeing/pdf/seguimiento_pdf.html', context)
-    pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri('/')).write_pdf()
+    pdf_file = PDFJobService.renderizar_plantilla('wellbeing/pdf/seguimiento_pdf.html', context, request.build_absolute_uri('/'))
     response = HttpResponse(pdf_file, content_type='application/pdf')
     response['Content-Disposition'] = f'inline; filename="Seguimiento_{seguimiento.estudiante.username}.pdf"'
     return response
@@ -627,10 +485,12 @@ def generar_acta_pdf(request, acta_id):
     tenant = get_current_tenant()
     acta = get_object_or_404(ActaInstitucional, id=acta_id, tenant=tenant)
     institucion = Institucion.objects.filter(tenant=tenant).first()
-    html_string = render_to_string('wellbeing/pdf/acta_institucional_weasy.html', {'acta': acta, 'institucion': institucion, 'request': request})
-    response = HttpResponse(content_type='application/pdf')
+    pdf_file = PDFJobService.renderizar_plantilla(
+        'wellbeing/pdf/acta_institucional_weasy.html', {'acta': acta, 'institucion': institucion, 'request': request},
+        request.build_absolute_uri()
+    )
+    response = HttpResponse(pdf_file, content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="Acta_{acta.consecutivo}.pdf"'
-    HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf(response)
     return response
 
 @role_required(['ADMINISTRADOR', 'COORD_CONVIVENCIA', 'PSICOLOGO', 'COORD_ACADEMICO', 'DIRECTOR_CURSO'])
@@ -661,9 +521,8 @@ def generar_reporte_integral_bienestar(request, estudiante_id):
         'generado_por': request.user.get_full_name(), 'request': request
     }
     
-    html_string = render_to_string('wellbeing/pdf/reporte_integral_template.html', context)
     if HTML is None: return HttpResponse("Error: WeasyPrint no instalado.", status=500)
-    pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri('/')).write_pdf()
+    pdf_file = PDFJobService.renderizar_plantilla('wellbeing/pdf/reporte_integral_template.html', context, request.build_absolute_uri('/'))
     response = HttpResponse(pdf_file, content_type='application/pdf')
     response['Content-Disposition'] = f'inline; filename="Expediente_{estudiante.username}.pdf"'
     return response
@@ -686,9 +545,8 @@ def generar_acta_historial_integral(request, estudiante_id):
     }
 
     context = {'acta': acta_virtual, 'institucion': institucion, 'observaciones_adjuntas': observaciones}
-    html_string = render_to_string('wellbeing/pdf/acta_institucional_weasy.html', context)
     if HTML is None: return HttpResponse("Error: WeasyPrint no instalado.", status=500)
-    pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri('/')).write_pdf()
+    pdf_file = PDFJobService.renderizar_plantilla('wellbeing/pdf/acta_institucional_weasy.html', context, request.build_absolute_uri('/'))
     response = HttpResponse(pdf_file, content_type='application/pdf')
     response['Content-Disposition'] = f'inline; filename="Acta_Oficial_{estudiante.username}.pdf"'
     return response
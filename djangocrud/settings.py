@@ -205,6 +205,44 @@ DEFAULT_TEMP_PASSWORD = '123456'
 # 🛡️ CIRUGÍA REALIZADA: Clave protegida con default para build
 DEEPSEEK_API_KEY = config('DEEPSEEK_API_KEY', default='dummy-ai-key')
 AI_MODEL_NAME = "deepseek-chat"
+DEEPSEEK_API_URL = config('DEEPSEEK_API_URL', default='https://api.deepseek.com/chat/completions')
+# Conectar debe ser rápido; leer cubre la generación de reportes largos
+DEEPSEEK_TIMEOUT_CONEXION = config('DEEPSEEK_TIMEOUT_CONEXION', default=5, cast=float)
+DEEPSEEK_TIMEOUT_LECTURA = config('DEEPSEEK_TIMEOUT_LECTURA', default=120, cast=float)
+# Reintentos (429/5xx/errores de conexión) con backoff y jitter
+DEEPSEEK_MAX_REINTENTOS = config('DEEPSEEK_MAX_REINTENTOS', default=2, cast=int)
+DEEPSEEK_POOL_CONEXIONES = config('DEEPSEEK_POOL_CONEXIONES', default=10, cast=int)
+# Circuit breaker: fallos seguidos para abrir y segundos antes de volver a probar
+DEEPSEEK_CIRCUITO_UMBRAL = config('DEEPSEEK_CIRCUITO_UMBRAL', default=5, cast=int)
+DEEPSEEK_CIRCUITO_ENFRIAMIENTO = config('DEEPSEEK_CIRCUITO_ENFRIAMIENTO', default=30, cast=int)
+# Peticiones IA idénticas en vuelo comparten una sola llamada (Redis si hay REDIS_URL; si no, archivos de lock)
+AI_SINGLE_FLIGHT = config('AI_SINGLE_FLIGHT', default=True, cast=bool)
+
+
+# ==============================================================
+# 🛡️ SNAPSHOTS DE RIESGO (SHADOW DASHBOARD)
+# ==============================================================
+# Minutos entre snapshots automáticos dentro del proceso web. 0 = desactivado
+# (usar `manage.py generar_snapshot_riesgo` en cron o con --intervalo).
+RISK_SNAPSHOT_INTERVALO_MIN = config('RISK_SNAPSHOT_INTERVALO_MIN', default=0, cast=int)
+
+
+# ==============================================================
+# 🖨️ RENDERIZADO PDF EN SEGUNDO PLANO
+# ==============================================================
+# Procesos del pool de WeasyPrint. 0 = uno por núcleo (os.cpu_count()).
+PDF_WORKERS = config('PDF_WORKERS', default=0, cast=int)
+# Minutos tras los que un TrabajoPDF sin terminar se marca ERROR (p. ej. tras un reinicio).
+PDF_TRABAJO_VENCIMIENTO_MIN = config('PDF_TRABAJO_VENCIMIENTO_MIN', default=30, cast=int)
+# Tope de la caché de PDFs en MEDIA (desalojo LRU). 0 = sin tope.
+PDF_CACHE_MAX_MB = config('PDF_CACHE_MAX_MB', default=512, cast=int)
+# Segundos que se guarda en caché el contexto de datos de cada boletín. 0 = sin caché.
+BOLETIN_CONTEXTO_TTL = config('BOLETIN_CONTEXTO_TTL', default=300, cast=int)
+# Hojas CSS (rutas de static) que se parsean una vez por proceso y se aplican a todos los PDFs.
+PDF_HOJAS_COMUNES = []
+# Métricas de cada render (tabla MetricaPDF + log `pdf_render`); p50/p95 en el admin.
+PDF_METRICAS = config('PDF_METRICAS', default=True, cast=bool)
+PDF_METRICAS_DIAS = config('PDF_METRICAS_DIAS', default=30, cast=int)
 
 
 # --- CONFIGURACIÓN PARA RAILWAY ---
@@ -245,6 +283,23 @@ else:
         }
     }
 
+# Caché de Django (contextos de boletín). Con Redis se comparte entre workers;
+# en local es memoria del proceso, con cupo para un grado completo.
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
+
 CSRF_TRUSTED_ORIGINS = [
     "https://web-production-707fc.up.railway.app",
 ]
@@ -3,7 +3,7 @@
 from django.contrib import admin
 from .models import ObservadorArchivado # <--- Agrega el import arriba
 
-from .models import PeriodoAcademico, PEIResumen, AIUsageLog, AIDocumento
+from .models import PeriodoAcademico, PEIResumen, AIUsageLog, AIDocumento, ResumenAcademico, SnapshotRiesgo, TrabajoPDF, CachePDF, MetricaPDF, AIRespuestaCache
 # 1. IMPORTS UNIFICADOS (Tus modelos viejos + Los nuevos de IA)
 from .models import (
     Perfil,
@@ -94,6 +94,20 @@ class AIUsageLogAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(AIRespuestaCache)
+class AIRespuestaCacheAdmin(admin.ModelAdmin):
+    list_display = ('huella', 'accion', 'rol', 'sujeto', 'aciertos', 'ultimo_acierto', 'expira')
+    list_filter = ('accion', 'rol')
+    date_hierarchy = 'creado'
+
+    # La llena el orquestador; borrar una entrada solo fuerza una nueva llamada a la IA
+    readonly_fields = [field.name for field in AIRespuestaCache._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(AIDocumento)
 class AIDocumentoAdmin(admin.ModelAdmin):
     list_display = ('titulo', 'tipo', 'usuario', 'periodo', 'creado_en')
@@ -119,4 +133,84 @@ class ObservadorArchivadoAdmin(admin.ModelAdmin):
     list_display = ('estudiante_nombre', 'estudiante_username', 'fecha_archivado', 'eliminado_por')
     search_fields = ('estudiante_nombre', 'estudiante_username')
     readonly_fields = ('fecha_archivado', 'archivo_pdf', 'eliminado_por')
-    list_filter = ('fecha_archivado',)
\ No newline at end of file
+    list_filter = ('fecha_archivado',)
+
+@admin.register(ResumenAcademico)
+class ResumenAcademicoAdmin(admin.ModelAdmin):
+    list_display = ('estudiante', 'curso', 'periodo', 'promedio', 'materias_perdidas', 'fallas', 'tardanzas', 'convivencia', 'actualizado')
+    list_filter = ('curso', 'periodo')
+    search_fields = ('estudiante__username', 'estudiante__last_name')
+
+    # Tabla derivada: se reconstruye con `manage.py reconstruir_resumen_academico`
+    readonly_fields = [field.name for field in ResumenAcademico._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(SnapshotRiesgo)
+class SnapshotRiesgoAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'total_riesgo', 'riesgo_mitigado', 'tasa_riesgo', 'kpi_dinero', 'costo_ia_mes', 'duracion_ms', 'generado_por')
+    date_hierarchy = 'fecha'
+
+    # Foto histórica: se genera con `manage.py generar_snapshot_riesgo` o desde el Command Center
+    readonly_fields = [field.name for field in SnapshotRiesgo._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(TrabajoPDF)
+class TrabajoPDFAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'estado', 'solicitado_por', 'creado', 'terminado')
+    list_filter = ('tipo', 'estado')
+    date_hierarchy = 'creado'
+
+    # Se crean desde las vistas de encolado; aquí solo se auditan
+    readonly_fields = [field.name for field in TrabajoPDF._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(CachePDF)
+class CachePDFAdmin(admin.ModelAdmin):
+    list_display = ('huella', 'tipo', 'matricula', 'tamano', 'accesos', 'ultimo_acceso')
+    list_filter = ('tipo',)
+    date_hierarchy = 'ultimo_acceso'
+
+    # Se llena al descargar boletines; borrar una entrada solo fuerza un nuevo render
+    readonly_fields = [field.name for field in CachePDF._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(MetricaPDF)
+class MetricaPDFAdmin(admin.ModelAdmin):
+    list_display = ('plantilla', 'tiempo_render_ms', 'tiempo_contexto_ms', 'tiempo_plantilla_ms', 'paginas', 'tamano', 'creado')
+    list_filter = ('plantilla',)
+    date_hierarchy = 'creado'
+    # Arriba del listado: p50/p95 por plantilla con los mismos filtros (fecha, plantilla)
+    change_list_template = 'admin/tasks/metricapdf/change_list.html'
+
+    # Las escribe el pool de PDFs; aquí solo se consultan
+    readonly_fields = [field.name for field in MetricaPDF._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        from tasks.services.pdf_metricas import resumen_por_plantilla
+
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None:
+            response.context_data['resumen_plantillas'] = resumen_por_plantilla(changelist.queryset)
+        return response
@@ -2,33 +2,60 @@
 
 import hashlib
 import json
-from django.utils import timezone
+import logging
+import threading
+from collections import defaultdict
 from datetime import timedelta
-from tasks.models import AIUsageLog, PEIResumen
-from .constants import MODEL_NAME
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+from django.db.models import F, Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from tasks.models import (
+    AIRespuestaCache, Asistencia, Convivencia, Nota, Observacion, PEIResumen, Seguimiento
+)
+from tasks.services.invalidacion import al_confirmar
+from .constants import MODEL_NAME, TTL_CACHE_IA_HORAS, TTL_CACHE_IA_HORAS_DEFECTO
+
+logger = logging.getLogger(__name__)
+
 
 class PedagogicCache:
     """
     EL MEMORIOSO (Sistema de Caché Institucional).
-    
+
     Principios de Diseño:
     1. Semántico: Importa el contexto exacto (notas, reportes), no solo el usuario.
     2. Sensible al PEI: Si el manual de convivencia cambia, el caché caduca.
-    3. Trazable: Se basa en la huella digital (Hash) guardada en los Logs.
+    3. Dedicado: las respuestas viven en AIRespuestaCache, buscadas por una
+       huella indexada (acción + rol + contexto + versión del prompt), con TTL
+       por acción e invalidación cuando cambian los datos del estudiante.
     """
-    
+
     PROMPT_VERSION = "v1.0"  # Incrementa esto si cambias la lógica en prompts.py
-    CACHE_TTL_HOURS = 12     # Tiempo de vida del caché
 
-    def calculate_hash(self, contexto_json):
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Contadores del proceso: {accion: {'aciertos': n, 'fallos': n}}
+        self._contadores = defaultdict(lambda: {'aciertos': 0, 'fallos': 0})
+
+    @staticmethod
+    def ttl_horas(accion):
+        return TTL_CACHE_IA_HORAS.get(accion, TTL_CACHE_IA_HORAS_DEFECTO)
+
+    def calculate_hash(self, contexto_json, accion=None, rol=None, extra=None):
         """
-        Genera el hash SHA256. 
-        CORRECCIÓN: Aseguramos que solo se pasen strings al JSON para evitar errores de serialización.
+        Genera el hash SHA256 de la petición.
+        `extra`: lo que también cambia la respuesta pero no está en el contexto
+        (historial del chat, temperatura).
         """
         # 1. Obtenemos el periodo o un string por defecto
         try:
             pei_activo = PEIResumen.objects.filter(activo=True).first()
-            
+
             # IMPORTANTE: Aquí extraemos el hash o un string, NUNCA el objeto completo de la DB
             pei_version = "NO_PEI"
             if pei_activo:
@@ -39,59 +66,136 @@ class PedagogicCache:
 
         # 2. Construcción del payload para el hash
         payload = {
-            "data": contexto_json,      
+            "accion": accion,
+            "rol": rol,
+            "data": contexto_json,
+            "extra": extra,
             "pei_ver": pei_version,
-            "prompt_ver": self.PROMPT_VERSION, 
-            "model": MODEL_NAME         
+            "prompt_ver": self.PROMPT_VERSION,
+            "model": MODEL_NAME
         }
-        
+
         # 3. Serialización determinista (sort_keys=True es vital para la consistencia del hash)
-        # ensure_ascii=False permite manejar tildes y caracteres especiales correctamente
-        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
-        
+        # ensure_ascii=False permite manejar tildes; default=str cubre fechas y Decimal del contexto
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+
         return hashlib.sha256(encoded).hexdigest()
 
-    def get_cached_response(self, usuario, accion, contexto_dict):
+    def get_cached_response(self, accion, huella):
         """
-        Intenta recuperar una respuesta previa idéntica de la base de datos.
-        
+        Respuesta vigente con esta huella (una consulta por el índice único).
+
         Returns:
             dict | None: Datos de la respuesta si existe, o None si no.
         """
-        # 1. Calcular la Huella Digital Única (Fingerprint)
-        current_hash = self.calculate_hash(contexto_dict)
-        
-        # 2. Definir ventana de validez (Ej: 12 horas)
-        fecha_limite = timezone.now() - timedelta(hours=self.CACHE_TTL_HOURS)
-        
-        # 3. Consultar la "Caja Negra" (AIUsageLog)
-        # Buscamos logs exitosos recientes que tengan ESTE MISMO hash en su metadata técnica.
         try:
-            log_previo = AIUsageLog.objects.filter(
-                usuario=usuario,
-                accion=accion,
-                fecha__gte=fecha_limite,
-                exitoso=True,
-                metadata_tecnica__context_hash=current_hash 
-            ).order_by('-fecha').first()
-            
-            if log_previo:
-                content = log_previo.metadata_tecnica.get('response_content')
-                if content:
-                    # ¡Éxito! Recuperamos el contenido del log anterior
-                    return {
-                        "cached": True,
-                        "content": content,
-                        "hash": current_hash,
-                        "fecha": log_previo.fecha,
-                        "log_id": log_previo.id
-                    }
-        except Exception:
+            entrada = AIRespuestaCache.objects.filter(huella=huella, expira__gt=timezone.now()).first()
+        except Exception as e:
             # Si falla la base de datos por cualquier motivo, simplemente ignoramos el caché
-            pass 
-            
-        # 4. Cache Miss (No encontramos nada válido)
-        return None
+            logger.warning(f"⚠️ Caché IA no disponible: {e}")
+            return None
+
+        self._contar(accion, 'aciertos' if entrada else 'fallos')
+        if entrada is None:
+            return None
+
+        AIRespuestaCache.objects.filter(id=entrada.id).update(
+            aciertos=F('aciertos') + 1, ultimo_acierto=timezone.now()
+        )
+        return {
+            "cached": True,
+            "content": entrada.contenido,
+            "hash": huella,
+            "fecha": entrada.creado,
+            "tokens_ahorrados": entrada.tokens_entrada + entrada.tokens_salida,
+        }
+
+    def guardar(self, accion, huella, contenido, rol='', sujeto=None, tokens_in=0, tokens_out=0):
+        """Guarda (o renueva) la respuesta de la IA para esta huella."""
+        horas = self.ttl_horas(accion)
+        if not horas or not contenido:
+            return None
+        valores = {
+            'accion': accion,
+            'rol': rol or '',
+            'sujeto_id': sujeto.pk if isinstance(sujeto, get_user_model()) else None,
+            'contenido': contenido,
+            'tokens_entrada': tokens_in or 0,
+            'tokens_salida': tokens_out or 0,
+            'expira': timezone.now() + timedelta(hours=horas),
+        }
+        try:
+            # Las vencidas no se sirven; aprovechamos cada escritura para retirarlas
+            self.purgar_expiradas()
+            entrada, _ = AIRespuestaCache.objects.update_or_create(huella=huella, defaults=valores)
+            return entrada
+        except IntegrityError:
+            # Otra petición idéntica guardó la misma huella en paralelo
+            return AIRespuestaCache.objects.filter(huella=huella).first()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar la respuesta IA en caché: {e}")
+            return None
+
+    @staticmethod
+    def invalidar(usuarios_ids=None, acciones=None):
+        """
+        Borra las respuestas sobre los usuarios indicados y/o de las acciones
+        indicadas. Retorna cuántas.
+        """
+        filtro = Q()
+        if usuarios_ids:
+            filtro |= Q(sujeto_id__in=list(usuarios_ids))
+        if acciones:
+            filtro |= Q(accion__in=list(acciones))
+        if not filtro:
+            return 0
+        borradas, _ = AIRespuestaCache.objects.filter(filtro).delete()
+        return borradas
+
+    @staticmethod
+    def invalidar_por_datos(estudiantes_ids):
+        """
+        Cambiaron datos académicos: caen solo las respuestas sobre estos estudiantes.
+        Las institucionales (ACCIONES_IA_INSTITUCIONALES) no se tocan: su contexto
+        es la radiografía del colegio, así que cualquier cambio produce otra huella
+        y la respuesta vieja deja de servirse (el TTL la retira).
+        """
+        return PedagogicCache.invalidar(usuarios_ids=estudiantes_ids)
+
+    @staticmethod
+    def purgar_expiradas():
+        borradas, _ = AIRespuestaCache.objects.filter(expira__lte=timezone.now()).delete()
+        return borradas
+
+    def _contar(self, accion, tipo):
+        with self._lock:
+            self._contadores[accion][tipo] += 1
+
+    def estadisticas(self):
+        """Aciertos y fallos del proceso por acción, con su tasa de acierto."""
+        with self._lock:
+            resumen = {accion: dict(valores) for accion, valores in self._contadores.items()}
+        for valores in resumen.values():
+            total = valores['aciertos'] + valores['fallos']
+            valores['tasa_acierto'] = round(valores['aciertos'] / total, 3) if total else 0.0
+        return resumen
 
 # Instancia global para ser utilizada en el orquestador
-ai_cache = PedagogicCache()
\ No newline at end of file
+ai_cache = PedagogicCache()
+
+
+# ===================================================================
+# 🔔 INVALIDACIÓN AUTOMÁTICA (conectada en TasksConfig.ready)
+# Las escrituras masivas de calificaciones invalidan explícitamente
+# (GradePersistenceService); en todo caso la huella cambia con el contexto.
+# Cada registro solo toca las respuestas de su estudiante, agrupadas por
+# transacción: pasar lista a un curso es una consulta, no una por alumno.
+# ===================================================================
+
+@receiver(post_save, sender=Nota)
+@receiver(post_save, sender=Observacion)
+@receiver(post_save, sender=Seguimiento)
+@receiver(post_save, sender=Convivencia)
+@receiver(post_save, sender=Asistencia)
+def _invalidar_respuestas_estudiante(sender, instance, **kwargs):
+    al_confirmar(PedagogicCache.invalidar_por_datos, [instance.estudiante_id])
@@ -108,6 +108,7 @@ DOC_ORIENTACION_ACUDIENTE = 'orientacion_acudiente'
 DOC_REPORTE_CONVIVENCIA = 'reporte_convivencia'
 DOC_REPORTE_INSTITUCIONAL = 'reporte_institucional'
 DOC_AUDITORIA_PEI = 'reporte_auditoria_pei'
+DOC_ANALISIS_BOLETIN = 'analisis_boletin'       # Precalculado para el boletín (sin IA en el render)
 
 DOCUMENTOS_IA_PERMITIDOS = [
     DOC_REPORTE_PEDAGOGICO,
@@ -116,6 +117,7 @@ DOCUMENTOS_IA_PERMITIDOS = [
     DOC_REPORTE_CONVIVENCIA,
     DOC_REPORTE_INSTITUCIONAL,
     DOC_AUDITORIA_PEI,
+    DOC_ANALISIS_BOLETIN,
 ]
 
 # ------------------------------------------------------------------------------
@@ -124,4 +126,27 @@ DOCUMENTOS_IA_PERMITIDOS = [
 MODEL_NAME = 'deepseek-chat' 
 MAX_TOKENS = 2500           # Aumentado para soportar explicaciones largas
 MAX_TOKENS_PER_REQUEST = 4000 # Límite duro de la API
-TEMPERATURE = 0.7           # Balance entre creatividad y precisión
\ No newline at end of file
+TEMPERATURE = 0.7           # Balance entre creatividad y precisión
+# ------------------------------------------------------------------------------
+# 6. CACHÉ DE RESPUESTAS (tasks.ai.cache)
+# ------------------------------------------------------------------------------
+# Acciones que analizan al colegio completo (no a un usuario). No se invalidan
+# por registro: su contexto cambia con cualquier dato y con él la huella.
+ACCIONES_IA_INSTITUCIONALES = [
+    ACCION_CUMPLIMIENTO_PEI,
+    ACCION_MEJORA_STAFF_ACADEMICO,
+    ACCION_ANALISIS_CONVIVENCIA,
+    ACCION_ANALISIS_GLOBAL_BIENESTAR,
+]
+
+# Horas que una respuesta idéntica se reutiliza, por acción. 0 = nunca se cachea
+# (el chat es conversacional: repetir la pregunta es pedir otra respuesta).
+TTL_CACHE_IA_HORAS = {
+    ACCION_CHAT_SOCRATICO: 0,
+    ACCION_CUMPLIMIENTO_PEI: 24,
+    ACCION_MEJORA_STAFF_ACADEMICO: 6,
+    ACCION_ANALISIS_CONVIVENCIA: 6,
+    ACCION_ANALISIS_GLOBAL_BIENESTAR: 6,
+    ACCION_RIESGO_ACADEMICO: 6,
+}
+TTL_CACHE_IA_HORAS_DEFECTO = 12
@@ -28,7 +28,8 @@ from .constants import (
     ACCION_TUTOR_PARETO,
     ACCION_NIVELACION_ACADEMICA,
     ACCION_DOCENTE_GRUPO,
-    ACCION_DOCENTE_INDIVIDUAL
+    ACCION_DOCENTE_INDIVIDUAL,
+    ACCIONES_IA_INSTITUCIONALES
 )
 
 class ContextBuilder:
@@ -130,14 +131,9 @@ class ContextBuilder:
         # =========================================================
         # 2. DEFINICIÓN DE ACCIONES GLOBALES
         # =========================================================
-        # 🔥 CORRECCIÓN: Quitamos ACCION_RIESGO_ACADEMICO de aquí para que no sea global
-        ACCIONES_GLOBALES = [
-            ACCION_CUMPLIMIENTO_PEI,
-            ACCION_MEJORA_STAFF_ACADEMICO,
-            ACCION_ANALISIS_CONVIVENCIA,
-            # Mantenemos Bienestar aquí, pero lo filtraremos abajo si es individual
-            ACCION_ANALISIS_GLOBAL_BIENESTAR 
-        ]
+        # 🔥 CORRECCIÓN: ACCION_RIESGO_ACADEMICO no es global
+        # (Bienestar sí, pero lo filtraremos abajo si es individual)
+        ACCIONES_GLOBALES = ACCIONES_IA_INSTITUCIONALES
 
         # =========================================================
         # 3. CONTEXTO INSTITUCIONAL GLOBAL (COLEGIO COMPLETO)
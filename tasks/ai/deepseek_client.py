@@ -1,255 +1,513 @@
 # tasks/ai/deepseek_client.py
 
-
-
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 
 from django.conf import settings
 
 from .constants import MODEL_NAME
 
+logger = logging.getLogger(__name__)
+
+# Respuestas del proveedor que vale la pena reintentar (saturación / caídas transitorias)
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+
+# ------------------------------------------------------------------------------
+# SESIÓN HTTP COMPARTIDA (keep-alive: un handshake TLS por conexión, no por llamada)
+# ------------------------------------------------------------------------------
+_lock_sesion = threading.Lock()
+_sesion = None
+
+
+def obtener_sesion():
+    """`requests.Session` del proceso con un pool de conexiones hacia la API."""
+    global _sesion
+    with _lock_sesion:
+        if _sesion is None:
+            tamano_pool = getattr(settings, 'DEEPSEEK_POOL_CONEXIONES', 10)
+            sesion = requests.Session()
+            # Los reintentos los maneja el cliente (con jitter y circuito), no urllib3
+            adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=tamano_pool, max_retries=0)
+            sesion.mount('https://', adaptador)
+            sesion.mount('http://', adaptador)
+            _sesion = sesion
+        return _sesion
+
+
+# Cliente asíncrono (streaming): su pool vive atado al event loop que lo creó
+_clientes_async = weakref.WeakKeyDictionary()
+
+
+def obtener_cliente_async():
+    """`httpx.AsyncClient` con pool de conexiones para el event loop en curso."""
+    loop = asyncio.get_running_loop()
+    cliente = _clientes_async.get(loop)
+    if cliente is None or cliente.is_closed:
+        tamano_pool = getattr(settings, 'DEEPSEEK_POOL_CONEXIONES', 10)
+        cliente = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=tamano_pool, max_keepalive_connections=tamano_pool)
+        )
+        _clientes_async[loop] = cliente
+    return cliente
+
+
+async def _datos_sse(lineas):
+    """Campos `data:` de un flujo Server-Sent Events, un evento por valor."""
+    datos = []
+    async for linea in lineas:
+        if not linea:
+            if datos:
+                yield "\n".join(datos)
+                datos = []
+            continue
+        if linea.startswith(":"):
+            # Comentario / keep-alive del servidor
+            continue
+        campo, _, valor = linea.partition(":")
+        if campo == "data":
+            datos.append(valor[1:] if valor.startswith(" ") else valor)
+    if datos:
+        yield "\n".join(datos)
+
+
+class CircuitoAbierto(Exception):
+    """El proveedor viene fallando: se rechaza la llamada sin tocar la red."""
+
+
+class CircuitBreaker:
+    """
+    INTERRUPTOR DE CIRCUITO (por proceso).
 
+    - CERRADO: las llamadas pasan; cada fallo consecutivo suma.
+    - ABIERTO: tras `umbral` fallos seguidos, se falla al instante durante `enfriamiento` segundos.
+    - SEMIABIERTO: pasado el enfriamiento se deja pasar una sola llamada de prueba;
+      si funciona se cierra, si falla se vuelve a abrir.
+    """
 
+    CERRADO = 'CERRADO'
+    ABIERTO = 'ABIERTO'
+    SEMIABIERTO = 'SEMIABIERTO'
+
+    def __init__(self, umbral=5, enfriamiento=30):
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._abierto_desde = None
+        self._prueba_en_curso = False
+
+    @property
+    def estado(self):
+        with self._lock:
+            return self._estado()
+
+    def _estado(self):
+        if self._abierto_desde is None:
+            return self.CERRADO
+        if time.monotonic() - self._abierto_desde >= self.enfriamiento:
+            return self.SEMIABIERTO
+        return self.ABIERTO
+
+    def antes_de_llamar(self):
+        """Lanza CircuitoAbierto si la llamada no debe salir."""
+        with self._lock:
+            estado = self._estado()
+            if estado == self.CERRADO:
+                return
+            if estado == self.SEMIABIERTO and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return
+            restante = max(0, int(self.enfriamiento - (time.monotonic() - self._abierto_desde)))
+            raise CircuitoAbierto(f"Servicio de IA en pausa tras fallos repetidos (reintento en {restante}s).")
+
+    def registrar_exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._abierto_desde = None
+            self._prueba_en_curso = False
+
+    def liberar_prueba(self):
+        """La llamada de prueba se abandonó sin veredicto: otra podrá intentarlo."""
+        with self._lock:
+            self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            if self._prueba_en_curso or self._fallos >= self.umbral:
+                if self._abierto_desde is None or self._prueba_en_curso:
+                    logger.warning(f"⚠️ Circuito DeepSeek ABIERTO tras {self._fallos} fallos seguidos.")
+                self._abierto_desde = time.monotonic()
+            self._prueba_en_curso = False
 
 
 class DeepSeekClient:
-
     """
-
-    CLIENTE HTTP PURO PARA DEEPSEEK.
-
+    CLIENTE HTTP PARA DEEPSEEK.
     Optimizado para reportes de alta densidad (Tier 1000).
 
+    - Sesión compartida con pool de conexiones (keep-alive).
+    - Timeouts separados: conectar es rápido; leer puede tardar en reportes largos.
+    - Reintentos acotados con backoff exponencial y jitter en 429/5xx y errores de conexión
+      (respeta Retry-After).
+    - Circuit breaker: tras fallos seguidos del proveedor, falla al instante un tiempo
+      en lugar de dejar workers esperando.
+    - `aget_completion` / `stream_completion`: variantes asíncronas (httpx; la
+      segunda por SSE, token a token) con los mismos reintentos y circuito.
     """
 
+    API_URL = getattr(settings, 'DEEPSEEK_API_URL', "https://api.deepseek.com/chat/completions")
 
+    TIMEOUT_CONEXION = getattr(settings, 'DEEPSEEK_TIMEOUT_CONEXION', 5)
+    # Reportes con contextos masivos: la lectura sí necesita margen, pero acotado
+    TIMEOUT_LECTURA = getattr(settings, 'DEEPSEEK_TIMEOUT_LECTURA', 120)
 
-    API_URL = "https://api.deepseek.com/chat/completions"
-
-    
-
-    # 🔥 AUMENTADO AL MÁXIMO PRÁCTICO: 300 segundos (5 minutos)
-
-    # Esto permite procesar contextos masivos con múltiples tablas sin interrupciones.
-
-    TIMEOUT_SECONDS = 300
-
+    MAX_REINTENTOS = getattr(settings, 'DEEPSEEK_MAX_REINTENTOS', 2)
+    BACKOFF_BASE = 0.5      # segundos
+    BACKOFF_MAXIMO = 8.0    # tope de cada espera (también para Retry-After)
 
+    def __init__(self, circuito=None):
+        self.circuito = circuito or CircuitBreaker(
+            umbral=getattr(settings, 'DEEPSEEK_CIRCUITO_UMBRAL', 5),
+            enfriamiento=getattr(settings, 'DEEPSEEK_CIRCUITO_ENFRIAMIENTO', 30),
+        )
 
-    def get_completion(self, messages_list, config=None):
-
-        """
-
-        Envía mensajes a DeepSeek y retorna respuesta + uso de tokens.
-
-        """
-
-
-
-        # ------------------------------------------------------------------
-
-        # 1. VALIDACIÓN DE API KEY
-
-        # ------------------------------------------------------------------
-
-        api_key = getattr(settings, "DEEPSEEK_API_KEY", None)
-
-        
-
-        if not api_key:
-
-            return {
-
-                "success": False,
-
-                "error": "Error de configuración: DEEPSEEK_API_KEY no definida en settings.py"
-
-            }
-
-
-
-        headers = {
+    def _espera(self, intento, respuesta=None):
+        """Backoff exponencial con jitter completo; Retry-After manda si viene."""
+        if respuesta is not None:
+            try:
+                return min(self.BACKOFF_MAXIMO, max(0.0, float(respuesta.headers.get('Retry-After'))))
+            except (TypeError, ValueError):
+                pass
+        return random.uniform(0, min(self.BACKOFF_MAXIMO, self.BACKOFF_BASE * (2 ** intento)))
 
+    def _headers(self, api_key):
+        return {
             "Authorization": f"Bearer {api_key}",
-
             "Content-Type": "application/json"
-
         }
 
-
-
-        # ------------------------------------------------------------------
-
-        # 2. CONFIGURACIÓN BASE + OVERRIDE
-
-        # ------------------------------------------------------------------
-
+    def _payload(self, messages_list, config, stream=False):
         final_config = {
-
             "temperature": 0.7,
-
             # 🔥 AUMENTADO A 4000 para evitar que la respuesta se corte en reportes extensos
-
             "max_tokens": 4000,
-
             "top_p": 1.0,
-
             "frequency_penalty": 0.0,
-
             "presence_penalty": 0.0
-
         }
-
-
-
         if isinstance(config, dict):
-
             final_config.update(config)
-
-
-
-        payload = {
-
+        return {
             "model": MODEL_NAME,
-
             "messages": messages_list,
-
-            "stream": False,
-
+            "stream": stream,
             **final_config
-
         }
 
+    def _post(self, payload, api_key, stream=False):
+        """
+        POST con reintentos y circuito. Retorna la respuesta HTTP final
+        (2xx o un error no reintentable / agotado). Lanza CircuitoAbierto o
+        las excepciones de red del último intento.
+        """
+        self.circuito.antes_de_llamar()
+        sesion = obtener_sesion()
+        intento = 0
+        while True:
+            respuesta = None
+            try:
+                respuesta = sesion.post(
+                    self.API_URL,
+                    json=payload,
+                    headers=self._headers(api_key),
+                    timeout=(self.TIMEOUT_CONEXION, self.TIMEOUT_LECTURA),
+                    stream=stream
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # Un ReadTimeout no se reintenta: la petición pudo haberse procesado y
+                # repetirla duplicaría la espera; conectar sí es barato de repetir
+                reintentable = not isinstance(e, requests.exceptions.ReadTimeout)
+                if not reintentable or intento >= self.MAX_REINTENTOS:
+                    self.circuito.registrar_fallo()
+                    raise
+                logger.warning(f"⚠️ DeepSeek: {type(e).__name__}, reintento {intento + 1}/{self.MAX_REINTENTOS}")
+            except Exception:
+                # Nunca dejar colgada una llamada de prueba del circuito semiabierto
+                self.circuito.registrar_fallo()
+                raise
+            else:
+                if respuesta.status_code not in ESTADOS_REINTENTABLES:
+                    # Éxito o error del cliente (clave, saldo, petición): el proveedor responde bien
+                    self.circuito.registrar_exito()
+                    return respuesta
+                if intento >= self.MAX_REINTENTOS:
+                    self.circuito.registrar_fallo()
+                    return respuesta
+                logger.warning(
+                    f"⚠️ DeepSeek HTTP {respuesta.status_code}, reintento {intento + 1}/{self.MAX_REINTENTOS}"
+                )
+                respuesta.close()
+
+            time.sleep(self._espera(intento, respuesta))
+            intento += 1
+
+    @staticmethod
+    def _error_http(response):
+        error_msg = response.text
+        if "insufficient_balance" in error_msg:
+            error_msg = "Saldo insuficiente en la cuenta de DeepSeek. Por favor recarga créditos."
+        return f"DeepSeek API Error {response.status_code}: {error_msg}"
+
+    @staticmethod
+    def _resultado(data):
+        """Respuesta JSON de chat/completions -> formato del cliente."""
+        try:
+            ai_message = data["choices"][0]["message"]["content"]
+            usage_data = data.get("usage", {})
+            request_id = data.get("id", "unknown_request_id")
+        except (KeyError, IndexError):
+            return {
+                "success": False,
+                "error": "Formato inesperado en la respuesta de DeepSeek."
+            }
 
+        return {
+            "success": True,
+            "content": ai_message,
+            "request_id": request_id,
+            "usage": {
+                "prompt_tokens": usage_data.get("prompt_tokens", 0),
+                "completion_tokens": usage_data.get("completion_tokens", 0),
+                "total_tokens": usage_data.get("total_tokens", 0)
+            }
+        }
+
+    def get_completion(self, messages_list, config=None):
+        """
+        Envía mensajes a DeepSeek y retorna respuesta + uso de tokens.
+        """
 
         # ------------------------------------------------------------------
+        # 1. VALIDACIÓN DE API KEY
+        # ------------------------------------------------------------------
+        api_key = getattr(settings, "DEEPSEEK_API_KEY", None)
 
-        # 3. LLAMADA HTTP
+        if not api_key:
+            return {
+                "success": False,
+                "error": "Error de configuración: DEEPSEEK_API_KEY no definida en settings.py"
+            }
 
         # ------------------------------------------------------------------
+        # 2. CONFIGURACIÓN BASE + OVERRIDE
+        # ------------------------------------------------------------------
+        payload = self._payload(messages_list, config)
 
+        # ------------------------------------------------------------------
+        # 3. LLAMADA HTTP (sesión compartida, reintentos y circuito)
+        # ------------------------------------------------------------------
         try:
-
-            response = requests.post(
-
-                self.API_URL,
-
-                json=payload,
-
-                headers=headers,
-
-                timeout=self.TIMEOUT_SECONDS 
-
-            )
-
-
+            response = self._post(payload, api_key)
 
             # --------------------------------------------------------------
-
             # 4. MANEJO DE ERRORES DE SALDO O API
-
             # --------------------------------------------------------------
-
             if response.status_code != 200:
-
-                error_msg = response.text
-
-                if "insufficient_balance" in error_msg:
-
-                    error_msg = "Saldo insuficiente en la cuenta de DeepSeek. Por favor recarga créditos."
-
-                
-
                 return {
-
                     "success": False,
-
-                    "error": f"DeepSeek API Error {response.status_code}: {error_msg}"
-
+                    "error": self._error_http(response)
                 }
 
-
-
             # --------------------------------------------------------------
-
             # 5. PROCESAR RESPUESTA EXITOSA
-
             # --------------------------------------------------------------
-
-            data = response.json()
-
-
-
-            try:
-
-                ai_message = data["choices"][0]["message"]["content"]
-
-                usage_data = data.get("usage", {})
-
-                request_id = data.get("id", "unknown_request_id")
-
-            except (KeyError, IndexError):
-
-                return {
-
-                    "success": False,
-
-                    "error": "Formato inesperado en la respuesta de DeepSeek."
-
-                }
-
-
-
-            return {
-
-                "success": True,
-
-                "content": ai_message,
-
-                "request_id": request_id,
-
-                "usage": {
-
-                    "prompt_tokens": usage_data.get("prompt_tokens", 0),
-
-                    "completion_tokens": usage_data.get("completion_tokens", 0),
-
-                    "total_tokens": usage_data.get("total_tokens", 0)
-
-                }
-
-            }
-
-
+            return self._resultado(response.json())
 
         # ------------------------------------------------------------------
-
         # 6. MANEJO DE EXCEPCIONES DE RED
-
         # ------------------------------------------------------------------
+        except CircuitoAbierto as e:
+            return {"success": False, "error": str(e)}
+        except Exception as e:
+            return {"success": False, "error": self._error_red(e)}
 
-        except requests.exceptions.Timeout:
+    # ------------------------------------------------------------------
+    # ⚡ VARIANTES ASÍNCRONAS (httpx): la espera del LLM no ocupa un hilo
+    # ------------------------------------------------------------------
+    def _timeout_httpx(self):
+        # `read` se mide entre fragmentos: un stream vivo nunca lo agota
+        return httpx.Timeout(self.TIMEOUT_LECTURA, connect=self.TIMEOUT_CONEXION)
 
+    async def _apost(self, payload, api_key, stream=False):
+        """
+        Equivalente asíncrono de `_post`. Con stream=True la respuesta queda
+        abierta: quien la recibe debe cerrarla (`aclose`).
+        """
+        self.circuito.antes_de_llamar()
+        cliente = obtener_cliente_async()
+        intento = 0
+        while True:
+            respuesta = None
+            try:
+                peticion = cliente.build_request(
+                    "POST",
+                    self.API_URL,
+                    json=payload,
+                    headers=self._headers(api_key),
+                    timeout=self._timeout_httpx()
+                )
+                respuesta = await cliente.send(peticion, stream=stream)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+                # RemoteProtocolError: el servidor cerró una conexión keep-alive reutilizada
+                if intento >= self.MAX_REINTENTOS:
+                    self.circuito.registrar_fallo()
+                    raise
+                logger.warning(f"⚠️ DeepSeek: {type(e).__name__}, reintento {intento + 1}/{self.MAX_REINTENTOS}")
+            except asyncio.CancelledError:
+                # El cliente se fue: no es culpa del proveedor
+                self.circuito.liberar_prueba()
+                raise
+            except Exception:
+                self.circuito.registrar_fallo()
+                raise
+            else:
+                if respuesta.status_code not in ESTADOS_REINTENTABLES:
+                    self.circuito.registrar_exito()
+                    return respuesta
+                if intento >= self.MAX_REINTENTOS:
+                    self.circuito.registrar_fallo()
+                    return respuesta
+                logger.warning(
+                    f"⚠️ DeepSeek HTTP {respuesta.status_code}, reintento {intento + 1}/{self.MAX_REINTENTOS}"
+                )
+                # Leer el cuerpo (corto) deja la conexión reutilizable en el pool
+                await respuesta.aread()
+                await respuesta.aclose()
+
+            await asyncio.sleep(self._espera(intento, respuesta))
+            intento += 1
+
+    def _error_red(self, e):
+        if isinstance(e, (requests.exceptions.ConnectTimeout, httpx.ConnectTimeout)):
+            return f"Timeout de conexión: DeepSeek no respondió en {self.TIMEOUT_CONEXION}s."
+        if isinstance(e, (requests.exceptions.Timeout, httpx.TimeoutException)):
+            return f"Timeout Crítico: La IA excedió los {self.TIMEOUT_LECTURA}s de procesamiento."
+        if isinstance(e, (requests.exceptions.ConnectionError, httpx.TransportError)):
+            return "Error de conexión: Verifica tu internet."
+        return f"Error inesperado: {str(e)}"
+
+    async def aget_completion(self, messages_list, config=None):
+        """Versión asíncrona de `get_completion` (mismo formato de retorno)."""
+        api_key = getattr(settings, "DEEPSEEK_API_KEY", None)
+        if not api_key:
             return {
-
-                "success": False, 
-
-                "error": f"Timeout Crítico: La IA excedió los {self.TIMEOUT_SECONDS}s de procesamiento."
-
+                "success": False,
+                "error": "Error de configuración: DEEPSEEK_API_KEY no definida en settings.py"
             }
 
-        except requests.exceptions.ConnectionError:
-
-            return {"success": False, "error": "Error de conexión: Verifica tu internet."}
-
+        try:
+            response = await self._apost(self._payload(messages_list, config), api_key)
+            if response.status_code != 200:
+                return {"success": False, "error": self._error_http(response)}
+            return self._resultado(response.json())
+        except CircuitoAbierto as e:
+            return {"success": False, "error": str(e)}
         except Exception as e:
+            return {"success": False, "error": self._error_red(e)}
 
-            return {"success": False, "error": f"Error inesperado: {str(e)}"}
+    async def stream_completion(self, messages_list, config=None):
+        """
+        Generador asíncrono de eventos:
+          {"tipo": "token", "content": "..."}  por cada fragmento recibido
+          {"tipo": "fin", "success": bool, ...} al terminar, con el mismo formato
+          de `get_completion` (content completo, request_id y usage, o error).
+        Nunca lanza excepciones de red: los fallos llegan en el evento "fin".
+        """
+        api_key = getattr(settings, "DEEPSEEK_API_KEY", None)
+        if not api_key:
+            yield {
+                "tipo": "fin",
+                "success": False,
+                "error": "Error de configuración: DEEPSEEK_API_KEY no definida en settings.py"
+            }
+            return
 
+        payload = self._payload(messages_list, config, stream=True)
+        # El último fragmento trae el consumo de tokens (para AIUsageLog)
+        payload["stream_options"] = {"include_usage": True}
 
+        try:
+            respuesta = await self._apost(payload, api_key, stream=True)
+        except CircuitoAbierto as e:
+            yield {"tipo": "fin", "success": False, "error": str(e)}
+            return
+        except Exception as e:
+            yield {"tipo": "fin", "success": False, "error": self._error_red(e)}
+            return
 
+        partes = []
+        usage_data = {}
+        request_id = "unknown_request_id"
+        completo = False
+        try:
+            if respuesta.status_code != 200:
+                await respuesta.aread()
+                yield {"tipo": "fin", "success": False, "error": self._error_http(respuesta)}
+                return
+
+            async for dato in _datos_sse(respuesta.aiter_lines()):
+                if dato.strip() == "[DONE]":
+                    completo = True
+                    break
+                try:
+                    fragmento = json.loads(dato)
+                except ValueError:
+                    continue
+                request_id = fragmento.get("id") or request_id
+                if fragmento.get("usage"):
+                    usage_data = fragmento["usage"]
+                for opcion in fragmento.get("choices") or []:
+                    texto = (opcion.get("delta") or {}).get("content")
+                    if texto:
+                        partes.append(texto)
+                        yield {"tipo": "token", "content": texto}
+        except Exception as e:
+            # El proveedor cortó a mitad de respuesta: cuenta como fallo del upstream
+            if isinstance(e, httpx.TransportError):
+                self.circuito.registrar_fallo()
+            yield {"tipo": "fin", "success": False, "content": "".join(partes), "error": self._error_red(e)}
+            return
+        finally:
+            await respuesta.aclose()
+
+        if not completo:
+            yield {"tipo": "fin", "success": False, "content": "".join(partes),
+                   "error": "El stream de DeepSeek terminó sin [DONE] (respuesta incompleta)."}
+            return
+
+        yield {
+            "tipo": "fin",
+            "success": True,
+            "content": "".join(partes),
+            "request_id": request_id,
+            "usage": {
+                "prompt_tokens": usage_data.get("prompt_tokens", 0),
+                "completion_tokens": usage_data.get("completion_tokens", 0),
+                "total_tokens": usage_data.get("total_tokens", 0)
+            }
+        }
 
 
 # INSTANCIA GLOBAL
-
-deepseek_client = DeepSeekClient()
\ No newline at end of file
+deepseek_client = DeepSeekClient()
@@ -1,7 +1,9 @@
 # tasks/ai/orchestrator.py
 
+import asyncio
 import logging
 import json
+from channels.db import database_sync_to_async
 from django.utils import timezone
 from tasks.models import AIUsageLog
 
@@ -14,6 +16,7 @@ from .prompts.prompt_factory import prompt_factory
 
 from .cache import ai_cache
 from .deepseek_client import deepseek_client
+from .single_flight import ai_single_flight
 from .constants import ACCION_ANALISIS_CONVIVENCIA, MODEL_NAME
 
 logger = logging.getLogger(__name__)
@@ -32,6 +35,112 @@ class AIOrchestrator:
         Punto único de entrada para todas las solicitudes de IA.
         Acepta 'context_override' en kwargs para saltar la construcción automática.
         """
+        plan, respuesta = self._preparar(user, action_type, user_query, kwargs)
+        if respuesta is not None:
+            return respuesta
+
+        try:
+            # ---------------------------------------------------------
+            # 6. CLIENTE IA (DeepSeek API Call)
+            # ---------------------------------------------------------
+            # Peticiones idénticas en vuelo comparten una sola llamada (misma huella)
+            api_result, compartido = ai_single_flight.ejecutar(
+                plan["context_hash"],
+                lambda: deepseek_client.get_completion(
+                    messages_list=plan["messages"],
+                    config=plan["ai_config"]
+                )
+            )
+            return self._finalizar(plan, api_result, compartido)
+
+        except Exception as e:
+            return self._fallo_interno(plan["log_id"], e)
+
+    async def aprocess_request(self, user, action_type, user_query=None, **kwargs):
+        """
+        Versión asíncrona de `process_request` (mismo retorno), para consumers
+        y vistas async bajo Daphne. Solo los tramos con ORM (gatekeeper,
+        contexto, caché, cierre del ticket) saltan a un hilo; la llamada a
+        DeepSeek se espera en el event loop sin ocupar el pool de sync_to_async.
+        """
+        plan, respuesta = await database_sync_to_async(self._preparar)(
+            user, action_type, user_query, kwargs
+        )
+        if respuesta is not None:
+            return respuesta
+
+        try:
+            api_result, compartido = await ai_single_flight.aejecutar(
+                plan["context_hash"],
+                lambda: deepseek_client.aget_completion(
+                    messages_list=plan["messages"],
+                    config=plan["ai_config"]
+                )
+            )
+            return await database_sync_to_async(self._finalizar)(plan, api_result, compartido)
+
+        except asyncio.CancelledError:
+            await asyncio.shield(database_sync_to_async(self._cerrar_ticket)(
+                log_id=plan["log_id"],
+                exitoso=False,
+                error="Solicitud cancelada por el cliente.",
+                context_hash=plan["context_hash"]
+            ))
+            raise
+        except Exception as e:
+            return await database_sync_to_async(self._fallo_interno)(plan["log_id"], e)
+
+    async def process_request_stream(self, user, action_type, user_query=None, **kwargs):
+        """
+        Variante en streaming de `process_request` (generador asíncrono).
+
+        Emite {"tipo": "token", "content": ...} a medida que DeepSeek genera y
+        cierra siempre con {"tipo": "fin", "respuesta": {...}}, donde `respuesta`
+        tiene el mismo formato que `process_request`. Gatekeeper, contexto,
+        caché y prompt corren en un hilo (ORM); la espera del LLM no ocupa
+        ninguno. El AIUsageLog se cierra cuando termina el stream.
+        """
+        plan, respuesta = await database_sync_to_async(self._preparar)(
+            user, action_type, user_query, kwargs
+        )
+        if respuesta is not None:
+            # Política, error de datos o acierto de caché: todo llega de una vez
+            yield {"tipo": "fin", "respuesta": respuesta}
+            return
+
+        api_result = None
+        partes = []
+        try:
+            async for evento in deepseek_client.stream_completion(plan["messages"], plan["ai_config"]):
+                if evento["tipo"] == "token":
+                    partes.append(evento["content"])
+                    yield evento
+                else:
+                    api_result = evento
+            respuesta = await database_sync_to_async(self._finalizar)(plan, api_result)
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # El estudiante se desconectó a mitad de respuesta: se audita lo generado
+            await asyncio.shield(database_sync_to_async(self._cerrar_ticket)(
+                log_id=plan["log_id"],
+                exitoso=False,
+                response_content="".join(partes),
+                error="Stream cancelado por el cliente.",
+                context_hash=plan["context_hash"],
+                metadata_extra={"source": "API", "model": MODEL_NAME}
+            ))
+            raise
+        except Exception as e:
+            respuesta = await database_sync_to_async(self._fallo_interno)(plan["log_id"], e)
+
+        yield {"tipo": "fin", "respuesta": respuesta}
+
+    def _preparar(self, user, action_type, user_query, kwargs):
+        """
+        Pasos 1-5 (gatekeeper, contexto, caché y prompt).
+        Retorna (plan, None) si hay que llamar a la IA, o (None, respuesta)
+        si la petición ya quedó resuelta (política, error de datos, caché).
+        """
         # ---------------------------------------------------------
         # 1. GATEKEEPER — PERMISOS + TICKET
         # ---------------------------------------------------------
@@ -40,7 +149,7 @@ class AIOrchestrator:
         log_id = gate.get("audit_log_id")
 
         if not gate.get("allowed"):
-            return {
+            return None, {
                 "success": False,
                 "content": gate.get("message"),
                 "source": "POLICY",
@@ -60,6 +169,10 @@ class AIOrchestrator:
             # [NUEVO] Extraemos override de contexto (Viene desde views.py)
             context_override = kwargs.pop('context_override', None)
 
+            # usar_cache=False fuerza una respuesta nueva (botones "regenerar")
+            usar_cache = kwargs.pop('usar_cache', True)
+            rol = (gate.get("meta") or {}).get("rol", "")
+
             # ---------------------------------------------------------
             # 3. CONTEXT BUILDER (Extracción de datos SQL)
             # ---------------------------------------------------------
@@ -81,7 +194,7 @@ class AIOrchestrator:
                     exitoso=False,
                     error=contexto_json.get("error")
                 )
-                return {
+                return None, {
                     "success": False, 
                     "content": f"Error de datos: {contexto_json.get('error')}", 
                     "source": "DATA_ERROR"
@@ -92,14 +205,33 @@ class AIOrchestrator:
             if user_query:
                 contexto_json['user_query_actual'] = user_query
 
+            # Configuración dinámica de la IA
+            ai_config = {
+                "temperature": 0.7, # Default
+                "max_tokens": 2000 # Aumentado para soportar reportes largos
+            }
+            
+            if action_type == ACCION_ANALISIS_CONVIVENCIA:
+                ai_config["temperature"] = 0.2 # Más determinista
+            
+            # Sobrescribir si vienen parámetros específicos en kwargs
+            if "temperature" in kwargs:
+                ai_config["temperature"] = float(kwargs.pop("temperature"))
+
             # ---------------------------------------------------------
-            # 4. CACHE SEMÁNTICO (CONTROLADO)
+            # 4. CACHE SEMÁNTICO (AIRespuestaCache, TTL por acción)
             # ---------------------------------------------------------
-            # Generamos la huella digital del contexto
-            current_hash = ai_cache.calculate_hash(contexto_json)
+            # Huella: acción + rol + contexto + lo que también cambia la respuesta
+            current_hash = ai_cache.calculate_hash(
+                contexto_json,
+                accion=action_type,
+                rol=rol,
+                extra={"historial": historial_chat, "config": ai_config}
+            )
 
-            # 🔴 POLÍTICA "SIEMPRE FRESCO": Ignoramos caché de lectura para asegurar datos en tiempo real
-            cache_result = None 
+            cache_result = None
+            if usar_cache and ai_cache.ttl_horas(action_type):
+                cache_result = ai_cache.get_cached_response(action_type, current_hash)
 
             if cache_result:
                 self._cerrar_ticket(
@@ -112,10 +244,11 @@ class AIOrchestrator:
                     metadata_extra={
                         "source": "CACHE", 
                         "ahorro": True,
+                        "tokens_ahorrados": cache_result.get("tokens_ahorrados"),
                         "cache_ref_date": str(cache_result.get("fecha"))
                     }
                 )
-                return {
+                return None, {
                     "success": True,
                     "content": cache_result.get("content"),
                     "source": "CACHE",
@@ -136,76 +269,89 @@ class AIOrchestrator:
                 historial=historial_chat # <--- CONEXIÓN DE MEMORIA APLICADA
             )
 
-            # Configuración dinámica de la IA
-            ai_config = {
-                "temperature": 0.7, # Default
-                "max_tokens": 2000 # Aumentado para soportar reportes largos
-            }
-            
-            if action_type == ACCION_ANALISIS_CONVIVENCIA:
-                ai_config["temperature"] = 0.2 # Más determinista
-            
-            # Sobrescribir si vienen parámetros específicos en kwargs
-            if "temperature" in kwargs:
-                ai_config["temperature"] = float(kwargs.pop("temperature"))
-
-            # ---------------------------------------------------------
-            # 6. CLIENTE IA (DeepSeek API Call)
-            # ---------------------------------------------------------
-            api_result = deepseek_client.get_completion(
-                messages_list=messages,
-                config=ai_config
-            )
-
-            usage = api_result.get("usage", {})
+        except Exception as e:
+            return None, self._fallo_interno(log_id, e)
 
-            # ---------------------------------------------------------
-            # 7. CIERRE DE TICKET (Auditoría final)
-            # ---------------------------------------------------------
-            self._cerrar_ticket(
-                log_id=log_id,
-                exitoso=api_result.get("success", False),
-                response_content=api_result.get("content"),
-                error=api_result.get("error"),
-                context_hash=current_hash, 
-                tokens_in=usage.get("prompt_tokens", 0),
-                tokens_out=usage.get("completion_tokens", 0),
-                metadata_extra={
-                    "request_id": api_result.get("request_id"),
-                    "source": "API",
-                    "target_user_id": target_user.id if hasattr(target_user, 'id') else None,
-                    "model": MODEL_NAME
-                }
-            )
+        return {
+            "log_id": log_id,
+            "action_type": action_type,
+            "rol": rol,
+            "target_user": target_user,
+            "context_hash": current_hash,
+            "ai_config": ai_config,
+            "messages": messages,
+        }, None
 
-            if not api_result.get("success"):
-                return {
-                    "success": False,
-                    "content": "Servicio de IA temporalmente no disponible.",
-                    "source": "API_ERROR",
-                    "debug": api_result.get("error")
-                }
+    def _finalizar(self, plan, api_result, compartido=False):
+        """
+        Pasos 7-8: cierra el ticket, guarda en caché y arma la respuesta.
+        compartido=True: el resultado lo pagó otra petición idéntica en vuelo
+        (el ticket queda sin tokens y la caché ya la escribió el líder).
+        """
+        api_result = api_result or {"success": False, "error": "La IA no entregó respuesta."}
+        usage = api_result.get("usage", {})
+        target_user = plan["target_user"]
+        tokens_ticket = {} if compartido else usage
 
-            return {
-                "success": True,
-                "content": api_result.get("content"),
-                "source": "IA",
-                "meta": usage
+        # ---------------------------------------------------------
+        # 7. CIERRE DE TICKET (Auditoría final)
+        # ---------------------------------------------------------
+        self._cerrar_ticket(
+            log_id=plan["log_id"],
+            exitoso=api_result.get("success", False),
+            response_content=api_result.get("content"),
+            error=api_result.get("error"),
+            context_hash=plan["context_hash"], 
+            tokens_in=tokens_ticket.get("prompt_tokens", 0),
+            tokens_out=tokens_ticket.get("completion_tokens", 0),
+            metadata_extra={
+                "request_id": api_result.get("request_id"),
+                "source": "COALESCED" if compartido else "API",
+                "target_user_id": target_user.id if hasattr(target_user, 'id') else None,
+                "model": MODEL_NAME
             }
+        )
 
-        except Exception as e:
-            logger.error("CRASH ORCHESTRATOR", exc_info=True)
-            self._cerrar_ticket(
-                log_id=log_id,
-                exitoso=False,
-                error=f"Error Crítico: {str(e)}"
-            )
+        if not api_result.get("success"):
             return {
                 "success": False,
-                "content": "Error interno en el motor de IA institucional.",
-                "source": "INTERNAL_ERROR"
+                "content": "Servicio de IA temporalmente no disponible.",
+                "source": "API_ERROR",
+                "debug": api_result.get("error")
             }
 
+        # ---------------------------------------------------------
+        # 8. La próxima petición idéntica se sirve desde la caché
+        # ---------------------------------------------------------
+        if not compartido:
+            ai_cache.guardar(
+                plan["action_type"], plan["context_hash"], api_result.get("content"),
+                rol=plan["rol"],
+                sujeto=target_user,
+                tokens_in=usage.get("prompt_tokens", 0),
+                tokens_out=usage.get("completion_tokens", 0)
+            )
+
+        return {
+            "success": True,
+            "content": api_result.get("content"),
+            "source": "IA",
+            "meta": usage
+        }
+
+    def _fallo_interno(self, log_id, e):
+        logger.error("CRASH ORCHESTRATOR", exc_info=e)
+        self._cerrar_ticket(
+            log_id=log_id,
+            exitoso=False,
+            error=f"Error Crítico: {str(e)}"
+        )
+        return {
+            "success": False,
+            "content": "Error interno en el motor de IA institucional.",
+            "source": "INTERNAL_ERROR"
+        }
+
     def _cerrar_ticket(self, log_id, exitoso, response_content=None, error=None, 
                        context_hash=None, tokens_in=0, tokens_out=0, metadata_extra=None):
         """
@@ -0,0 +1,341 @@
+# tasks/ai/single_flight.py
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FuturoTimeout
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# AI_SINGLE_FLIGHT = False desactiva la coalescencia (cada petición llama a DeepSeek)
+AI_SINGLE_FLIGHT = getattr(settings, 'AI_SINGLE_FLIGHT', True)
+# Lo máximo que un seguidor espera al líder; también vence locks de líderes caídos
+ESPERA_MAXIMA = getattr(
+    settings, 'AI_SINGLE_FLIGHT_ESPERA',
+    getattr(settings, 'DEEPSEEK_TIMEOUT_LECTURA', 120) + 60
+)
+# Segundos que el resultado publicado queda disponible para otros procesos
+TTL_RESULTADO = 60
+# Cada cuánto revisa un seguidor de otro proceso si el líder ya publicó
+INTERVALO_SONDEO = 0.25
+
+
+class _BackendCache:
+    """Entre procesos vía la caché de Django (Redis cuando REDIS_URL está configurado)."""
+
+    PREFIJO = 'ai_vuelo:v1'
+
+    def adquirir(self, clave):
+        token = uuid.uuid4().hex
+        # add() es atómico en Redis (SET NX): solo un proceso gana el vuelo
+        if cache.add(f'{self.PREFIJO}:lock:{clave}', token, timeout=ESPERA_MAXIMA):
+            return token
+        return None
+
+    def titular(self, clave):
+        return cache.get(f'{self.PREFIJO}:lock:{clave}')
+
+    def publicar(self, clave, token, resultado):
+        cache.set(f'{self.PREFIJO}:res:{clave}:{token}', resultado, timeout=TTL_RESULTADO)
+
+    def leer(self, clave, token):
+        return cache.get(f'{self.PREFIJO}:res:{clave}:{token}')
+
+    def liberar(self, clave, token):
+        llave = f'{self.PREFIJO}:lock:{clave}'
+        if cache.get(llave) == token:
+            cache.delete(llave)
+
+
+class _BackendArchivos:
+    """Entre procesos con archivos de lock (ejecución local sin Redis)."""
+
+    def __init__(self, directorio=None):
+        self.directorio = directorio or getattr(
+            settings, 'AI_SINGLE_FLIGHT_DIR', os.path.join(tempfile.gettempdir(), 'ai_single_flight')
+        )
+
+    def _ruta(self, nombre):
+        # Los resultados incluyen respuestas de la IA: solo el usuario del proceso los lee
+        os.makedirs(self.directorio, mode=0o700, exist_ok=True)
+        return os.path.join(self.directorio, nombre)
+
+    def adquirir(self, clave):
+        ruta = self._ruta(f'{clave}.lock')
+        token = uuid.uuid4().hex
+        try:
+            fd = os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # Lock de un líder que murió sin liberarlo: se descarta al vencer
+            try:
+                if time.time() - os.path.getmtime(ruta) > ESPERA_MAXIMA:
+                    os.remove(ruta)
+            except OSError:
+                pass
+            return None
+        with os.fdopen(fd, 'w') as f:
+            f.write(token)
+        self._purgar_resultados()
+        return token
+
+    def titular(self, clave):
+        try:
+            with open(self._ruta(f'{clave}.lock')) as f:
+                return f.read() or None
+        except OSError:
+            return None
+
+    def publicar(self, clave, token, resultado):
+        ruta = self._ruta(f'{clave}.{token}.json')
+        temporal = f'{ruta}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, ensure_ascii=False, default=str)
+        # Reemplazo atómico: un seguidor nunca lee un JSON a medias
+        os.replace(temporal, ruta)
+
+    def leer(self, clave, token):
+        try:
+            with open(self._ruta(f'{clave}.{token}.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def liberar(self, clave, token):
+        if self.titular(clave) == token:
+            try:
+                os.remove(self._ruta(f'{clave}.lock'))
+            except OSError:
+                pass
+
+    def _purgar_resultados(self):
+        limite = time.time() - TTL_RESULTADO
+        try:
+            with os.scandir(self.directorio) as entradas:
+                for entrada in entradas:
+                    if entrada.name.endswith('.json') and entrada.stat().st_mtime < limite:
+                        os.remove(entrada.path)
+        except OSError:
+            pass
+
+
+class SingleFlight:
+    """
+    COALESCENCIA DE PETICIONES IDÉNTICAS EN VUELO.
+
+    La primera petición con una huella (el hash de PedagogicCache) llama a
+    DeepSeek; las idénticas que llegan mientras tanto esperan y reciben el
+    mismo resultado en lugar de pagar otra llamada.
+
+    - En el proceso: un Future por huella (sirve a hilos y a corrutinas).
+    - Entre procesos: lock + resultado publicado en la caché de Django cuando
+      hay Redis (REDIS_URL, el mismo de la capa de canales); si no, archivos de lock.
+
+    `ejecutar` / `aejecutar` retornan (resultado, compartido); compartido=True
+    indica que el resultado lo pagó otra petición.
+    """
+
+    def __init__(self, backend=None):
+        self._lock = threading.Lock()
+        self._vuelos = {}
+        self._backend_fijo = backend
+
+    def _backend(self):
+        if self._backend_fijo is not None:
+            return self._backend_fijo
+        if getattr(settings, 'REDIS_URL', None):
+            return _BackendCache()
+        return _BackendArchivos()
+
+    def _registrar(self, clave):
+        """(futuro, es_lider) para esta huella dentro del proceso."""
+        with self._lock:
+            futuro = self._vuelos.get(clave)
+            if futuro is not None:
+                return futuro, False
+            futuro = Future()
+            self._vuelos[clave] = futuro
+            return futuro, True
+
+    def _terminar(self, clave, futuro, resultado=None, error=None):
+        with self._lock:
+            self._vuelos.pop(clave, None)
+        if isinstance(error, Exception):
+            futuro.set_exception(error)
+        else:
+            # Éxito, o líder cancelado (None): los seguidores harán su propia llamada
+            futuro.set_result(resultado)
+
+    # ------------------------------------------------------------------
+    # SÍNCRONO
+    # ------------------------------------------------------------------
+    def ejecutar(self, clave, funcion):
+        if not AI_SINGLE_FLIGHT or not clave:
+            return funcion(), False
+
+        futuro, es_lider = self._registrar(clave)
+        if not es_lider:
+            try:
+                resultado = futuro.result(timeout=ESPERA_MAXIMA)
+            except FuturoTimeout:
+                logger.warning(f"⚠️ Single-flight: el líder de {clave[:12]} no respondió a tiempo.")
+                resultado = None
+            if resultado is None:
+                return funcion(), False
+            return dict(resultado), True
+
+        try:
+            resultado, compartido = self._entre_procesos(clave, funcion)
+        except BaseException as e:
+            self._terminar(clave, futuro, error=e)
+            raise
+        self._terminar(clave, futuro, resultado)
+        return resultado, compartido
+
+    def _entre_procesos(self, clave, funcion):
+        try:
+            backend = self._backend()
+        except Exception as e:
+            logger.warning(f"⚠️ Single-flight sin backend entre procesos: {e}")
+            return funcion(), False
+
+        limite = time.monotonic() + ESPERA_MAXIMA
+        visto = None
+        while time.monotonic() < limite:
+            token = self._adquirir(backend, clave)
+            if token is not None:
+                return self._como_lider(backend, clave, token, funcion), False
+            # Otro proceso tiene el vuelo: esperamos su resultado publicado
+            resultado, visto = self._sondear(backend, clave, visto)
+            if resultado is not None:
+                return resultado, True
+            time.sleep(INTERVALO_SONDEO)
+            resultado = self._leer(backend, clave, visto)
+            if resultado is not None:
+                return resultado, True
+        return funcion(), False
+
+    # ------------------------------------------------------------------
+    # ASÍNCRONO (la espera no ocupa un hilo)
+    # ------------------------------------------------------------------
+    async def aejecutar(self, clave, corrutina):
+        """`corrutina`: función sin argumentos que retorna un awaitable."""
+        if not AI_SINGLE_FLIGHT or not clave:
+            return await corrutina(), False
+
+        futuro, es_lider = self._registrar(clave)
+        if not es_lider:
+            try:
+                # shield: si este seguidor se cancela, el Future del líder sigue intacto
+                resultado = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(futuro)), ESPERA_MAXIMA)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Single-flight: el líder de {clave[:12]} no respondió a tiempo.")
+                resultado = None
+            if resultado is None:
+                return await corrutina(), False
+            return dict(resultado), True
+
+        try:
+            resultado, compartido = await self._aentre_procesos(clave, corrutina)
+        except BaseException as e:
+            self._terminar(clave, futuro, error=e)
+            raise
+        self._terminar(clave, futuro, resultado)
+        return resultado, compartido
+
+    async def _aentre_procesos(self, clave, corrutina):
+        try:
+            backend = self._backend()
+        except Exception as e:
+            logger.warning(f"⚠️ Single-flight sin backend entre procesos: {e}")
+            return await corrutina(), False
+
+        limite = time.monotonic() + ESPERA_MAXIMA
+        visto = None
+        while time.monotonic() < limite:
+            token = self._adquirir(backend, clave)
+            if token is not None:
+                try:
+                    resultado = await corrutina()
+                    self._publicar(backend, clave, token, resultado)
+                    return resultado, False
+                finally:
+                    self._liberar(backend, clave, token)
+            resultado, visto = self._sondear(backend, clave, visto)
+            if resultado is not None:
+                return resultado, True
+            await asyncio.sleep(INTERVALO_SONDEO)
+            resultado = self._leer(backend, clave, visto)
+            if resultado is not None:
+                return resultado, True
+        return await corrutina(), False
+
+    # ------------------------------------------------------------------
+    # PASOS COMUNES (un backend caído nunca bloquea la petición)
+    # ------------------------------------------------------------------
+    def _como_lider(self, backend, clave, token, funcion):
+        try:
+            resultado = funcion()
+            self._publicar(backend, clave, token, resultado)
+            return resultado
+        finally:
+            self._liberar(backend, clave, token)
+
+    @staticmethod
+    def _adquirir(backend, clave):
+        try:
+            return backend.adquirir(clave)
+        except Exception as e:
+            logger.warning(f"⚠️ Single-flight: no se pudo tomar el lock ({e}); se llama directo.")
+            return ''
+
+    @staticmethod
+    def _publicar(backend, clave, token, resultado):
+        if not token:
+            return
+        try:
+            backend.publicar(clave, token, resultado)
+        except Exception as e:
+            logger.warning(f"⚠️ Single-flight: no se pudo publicar el resultado: {e}")
+
+    @staticmethod
+    def _liberar(backend, clave, token):
+        if not token:
+            return
+        try:
+            backend.liberar(clave, token)
+        except Exception as e:
+            logger.warning(f"⚠️ Single-flight: no se pudo liberar el lock: {e}")
+
+    @staticmethod
+    def _leer(backend, clave, token):
+        if not token:
+            return None
+        try:
+            return backend.leer(clave, token)
+        except Exception:
+            return None
+
+    @classmethod
+    def _sondear(cls, backend, clave, visto):
+        """
+        (resultado, token_visto). Se recuerda el token del líder: cuando
+        libera el lock su resultado sigue publicado bajo ese token, y si
+        terminó sin publicar, la siguiente vuelta compite por el lock.
+        """
+        try:
+            visto = backend.titular(clave) or visto
+        except Exception:
+            pass
+        return cls._leer(backend, clave, visto), visto
+
+
+# Instancia global para ser utilizada en el orquestador
+ai_single_flight = SingleFlight()
@@ -1,10 +1,30 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 class TasksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tasks'
 
-    #def ready(self):
+    def ready(self):
         # Importar las señales cuando la app esté lista
         #import tasks.signals
-    
\ No newline at end of file
+
+        # Invalidación automática del resumen académico materializado
+        import tasks.services.academic_summary  # noqa: F401
+
+        # Invalidación automática de la caché de PDFs (boletines)
+        import tasks.services.pdf_cache  # noqa: F401
+
+        # Invalidación automática de la caché de respuestas de IA
+        import tasks.ai.cache  # noqa: F401
+
+        # Invalidación automática del análisis IA precalculado de los boletines
+        import tasks.services.boletin_ia  # noqa: F401
+
+        # Programador opcional de snapshots de riesgo (desactivado por defecto),
+        # solo en el proceso web: no en migrate, test, shell ni comandos de cron
+        intervalo = getattr(settings, 'RISK_SNAPSHOT_INTERVALO_MIN', 0)
+        if intervalo:
+            from tasks.services.risk_snapshot import ProgramadorSnapshotRiesgo, es_proceso_servidor
+            if es_proceso_servidor():
+                ProgramadorSnapshotRiesgo.iniciar(intervalo)
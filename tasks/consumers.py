@@ -193,6 +193,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'tipo_alerta': event.get('tipo_alerta', 'info')
         }))# tasks/consumers.py (COMPLETO Y FINAL)
 
+import asyncio
 import json
 from datetime import datetime
 from channels.generic.websocket import AsyncWebsocketConsumer
@@ -364,6 +365,16 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'tipo_alerta': event.get('tipo_alerta', 'info')
         }))
 
+    async def pdf_progreso(self, event):
+        """Avance de un lote de PDFs (PDFJobService.reportar_progreso)"""
+        await self.send(text_data=json.dumps({
+            'type': 'pdf_progress',
+            'trabajo_id': event['trabajo_id'],
+            'tipo': event.get('tipo'),
+            'hechos': event['hechos'],
+            'total': event['total']
+        }))
+
 
 # ===================================================================
 # 🤖 NUEVO: CHAT SOCRÁTICO CON IA (FASE 7)
@@ -373,9 +384,16 @@ class SocraticAIConsumer(AsyncWebsocketConsumer):
     """
     Canal privado 1 a 1 entre el Estudiante y el Orquestador IA.
     No requiere grupos porque es una conversación personal.
+
+    La respuesta llega en streaming: un mensaje 'ai_token' por fragmento y,
+    al final, el 'ai_response' completo (o 'error'). Con {"stream": false}
+    solo llega el 'ai_response'. En ambos casos se usa el orquestador
+    asíncrono: ninguna respuesta ocupa un hilo mientras DeepSeek genera.
+    El cliente (y el protocolo completo) está en tasks/ai_chat.html.
     """
     async def connect(self):
         self.user = self.scope['user']
+        self.tarea_ia = None
 
         # 1. Seguridad: Solo usuarios autenticados
         if self.user.is_anonymous:
@@ -391,11 +409,15 @@ class SocraticAIConsumer(AsyncWebsocketConsumer):
         }))
 
     async def disconnect(self, close_code):
-        pass # No necesitamos limpiar nada especial aquí
+        # Si se va a mitad de respuesta, cortamos el stream (el orquestador audita lo generado)
+        if getattr(self, 'tarea_ia', None) and not self.tarea_ia.done():
+            self.tarea_ia.cancel()
 
     async def receive(self, text_data):
         """
-        Recibe la pregunta del estudiante, llama al Orquestador y devuelve la respuesta.
+        Recibe la pregunta del estudiante y lanza la respuesta en streaming.
+        Corre como tarea aparte para que el consumer siga atendiendo el
+        socket (p. ej. la desconexión) mientras la IA genera.
         """
         try:
             data = json.loads(text_data)
@@ -405,49 +427,84 @@ class SocraticAIConsumer(AsyncWebsocketConsumer):
             if not user_message:
                 return
 
+            if self.tarea_ia and not self.tarea_ia.done():
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'code': 'BUSY',
+                    'message': 'Espera a que termine la respuesta anterior.'
+                }))
+                return
+
             # Indicador de "Pensando..."
             await self.send(text_data=json.dumps({'type': 'typing', 'status': True}))
 
-            # 2. LLAMADA AL ORQUESTADOR (Es síncrono, así que lo envolvemos)
-            # Esto dispara: RateLimit -> Contexto -> Prompt -> DeepSeek -> Log
-            response = await self.call_ai_orchestrator(
-                user=self.user,
-                query=user_message,
-                materia=subject_context
-            )
-
-            # 3. RESPUESTA AL CLIENTE
-            if response['success']:
-                await self.send(text_data=json.dumps({
-                    'type': 'ai_response',
-                    'message': response['content'],
-                    'tokens': response.get('meta', {}).get('total_tokens', 0)
-                }))
+            if data.get('stream', True):
+                respuesta = self.responder_en_streaming(user_message, subject_context)
             else:
-                # Manejo de Errores (Límite alcanzado, Política, Error API)
-                error_type = response.get('source', 'ERROR')
-                await self.send(text_data=json.dumps({
-                    'type': 'error',
-                    'code': error_type,
-                    'message': response['content']
-                }))
+                respuesta = self.responder_completo(user_message, subject_context)
+            self.tarea_ia = asyncio.create_task(respuesta)
 
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({'type': 'error', 'message': 'Formato inválido'}))
         except Exception as e:
             await self.send(text_data=json.dumps({'type': 'error', 'message': f'Error interno: {str(e)}'}))
 
-    # --- PUENTE SÍNCRONO <-> ASÍNCRONO ---
-    
-    @database_sync_to_async
-    def call_ai_orchestrator(self, user, query, materia):
+    async def responder_en_streaming(self, query, materia):
         """
-        Envuelve la llamada al orquestador en un hilo seguro para no bloquear WebSockets.
+        2. LLAMADA AL ORQUESTADOR EN STREAMING
+        Esto dispara: RateLimit -> Contexto -> Prompt -> DeepSeek (SSE) -> Log
         """
-        return ai_orchestrator.process_request(
-            user=user,
-            action_type=ACCION_CHAT_SOCRATICO,
-            user_query=query,
-            materia_actual=materia,
-            temperature=0.6 # Creatividad media para chat
-        )
\ No newline at end of file
+        try:
+            async for evento in ai_orchestrator.process_request_stream(
+                user=self.user,
+                action_type=ACCION_CHAT_SOCRATICO,
+                user_query=query,
+                materia_actual=materia,
+                temperature=0.6 # Creatividad media para chat
+            ):
+                if evento['tipo'] == 'token':
+                    await self.send(text_data=json.dumps({
+                        'type': 'ai_token',
+                        'token': evento['content']
+                    }))
+                    continue
+
+                # 3. RESPUESTA FINAL AL CLIENTE (texto completo, ya auditado)
+                await self.enviar_respuesta(evento['respuesta'])
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self.send(text_data=json.dumps({'type': 'error', 'message': f'Error interno: {str(e)}'}))
+
+    async def responder_completo(self, query, materia):
+        """Misma llamada sin streaming: la respuesta llega de una sola vez."""
+        try:
+            response = await ai_orchestrator.aprocess_request(
+                user=self.user,
+                action_type=ACCION_CHAT_SOCRATICO,
+                user_query=query,
+                materia_actual=materia,
+                temperature=0.6 # Creatividad media para chat
+            )
+            await self.enviar_respuesta(response)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self.send(text_data=json.dumps({'type': 'error', 'message': f'Error interno: {str(e)}'}))
+
+    async def enviar_respuesta(self, response):
+        if response['success']:
+            await self.send(text_data=json.dumps({
+                'type': 'ai_response',
+                'message': response['content'],
+                'tokens': response.get('meta', {}).get('total_tokens', 0)
+            }))
+        else:
+            # Manejo de Errores (Límite alcanzado, Política, Error API)
+            error_type = response.get('source', 'ERROR')
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'code': error_type,
+                'message': response['content']
+            }))
@@ -0,0 +1,35 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from tasks.services.risk_snapshot import SnapshotRiesgoService
+
+
+class Command(BaseCommand):
+    help = 'Genera un snapshot de riesgo (académico, legal, ausentismo y costos IA) para el Command Center.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=int, default=0,
+                            help='Minutos entre ejecuciones. Si se indica, el comando queda en bucle.')
+        parser.add_argument('--purgar-dias', type=int, default=0,
+                            help='Elimina snapshots más antiguos que N días después de generar.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        intervalo = options['intervalo']
+        while True:
+            self._ejecutar(options['purgar_dias'])
+            if not intervalo:
+                break
+            time.sleep(intervalo * 60)
+
+    def _ejecutar(self, purgar_dias):
+        self.stdout.write(self.style.HTTP_INFO('🛡️ GENERANDO SNAPSHOT DE RIESGO'))
+        snapshot = SnapshotRiesgoService.generar()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Snapshot #{snapshot.id}: {snapshot.total_riesgo} en riesgo neto, '
+            f'{snapshot.riesgo_mitigado} mitigados ({snapshot.duracion_ms} ms)'
+        ))
+        if purgar_dias:
+            borrados = SnapshotRiesgoService.purgar(purgar_dias)
+            self.stdout.write(f"🧹 Snapshots purgados: {borrados}")
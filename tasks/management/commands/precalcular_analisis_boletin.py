@@ -0,0 +1,50 @@
+from typing import Any
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.services.boletin_batch import LoteBoletinesService
+from tasks.services.boletin_ia import AnalisisBoletinService
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Precalcula el análisis IA de los boletines (AIDocumento) del periodo activo, fuera del render del PDF.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--curso', type=int, help='Solo las matrículas activas de este curso (id).')
+        parser.add_argument('--grado', help='Solo las matrículas activas de este grado.')
+        parser.add_argument('--anio', help='Año escolar (con --grado).')
+        parser.add_argument('--usuario', help='Username a cuyo nombre se audita el uso de IA (por defecto, el primer superusuario).')
+        parser.add_argument('--forzar', action='store_true', help='Regenera aunque ya exista análisis en el periodo.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options['usuario']:
+            usuario = User.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = User.objects.filter(is_superuser=True).order_by('id').first()
+        if usuario is None:
+            raise CommandError('No se encontró el usuario que audita las llamadas a la IA.')
+
+        if options['curso']:
+            matriculas_ids = LoteBoletinesService.matriculas_de_curso(options['curso'])
+        elif options['grado']:
+            matriculas_ids = LoteBoletinesService.matriculas_de_grado(options['grado'], options['anio'])
+        else:
+            from tasks.models import Matricula
+            matriculas_ids = list(Matricula.objects.filter(activo=True).values_list('id', flat=True))
+
+        self.stdout.write(self.style.HTTP_INFO(f'🧠 ANÁLISIS IA DE BOLETINES: {len(matriculas_ids)} matrículas'))
+        try:
+            generados, omitidos, fallidos = AnalisisBoletinService.precalcular(
+                matriculas_ids, usuario, forzar=options['forzar'],
+                al_progresar=lambda hechos, total: self.stdout.write(f'   {hechos}/{total}', ending='\r')
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Generados: {generados} | ya existentes: {omitidos} | fallidos: {fallidos}'
+        ))
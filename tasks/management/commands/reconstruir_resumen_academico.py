@@ -0,0 +1,29 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from tasks.models import Curso
+from tasks.services.academic_summary import ResumenAcademicoService
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero la tabla ResumenAcademico (estudiante × curso × periodo).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--curso', type=int, help='Recalcula solo el curso indicado (sin borrar el resto).')
+        parser.add_argument('--incluir-inactivos', action='store_true', help='Incluye cursos inactivos en la reconstrucción total.')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        start_time = time.time()
+        self.stdout.write(self.style.HTTP_INFO('📊 RECONSTRUYENDO RESUMEN ACADÉMICO'))
+
+        if options.get('curso'):
+            curso = Curso.objects.get(id=options['curso'])
+            total = ResumenAcademicoService.recalcular(curso)
+        else:
+            total = ResumenAcademicoService.reconstruir_todo(solo_activos=not options['incluir_inactivos'])
+
+        duration = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f'✅ Filas escritas: {total}'))
+        self.stdout.write(f"⏱️ Tiempo total: {duration:.2f} segundos")
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 11:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0019_bovedaseguridad'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenAcademico',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('promedio', models.DecimalField(blank=True, decimal_places=2, max_digits=4, null=True)),
+                ('materias_evaluadas', models.PositiveIntegerField(default=0)),
+                ('materias_perdidas', models.PositiveIntegerField(default=0)),
+                ('clases_registradas', models.PositiveIntegerField(default=0)),
+                ('fallas', models.PositiveIntegerField(default=0)),
+                ('tardanzas', models.PositiveIntegerField(default=0)),
+                ('convivencia', models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('curso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_academicos', to='tasks.curso')),
+                ('estudiante', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_academicos', to=settings.AUTH_USER_MODEL)),
+                ('periodo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_academicos', to='tasks.periodo')),
+            ],
+            options={
+                'verbose_name': 'Resumen Académico',
+                'verbose_name_plural': 'Resúmenes Académicos',
+                'indexes': [models.Index(fields=['curso', 'periodo'], name='tasks_resum_curso_i_8aedba_idx')],
+                'unique_together': {('estudiante', 'curso', 'periodo')},
+            },
+        ),
+    ]
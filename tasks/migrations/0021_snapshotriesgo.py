@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0020_resumenacademico'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotRiesgo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('duracion_ms', models.PositiveIntegerField(default=0)),
+                ('ids_academico', models.JSONField(default=list)),
+                ('ids_legal', models.JSONField(default=list)),
+                ('ids_ausentismo', models.JSONField(default=list)),
+                ('ids_atendidos', models.JSONField(default=list)),
+                ('total_alumnos', models.PositiveIntegerField(default=0)),
+                ('conteo_academico', models.PositiveIntegerField(default=0)),
+                ('conteo_legal', models.PositiveIntegerField(default=0)),
+                ('conteo_ausentismo', models.PositiveIntegerField(default=0)),
+                ('total_riesgo', models.PositiveIntegerField(default=0)),
+                ('riesgo_mitigado', models.PositiveIntegerField(default=0)),
+                ('tasa_riesgo', models.DecimalField(decimal_places=1, default=0, max_digits=5)),
+                ('kpi_dinero', models.BigIntegerField(default=0)),
+                ('kpi_legal', models.BigIntegerField(default=0)),
+                ('tokens_entrada_mes', models.BigIntegerField(default=0)),
+                ('tokens_salida_mes', models.BigIntegerField(default=0)),
+                ('costo_ia_mes', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('generado_por', models.ForeignKey(blank=True, help_text='Vacío si lo generó el comando o el programador.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='snapshots_riesgo', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Snapshot de Riesgo',
+                'verbose_name_plural': 'Snapshots de Riesgo',
+                'ordering': ['-fecha'],
+                'get_latest_by': 'fecha',
+            },
+        ),
+    ]
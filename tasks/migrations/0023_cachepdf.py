@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 11:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0022_trabajopdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachePDF',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('huella', models.CharField(help_text='SHA-256 del contexto normalizado + plantilla.', max_length=64, unique=True)),
+                ('tipo', models.CharField(db_index=True, max_length=30)),
+                ('archivo', models.FileField(upload_to='pdf_cache/%Y/%m/')),
+                ('nombre_archivo', models.CharField(blank=True, max_length=255)),
+                ('tamano', models.PositiveIntegerField(default=0, help_text='Bytes (para el tope de la caché).')),
+                ('accesos', models.PositiveIntegerField(default=0)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('ultimo_acceso', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('matricula', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pdfs_cacheados', to='tasks.matricula')),
+            ],
+            options={
+                'verbose_name': 'PDF en Caché',
+                'verbose_name_plural': 'PDFs en Caché',
+                'ordering': ['-ultimo_acceso'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0023_cachepdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajopdf',
+            name='progreso_hechos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trabajopdf',
+            name='progreso_total',
+            field=models.PositiveIntegerField(default=0, help_text='Documentos del lote (0 = trabajo individual).'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0024_trabajopdf_progreso'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aidocumento',
+            name='tipo',
+            field=models.CharField(choices=[('reporte_pedagogico', 'Reporte Pedagógico Docente'), ('orientacion_estudiante', 'Plan de Mejora Estudiantil'), ('orientacion_acudiente', 'Orientación Familiar'), ('reporte_convivencia', 'Reporte de Convivencia'), ('reporte_institucional', 'Análisis Institucional (PEI)'), ('analisis_boletin', 'Análisis IA del Boletín')], max_length=50),
+        ),
+    ]
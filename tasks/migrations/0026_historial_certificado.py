@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0025_aidocumento_analisis_boletin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historialacademico',
+            name='archivo_certificado',
+            field=models.FileField(blank=True, help_text='Certificado de notas ya generado; se reutiliza en cada descarga.', null=True, upload_to='historiales/certificados/%Y/'),
+        ),
+        migrations.AddField(
+            model_name='historialacademico',
+            name='certificado_generado',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='historialacademico',
+            name='certificado_huella',
+            field=models.CharField(blank=True, help_text='Huella de los datos con que se generó el certificado (si cambian, se regenera).', max_length=64),
+        ),
+    ]
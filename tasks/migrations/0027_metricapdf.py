@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0026_historial_certificado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricaPDF',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plantilla', models.CharField(help_text="Plantilla HTML del documento ('' si no se indicó).", max_length=150)),
+                ('tiempo_contexto_ms', models.PositiveIntegerField(blank=True, help_text='Consultas y armado del contexto.', null=True)),
+                ('tiempo_plantilla_ms', models.PositiveIntegerField(blank=True, help_text='render_to_string.', null=True)),
+                ('tiempo_render_ms', models.PositiveIntegerField(help_text='WeasyPrint (layout + write_pdf) en el proceso del pool.')),
+                ('paginas', models.PositiveIntegerField(default=0)),
+                ('tamano', models.PositiveIntegerField(default=0, help_text='Bytes del PDF.')),
+                ('creado', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Métrica de PDF',
+                'verbose_name_plural': 'Métricas de PDF',
+                'ordering': ['-creado'],
+                'indexes': [models.Index(fields=['plantilla', 'creado'], name='tasks_metri_plantil_5be164_idx')],
+            },
+        ),
+    ]
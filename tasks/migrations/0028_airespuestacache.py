@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 11:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0027_metricapdf'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIRespuestaCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('huella', models.CharField(help_text='SHA-256 de acción, rol, contexto y versión del prompt.', max_length=64, unique=True)),
+                ('accion', models.CharField(db_index=True, max_length=50)),
+                ('rol', models.CharField(blank=True, max_length=50)),
+                ('contenido', models.TextField()),
+                ('tokens_entrada', models.IntegerField(default=0, help_text='Tokens que costó la respuesta original.')),
+                ('tokens_salida', models.IntegerField(default=0)),
+                ('aciertos', models.PositiveIntegerField(default=0, help_text='Veces servida sin llamar a la IA.')),
+                ('ultimo_acierto', models.DateTimeField(blank=True, null=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('expira', models.DateTimeField(db_index=True)),
+                ('sujeto', models.ForeignKey(blank=True, help_text='Usuario analizado: sus cambios académicos invalidan la entrada.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ai_respuestas_cache', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Respuesta IA en Caché',
+                'verbose_name_plural': 'Respuestas IA en Caché',
+                'ordering': ['-creado'],
+            },
+        ),
+    ]
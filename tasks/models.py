@@ -47,6 +47,7 @@ from .ai.constants import (
     DOC_ORIENTACION_ACUDIENTE,
     DOC_REPORTE_CONVIVENCIA,
     DOC_REPORTE_INSTITUCIONAL,
+    DOC_ANALISIS_BOLETIN,
     DOCUMENTOS_IA_PERMITIDOS  # Útil si necesitas validar listas
 )
 
@@ -1285,6 +1286,40 @@ class AIUsageLog(models.Model):
         return self.tokens_entrada + self.tokens_salida
 
 
+class AIRespuestaCache(models.Model):
+    """
+    Respuesta de la IA reutilizable (ver `tasks.ai.cache.PedagogicCache`).
+    La huella resume acción + rol + contexto normalizado + versión del prompt:
+    una petición idéntica dentro del TTL de su acción se sirve sin llamar a DeepSeek.
+    """
+    huella = models.CharField(max_length=64, unique=True, help_text="SHA-256 de acción, rol, contexto y versión del prompt.")
+    accion = models.CharField(max_length=50, db_index=True)
+    rol = models.CharField(max_length=50, blank=True)
+    sujeto = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True, blank=True,
+        related_name='ai_respuestas_cache',
+        help_text="Usuario analizado: sus cambios académicos invalidan la entrada."
+    )
+    contenido = models.TextField()
+    tokens_entrada = models.IntegerField(default=0, help_text="Tokens que costó la respuesta original.")
+    tokens_salida = models.IntegerField(default=0)
+
+    aciertos = models.PositiveIntegerField(default=0, help_text="Veces servida sin llamar a la IA.")
+    ultimo_acierto = models.DateTimeField(null=True, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    expira = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Respuesta IA en Caché"
+        verbose_name_plural = "Respuestas IA en Caché"
+        ordering = ['-creado']
+
+    def __str__(self):
+        return f"{self.accion} {self.huella[:12]} ({self.aciertos} aciertos)"
+
+
 
 class AIDocumento(models.Model):
     """
@@ -1300,6 +1335,7 @@ class AIDocumento(models.Model):
         (DOC_ORIENTACION_ACUDIENTE, 'Orientación Familiar'),
         (DOC_REPORTE_CONVIVENCIA, 'Reporte de Convivencia'),
         (DOC_REPORTE_INSTITUCIONAL, 'Análisis Institucional (PEI)'),
+        (DOC_ANALISIS_BOLETIN, 'Análisis IA del Boletín'),
     )
 
     titulo = models.CharField(max_length=200, help_text="Ej: Plan de Mejora - Matemáticas")
@@ -1920,6 +1956,19 @@ class HistorialAcademico(models.Model):
         blank=True,
         help_text="Copia digital inmutable del boletín entregado a los padres."
     )
+    # Certificado oficial renderizado una sola vez (el snapshot no cambia)
+    archivo_certificado = models.FileField(
+        upload_to='historiales/certificados/%Y/',
+        null=True,
+        blank=True,
+        help_text="Certificado de notas ya generado; se reutiliza en cada descarga."
+    )
+    certificado_huella = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Huella de los datos con que se generó el certificado (si cambian, se regenera)."
+    )
+    certificado_generado = models.DateTimeField(null=True, blank=True)
     
     # 7. AUDITORÍA Y TRAZABILIDAD (VERSIONADO)
     meta_confianza = models.JSONField(
@@ -2227,3 +2276,212 @@ class BovedaSeguridad(models.Model):
         return sha256_hash.hexdigest() == self.checksum_sha256
 
 
+
+
+# ===================================================================
+# 📊 RESUMEN ACADÉMICO MATERIALIZADO (LECTURA RÁPIDA DE DASHBOARDS)
+# ===================================================================
+
+class ResumenAcademico(models.Model):
+    """
+    Fila desnormalizada por estudiante × curso × periodo.
+    Se mantiene desde los caminos de escritura (notas, convivencia, asistencia)
+    y se reconstruye con `manage.py reconstruir_resumen_academico`.
+    """
+    estudiante = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='resumenes_academicos')
+    curso = models.ForeignKey(Curso, on_delete=models.CASCADE, related_name='resumenes_academicos')
+    periodo = models.ForeignKey(Periodo, on_delete=models.CASCADE, related_name='resumenes_academicos')
+
+    # Rendimiento (definitivas numero_nota=5)
+    promedio = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True)
+    materias_evaluadas = models.PositiveIntegerField(default=0)
+    materias_perdidas = models.PositiveIntegerField(default=0)
+
+    # Asistencia (registros dentro del rango de fechas del periodo)
+    clases_registradas = models.PositiveIntegerField(default=0)
+    fallas = models.PositiveIntegerField(default=0)
+    tardanzas = models.PositiveIntegerField(default=0)
+
+    # Convivencia
+    convivencia = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True)
+
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Resumen Académico"
+        verbose_name_plural = "Resúmenes Académicos"
+        unique_together = ('estudiante', 'curso', 'periodo')
+        indexes = [
+            models.Index(fields=['curso', 'periodo']),
+        ]
+
+    def __str__(self):
+        return f"Resumen {self.estudiante_id} - curso {self.curso_id} - periodo {self.periodo_id}: {self.promedio}"
+
+
+# ===================================================================
+# 🛡️ SNAPSHOT DE RIESGO (TORRE DE CONTROL / SHADOW DASHBOARD)
+# ===================================================================
+
+class SnapshotRiesgo(models.Model):
+    """
+    Foto materializada de los conjuntos de riesgo (académico, legal, ausentismo)
+    y de los KPIs del Command Center. La genera `manage.py generar_snapshot_riesgo`
+    (o el programador en proceso); el dashboard solo lee la última.
+    """
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+    generado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='snapshots_riesgo',
+        help_text="Vacío si lo generó el comando o el programador."
+    )
+    duracion_ms = models.PositiveIntegerField(default=0)
+
+    # Conjuntos (ids de estudiantes)
+    ids_academico = models.JSONField(default=list)
+    ids_legal = models.JSONField(default=list)
+    ids_ausentismo = models.JSONField(default=list)
+    ids_atendidos = models.JSONField(default=list)
+
+    # KPIs (columnas propias para graficar tendencias sin abrir los JSON)
+    total_alumnos = models.PositiveIntegerField(default=0)
+    conteo_academico = models.PositiveIntegerField(default=0)
+    conteo_legal = models.PositiveIntegerField(default=0)
+    conteo_ausentismo = models.PositiveIntegerField(default=0)
+    total_riesgo = models.PositiveIntegerField(default=0)
+    riesgo_mitigado = models.PositiveIntegerField(default=0)
+    tasa_riesgo = models.DecimalField(max_digits=5, decimal_places=1, default=0)
+    kpi_dinero = models.BigIntegerField(default=0)
+    kpi_legal = models.BigIntegerField(default=0)
+    tokens_entrada_mes = models.BigIntegerField(default=0)
+    tokens_salida_mes = models.BigIntegerField(default=0)
+    costo_ia_mes = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+
+    class Meta:
+        verbose_name = "Snapshot de Riesgo"
+        verbose_name_plural = "Snapshots de Riesgo"
+        ordering = ['-fecha']
+        get_latest_by = 'fecha'
+
+    def __str__(self):
+        return f"Snapshot {self.fecha:%Y-%m-%d %H:%M} - {self.total_riesgo} en riesgo"
+
+
+# ===================================================================
+# 🖨️ TRABAJOS DE RENDERIZADO PDF (COLA EN SEGUNDO PLANO)
+# ===================================================================
+
+class TrabajoPDF(models.Model):
+    """
+    Solicitud de renderizado de un PDF fuera del ciclo de la petición.
+    La vista encola y devuelve este id; un pool de procesos ejecuta WeasyPrint
+    y el archivo queda guardado para servirse en cada descarga posterior.
+    """
+    ESTADO_PENDIENTE = 'PENDIENTE'
+    ESTADO_PROCESANDO = 'PROCESANDO'
+    ESTADO_LISTO = 'LISTO'
+    ESTADO_ERROR = 'ERROR'
+    ESTADOS = [
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_PROCESANDO, 'Procesando'),
+        (ESTADO_LISTO, 'Listo'),
+        (ESTADO_ERROR, 'Error'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tipo = models.CharField(max_length=30, db_index=True, help_text="Renderizador registrado (BOLETIN, OBSERVADOR...).")
+    parametros = models.JSONField(default=dict, blank=True)
+    clave = models.CharField(max_length=64, db_index=True, help_text="SHA-256 de tipo + parámetros (deduplicación).")
+
+    estado = models.CharField(max_length=12, choices=ESTADOS, default=ESTADO_PENDIENTE, db_index=True)
+    archivo = models.FileField(upload_to='pdf_jobs/%Y/%m/', null=True, blank=True)
+    nombre_archivo = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    progreso_hechos = models.PositiveIntegerField(default=0)
+    progreso_total = models.PositiveIntegerField(default=0, help_text="Documentos del lote (0 = trabajo individual).")
+
+    solicitado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='trabajos_pdf'
+    )
+    creado = models.DateTimeField(auto_now_add=True, db_index=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Trabajo PDF"
+        verbose_name_plural = "Trabajos PDF"
+        ordering = ['-creado']
+        indexes = [
+            models.Index(fields=['clave', 'estado']),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.id} [{self.estado}]"
+
+    @property
+    def terminado_ok(self):
+        return self.estado == self.ESTADO_LISTO and bool(self.archivo)
+
+
+# ===================================================================
+# 🗄️ CACHÉ DIRECCIONADA POR CONTENIDO DE PDFs (BOLETINES)
+# ===================================================================
+
+class CachePDF(models.Model):
+    """
+    PDF ya renderizado, identificado por la huella (SHA-256) del contexto con
+    el que se generó. Si los datos no cambian, la huella es la misma y la
+    descarga es una lectura de archivo en lugar de un render de WeasyPrint.
+    """
+    huella = models.CharField(max_length=64, unique=True, help_text="SHA-256 del contexto normalizado + plantilla.")
+    tipo = models.CharField(max_length=30, db_index=True)
+    matricula = models.ForeignKey(
+        'Matricula',
+        on_delete=models.CASCADE,
+        null=True, blank=True,
+        related_name='pdfs_cacheados'
+    )
+    archivo = models.FileField(upload_to='pdf_cache/%Y/%m/')
+    nombre_archivo = models.CharField(max_length=255, blank=True)
+    tamano = models.PositiveIntegerField(default=0, help_text="Bytes (para el tope de la caché).")
+
+    accesos = models.PositiveIntegerField(default=0)
+    creado = models.DateTimeField(auto_now_add=True)
+    ultimo_acceso = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = "PDF en Caché"
+        verbose_name_plural = "PDFs en Caché"
+        ordering = ['-ultimo_acceso']
+
+    def __str__(self):
+        return f"{self.tipo} {self.huella[:12]} ({self.tamano} B)"
+
+
+class MetricaPDF(models.Model):
+    """
+    Una fila por render de WeasyPrint (ver `tasks.services.pdf_metricas`):
+    cuánto tardó cada fase y qué tan grande salió el documento, para saber
+    qué plantillas conviene optimizar primero (p50/p95 en el admin).
+    """
+    plantilla = models.CharField(max_length=150, help_text="Plantilla HTML del documento ('' si no se indicó).")
+    tiempo_contexto_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Consultas y armado del contexto.")
+    tiempo_plantilla_ms = models.PositiveIntegerField(null=True, blank=True, help_text="render_to_string.")
+    tiempo_render_ms = models.PositiveIntegerField(help_text="WeasyPrint (layout + write_pdf) en el proceso del pool.")
+    paginas = models.PositiveIntegerField(default=0)
+    tamano = models.PositiveIntegerField(default=0, help_text="Bytes del PDF.")
+    creado = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Métrica de PDF"
+        verbose_name_plural = "Métricas de PDF"
+        ordering = ['-creado']
+        indexes = [models.Index(fields=['plantilla', 'creado'])]
+
+    def __str__(self):
+        return f"{self.plantilla or '?'}: {self.tiempo_render_ms} ms, {self.paginas} pág."
@@ -0,0 +1,185 @@
+# tasks/pdf_worker.py
+"""
+Motor de renderizado WeasyPrint compartido por todos los PDFs.
+
+Este módulo no importa Django a propósito: se ejecuta dentro de los procesos
+del pool (creados con `spawn`) y recibe su configuración una sola vez por
+proceso con `configurar()` (ver `tasks.services.pdf_jobs`).
+
+Por proceso se mantienen:
+- un `url_fetcher` que resuelve /static/ y /media/ desde el disco local
+  (sin peticiones HTTP de vuelta a la propia aplicación);
+- una caché en memoria de recursos (logos institucionales, fuentes remotas);
+- las hojas CSS comunes ya parseadas, una FontConfiguration y la caché de
+  imágenes de WeasyPrint reutilizadas entre renders.
+"""
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+# Recursos de más de este tamaño no se guardan en memoria
+MAX_BYTES_RECURSO = 5 * 1024 * 1024
+MAX_RECURSOS_EN_MEMORIA = 256
+# La FontConfiguration acumula los @font-face de cada documento y la caché de
+# imágenes guarda también los QR (data:) de cada certificado: se renuevan cada N renders
+RENDERS_POR_CICLO = 200
+
+_config = {}
+_lock = threading.Lock()
+_recursos = OrderedDict()     # url/ruta -> dict del fetcher (LRU)
+_estado = {}                  # font_config, hojas, cache de imágenes
+
+
+def configurar(config):
+    """
+    Fija la configuración del proceso. `config` (dict serializable):
+    - static_url / media_url: prefijos de URL ('/static/', '/media/')
+    - static_dirs: carpetas donde buscar estáticos, en orden
+    - media_root: carpeta de MEDIA
+    - hojas: rutas de archivos CSS comunes a todos los PDFs
+    """
+    global _config
+    with _lock:
+        _config = dict(config or {})
+        _recursos.clear()
+        _estado.clear()
+
+
+def _normalizar_prefijo(prefijo):
+    if not prefijo:
+        return None
+    return '/' + prefijo.strip('/') + '/'
+
+
+def _ruta_local(url, base_url):
+    """Ruta en disco para URLs de /static/ o /media/ del propio sitio; None si no aplica."""
+    partes = urlsplit(url)
+    if partes.scheme in ('http', 'https'):
+        base = urlsplit(base_url or '')
+        if not base.netloc or partes.netloc != base.netloc:
+            return None
+    elif partes.scheme:
+        return None
+
+    ruta = unquote(partes.path)
+    candidatos = []
+    static_url = _normalizar_prefijo(_config.get('static_url'))
+    media_url = _normalizar_prefijo(_config.get('media_url'))
+    if static_url and ruta.startswith(static_url):
+        relativa = ruta[len(static_url):]
+        candidatos = [(raiz, relativa) for raiz in _config.get('static_dirs', [])]
+    elif media_url and ruta.startswith(media_url) and _config.get('media_root'):
+        candidatos = [(_config['media_root'], ruta[len(media_url):])]
+
+    for raiz, relativa in candidatos:
+        raiz = os.path.abspath(raiz)
+        completa = os.path.abspath(os.path.join(raiz, relativa))
+        # Nunca salir de la carpeta raíz (../)
+        if completa.startswith(raiz + os.sep) and os.path.isfile(completa):
+            return completa
+    return None
+
+
+def _guardar_recurso(llave, recurso):
+    if len(recurso.get('string') or b'') > MAX_BYTES_RECURSO:
+        return
+    with _lock:
+        _recursos[llave] = recurso
+        _recursos.move_to_end(llave)
+        while len(_recursos) > MAX_RECURSOS_EN_MEMORIA:
+            _recursos.popitem(last=False)
+
+
+def _leer_recurso(llave):
+    with _lock:
+        recurso = _recursos.get(llave)
+        if recurso is not None:
+            _recursos.move_to_end(llave)
+        return recurso
+
+
+def crear_url_fetcher(base_url=None):
+    """url_fetcher de WeasyPrint: disco local para static/media y memoria para remotos."""
+    from weasyprint import default_url_fetcher
+
+    def url_fetcher(url, *args, **kwargs):
+        ruta = _ruta_local(url, base_url)
+        if ruta is not None:
+            llave = (ruta, os.path.getmtime(ruta))
+            recurso = _leer_recurso(llave)
+            if recurso is None:
+                with open(ruta, 'rb') as f:
+                    recurso = {
+                        'string': f.read(),
+                        'mime_type': mimetypes.guess_type(ruta)[0],
+                        'redirected_url': url,
+                        'path': ruta,
+                    }
+                _guardar_recurso(llave, recurso)
+            return dict(recurso)
+
+        if url.startswith(('http://', 'https://')):
+            # Fuentes de Google y logos remotos: se descargan una vez por proceso
+            recurso = _leer_recurso(url)
+            if recurso is None:
+                recurso = default_url_fetcher(url, *args, **kwargs)
+                if 'file_obj' in recurso:
+                    with recurso.pop('file_obj') as f:
+                        recurso['string'] = f.read()
+                _guardar_recurso(url, recurso)
+            return dict(recurso)
+
+        return default_url_fetcher(url, *args, **kwargs)
+
+    return url_fetcher
+
+
+def _recursos_compartidos():
+    """FontConfiguration, hojas CSS comunes y caché de imágenes (una vez por proceso)."""
+    with _lock:
+        if _estado and _estado['renders'] < RENDERS_POR_CICLO:
+            _estado['renders'] += 1
+            return _estado
+        _estado.clear()
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    fetcher = crear_url_fetcher()
+    hojas = [
+        CSS(filename=ruta, font_config=font_config, url_fetcher=fetcher)
+        for ruta in _config.get('hojas', []) if os.path.isfile(ruta)
+    ]
+    with _lock:
+        if not _estado:
+            _estado.update({'font_config': font_config, 'hojas': hojas, 'imagenes': {}, 'renders': 1})
+        return _estado
+
+
+def renderizar_pdf_medido(html_string, base_url=None, opciones=None):
+    """
+    Convierte HTML en PDF dentro de un proceso del pool.
+    Retorna (pdf_bytes, paginas, segundos_de_render) para las métricas.
+    Equivale a `HTML.write_pdf`, separado en `render()` + `write_pdf()` para contar páginas.
+    """
+    from weasyprint import HTML
+
+    inicio = time.perf_counter()
+    compartidos = _recursos_compartidos()
+    opciones = dict(opciones or {})
+    opciones['stylesheets'] = compartidos['hojas'] + list(opciones.get('stylesheets') or [])
+    opciones.setdefault('cache', compartidos['imagenes'])
+
+    documento = HTML(
+        string=html_string, base_url=base_url, url_fetcher=crear_url_fetcher(base_url)
+    ).render(font_config=compartidos['font_config'], **opciones)
+    pdf_bytes = documento.write_pdf(**opciones)
+    return pdf_bytes, len(documento.pages), time.perf_counter() - inicio
+
+
+def renderizar_pdf(html_string, base_url=None, opciones=None):
+    """Convierte HTML en PDF (bytes). Se ejecuta en un proceso del pool."""
+    return renderizar_pdf_medido(html_string, base_url, opciones)[0]
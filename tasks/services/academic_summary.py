@@ -0,0 +1,213 @@
+# tasks/services/academic_summary.py
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Avg, Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from tasks.models import (
+    Asistencia, Convivencia, Curso, Matricula, Nota, Periodo, ResumenAcademico
+)
+from tasks.services.invalidacion import al_confirmar
+
+logger = logging.getLogger(__name__)
+
+TWO_PLACES = Decimal('0.01')
+# Nota mínima para ganar una materia (escala 1.0 - 5.0). Única fuente para el resumen,
+# los tableros, la sábana, el motor de riesgo y el cierre de año.
+NOTA_MINIMA_APROBATORIA = Decimal('3.0')
+
+CAMPOS_RESUMEN = [
+    'promedio', 'materias_evaluadas', 'materias_perdidas',
+    'clases_registradas', 'fallas', 'tardanzas', 'convivencia', 'actualizado',
+]
+
+
+def _a_decimal(valor):
+    if valor is None:
+        return None
+    return Decimal(str(valor)).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+class ResumenAcademicoService:
+    """
+    📊 MATERIALIZADOR DEL RESUMEN ACADÉMICO
+
+    Calcula con agregados agrupados (un GROUP BY por fuente) la fila
+    estudiante × curso × periodo y la persiste con un único upsert por lotes.
+    Los dashboards leen estas filas en lugar de recalcular sobre Nota/Asistencia.
+    """
+
+    BATCH_SIZE = 500
+
+    @staticmethod
+    def recalcular(curso, estudiantes_ids=None, periodos=None):
+        """
+        Recalcula el resumen de un curso. Si no se indican estudiantes se toman las
+        matrículas activas; si no se indican periodos, los periodos activos del curso.
+        Devuelve el número de filas escritas.
+        """
+        if periodos is None:
+            periodos = Periodo.objects.filter(curso=curso, activo=True).order_by('id')
+        periodos = list(periodos)
+        if estudiantes_ids is None:
+            estudiantes_ids = Matricula.objects.filter(
+                curso=curso, activo=True
+            ).values_list('estudiante_id', flat=True)
+        estudiantes_ids = list(estudiantes_ids)
+
+        if not periodos or not estudiantes_ids:
+            return 0
+
+        filas = {
+            (est_id, p.id): ResumenAcademico(estudiante_id=est_id, curso=curso, periodo=p)
+            for est_id in estudiantes_ids for p in periodos
+        }
+
+        # 1. Rendimiento: promedio de definitivas y materias perdidas por estudiante/periodo
+        notas_agrupadas = Nota.objects.filter(
+            estudiante_id__in=estudiantes_ids, periodo__in=periodos, numero_nota=5
+        ).values('estudiante_id', 'periodo_id').annotate(
+            prom=Avg('valor'),
+            evaluadas=Count('id'),
+            perdidas=Count('id', filter=Q(valor__lt=NOTA_MINIMA_APROBATORIA)),
+        )
+        for fila in notas_agrupadas:
+            resumen = filas.get((fila['estudiante_id'], fila['periodo_id']))
+            if resumen:
+                resumen.promedio = _a_decimal(fila['prom'])
+                resumen.materias_evaluadas = fila['evaluadas']
+                resumen.materias_perdidas = fila['perdidas']
+
+        # 2. Asistencia: Asistencia no tiene periodo, se asigna por rango de fechas
+        for periodo in periodos:
+            asistencia_agrupada = Asistencia.objects.filter(
+                curso=curso, estudiante_id__in=estudiantes_ids,
+                fecha__range=(periodo.fecha_inicio, periodo.fecha_fin)
+            ).values('estudiante_id').annotate(
+                total=Count('id'),
+                fallas=Count('id', filter=Q(estado='FALLA')),
+                tardanzas=Count('id', filter=Q(estado='TARDE')),
+            )
+            for fila in asistencia_agrupada:
+                resumen = filas.get((fila['estudiante_id'], periodo.id))
+                if resumen:
+                    resumen.clases_registradas = fila['total']
+                    resumen.fallas = fila['fallas']
+                    resumen.tardanzas = fila['tardanzas']
+
+        # 3. Convivencia
+        for fila in Convivencia.objects.filter(
+            curso=curso, estudiante_id__in=estudiantes_ids, periodo__in=periodos
+        ).values('estudiante_id', 'periodo_id', 'valor'):
+            resumen = filas.get((fila['estudiante_id'], fila['periodo_id']))
+            if resumen:
+                resumen.convivencia = fila['valor']
+
+        ResumenAcademico.objects.bulk_create(
+            filas.values(), batch_size=ResumenAcademicoService.BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['estudiante', 'curso', 'periodo'],
+            update_fields=CAMPOS_RESUMEN,
+        )
+        return len(filas)
+
+    @staticmethod
+    def invalidar(estudiantes_ids):
+        """
+        Borra las filas de los estudiantes; `obtener_lote` las vuelve a
+        materializar en la próxima lectura. Retorna cuántas.
+        """
+        borradas, _ = ResumenAcademico.objects.filter(estudiante_id__in=list(estudiantes_ids)).delete()
+        return borradas
+
+    @staticmethod
+    def obtener(estudiante, curso, periodos):
+        """
+        Lectura con materialización perezosa: si faltan filas (curso nunca
+        reconstruido) se calculan para ese estudiante y se devuelven.
+        Retorna {periodo_id: ResumenAcademico}.
+        """
+        periodos = list(periodos)
+        resumenes = ResumenAcademicoService.obtener_lote(
+            {estudiante.id: curso}, {curso.id: periodos}
+        )
+        return resumenes.get(estudiante.id, {})
+
+    @staticmethod
+    def obtener_lote(cursos_por_estudiante, periodos_por_curso):
+        """
+        Versión por lotes de `obtener` para varios estudiantes (p. ej. los hijos
+        de un acudiente): una consulta para todas las filas y un recálculo por
+        curso solo para los estudiantes a los que les falten.
+        Retorna {estudiante_id: {periodo_id: ResumenAcademico}}.
+        """
+        if not cursos_por_estudiante:
+            return {}
+
+        def _leer():
+            resultado = {}
+            for r in ResumenAcademico.objects.filter(
+                estudiante_id__in=cursos_por_estudiante.keys(),
+                curso_id__in={c.id for c in cursos_por_estudiante.values()},
+            ):
+                if cursos_por_estudiante[r.estudiante_id].id == r.curso_id:
+                    resultado.setdefault(r.estudiante_id, {})[r.periodo_id] = r
+            return resultado
+
+        resumenes = _leer()
+
+        faltantes_por_curso = {}
+        for est_id, curso in cursos_por_estudiante.items():
+            periodos = periodos_por_curso.get(curso.id, [])
+            existentes = resumenes.get(est_id, {})
+            if any(p.id not in existentes for p in periodos):
+                faltantes_por_curso.setdefault(curso, []).append(est_id)
+
+        if faltantes_por_curso:
+            for curso, estudiantes_ids in faltantes_por_curso.items():
+                ResumenAcademicoService.recalcular(
+                    curso, estudiantes_ids, periodos_por_curso.get(curso.id, [])
+                )
+            resumenes = _leer()
+        return resumenes
+
+    @staticmethod
+    def reconstruir_todo(solo_activos=True):
+        """Borra y recalcula la tabla completa, curso por curso."""
+        cursos = Curso.objects.all()
+        if solo_activos:
+            cursos = cursos.filter(activo=True)
+
+        total = 0
+        with transaction.atomic():
+            ResumenAcademico.objects.all().delete()
+            for curso in cursos.order_by('id'):
+                total += ResumenAcademicoService.recalcular(curso)
+        return total
+
+
+# ===================================================================
+# 🔔 INVALIDACIÓN AUTOMÁTICA (conectada en TasksConfig.ready)
+# Cualquier escritura o borrado fila a fila (admin, asistencia diaria,
+# convivencia) deja obsoletas las filas del estudiante. Las escrituras
+# masivas de GradePersistenceService no emiten señales y recalculan
+# explícitamente.
+# ===================================================================
+
+@receiver(post_save, sender=Nota)
+@receiver(post_delete, sender=Nota)
+def _invalidar_por_nota(sender, instance, **kwargs):
+    # El resumen solo se alimenta de las definitivas
+    if instance.numero_nota == 5:
+        al_confirmar(ResumenAcademicoService.invalidar, [instance.estudiante_id])
+
+
+@receiver(post_save, sender=Asistencia)
+@receiver(post_delete, sender=Asistencia)
+@receiver(post_save, sender=Convivencia)
+@receiver(post_delete, sender=Convivencia)
+def _invalidar_por_estudiante(sender, instance, **kwargs):
+    al_confirmar(ResumenAcademicoService.invalidar, [instance.estudiante_id])
@@ -0,0 +1,207 @@
+# tasks/services/boletin_batch.py
+import io
+import logging
+import time
+import zipfile
+from concurrent.futures import as_completed
+
+from django.template.loader import render_to_string
+from pypdf import PdfWriter
+
+from tasks.models import Matricula
+from tasks.services.boletin_ia import AnalisisBoletinService
+from tasks.services.pdf_cache import CachePDFService, huella_contexto
+from tasks.services.pdf_jobs import PLANTILLA_BOLETIN, TIPO_CACHE_BOLETIN, PDFJobService, registrar_renderizador
+from tasks.services.reports import get_student_report_contexts
+
+logger = logging.getLogger(__name__)
+
+FORMATO_PDF = 'pdf'
+FORMATO_ZIP = 'zip'
+FORMATOS = (FORMATO_PDF, FORMATO_ZIP)
+# Cuántos avisos de progreso como máximo por lote (evita saturar el channel layer)
+MAX_AVISOS_PROGRESO = 50
+
+
+class LoteBoletinesService:
+    """
+    📚 GENERACIÓN MASIVA DE BOLETINES (CURSO, GRADO O CIERRE ANUAL)
+
+    1. Carga todos los contextos con `get_student_report_contexts` (consultas fijas).
+    2. Arma cada HTML en este hilo (BD + plantillas) y despacha el `write_pdf`
+       al pool de procesos, así los renders corren en paralelo.
+    3. Reutiliza la caché de PDFs: si el contexto no cambió no se renderiza.
+       El análisis IA precalculado se incluye tal cual (nunca se llama a la IA).
+    4. Entrega la lista de documentos, un PDF combinado (pypdf) o un ZIP.
+
+    `al_progresar(hechos, total)` se invoca a medida que termina cada documento.
+    Con `usar_cache=False` (documentos que se archivan) no se usa ninguna de
+    las dos cachés: contexto desde la BD y render siempre.
+    """
+
+    def __init__(self, matriculas_ids, base_url=None, al_progresar=None, usar_cache=True):
+        self.matriculas_ids = list(matriculas_ids)
+        self.base_url = base_url
+        self.al_progresar = al_progresar
+        self.usar_cache = usar_cache
+
+    @staticmethod
+    def matriculas_de_curso(curso_id):
+        return list(
+            Matricula.objects.filter(curso_id=curso_id, activo=True)
+            .order_by('estudiante__last_name', 'estudiante__first_name')
+            .values_list('id', flat=True)
+        )
+
+    @staticmethod
+    def matriculas_de_grado(grado, anio_escolar=None):
+        qs = Matricula.objects.filter(curso__grado=grado, activo=True)
+        if anio_escolar:
+            qs = qs.filter(curso__anio_escolar=anio_escolar)
+        return list(
+            qs.order_by('curso__seccion', 'estudiante__last_name', 'estudiante__first_name')
+            .values_list('id', flat=True)
+        )
+
+    def generar(self):
+        """
+        Retorna [(matricula_id, nombre_archivo, pdf_bytes)] en el orden de entrada.
+        Un documento que falla se registra y se omite; no detiene el lote.
+        """
+        resultados = {matricula_id: (nombre, pdf_bytes) for matricula_id, nombre, pdf_bytes in self.iterar()}
+        return [
+            (matricula_id, *resultados[matricula_id])
+            for matricula_id in self.matriculas_ids if matricula_id in resultados
+        ]
+
+    def iterar(self):
+        """
+        Entrega (matricula_id, nombre_archivo, pdf_bytes) a medida que cada
+        documento queda listo: primero los de la caché y luego en orden de
+        terminación. El llamador guarda cada PDF y lo suelta, así un lote
+        grande (cierre anual) no retiene todos los bytes en memoria.
+        """
+        inicio = time.perf_counter()
+        contextos = get_student_report_contexts(self.matriculas_ids, usar_cache=self.usar_cache)
+        analisis = AnalisisBoletinService.obtener_varios(
+            [context['estudiante'].id for context in contextos.values()]
+        )
+        # Para las métricas: la carga por lote se reparte entre los documentos
+        tiempo_contexto = (time.perf_counter() - inicio) / max(1, len(contextos))
+        for context in contextos.values():
+            if context['estudiante'].id in analisis:
+                context['analisis_ia'] = analisis[context['estudiante'].id]
+        total = len(contextos)
+        huellas = {
+            matricula_id: huella_contexto(TIPO_CACHE_BOLETIN, PLANTILLA_BOLETIN, context)
+            for matricula_id, context in contextos.items()
+        }
+        en_cache = CachePDFService.obtener_varios(huellas.values()) if self.usar_cache else {}
+        hechos = 0
+        pendientes = {}
+        # Entradas de la caché: se leen de disco una a una después de despachar los renders
+        reutilizados = []
+
+        for matricula_id in self.matriculas_ids:
+            context = contextos.get(matricula_id)
+            if context is None:
+                continue
+            estudiante = context['estudiante']
+            nombre = f"boletin_{estudiante.username}_{context['curso'].anio_escolar}.pdf"
+            huella = huellas[matricula_id]
+
+            entrada = en_cache.get(huella)
+            if entrada is not None:
+                reutilizados.append((matricula_id, nombre, entrada))
+                continue
+
+            try:
+                inicio = time.perf_counter()
+                html_string = render_to_string(PLANTILLA_BOLETIN, context)
+            except Exception as e:
+                logger.error(f"❌ Boletín de la matrícula {matricula_id}: {e}")
+                continue
+            futuro = PDFJobService.enviar(
+                html_string, self.base_url, plantilla=PLANTILLA_BOLETIN,
+                tiempo_contexto=tiempo_contexto, tiempo_plantilla=time.perf_counter() - inicio
+            )
+            pendientes[futuro] = (matricula_id, nombre, huella, context['matricula'])
+
+        for matricula_id, nombre, entrada in reutilizados:
+            with entrada.archivo.open('rb') as f:
+                pdf_bytes = f.read()
+            hechos += 1
+            yield matricula_id, nombre, pdf_bytes
+        self._progresar(hechos, total)
+        hubo_renders = bool(pendientes)
+
+        for futuro in as_completed(pendientes):
+            # Se saca del dict: el Future (y sus bytes) se libera tras entregarlo
+            matricula_id, nombre, huella, matricula = pendientes.pop(futuro)
+            hechos += 1
+            try:
+                pdf_bytes = futuro.result()
+            except Exception as e:
+                logger.error(f"❌ Boletín de la matrícula {matricula_id}: {e}")
+                self._progresar(hechos, total)
+                continue
+            if self.usar_cache:
+                CachePDFService.guardar(huella, TIPO_CACHE_BOLETIN, pdf_bytes, nombre, matricula, recortar=False)
+            self._progresar(hechos, total)
+            yield matricula_id, nombre, pdf_bytes
+
+        if hubo_renders and self.usar_cache:
+            CachePDFService.recortar()
+
+    def _progresar(self, hechos, total):
+        paso = max(1, total // MAX_AVISOS_PROGRESO)
+        if self.al_progresar and (hechos == total or hechos % paso == 0):
+            self.al_progresar(hechos, total)
+
+    @staticmethod
+    def combinar_pdf(documentos):
+        """Un solo PDF con todos los boletines, en orden."""
+        writer = PdfWriter()
+        for _, _, pdf_bytes in documentos:
+            writer.append(io.BytesIO(pdf_bytes))
+        salida = io.BytesIO()
+        writer.write(salida)
+        writer.close()
+        return salida.getvalue()
+
+    @staticmethod
+    def empaquetar_zip(documentos):
+        """ZIP con un PDF por estudiante (los PDF ya vienen comprimidos: ZIP_STORED)."""
+        salida = io.BytesIO()
+        with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as zf:
+            for _, nombre, pdf_bytes in documentos:
+                zf.writestr(nombre, pdf_bytes)
+        return salida.getvalue()
+
+
+@registrar_renderizador('BOLETINES_LOTE')
+def _renderizar_lote_boletines(trabajo):
+    """
+    Parámetros: `curso_id` o `grado` (+ `anio_escolar` opcional), `formato`
+    ('pdf' combinado o 'zip') y `base_url`.
+    """
+    parametros = trabajo.parametros
+    if parametros.get('curso_id'):
+        matriculas_ids = LoteBoletinesService.matriculas_de_curso(parametros['curso_id'])
+        etiqueta = f"curso_{parametros['curso_id']}"
+    else:
+        matriculas_ids = LoteBoletinesService.matriculas_de_grado(parametros['grado'], parametros.get('anio_escolar'))
+        etiqueta = f"grado_{parametros['grado']}"
+
+    lote = LoteBoletinesService(
+        matriculas_ids,
+        base_url=parametros.get('base_url'),
+        al_progresar=lambda hechos, total: PDFJobService.reportar_progreso(trabajo, hechos, total)
+    )
+    documentos = lote.generar()
+    if not documentos:
+        raise ValueError("No se generó ningún boletín para el lote solicitado.")
+
+    if parametros.get('formato') == FORMATO_ZIP:
+        return LoteBoletinesService.empaquetar_zip(documentos), f"boletines_{etiqueta}.zip"
+    return LoteBoletinesService.combinar_pdf(documentos), f"boletines_{etiqueta}.pdf"
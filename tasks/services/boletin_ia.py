@@ -0,0 +1,187 @@
+# tasks/services/boletin_ia.py
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from tasks.ai.constants import ACCION_MEJORAS_ESTUDIANTE, DOC_ANALISIS_BOLETIN
+from tasks.models import AIDocumento, Matricula, Nota, PeriodoAcademico
+from tasks.services.invalidacion import al_confirmar
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Llamadas a la IA en segundo plano: pocas a la vez (cuota y latencia de la API)
+MAX_HILOS_IA = 2
+
+_lock = threading.Lock()
+_pool = None
+_en_curso = set()  # (estudiante_id, periodo_id) programados y aún sin terminar
+
+
+def _obtener_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=MAX_HILOS_IA, thread_name_prefix='boletin-ia')
+        return _pool
+
+
+class AnalisisBoletinService:
+    """
+    🧠 ANÁLISIS IA PRECALCULADO PARA BOLETINES
+
+    El boletín ya no espera a DeepSeek: el análisis de cada estudiante se
+    genera aparte (comando `precalcular_analisis_boletin` o en segundo plano
+    la primera vez que se pide su boletín) y se guarda como AIDocumento
+    (tipo DOC_ANALISIS_BOLETIN) del periodo académico activo.
+
+    El render solo lee lo guardado; si aún no existe, el boletín sale sin
+    análisis y la caché de PDFs lo regenera cuando el análisis aparece
+    (el texto forma parte de la huella del contexto). Cuando cambian las
+    notas del estudiante el análisis se descarta (`invalidar`) y el
+    siguiente boletín programa uno nuevo.
+    """
+
+    @staticmethod
+    def periodo_actual():
+        return PeriodoAcademico.objects.filter(activo=True).first()
+
+    @staticmethod
+    def obtener_varios(estudiantes_ids, periodo=None):
+        """{estudiante_id: contenido} con el análisis más reciente de cada uno (1 consulta)."""
+        periodo = periodo or AnalisisBoletinService.periodo_actual()
+        if periodo is None:
+            return {}
+        analisis = {}
+        for usuario_id, contenido in AIDocumento.objects.filter(
+            usuario_id__in=list(estudiantes_ids), tipo=DOC_ANALISIS_BOLETIN, periodo=periodo
+        ).order_by('-creado_en').values_list('usuario_id', 'contenido'):
+            analisis.setdefault(usuario_id, contenido)
+        return analisis
+
+    @staticmethod
+    def obtener(estudiante_id, periodo=None):
+        return AnalisisBoletinService.obtener_varios([estudiante_id], periodo).get(estudiante_id)
+
+    @staticmethod
+    def invalidar(estudiantes_ids):
+        """Descarta el análisis del periodo activo de estos estudiantes. Retorna cuántos."""
+        if not estudiantes_ids:
+            return 0
+        borrados, _ = AIDocumento.objects.filter(
+            usuario_id__in=list(estudiantes_ids), tipo=DOC_ANALISIS_BOLETIN, periodo__activo=True
+        ).delete()
+        return borrados
+
+    @staticmethod
+    def generar(estudiante, usuario, periodo, matricula_id=None):
+        """Llama a la IA y guarda el resultado. Retorna el AIDocumento o None si falló."""
+        from tasks.ai.orchestrator import ai_orchestrator
+
+        resultado = ai_orchestrator.process_request(
+            user=usuario,
+            action_type=ACCION_MEJORAS_ESTUDIANTE,
+            target_user=estudiante
+        )
+        if not resultado.get('success'):
+            logger.warning(f"⚠️ Análisis IA del boletín de {estudiante.username}: {resultado.get('content')}")
+            return None
+
+        return AIDocumento.objects.create(
+            titulo=f"Análisis del boletín - {estudiante.get_full_name() or estudiante.username}",
+            tipo=DOC_ANALISIS_BOLETIN,
+            usuario=estudiante,
+            periodo=periodo,
+            contenido=resultado.get('content') or '',
+            contexto_snapshot={
+                'matricula_id': matricula_id,
+                'solicitado_por': usuario.id,
+                'meta': resultado.get('meta') or {},
+            },
+            es_publico=False,
+        )
+
+    @staticmethod
+    def precalcular(matriculas_ids, usuario, forzar=False, al_progresar=None):
+        """
+        Genera el análisis de cada matrícula que aún no lo tiene en el periodo activo
+        (o de todas con `forzar`). Retorna (generados, omitidos, fallidos).
+        """
+        periodo = AnalisisBoletinService.periodo_actual()
+        if periodo is None:
+            raise ValueError("No hay un periodo académico (IA) activo.")
+
+        matriculas = list(
+            Matricula.objects.filter(id__in=list(matriculas_ids)).select_related('estudiante')
+        )
+        existentes = set() if forzar else set(
+            AnalisisBoletinService.obtener_varios([m.estudiante_id for m in matriculas], periodo)
+        )
+
+        generados = omitidos = fallidos = 0
+        for indice, matricula in enumerate(matriculas, start=1):
+            if matricula.estudiante_id in existentes:
+                omitidos += 1
+            elif AnalisisBoletinService.generar(matricula.estudiante, usuario, periodo, matricula.id):
+                generados += 1
+            else:
+                fallidos += 1
+            if al_progresar:
+                al_progresar(indice, len(matriculas))
+        return generados, omitidos, fallidos
+
+    @staticmethod
+    def programar(estudiante_id, matricula_id, usuario):
+        """
+        Encola el análisis de un estudiante sin esperar (el boletín ya se entregó sin él).
+        No duplica peticiones en curso para el mismo estudiante y periodo.
+        """
+        if usuario is None:
+            return
+        periodo = AnalisisBoletinService.periodo_actual()
+        if periodo is None:
+            return
+        llave = (estudiante_id, periodo.id)
+        with _lock:
+            if llave in _en_curso:
+                return
+            _en_curso.add(llave)
+        _obtener_pool().submit(AnalisisBoletinService._ejecutar_programado, llave, matricula_id, usuario.id)
+
+    @staticmethod
+    def _ejecutar_programado(llave, matricula_id, usuario_id):
+        estudiante_id, periodo_id = llave
+        close_old_connections()
+        try:
+            periodo = PeriodoAcademico.objects.get(id=periodo_id)
+            if AnalisisBoletinService.obtener(estudiante_id, periodo) is None:
+                AnalisisBoletinService.generar(
+                    User.objects.get(id=estudiante_id), User.objects.get(id=usuario_id), periodo, matricula_id
+                )
+        except Exception as e:
+            logger.error(f"❌ Análisis IA del boletín (estudiante {estudiante_id}): {e}", exc_info=True)
+        finally:
+            with _lock:
+                _en_curso.discard(llave)
+            close_old_connections()
+
+
+# ===================================================================
+# 🔔 INVALIDACIÓN AUTOMÁTICA (conectada en TasksConfig.ready)
+# Solo las notas: asistencia y observaciones cambian a diario y regenerar
+# el análisis por cada una multiplicaría las llamadas a la IA. Basta con
+# la definitiva (Nota): los cortes la recalculan al guardarse, y dejar
+# NotaDetallada sin receptores conserva su borrado rápido.
+# Las escrituras masivas invalidan explícitamente (GradePersistenceService).
+# ===================================================================
+
+@receiver(post_save, sender=Nota)
+@receiver(post_delete, sender=Nota)
+def _invalidar_analisis_por_nota(sender, instance, **kwargs):
+    al_confirmar(AnalisisBoletinService.invalidar, [instance.estudiante_id])
@@ -1,21 +1,57 @@
 import qrcode
 import base64
+import hashlib
+import io
+import json
 import logging
+import zipfile
+from concurrent.futures import as_completed
+from functools import lru_cache
 from io import BytesIO
 from typing import Dict, Any, Union
+from urllib.parse import urljoin, urlsplit
 
 from django.template.loader import render_to_string
 from django.utils import timezone
+from django.core.files.base import ContentFile
 from django.core.signing import Signer
 from django.http import HttpRequest
 from django.conf import settings
 from django.utils.text import slugify
 
-from weasyprint import HTML
+from tasks.models import HistorialAcademico
+from tasks.services.pdf_jobs import PDFJobService, registrar_renderizador
 
 # Configuración de Logging Estructurado para trazabilidad industrial
 logger = logging.getLogger(__name__)
 
+# QRs distintos que se guardan en memoria por proceso (uno por payload firmado)
+MAX_QR_EN_MEMORIA = 2048
+# Sube si cambia la plantilla o el contexto: invalida los certificados guardados
+VERSION_CERTIFICADO = 1
+PLANTILLA_CERTIFICADO = 'admin/reports/certificate_template.html'
+
+
+@lru_cache(maxsize=MAX_QR_EN_MEMORIA)
+def qr_png_base64(data: str, fill_color: str = "black", back_color: str = "white", border: int = 2) -> str:
+    """
+    QR Level H en PNG/Base64, memoizado por contenido: la misma URL firmada
+    (o de verificación) no vuelve a pasar por `qrcode` + PIL.
+    """
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H, # Máxima redundancia
+        box_size=10,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color=fill_color, back_color=back_color)
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
 class CertificateService:
     """
     🏭 SERVICIO DE CERTIFICACIÓN ACADÉMICA (ENTERPRISE GRADE)
@@ -41,10 +77,15 @@ class CertificateService:
         Genera una URL firmada criptográficamente para el código QR.
         Garantiza que el ID del documento y el año no han sido manipulados.
         """
+        return self.url_verificacion(request.build_absolute_uri('/'), doc_id, year)
+
+    def url_verificacion(self, base_url: str, doc_id: str, year: int) -> str:
+        """Igual que `generate_signed_url` sin request (trabajos en segundo plano)."""
         try:
             payload = f"{doc_id}:{year}"
+            # Signer sin timestamp: el mismo payload produce siempre el mismo token (y el mismo QR)
             signed_token = self.signer.sign(payload)
-            return request.build_absolute_uri(f'{self.VERIFICATION_ROUTE}?token={signed_token}')
+            return urljoin(base_url, f'{self.VERIFICATION_ROUTE}?token={signed_token}')
         except Exception as e:
             logger.error(f"Error generando firma criptográfica para {doc_id}: {e}")
             raise ValueError("Fallo en el subsistema de seguridad documental.")
@@ -55,72 +96,64 @@ class CertificateService:
         Permite la lectura incluso con daños físicos en el papel impreso.
         """
         try:
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_H, # Máxima redundancia
-                box_size=10,
-                border=2,
-            )
-            qr.add_data(data)
-            qr.make(fit=True)
-            
-            img = qr.make_image(
-                fill_color=self.QR_COLOR_FILL, 
-                back_color=self.QR_COLOR_BACK
-            )
-            
-            buffer = BytesIO()
-            img.save(buffer, format="PNG")
-            return base64.b64encode(buffer.getvalue()).decode()
-            
+            return qr_png_base64(data, self.QR_COLOR_FILL, self.QR_COLOR_BACK, 2)
         except Exception as e:
             logger.critical(f"Fallo crítico en motor QR: {str(e)}", exc_info=True)
             return ""
 
+    def preparar_render(self, historial: Any, base_url: str, generado=None):
+        """
+        Pasos 1-5 del pipeline (BD, firma, QR y plantilla) sin el render.
+        `generado` es la fecha de emisión impresa (la que se guarda en
+        `certificado_generado` si el PDF se persiste).
+        Retorna (html_string, opciones) listos para `PDFJobService`.
+        """
+        estudiante = historial.estudiante
+
+        # 1. Capa de Seguridad: URL Firmada para validación QR
+        verify_url = self.url_verificacion(
+            base_url,
+            estudiante.numero_documento,
+            historial.anio_lectivo
+        )
+
+        # 2. Capa de Activos: Generar QR institucional (memoizado por URL)
+        qr_base64 = self.generate_qr_code(verify_url)
+
+        # 3. Capa de Datos: Procesamiento de calificaciones
+        promedio_final = self._calcular_promedio_robusto(historial.calificaciones_json)
+
+        # 4. Construcción del Contexto de Renderizado
+        context = {
+            'estudiante': estudiante,
+            'historial': historial,
+            'notas': historial.calificaciones_json,
+            'fecha_impresion': generado or timezone.now(),
+            'qr_code': qr_base64,
+            'anio': historial.anio_lectivo,
+            'promedio': promedio_final,
+            'uuid_folio': str(historial.id).split('-')[0].upper(), # Folio visual único
+        }
+
+        # 5. Renderizado de Template a String HTML
+        html_string = render_to_string(PLANTILLA_CERTIFICADO, context)
+        opciones = {
+            'presentational_hints': True, # Importante para CSS de impresión
+            'metadata': self._get_pdf_metadata(estudiante, historial.anio_lectivo),
+        }
+        return html_string, opciones
+
     def generate_certificate_pdf(self, historial: Any, request: HttpRequest) -> bytes:
         """
         Orquestador principal del pipeline de generación de PDF oficial.
         """
         try:
             estudiante = historial.estudiante
-            
-            # 1. Capa de Seguridad: URL Firmada para validación QR
-            verify_url = self.generate_signed_url(
-                request, 
-                estudiante.numero_documento, 
-                historial.anio_lectivo
-            )
-            
-            # 2. Capa de Activos: Generar QR institucional
-            qr_base64 = self.generate_qr_code(verify_url)
-
-            # 3. Capa de Datos: Procesamiento de calificaciones
-            promedio_final = self._calcular_promedio_robusto(historial.calificaciones_json)
-
-            # 4. Construcción del Contexto de Renderizado
-            context = {
-                'estudiante': estudiante,
-                'historial': historial,
-                'notas': historial.calificaciones_json,
-                'fecha_impresion': timezone.now(),
-                'qr_code': qr_base64,
-                'anio': historial.anio_lectivo,
-                'promedio': promedio_final,
-                'uuid_folio': str(historial.id).split('-')[0].upper(), # Folio visual único
-                'request': request 
-            }
-
-            # 5. Renderizado de Template a String HTML
-            html_string = render_to_string('admin/reports/certificate_template.html', context)
-            
-            # 6. Generación de PDF mediante Motor WeasyPrint
             base_url = request.build_absolute_uri('/')
-            html = HTML(string=html_string, base_url=base_url)
-            
-            pdf_bytes = html.write_pdf(
-                presentational_hints=True, # Importante para CSS de impresión
-                metadata=self._get_pdf_metadata(estudiante, historial.anio_lectivo)
-            )
+            html_string, opciones = self.preparar_render(historial, base_url)
+
+            # 6. Generación de PDF mediante Motor WeasyPrint
+            pdf_bytes = PDFJobService.renderizar(html_string, base_url, opciones, plantilla=PLANTILLA_CERTIFICADO)
             
             logger.info(f"Certificado generado exitosamente: {estudiante.numero_documento} - Ciclo {historial.anio_lectivo}")
             return pdf_bytes
@@ -132,6 +165,64 @@ class CertificateService:
             )
             raise ValueError("Error interno procesando el documento. Contacte a sistemas.")
 
+    # ------------------------------------------------------------------
+    # CERTIFICADOS PERSISTIDOS (el HistorialAcademico es un snapshot inmutable)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def huella_certificado(historial: Any, base_url: str) -> str:
+        """
+        Huella de los datos que aparecen en el certificado: los del snapshot
+        y el host del QR de verificación (cambiar de dominio lo regenera).
+        """
+        crudo = json.dumps({
+            'v': VERSION_CERTIFICADO,
+            'id': historial.id,
+            'version': historial.version,
+            'anio': historial.anio_lectivo,
+            'estado': historial.estado_final,
+            'curso': historial.curso_snapshot,
+            'promedio': historial.promedio_final,
+            'notas': historial.calificaciones_json,
+            'documento': historial.estudiante.numero_documento,
+            'host': urlsplit(base_url).netloc,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(crudo.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def vigente(historial: Any, base_url: str) -> bool:
+        return bool(historial.archivo_certificado) and \
+            historial.certificado_huella == CertificateService.huella_certificado(historial, base_url)
+
+    def guardar_certificado(self, historial: Any, pdf_bytes: bytes, base_url: str, generado) -> Any:
+        """`generado` debe ser la misma fecha con que se llamó a `preparar_render`."""
+        historial.certificado_huella = self.huella_certificado(historial, base_url)
+        historial.certificado_generado = generado
+        historial.archivo_certificado.save(
+            f"certificado_{historial.id}_{historial.anio_lectivo}.pdf", ContentFile(pdf_bytes), save=False
+        )
+        historial.save(update_fields=['archivo_certificado', 'certificado_huella', 'certificado_generado'])
+        return historial
+
+    def obtener_certificado(self, historial: Any, base_url: str) -> Any:
+        """
+        Retorna el historial con `archivo_certificado` listo: solo se renderiza
+        la primera vez (o si cambió el snapshot o el host); después se sirve el archivo.
+        """
+        if not self.vigente(historial, base_url):
+            generado = timezone.now()
+            try:
+                html_string, opciones = self.preparar_render(historial, base_url, generado)
+                pdf_bytes = PDFJobService.renderizar(html_string, base_url, opciones, plantilla=PLANTILLA_CERTIFICADO)
+            except Exception as e:
+                logger.critical(
+                    f"🔥 Fallo crítico en generación PDF. Historial ID: {historial.id}. Error: {str(e)}",
+                    exc_info=True
+                )
+                raise ValueError("Error interno procesando el documento. Contacte a sistemas.")
+            self.guardar_certificado(historial, pdf_bytes, base_url, generado)
+        return historial
+
     def _calcular_promedio_robusto(self, notas: Dict) -> float:
         """
         Calcula el promedio aritmético limpiando datos corruptos, textos o nulos.
@@ -186,4 +277,78 @@ class CertificateService:
             'Subject': f"Historial de Calificaciones Oficial - Periodo {anio}",
             'Keywords': f"certificado, notas, {nombre_slug}, {anio}, oficial",
             'Creator': 'Sistema de Gestion Academica V2'
-        }
\ No newline at end of file
+        }
+
+# ===================================================================
+# 🎓 CERTIFICADOS MASIVOS (TEMPORADA DE GRADOS)
+# ===================================================================
+
+def generar_certificados_graduados(anio_lectivo, base_url, al_progresar=None):
+    """
+    Genera (y guarda) el certificado de todos los graduados activos del año.
+    Los ya vigentes se reutilizan; los demás se arman en este hilo y se
+    renderizan en paralelo en el pool de procesos.
+    Retorna [(nombre_archivo, pdf_bytes)] en orden alfabético.
+    """
+    service = CertificateService()
+    historiales = list(
+        HistorialAcademico.objects.filter(
+            anio_lectivo=anio_lectivo, estado_final='GRADUADO', is_active=True
+        ).select_related('estudiante__user').order_by('estudiante__user__last_name', 'estudiante__user__first_name')
+    )
+    total = len(historiales)
+    hechos = 0
+    pendientes = {}
+
+    for historial in historiales:
+        if service.vigente(historial, base_url):
+            hechos += 1
+            continue
+        generado = timezone.now()
+        try:
+            html_string, opciones = service.preparar_render(historial, base_url, generado)
+        except Exception as e:
+            logger.error(f"❌ Certificado del historial {historial.id}: {e}")
+            continue
+        pendientes[PDFJobService.enviar(html_string, base_url, opciones, plantilla=PLANTILLA_CERTIFICADO)] = (historial, generado)
+
+    if al_progresar:
+        al_progresar(hechos, total)
+
+    for futuro in as_completed(pendientes):
+        historial, generado = pendientes[futuro]
+        try:
+            service.guardar_certificado(historial, futuro.result(), base_url, generado)
+        except Exception as e:
+            logger.error(f"❌ Certificado del historial {historial.id}: {e}")
+        hechos += 1
+        if al_progresar:
+            al_progresar(hechos, total)
+
+    documentos = []
+    for historial in historiales:
+        if service.vigente(historial, base_url):
+            with historial.archivo_certificado.open('rb') as f:
+                documentos.append((
+                    f"Certificado_{historial.estudiante.numero_documento or historial.id}_{anio_lectivo}.pdf",
+                    f.read()
+                ))
+    return documentos
+
+
+@registrar_renderizador('CERTIFICADOS_GRADUADOS')
+def _renderizar_certificados_graduados(trabajo):
+    """Parámetros: `anio_lectivo` y `base_url`. Entrega un ZIP con un PDF por graduado."""
+    anio = trabajo.parametros['anio_lectivo']
+    documentos = generar_certificados_graduados(
+        anio, trabajo.parametros.get('base_url') or '/',
+        al_progresar=lambda hechos, total: PDFJobService.reportar_progreso(trabajo, hechos, total)
+    )
+    if not documentos:
+        raise ValueError(f"No hay graduados con certificado para {anio}.")
+
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as zf:
+        for nombre, pdf_bytes in documentos:
+            zf.writestr(nombre, pdf_bytes)
+    return salida.getvalue(), f"certificados_graduados_{anio}.zip"
@@ -0,0 +1,334 @@
+# tasks/services/grades.py
+import logging
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from tasks.models import Nota, NotaDetallada, ComentarioDocente
+from tasks.services.academic_summary import ResumenAcademicoService
+from tasks.ai.cache import PedagogicCache
+from tasks.services.pdf_cache import CachePDFService
+from tasks.services.boletin_ia import AnalisisBoletinService
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+TWO_PLACES = Decimal('0.01')
+ESCALA_MIN = Decimal('1.0')
+ESCALA_MAX = Decimal('5.0')
+DESCRIPCION_DEFINITIVA = 'Promedio Dinámico Auto-generado'
+
+
+def parsear_valor_nota(val_str):
+    """
+    Convierte el texto digitado por el docente ('4,5', '4.5') en Decimal.
+    Devuelve None si viene vacío y lanza ValueError si no es una nota válida.
+    """
+    if val_str is None or not str(val_str).strip():
+        return None
+    try:
+        valor = Decimal(str(val_str).strip().replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"Valor no numérico: {val_str}")
+    if not (ESCALA_MIN <= valor <= ESCALA_MAX):
+        raise ValueError(f"Valor fuera de escala: {val_str}")
+    return valor.quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+def calcular_definitiva(definiciones, valores):
+    """
+    Suma ponderada de los cortes de un periodo.
+    `valores` es un dict {definicion_id: Decimal}. Devuelve None si no hay ningún corte calificado.
+    """
+    suma_ponderada = Decimal('0.0')
+    suma_porcentajes = Decimal('0.0')
+    for definicion in definiciones:
+        valor = valores.get(definicion.id)
+        if valor is None:
+            continue
+        peso = definicion.porcentaje / Decimal('100.0')
+        suma_ponderada += valor * peso
+        suma_porcentajes += peso
+
+    if suma_porcentajes <= 0:
+        return None
+    return suma_ponderada.quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+class GradePersistenceService:
+    """
+    💾 MOTOR DE GUARDADO MASIVO DE CALIFICACIONES (SET-BASED)
+
+    Compara la matriz enviada por el docente contra lo que ya existe en BD y aplica
+    el diferencial con operaciones por lotes (bulk_create / bulk_update / delete id__in).
+    El número de consultas por guardado es constante, sin importar cuántos
+    estudiantes, periodos o columnas tenga la sábana.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, materia, docente, periodos, definiciones_map):
+        self.materia = materia
+        self.docente = docente
+        self.periodos = list(periodos)
+        self.definiciones_map = definiciones_map
+        self.stats = {'creadas': 0, 'actualizadas': 0, 'eliminadas': 0}
+
+    # ---------------------------------------------------------
+    # 🚪 PUNTOS DE ENTRADA
+    # ---------------------------------------------------------
+    def guardar_matriz(self, estudiantes_ids, data):
+        """
+        Persiste notas detalladas, definitivas (numero_nota=5) y comentarios a partir
+        del POST de `subir_notas` (campos nota_<est>_<def> y comentario_<est>_<periodo>).
+        Debe ejecutarse dentro de transaction.atomic().
+        """
+        estudiantes_ids = list(estudiantes_ids)
+        valores = self._leer_matriz(estudiantes_ids, data)
+
+        notas_existentes = {
+            (n.estudiante_id, n.definicion_id): n
+            for n in NotaDetallada.objects.filter(definicion__materia=self.materia)
+        }
+        self._guardar_notas_detalladas(valores, notas_existentes)
+
+        # Los valores inválidos no suman al promedio (mismo criterio del formulario)
+        estado = {key: valor for key, valor in valores.items() if valor}
+        pares = [(est_id, periodo) for est_id in estudiantes_ids for periodo in self.periodos]
+        self._sincronizar_definitivas(pares, estado)
+
+        self._guardar_comentarios(estudiantes_ids, data)
+        ResumenAcademicoService.recalcular(self.materia.curso, estudiantes_ids, self.periodos)
+        # bulk_create/bulk_update no emiten señales: invalidamos las cachés (boletines, IA) aquí
+        CachePDFService.invalidar(estudiantes_ids=estudiantes_ids)
+        PedagogicCache.invalidar_por_datos(estudiantes_ids)
+        AnalisisBoletinService.invalidar(estudiantes_ids)
+        return self.stats
+
+    def guardar_celdas(self, cambios):
+        """
+        ⚡ AUTOGUARDADO INCREMENTAL: recibe solo las celdas editadas
+        [{'estudiante_id', 'definicion_id', 'valor'}, ...], hace upsert de esas
+        NotaDetallada y recalcula únicamente las definitivas afectadas.
+        Devuelve {(estudiante_id, periodo_id): Decimal | None}.
+        Lanza ValueError si alguna celda no es válida (no se guarda nada).
+        """
+        definiciones_por_id = {
+            d.id: d for defs in self.definiciones_map.values() for d in defs
+        }
+        periodos_por_id = {p.id: p for p in self.periodos}
+
+        valores = {}
+        for cambio in cambios:
+            try:
+                est_id = int(cambio['estudiante_id'])
+                def_id = int(cambio['definicion_id'])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Cada celda requiere estudiante_id y definicion_id.")
+            if def_id not in definiciones_por_id:
+                raise ValueError(f"La columna {def_id} no pertenece a esta materia.")
+            valores[(est_id, def_id)] = parsear_valor_nota(cambio.get('valor'))
+
+        if not valores:
+            return {}
+
+        estudiantes_ids = sorted({est_id for est_id, _ in valores})
+        periodos_ids = sorted({definiciones_por_id[def_id].periodo_id for _, def_id in valores})
+        definiciones_afectadas = [
+            d for pid in periodos_ids for d in self.definiciones_map.get(pid, [])
+        ]
+
+        # Traemos todos los cortes de los periodos tocados: sirven para el diff y para el promedio
+        notas_existentes = {
+            (n.estudiante_id, n.definicion_id): n
+            for n in NotaDetallada.objects.filter(
+                estudiante_id__in=estudiantes_ids, definicion__in=definiciones_afectadas
+            )
+        }
+        self._guardar_notas_detalladas(valores, notas_existentes)
+
+        estado = {key: n.valor for key, n in notas_existentes.items()}
+        for key, valor in valores.items():
+            if valor is None:
+                estado.pop(key, None)
+            else:
+                estado[key] = valor
+
+        pares = sorted({
+            (est_id, definiciones_por_id[def_id].periodo_id) for est_id, def_id in valores
+        })
+        definitivas = self._sincronizar_definitivas(
+            [(est_id, periodos_por_id[pid]) for est_id, pid in pares], estado
+        )
+        ResumenAcademicoService.recalcular(
+            self.materia.curso, estudiantes_ids, [periodos_por_id[pid] for pid in periodos_ids]
+        )
+        CachePDFService.invalidar(estudiantes_ids=estudiantes_ids)
+        PedagogicCache.invalidar_por_datos(estudiantes_ids)
+        AnalisisBoletinService.invalidar(estudiantes_ids)
+        return definitivas
+
+    # ---------------------------------------------------------
+    # 1. LECTURA DE LA MATRIZ ENVIADA
+    # ---------------------------------------------------------
+    def _leer_matriz(self, estudiantes_ids, data):
+        """
+        Devuelve {(estudiante_id, definicion_id): Decimal | None | False}.
+        None = celda vacía (se borra), False = valor inválido (no se toca).
+        """
+        valores = {}
+        for est_id in estudiantes_ids:
+            for periodo in self.periodos:
+                for definicion in self.definiciones_map.get(periodo.id, []):
+                    val_str = data.get(f'nota_{est_id}_{definicion.id}')
+                    try:
+                        valores[(est_id, definicion.id)] = parsear_valor_nota(val_str)
+                    except ValueError:
+                        valores[(est_id, definicion.id)] = False
+        return valores
+
+    # ---------------------------------------------------------
+    # 2. NOTAS DETALLADAS (CORTES)
+    # ---------------------------------------------------------
+    def _guardar_notas_detalladas(self, valores, notas_existentes):
+        """`notas_existentes` es el mapa {(estudiante_id, definicion_id): NotaDetallada} ya cargado."""
+        ahora = timezone.now()
+        nuevas, modificadas, ids_borrar = [], [], []
+
+        for key, valor in valores.items():
+            existente = notas_existentes.get(key)
+            if valor is False:
+                continue
+            if valor is None:
+                if existente:
+                    ids_borrar.append(existente.id)
+                continue
+            if existente is None:
+                nuevas.append(NotaDetallada(
+                    estudiante_id=key[0], definicion_id=key[1],
+                    valor=valor, registrado_por=self.docente
+                ))
+            elif existente.valor != valor:
+                existente.valor = valor
+                existente.registrado_por = self.docente
+                existente.fecha_modificacion = ahora
+                modificadas.append(existente)
+
+        self._aplicar(
+            NotaDetallada, nuevas, modificadas, ids_borrar,
+            unique_fields=['definicion', 'estudiante'],
+            update_fields=['valor', 'registrado_por', 'fecha_modificacion'],
+        )
+
+    # ---------------------------------------------------------
+    # 3. SINCRONIZACIÓN CON SISTEMA LEGACY (Nota #5)
+    # ---------------------------------------------------------
+    def _sincronizar_definitivas(self, pares, estado):
+        """
+        Recalcula la definitiva de cada par (estudiante_id, periodo) a partir de `estado`
+        ({(estudiante_id, definicion_id): Decimal}) y devuelve {(estudiante_id, periodo_id): definitiva}.
+        """
+        usuario_sistema, _ = User.objects.get_or_create(username='sistema', defaults={'is_active': False})
+
+        definitivas_existentes = {
+            (n.estudiante_id, n.periodo_id): n
+            for n in Nota.objects.filter(
+                materia=self.materia,
+                periodo__in={periodo.id for _, periodo in pares},
+                estudiante_id__in={est_id for est_id, _ in pares},
+                numero_nota=5
+            )
+        }
+
+        nuevas, modificadas, ids_borrar = [], [], []
+        definitivas = {}
+
+        for est_id, periodo in pares:
+            definiciones = self.definiciones_map.get(periodo.id, [])
+            valores_periodo = {
+                d.id: estado[(est_id, d.id)] for d in definiciones if (est_id, d.id) in estado
+            }
+            definitiva = calcular_definitiva(definiciones, valores_periodo)
+            definitivas[(est_id, periodo.id)] = definitiva
+            existente = definitivas_existentes.get((est_id, periodo.id))
+
+            if definitiva is None:
+                if existente:
+                    ids_borrar.append(existente.id)
+            elif existente is None:
+                nuevas.append(Nota(
+                    estudiante_id=est_id, materia=self.materia, periodo=periodo,
+                    numero_nota=5, valor=definitiva,
+                    descripcion=DESCRIPCION_DEFINITIVA, registrado_por=usuario_sistema
+                ))
+            elif existente.valor != definitiva:
+                existente.valor = definitiva
+                existente.descripcion = DESCRIPCION_DEFINITIVA
+                existente.registrado_por = usuario_sistema
+                modificadas.append(existente)
+
+        self._aplicar(
+            Nota, nuevas, modificadas, ids_borrar,
+            unique_fields=['estudiante', 'materia', 'periodo', 'numero_nota'],
+            update_fields=['valor', 'descripcion', 'registrado_por'],
+        )
+        return definitivas
+
+    # ---------------------------------------------------------
+    # 4. COMENTARIOS DEL DOCENTE
+    # ---------------------------------------------------------
+    def _guardar_comentarios(self, estudiantes_ids, data):
+        comentarios_existentes = {
+            (c.estudiante_id, c.periodo_id): c
+            for c in ComentarioDocente.objects.filter(
+                docente=self.docente, materia=self.materia,
+                periodo__in=self.periodos, estudiante_id__in=estudiantes_ids
+            )
+        }
+
+        nuevos, modificados, ids_borrar = [], [], []
+
+        for est_id in estudiantes_ids:
+            for periodo in self.periodos:
+                texto = (data.get(f'comentario_{est_id}_{periodo.id}') or '').strip()
+                existente = comentarios_existentes.get((est_id, periodo.id))
+
+                if not texto:
+                    if existente:
+                        ids_borrar.append(existente.id)
+                elif existente is None:
+                    nuevos.append(ComentarioDocente(
+                        docente=self.docente, estudiante_id=est_id,
+                        materia=self.materia, periodo=periodo, comentario=texto
+                    ))
+                elif existente.comentario != texto:
+                    existente.comentario = texto
+                    modificados.append(existente)
+
+        self._aplicar(
+            ComentarioDocente, nuevos, modificados, ids_borrar,
+            unique_fields=['docente', 'estudiante', 'materia', 'periodo'],
+            update_fields=['comentario'],
+        )
+
+    # ---------------------------------------------------------
+    # ⚙️ APLICACIÓN DEL DIFERENCIAL
+    # ---------------------------------------------------------
+    def _aplicar(self, model, nuevos, modificados, ids_borrar, unique_fields, update_fields):
+        """Una operación por tipo de cambio y por tabla."""
+        if nuevos:
+            # update_conflicts cubre la carrera de dos pestañas guardando la misma celda
+            model.objects.bulk_create(
+                nuevos, batch_size=self.BATCH_SIZE,
+                update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields
+            )
+        if modificados:
+            model.objects.bulk_update(modificados, update_fields, batch_size=self.BATCH_SIZE)
+        if ids_borrar:
+            model.objects.filter(id__in=ids_borrar).delete()
+
+        self.stats['creadas'] += len(nuevos)
+        self.stats['actualizadas'] += len(modificados)
+        self.stats['eliminadas'] += len(ids_borrar)
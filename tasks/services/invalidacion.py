@@ -0,0 +1,45 @@
+# tasks/services/invalidacion.py
+import threading
+import weakref
+
+from django.db import transaction
+
+_pendientes = threading.local()
+
+
+class _Lote:
+    """Ids acumulados de una transacción; Django lo ejecuta al confirmar."""
+
+    def __init__(self, funcion):
+        self.funcion = funcion
+        self.ids = set()
+        self.ejecutado = False
+
+    def __call__(self):
+        self.ejecutado = True
+        self.funcion(self.ids)
+
+
+def al_confirmar(funcion, estudiantes_ids):
+    """
+    🔔 INVALIDACIÓN DIFERIDA PARA RECEPTORES DE SEÑALES
+
+    Acumula los ids de la transacción en curso y ejecuta `funcion(ids)` una
+    sola vez cuando confirma (de inmediato en autocommit). Así un borrado
+    masivo que emite miles de post_delete termina en una sola consulta.
+
+    Solo se guarda una referencia débil al lote: si la transacción se
+    revierte, Django descarta el callback y el lote desaparece con él.
+    """
+    lotes = getattr(_pendientes, 'lotes', None)
+    if lotes is None:
+        lotes = _pendientes.lotes = {}
+    referencia = lotes.get(funcion)
+    lote = referencia() if referencia else None
+    if lote is None or lote.ejecutado:
+        lote = _Lote(funcion)
+        lotes[funcion] = weakref.ref(lote)
+        lote.ids.update(estudiantes_ids)
+        transaction.on_commit(lote)
+    else:
+        lote.ids.update(estudiantes_ids)
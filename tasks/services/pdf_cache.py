@@ -0,0 +1,206 @@
+# tasks/services/pdf_cache.py
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, models
+from django.db.models import F, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from tasks.models import CachePDF, ComentarioDocente, Convivencia, LogroPeriodo, Nota
+from tasks.services.invalidacion import al_confirmar
+from tasks.services.reports import invalidar_contextos
+
+logger = logging.getLogger(__name__)
+
+# Subir este número invalida toda la caché (p. ej. al cambiar el diseño de una plantilla)
+VERSION_CACHE = 1
+PDF_CACHE_MAX_BYTES = (getattr(settings, 'PDF_CACHE_MAX_MB', 512) or 0) * 1024 * 1024
+
+# Campos que cambian sin afectar el documento (login del estudiante, hash de clave)
+_CAMPOS_IGNORADOS = {'password', 'last_login'}
+
+
+def _normalizar(valor):
+    """Convierte el contexto en una estructura JSON estable (modelos → sus columnas)."""
+    if isinstance(valor, models.Model):
+        datos = {'_modelo': valor._meta.label}
+        for campo in valor._meta.concrete_fields:
+            if campo.attname not in _CAMPOS_IGNORADOS:
+                datos[campo.attname] = _normalizar(getattr(valor, campo.attname))
+        return datos
+    if isinstance(valor, dict):
+        return {str(k): _normalizar(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_normalizar(v) for v in valor]
+    return valor
+
+
+def huella_contexto(tipo, plantilla, context):
+    """SHA-256 del contexto normalizado + plantilla + versión."""
+    crudo = json.dumps(
+        {'v': VERSION_CACHE, 'tipo': tipo, 'plantilla': plantilla, 'contexto': _normalizar(context)},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(crudo.encode('utf-8')).hexdigest()
+
+
+class CachePDFService:
+    """
+    🗄️ CACHÉ DE PDFs DIRECCIONADA POR CONTENIDO
+
+    - La llave es la huella del contexto: si una nota, logro, comentario o
+      registro de convivencia cambia, el contexto cambia y la huella también.
+    - Además, las señales de esos modelos borran de inmediato las entradas
+      del estudiante/curso afectado para no guardar PDFs obsoletos.
+    - Tope de tamaño (settings.PDF_CACHE_MAX_MB) con desalojo LRU.
+    """
+
+    @staticmethod
+    def obtener(huella):
+        entrada = CachePDF.objects.filter(huella=huella).first()
+        if entrada is None:
+            return None
+        if not entrada.archivo or not entrada.archivo.storage.exists(entrada.archivo.name):
+            # El archivo desapareció de MEDIA (limpieza manual, redeploy): se descarta
+            entrada.delete()
+            return None
+        CachePDF.objects.filter(id=entrada.id).update(
+            accesos=F('accesos') + 1, ultimo_acceso=timezone.now()
+        )
+        return entrada
+
+    @staticmethod
+    def obtener_varios(huellas):
+        """Versión por lotes de `obtener`: {huella: entrada} con dos consultas."""
+        vigentes = {}
+        descartadas = []
+        for entrada in CachePDF.objects.filter(huella__in=list(huellas)):
+            if entrada.archivo and entrada.archivo.storage.exists(entrada.archivo.name):
+                vigentes[entrada.huella] = entrada
+            else:
+                descartadas.append(entrada.id)
+        if descartadas:
+            CachePDF.objects.filter(id__in=descartadas).delete()
+        if vigentes:
+            CachePDF.objects.filter(id__in=[e.id for e in vigentes.values()]).update(
+                accesos=F('accesos') + 1, ultimo_acceso=timezone.now()
+            )
+        return vigentes
+
+    @staticmethod
+    def guardar(huella, tipo, pdf_bytes, nombre_archivo='', matricula=None, recortar=True):
+        entrada = CachePDF(
+            huella=huella, tipo=tipo, matricula=matricula,
+            nombre_archivo=nombre_archivo, tamano=len(pdf_bytes)
+        )
+        entrada.archivo.save(f"{huella}.pdf", ContentFile(pdf_bytes), save=False)
+        try:
+            entrada.save()
+        except IntegrityError:
+            # Otra petición guardó la misma huella en paralelo: conservamos la suya
+            entrada.archivo.delete(save=False)
+            return CachePDF.objects.get(huella=huella)
+        if recortar:
+            CachePDFService.recortar(conservar=entrada.id)
+        return entrada
+
+    @staticmethod
+    def obtener_o_generar(tipo, plantilla, context, generar, nombre_archivo='', matricula=None):
+        """
+        Retorna la entrada de caché del documento. `generar()` (que devuelve los
+        bytes del PDF) solo se invoca si la huella no está en caché.
+        La huella se calcula antes de llamar a `generar`, que puede mutar el contexto.
+        """
+        huella = huella_contexto(tipo, plantilla, context)
+        entrada = CachePDFService.obtener(huella)
+        if entrada is not None:
+            logger.info(f"🗄️ PDF {tipo} servido desde caché ({huella[:12]})")
+            return entrada
+        return CachePDFService.guardar(huella, tipo, generar(), nombre_archivo, matricula)
+
+    @staticmethod
+    def invalidar(estudiantes_ids=None, cursos_ids=None):
+        """
+        Borra las entradas de los estudiantes y/o cursos indicados. Retorna cuántas.
+        También descarta sus contextos de boletín en caché (la huella se calcula sobre ellos).
+        """
+        invalidar_contextos(estudiantes_ids, cursos_ids)
+        filtro = models.Q()
+        if estudiantes_ids:
+            filtro |= models.Q(matricula__estudiante_id__in=list(estudiantes_ids))
+        if cursos_ids:
+            filtro |= models.Q(matricula__curso_id__in=list(cursos_ids))
+        if not filtro:
+            return 0
+        borrados, _ = CachePDF.objects.filter(filtro).delete()
+        return borrados
+
+    @staticmethod
+    def recortar(max_bytes=None, conservar=None):
+        """
+        Desalojo LRU: elimina las entradas menos usadas hasta quedar bajo el tope.
+        `conservar` protege la entrada recién guardada (se va a servir ya).
+        """
+        max_bytes = PDF_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        if not max_bytes:
+            return 0
+        total = CachePDF.objects.aggregate(total=Sum('tamano'))['total'] or 0
+        exceso = total - max_bytes
+        if exceso <= 0:
+            return 0
+
+        ids_borrar = []
+        candidatas = CachePDF.objects.exclude(id=conservar).order_by('ultimo_acceso')
+        for entrada_id, tamano in candidatas.values_list('id', 'tamano').iterator():
+            ids_borrar.append(entrada_id)
+            exceso -= tamano
+            if exceso <= 0:
+                break
+        borrados, _ = CachePDF.objects.filter(id__in=ids_borrar).delete()
+        logger.info(f"🗄️ Caché PDF: {borrados} entradas desalojadas (LRU)")
+        return borrados
+
+
+# ===================================================================
+# 🔔 INVALIDACIÓN AUTOMÁTICA (conectada en TasksConfig.ready)
+# Las escrituras masivas (bulk_create/bulk_update) no emiten señales:
+# GradePersistenceService invalida explícitamente y, en todo caso, la
+# huella cambia con los datos, así que nunca se sirve un PDF obsoleto.
+# Altas, cambios y borrados se agrupan por transacción (`al_confirmar`):
+# sin post_delete, borrar una nota o un logro dejaba el contexto del
+# boletín en caché hasta que vencía BOLETIN_CONTEXTO_TTL.
+# ===================================================================
+
+def _invalidar_estudiantes(estudiantes_ids):
+    CachePDFService.invalidar(estudiantes_ids=estudiantes_ids)
+
+
+def _invalidar_cursos(cursos_ids):
+    CachePDFService.invalidar(cursos_ids=cursos_ids)
+
+
+@receiver(post_save, sender=Nota)
+@receiver(post_delete, sender=Nota)
+@receiver(post_save, sender=ComentarioDocente)
+@receiver(post_delete, sender=ComentarioDocente)
+@receiver(post_save, sender=Convivencia)
+@receiver(post_delete, sender=Convivencia)
+def _invalidar_por_estudiante(sender, instance, **kwargs):
+    al_confirmar(_invalidar_estudiantes, [instance.estudiante_id])
+
+
+@receiver(post_save, sender=LogroPeriodo)
+@receiver(post_delete, sender=LogroPeriodo)
+def _invalidar_por_curso(sender, instance, **kwargs):
+    al_confirmar(_invalidar_cursos, [instance.curso_id])
+
+
+@receiver(post_delete, sender=CachePDF)
+def _borrar_archivo_cache(sender, instance, **kwargs):
+    if instance.archivo:
+        instance.archivo.delete(save=False)
@@ -0,0 +1,130 @@
+# tasks/services/pdf_delivery.py
+import hashlib
+import logging
+import mimetypes
+import re
+from datetime import timezone as dt_timezone
+
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+logger = logging.getLogger(__name__)
+
+# Documentos privados: el navegador puede guardarlos pero debe revalidar (304)
+CACHE_CONTROL_DOCUMENTOS = 'private, max-age=0, must-revalidate'
+
+_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _timestamp(fecha):
+    if fecha is None:
+        return None
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=dt_timezone.utc)
+    return int(fecha.timestamp())
+
+
+def etag_de(*partes):
+    """ETag estable a partir de valores que identifican el contenido."""
+    crudo = '|'.join(str(p) for p in partes)
+    return quote_etag(hashlib.sha256(crudo.encode('utf-8')).hexdigest()[:32])
+
+
+def validadores_archivo(archivo, huella=None, modificado=None):
+    """
+    (etag, last_modified) de un FieldFile. La huella conocida (sha256 del
+    documento, huella de la caché) es el mejor ETag; si no hay, se usa
+    nombre + tamaño + fecha de modificación en el storage.
+    """
+    if modificado is None:
+        try:
+            modificado = archivo.storage.get_modified_time(archivo.name)
+        except (NotImplementedError, OSError):
+            modificado = None
+    if huella:
+        etag = quote_etag(huella)
+    else:
+        etag = etag_de(archivo.name, archivo.size, _timestamp(modificado))
+    return etag, modificado
+
+
+def _aplicar_validadores(response, etag, modificado):
+    if etag:
+        response['ETag'] = etag
+    if modificado is not None:
+        response['Last-Modified'] = http_date(_timestamp(modificado))
+    response['Cache-Control'] = CACHE_CONTROL_DOCUMENTOS
+    return response
+
+
+def respuesta_condicional(request, etag=None, modificado=None):
+    """
+    304/412 si el cliente ya tiene esta versión (If-None-Match / If-Modified-Since);
+    None si hay que enviar el documento.
+    """
+    respuesta = get_conditional_response(request, etag=etag, last_modified=_timestamp(modificado))
+    if respuesta is not None:
+        _aplicar_validadores(respuesta, etag, modificado)
+    return respuesta
+
+
+def _rango_solicitado(request, etag, tamano):
+    """(inicio, fin) de un único rango `bytes=` válido, 'invalido' o None (archivo completo)."""
+    encabezado = request.META.get('HTTP_RANGE', '')
+    if not encabezado or tamano == 0:
+        return None
+    # If-Range: solo se honra el rango si el cliente tiene esta misma versión
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        return None
+    coincide = _RANGO.match(encabezado.strip())
+    if not coincide or coincide.groups() == ('', ''):
+        return None  # rangos múltiples o mal formados: se ignora y se envía completo
+    inicio, fin = coincide.groups()
+    if inicio == '':
+        # Sufijo: los últimos N bytes
+        inicio, fin = max(0, tamano - int(fin)), tamano - 1
+    else:
+        inicio, fin = int(inicio), min(int(fin) if fin else tamano - 1, tamano - 1)
+    if inicio > fin or inicio >= tamano:
+        return 'invalido'
+    return inicio, fin
+
+
+def servir_archivo(request, archivo, nombre, huella=None, modificado=None,
+                   as_attachment=False, content_type=None):
+    """
+    📤 Entrega un documento guardado (FieldFile) en streaming con FileResponse.
+    - ETag / Last-Modified / Cache-Control y respuesta 304 si no cambió.
+    - Un solo rango `bytes=` (visores PDF en móviles) con 206.
+    """
+    etag, modificado = validadores_archivo(archivo, huella, modificado)
+    no_modificado = respuesta_condicional(request, etag, modificado)
+    if no_modificado is not None:
+        return no_modificado
+
+    content_type = content_type or mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+    tamano = archivo.size
+    rango = _rango_solicitado(request, etag, tamano)
+
+    if rango == 'invalido':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{tamano}'
+        return _aplicar_validadores(response, etag, modificado)
+
+    if rango is not None:
+        inicio, fin = rango
+        with archivo.open('rb') as f:
+            f.seek(inicio)
+            parte = f.read(fin - inicio + 1)
+        response = HttpResponse(parte, status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+    else:
+        response = FileResponse(
+            archivo.open('rb'), content_type=content_type,
+            as_attachment=as_attachment, filename=nombre
+        )
+    response['Accept-Ranges'] = 'bytes'
+    return _aplicar_validadores(response, etag, modificado)
+
@@ -0,0 +1,364 @@
+# tasks/services/pdf_jobs.py
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from tasks.models import TrabajoPDF
+from tasks.pdf_worker import configurar, renderizar_pdf_medido
+from tasks.services import pdf_metricas
+
+logger = logging.getLogger(__name__)
+
+# Tamaño del pool: PDF_WORKERS en settings o un proceso por núcleo
+PDF_WORKERS = getattr(settings, 'PDF_WORKERS', None) or os.cpu_count() or 2
+# Minutos tras los que un trabajo PENDIENTE/PROCESANDO se da por abandonado
+# (el pool vive en el proceso: un reinicio deja sus trabajos sin nadie que los termine)
+PDF_TRABAJO_VENCIMIENTO_MIN = getattr(settings, 'PDF_TRABAJO_VENCIMIENTO_MIN', 30)
+
+# tipo -> función(trabajo) que devuelve (bytes, nombre_archivo); la extensión del nombre
+# define la del archivo guardado (.pdf, .zip)
+_RENDERIZADORES = {}
+
+PLANTILLA_BOLETIN = 'pdf/boletin_template.html'
+# Tipo de CachePDF de los boletines (individuales y por lote comparten entradas)
+TIPO_CACHE_BOLETIN = 'BOLETIN'
+
+_lock = threading.Lock()
+_pool_procesos = None
+_pool_hilos = None
+
+
+def registrar_renderizador(tipo):
+    """
+    Decorador para registrar cómo se produce un tipo de trabajo.
+    La función recibe el TrabajoPDF y retorna (pdf_bytes, nombre_archivo).
+    Se ejecuta en un hilo del servidor (tiene acceso a la BD); el
+    `write_pdf` debe delegarse a `PDFJobService.renderizar` (pool de procesos).
+    """
+    def decorador(funcion):
+        _RENDERIZADORES[tipo] = funcion
+        return funcion
+    return decorador
+
+
+def configuracion_pdf():
+    """
+    Configuración que recibe cada proceso del pool (`tasks.pdf_worker.configurar`):
+    dónde están en disco los estáticos y MEDIA, para que WeasyPrint no haga
+    peticiones HTTP al propio servidor, y las hojas CSS comunes (PDF_HOJAS_COMUNES).
+    """
+    from django.contrib.staticfiles import finders
+
+    static_dirs = []
+    if settings.STATIC_ROOT:
+        static_dirs.append(str(settings.STATIC_ROOT))
+    for finder in finders.get_finders():
+        # FileSystemFinder (STATICFILES_DIRS) y AppDirectoriesFinder (app/static)
+        for _, ubicacion in getattr(finder, 'locations', []):
+            static_dirs.append(str(ubicacion))
+        for storage in getattr(finder, 'storages', {}).values():
+            ubicacion = getattr(storage, 'location', None)
+            if ubicacion:
+                static_dirs.append(str(ubicacion))
+
+    hojas = []
+    for ruta in getattr(settings, 'PDF_HOJAS_COMUNES', []):
+        encontrada = finders.find(ruta)
+        if encontrada:
+            hojas.append(encontrada)
+        else:
+            logger.warning(f"⚠️ Hoja CSS común para PDFs no encontrada: {ruta}")
+
+    return {
+        'static_url': settings.STATIC_URL,
+        'media_url': settings.MEDIA_URL,
+        'static_dirs': list(dict.fromkeys(static_dirs)),
+        'media_root': str(settings.MEDIA_ROOT),
+        'hojas': hojas,
+    }
+
+
+def _obtener_pools():
+    global _pool_procesos, _pool_hilos
+    with _lock:
+        if _pool_procesos is None:
+            _pool_procesos = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=configurar,
+                initargs=(configuracion_pdf(),),
+            )
+        if _pool_hilos is None:
+            # Hilos coordinadores: consultas + plantilla + espera del proceso
+            _pool_hilos = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix='pdf-job')
+        return _pool_procesos, _pool_hilos
+
+
+def _reiniciar_pool_procesos():
+    global _pool_procesos
+    with _lock:
+        _pool_procesos = None
+
+
+def _clave(tipo, parametros):
+    crudo = json.dumps({'tipo': tipo, 'parametros': parametros}, sort_keys=True, default=str)
+    return hashlib.sha256(crudo.encode('utf-8')).hexdigest()
+
+
+class PDFJobService:
+    """
+    🖨️ COLA DE RENDERIZADO PDF
+
+    - `encolar`: crea (o reutiliza si el mismo usuario ya tiene uno igual en
+      curso) un TrabajoPDF y lo despacha al pool; la vista responde de
+      inmediato con el id.
+    - `procesar`: ejecuta el renderizador registrado (HTML en el hilo,
+      WeasyPrint en un proceso hijo) y guarda el archivo en MEDIA.
+    - `renderizar`: atajo síncrono que usa el mismo pool de procesos. Es la
+      única puerta a WeasyPrint: todas las vistas PDF deben pasar por aquí.
+    """
+
+    @staticmethod
+    def encolar(tipo, parametros, usuario=None):
+        if tipo not in _RENDERIZADORES:
+            raise ValueError(f"Tipo de PDF no registrado: {tipo}")
+
+        clave = _clave(tipo, parametros)
+        # Un trabajo huérfano de un proceso anterior no debe absorber las nuevas solicitudes
+        PDFJobService.vencer_abandonados(clave=clave)
+        # Por solicitante: el trabajo de otro usuario no se puede consultar (puede_ver)
+        # y los lotes registran quién los generó
+        en_curso = TrabajoPDF.objects.filter(
+            clave=clave,
+            solicitado_por=usuario,
+            estado__in=[TrabajoPDF.ESTADO_PENDIENTE, TrabajoPDF.ESTADO_PROCESANDO],
+        ).first()
+        if en_curso:
+            return en_curso
+
+        trabajo = TrabajoPDF.objects.create(
+            tipo=tipo, parametros=parametros, clave=clave, solicitado_por=usuario
+        )
+        # El hilo lee el trabajo con su propia conexión: solo se despacha cuando la
+        # fila ya está confirmada (en autocommit, de inmediato; si se revierte, nunca)
+        trabajo_id = trabajo.id
+        transaction.on_commit(lambda: _obtener_pools()[1].submit(PDFJobService.procesar, trabajo_id))
+        return trabajo
+
+    @staticmethod
+    def vencer_abandonados(**filtros):
+        """
+        Marca como ERROR los trabajos en curso creados hace más de
+        PDF_TRABAJO_VENCIMIENTO_MIN minutos. Retorna cuántos venció.
+        Si el hilo original sigue vivo y termina, `procesar` lo deja en LISTO.
+        """
+        limite = timezone.now() - timedelta(minutes=PDF_TRABAJO_VENCIMIENTO_MIN)
+        return TrabajoPDF.objects.filter(
+            estado__in=[TrabajoPDF.ESTADO_PENDIENTE, TrabajoPDF.ESTADO_PROCESANDO],
+            creado__lt=limite,
+            **filtros
+        ).update(
+            estado=TrabajoPDF.ESTADO_ERROR,
+            error="El trabajo no terminó a tiempo (servidor reiniciado o render detenido). Solicítalo de nuevo.",
+            terminado=timezone.now()
+        )
+
+    @staticmethod
+    def procesar(trabajo_id):
+        close_old_connections()
+        try:
+            trabajo = TrabajoPDF.objects.select_related('solicitado_por').get(id=trabajo_id)
+            TrabajoPDF.objects.filter(id=trabajo.id).update(
+                estado=TrabajoPDF.ESTADO_PROCESANDO, iniciado=timezone.now()
+            )
+
+            pdf_bytes, nombre_archivo = _RENDERIZADORES[trabajo.tipo](trabajo)
+
+            extension = os.path.splitext(nombre_archivo)[1] or '.pdf'
+            trabajo.nombre_archivo = nombre_archivo
+            trabajo.archivo.save(f"{trabajo.id}{extension}", ContentFile(pdf_bytes), save=False)
+            trabajo.estado = TrabajoPDF.ESTADO_LISTO
+            trabajo.terminado = timezone.now()
+            trabajo.save(update_fields=['nombre_archivo', 'archivo', 'estado', 'terminado'])
+        except Exception as e:
+            logger.error(f"❌ Trabajo PDF {trabajo_id} falló: {e}", exc_info=True)
+            TrabajoPDF.objects.filter(id=trabajo_id).update(
+                estado=TrabajoPDF.ESTADO_ERROR, error=str(e)[:2000], terminado=timezone.now()
+            )
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def enviar(html_string, base_url=None, opciones=None, plantilla='',
+               tiempo_contexto=None, tiempo_plantilla=None):
+        """
+        Despacha el render al pool de procesos sin esperar. Retorna un Future (bytes).
+        `opciones` se pasan a `write_pdf` (p. ej. presentational_hints, metadata).
+        `plantilla` y los tiempos previos (segundos) solo alimentan las métricas
+        (`tasks.services.pdf_metricas`): el render, páginas y tamaño se miden siempre.
+        """
+        pool_procesos, _ = _obtener_pools()
+        try:
+            futuro_proceso = pool_procesos.submit(renderizar_pdf_medido, html_string, base_url, opciones)
+        except BrokenProcessPool:
+            logger.warning("⚠️ Pool de PDFs roto; se recrea.")
+            _reiniciar_pool_procesos()
+            pool_procesos, _ = _obtener_pools()
+            futuro_proceso = pool_procesos.submit(renderizar_pdf_medido, html_string, base_url, opciones)
+
+        resultado = Future()
+
+        def completar(futuro):
+            try:
+                pdf_bytes, paginas, segundos = futuro.result()
+            except BaseException as e:
+                resultado.set_exception(e)
+                return
+            resultado.set_result(pdf_bytes)
+            pdf_metricas.registrar(
+                plantilla, segundos, paginas, len(pdf_bytes),
+                tiempo_contexto=tiempo_contexto, tiempo_plantilla=tiempo_plantilla
+            )
+
+        futuro_proceso.add_done_callback(completar)
+        return resultado
+
+    @staticmethod
+    def renderizar(html_string, base_url=None, opciones=None, plantilla='',
+                   tiempo_contexto=None, tiempo_plantilla=None):
+        """Ejecuta WeasyPrint en el pool de procesos y espera los bytes."""
+        metricas = {'plantilla': plantilla, 'tiempo_contexto': tiempo_contexto, 'tiempo_plantilla': tiempo_plantilla}
+        try:
+            return PDFJobService.enviar(html_string, base_url, opciones, **metricas).result()
+        except BrokenProcessPool:
+            # Un hijo murió (OOM, señal): se recrea el pool y se reintenta una vez
+            logger.warning("⚠️ Pool de PDFs roto; se recrea.")
+            _reiniciar_pool_procesos()
+            return PDFJobService.enviar(html_string, base_url, opciones, **metricas).result()
+
+    @staticmethod
+    def renderizar_plantilla(plantilla, context, base_url=None, opciones=None,
+                             tiempo_contexto=None, request=None):
+        """
+        `render_to_string` + `renderizar` midiendo ambas fases.
+        `tiempo_contexto`: segundos que tomó armar `context` (si el llamador los midió).
+        """
+        inicio = time.perf_counter()
+        html_string = render_to_string(plantilla, context, request=request)
+        return PDFJobService.renderizar(
+            html_string, base_url, opciones, plantilla=plantilla,
+            tiempo_contexto=tiempo_contexto, tiempo_plantilla=time.perf_counter() - inicio
+        )
+
+    @staticmethod
+    def reportar_progreso(trabajo, hechos, total):
+        """
+        Guarda el avance de un lote y lo empuja al canal personal del solicitante
+        (NotificationConsumer, evento `pdf.progreso`). Nunca interrumpe el render.
+        """
+        TrabajoPDF.objects.filter(id=trabajo.id).update(progreso_hechos=hechos, progreso_total=total)
+        if not trabajo.solicitado_por_id:
+            return
+        try:
+            channel_layer = get_channel_layer()
+            if channel_layer:
+                async_to_sync(channel_layer.group_send)(
+                    f"user_{trabajo.solicitado_por_id}",
+                    {
+                        'type': 'pdf.progreso',
+                        'trabajo_id': str(trabajo.id),
+                        'tipo': trabajo.tipo,
+                        'hechos': hechos,
+                        'total': total,
+                    }
+                )
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo notificar el progreso del trabajo {trabajo.id}: {e}")
+
+    @staticmethod
+    def puede_ver(trabajo, usuario):
+        """Solo quien lo pidió (o staff) consulta/descarga un trabajo."""
+        return usuario.is_staff or usuario.is_superuser or trabajo.solicitado_por_id == usuario.id
+
+    @staticmethod
+    def a_dict(trabajo):
+        from django.urls import reverse
+        return {
+            'id': str(trabajo.id),
+            'tipo': trabajo.tipo,
+            'estado': trabajo.estado,
+            'error': trabajo.error or None,
+            'progreso': {'hechos': trabajo.progreso_hechos, 'total': trabajo.progreso_total},
+            'estado_url': reverse('pdf_trabajo_estado', args=[trabajo.id]),
+            'descarga_url': reverse('pdf_trabajo_descargar', args=[trabajo.id]) if trabajo.terminado_ok else None,
+        }
+
+
+# ===================================================================
+# 📚 RENDERIZADORES DEL NÚCLEO (tasks)
+# ===================================================================
+
+def obtener_boletin_pdf(matricula_id, usuario=None, base_url=None, request=None):
+    """
+    Boletín de una matrícula como entrada de CachePDF (mismo contenido que
+    `_generar_boletin_pdf_logica`). Si el contexto académico no cambió desde
+    el último render, no se llama a WeasyPrint: se reutiliza el archivo.
+
+    El análisis IA no se calcula aquí: se lee el precalculado
+    (`AnalisisBoletinService`). Si aún no existe, el boletín sale sin él y se
+    programa su cálculo en segundo plano para la próxima descarga.
+    """
+    from tasks.services.boletin_ia import AnalisisBoletinService
+    from tasks.services.pdf_cache import CachePDFService
+    from tasks.services.reports import get_student_report_context
+
+    inicio = time.perf_counter()
+    context = get_student_report_context(matricula_id)
+    tiempo_contexto = time.perf_counter() - inicio
+    if not context:
+        raise ValueError(f"No se encontró contexto para la matrícula_id: {matricula_id}")
+
+    estudiante = context.get('estudiante')
+    analisis = AnalisisBoletinService.obtener(estudiante.id)
+    if analisis:
+        # Forma parte de la huella: cuando el análisis aparece, el PDF se regenera
+        context['analisis_ia'] = analisis
+    else:
+        AnalisisBoletinService.programar(estudiante.id, matricula_id, usuario)
+
+    def generar():
+        if request is not None:
+            context['request'] = request
+        return PDFJobService.renderizar_plantilla(
+            PLANTILLA_BOLETIN, context, base_url, tiempo_contexto=tiempo_contexto
+        )
+
+    return CachePDFService.obtener_o_generar(
+        TIPO_CACHE_BOLETIN, PLANTILLA_BOLETIN, context, generar,
+        nombre_archivo=f"boletin_{estudiante.username}_{context['curso'].anio_escolar}.pdf",
+        matricula=context['matricula']
+    )
+
+
+@registrar_renderizador('BOLETIN')
+def _renderizar_boletin(trabajo):
+    entrada = obtener_boletin_pdf(
+        trabajo.parametros['matricula_id'], trabajo.solicitado_por, trabajo.parametros.get('base_url')
+    )
+    with entrada.archivo.open('rb') as f:
+        return f.read(), entrada.nombre_archivo
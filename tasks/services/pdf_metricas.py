@@ -0,0 +1,144 @@
+# tasks/services/pdf_metricas.py
+import json
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from tasks.models import MetricaPDF
+
+logger = logging.getLogger(__name__)
+
+# PDF_METRICAS = False desactiva tabla y log; PDF_METRICAS_DIAS = días que se conservan
+PDF_METRICAS = getattr(settings, 'PDF_METRICAS', True)
+PDF_METRICAS_DIAS = getattr(settings, 'PDF_METRICAS_DIAS', 30)
+# La purga de filas viejas corre como mucho una vez por este intervalo (segundos)
+INTERVALO_PURGA = 3600
+# Filas por plantilla que se leen para calcular percentiles en el admin
+MAX_MUESTRAS_RESUMEN = 5000
+
+_lock = threading.Lock()
+_pendientes = []
+_volcado_programado = False
+_ultima_purga = 0.0
+_pool = None
+
+
+def _obtener_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # Un solo hilo: las escrituras se agrupan en bulk_create y nunca compiten entre sí
+            _pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pdf-metricas')
+        return _pool
+
+
+def _ms(segundos):
+    return None if segundos is None else int(round(segundos * 1000))
+
+
+def registrar(plantilla, tiempo_render, paginas, tamano, tiempo_contexto=None, tiempo_plantilla=None):
+    """
+    Anota un render (tiempos en segundos). Escribe una línea JSON en el log
+    y encola la fila; un hilo aparte la guarda con las demás pendientes.
+    Nunca lanza excepciones: las métricas no pueden romper un PDF.
+    """
+    global _volcado_programado
+    if not PDF_METRICAS:
+        return
+    try:
+        metrica = MetricaPDF(
+            plantilla=(plantilla or '')[:150],
+            tiempo_contexto_ms=_ms(tiempo_contexto),
+            tiempo_plantilla_ms=_ms(tiempo_plantilla),
+            tiempo_render_ms=_ms(tiempo_render),
+            paginas=paginas or 0,
+            tamano=tamano or 0,
+        )
+        logger.info('pdf_render %s', json.dumps({
+            'plantilla': metrica.plantilla,
+            'contexto_ms': metrica.tiempo_contexto_ms,
+            'plantilla_ms': metrica.tiempo_plantilla_ms,
+            'render_ms': metrica.tiempo_render_ms,
+            'paginas': metrica.paginas,
+            'bytes': metrica.tamano,
+        }))
+        with _lock:
+            _pendientes.append(metrica)
+            if _volcado_programado:
+                return
+            _volcado_programado = True
+        _obtener_pool().submit(_volcar)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo registrar la métrica del PDF: {e}")
+
+
+def _volcar():
+    global _volcado_programado, _ultima_purga
+    close_old_connections()
+    try:
+        with _lock:
+            lote = list(_pendientes)
+            _pendientes.clear()
+            _volcado_programado = False
+        if lote:
+            MetricaPDF.objects.bulk_create(lote)
+
+        ahora = time.monotonic()
+        if PDF_METRICAS_DIAS and ahora - _ultima_purga > INTERVALO_PURGA:
+            _ultima_purga = ahora
+            MetricaPDF.objects.filter(
+                creado__lt=timezone.now() - timedelta(days=PDF_METRICAS_DIAS)
+            ).delete()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron guardar las métricas de PDF: {e}")
+    finally:
+        close_old_connections()
+
+
+def _percentil(ordenados, p):
+    """Percentil por rango más cercano de una lista ya ordenada (None si está vacía)."""
+    if not ordenados:
+        return None
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+def resumen_por_plantilla(queryset=None):
+    """
+    [{plantilla, renders, render_p50, render_p95, contexto_p50, contexto_p95,
+      paginas_prom, kb_prom}] ordenado por p95 de render (las más lentas primero).
+    Usa las MAX_MUESTRAS_RESUMEN filas más recientes de cada plantilla.
+    """
+    queryset = MetricaPDF.objects.all() if queryset is None else queryset
+    muestras = defaultdict(list)
+    for fila in queryset.order_by('plantilla', '-creado').values_list(
+        'plantilla', 'tiempo_render_ms', 'tiempo_contexto_ms', 'paginas', 'tamano'
+    ).iterator():
+        lista = muestras[fila[0]]
+        if len(lista) < MAX_MUESTRAS_RESUMEN:
+            lista.append(fila[1:])
+
+    resumen = []
+    for plantilla, filas in muestras.items():
+        render = sorted(f[0] for f in filas)
+        contexto = sorted(f[1] for f in filas if f[1] is not None)
+        resumen.append({
+            'plantilla': plantilla or '(sin plantilla)',
+            'renders': len(filas),
+            'render_p50': _percentil(render, 50),
+            'render_p95': _percentil(render, 95),
+            'contexto_p50': _percentil(contexto, 50),
+            'contexto_p95': _percentil(contexto, 95),
+            'paginas_prom': round(sum(f[2] for f in filas) / len(filas), 1),
+            'kb_prom': round(sum(f[3] for f in filas) / len(filas) / 1024, 1),
+        })
+    resumen.sort(key=lambda r: r['render_p95'] or 0, reverse=True)
+    return resumen
@@ -1,7 +1,11 @@
 # tasks/services/reports.py
 import logging
+import uuid
 from datetime import date
 from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
 from tasks.models import (
     Matricula, Nota, LogroPeriodo, ComentarioDocente, Convivencia, 
     Institucion, AsignacionMateria, Periodo, Acudiente,
@@ -10,98 +14,247 @@ from tasks.models import (
 
 logger = logging.getLogger(__name__)
 
-def get_student_report_context(matricula_id: int) -> dict:
+# Subir este número invalida los contextos guardados (p. ej. al cambiar su estructura)
+VERSION_CONTEXTO = 1
+# Segundos que vive un contexto en caché. Acota lo que no emite invalidación
+# (cambios de matrícula, asignaciones, institución) y, con una caché local por
+# proceso, lo que se invalidó en otro worker. 0 = sin caché.
+BOLETIN_CONTEXTO_TTL = getattr(settings, 'BOLETIN_CONTEXTO_TTL', 300)
+
+_PREFIJO = f'boletin_ctx:v{VERSION_CONTEXTO}'
+
+
+def get_student_report_context(matricula_id: int, periodo_id=None, usar_cache=True) -> dict:
     """
     Recopila datos para el boletín académico individual.
+    Con `periodo_id` el boletín incluye solo ese periodo (si no, todos los activos).
     """
-    try:
-        matricula = Matricula.objects.select_related('estudiante', 'curso').get(id=matricula_id)
-    except Matricula.DoesNotExist:
+    context = get_student_report_contexts([matricula_id], periodo_id, usar_cache).get(matricula_id)
+    if context is None:
         logger.error(f"No se encontró matrícula con el id: {matricula_id}")
-        return None
+    return context
+
+
+def get_student_report_contexts(matricula_ids, periodo_id=None, usar_cache=True) -> dict:
+    """
+    Contextos del boletín por lotes (curso, grado o cierre anual): {matricula_id: context}.
+    Es la única fuente de datos del boletín (vistas PDF, lotes, cierre anual y retiros).
+
+    Cada contexto se guarda en la caché de Django por matrícula y periodo; solo
+    las matrículas que no están en caché se construyen, con un número fijo de
+    consultas agrupadas (`__in`). Las matrículas inexistentes no aparecen en el resultado.
+    Cada llamada recibe su propia copia (los llamadores pueden mutarla).
+
+    Con `usar_cache=False` se construye desde la BD sin leer ni escribir la
+    caché: lo usan los documentos que se archivan (cierre anual, retiro), que
+    no pueden salir con datos de hasta `BOLETIN_CONTEXTO_TTL` segundos atrás.
+    """
+    matricula_ids = list(dict.fromkeys(matricula_ids))
+    if not matricula_ids:
+        return {}
+    if not usar_cache or not BOLETIN_CONTEXTO_TTL:
+        return _construir_contextos(matricula_ids, periodo_id)
+
+    llaves = _llaves_contexto(matricula_ids, periodo_id)
+    guardados = cache.get_many(list(llaves.values()))
+    contextos = {
+        matricula_id: guardados[llave]
+        for matricula_id, llave in llaves.items() if llave in guardados
+    }
 
-    estudiante = matricula.estudiante
-    curso = matricula.curso
+    faltantes = [matricula_id for matricula_id in matricula_ids if matricula_id not in contextos]
+    if faltantes:
+        nuevos = _construir_contextos(faltantes, periodo_id)
+        cache.set_many({llaves[m]: context for m, context in nuevos.items()}, BOLETIN_CONTEXTO_TTL)
+        contextos.update(nuevos)
 
-    acudiente_link = Acudiente.objects.filter(estudiante=estudiante).select_related('acudiente').first()
-    acudiente = acudiente_link.acudiente if acudiente_link else None
+    hoy = date.today()
+    for context in contextos.values():
+        context['fecha_emision'] = hoy
+    return contextos
+
+
+def _llaves_contexto(matricula_ids, periodo_id):
+    """
+    {matricula_id: llave}. La llave incluye una generación por matrícula:
+    invalidar es cambiar la generación (los contextos viejos expiran solos).
+    """
+    llaves_generacion = {m: f'{_PREFIJO}:gen:{m}' for m in matricula_ids}
+    generaciones = cache.get_many(list(llaves_generacion.values()))
+    nuevas = {}
+    for llave in llaves_generacion.values():
+        if llave not in generaciones:
+            nuevas[llave] = uuid.uuid4().hex[:12]
+    if nuevas:
+        # Sin TTL propio: debe durar más que cualquier contexto que la use
+        cache.set_many(nuevas, None)
+        generaciones.update(nuevas)
+    return {
+        m: f"{_PREFIJO}:{m}:{periodo_id or 'todos'}:{generaciones[llave]}"
+        for m, llave in llaves_generacion.items()
+    }
+
+
+def invalidar_contextos(estudiantes_ids=None, cursos_ids=None):
+    """
+    Descarta los contextos guardados de los estudiantes y/o cursos indicados.
+    Se invoca desde `CachePDFService.invalidar`, que ya cubre las altas, cambios
+    y borrados de Nota/Logro/Comentario/Convivencia y las escrituras masivas de
+    calificaciones.
+    """
+    filtro = Q()
+    if estudiantes_ids:
+        filtro |= Q(estudiante_id__in=list(estudiantes_ids))
+    if cursos_ids:
+        filtro |= Q(curso_id__in=list(cursos_ids))
+    if not filtro or not BOLETIN_CONTEXTO_TTL:
+        return
+    matricula_ids = Matricula.objects.filter(filtro).values_list('id', flat=True)
+    cache.delete_many([f'{_PREFIJO}:gen:{m}' for m in matricula_ids])
+
+
+def _construir_contextos(matricula_ids, periodo_id=None) -> dict:
+    """
+    Carga todo con un número fijo de consultas agrupadas (`__in`) e índices
+    por llave (estudiante, materia, periodo): O(filas), sin consultas por materia × periodo.
+    """
+    matriculas = list(
+        Matricula.objects.select_related('estudiante', 'curso').filter(id__in=list(matricula_ids))
+    )
+    if not matriculas:
+        return {}
+
+    estudiantes_ids = {m.estudiante_id for m in matriculas}
+    cursos = {m.curso_id: m.curso for m in matriculas}
+
+    acudiente_por_estudiante = {}
+    for vinculo in Acudiente.objects.filter(estudiante_id__in=estudiantes_ids).select_related('acudiente').order_by('id'):
+        acudiente_por_estudiante.setdefault(vinculo.estudiante_id, vinculo.acudiente)
 
     institucion = Institucion.objects.first()
     if not institucion:
         institucion = Institucion(nombre="[Configurar Institución en Admin]")
 
-    periodos = list(Periodo.objects.filter(curso=curso, activo=True).order_by('id'))
-    
-    # Lógica de asignaciones por año escolar
-    anio_prefix = curso.anio_escolar.split('-')[0] if curso.anio_escolar else ""
-    asignaciones = AsignacionMateria.objects.filter(
-        curso=curso,
-        activo=True,
-        periodo_academico__startswith=anio_prefix
-    ).select_related('materia', 'docente')
-
-    if not asignaciones.exists():
-        materias_del_curso = list(Materia.objects.filter(curso=curso))
-        asignaciones = []
-        for mat in materias_del_curso:
-            docente_asignado = AsignacionMateria.objects.filter(materia=mat).select_related('docente').last()
-            asignaciones.append(AsignacionMateria(materia=mat, docente=docente_asignado.docente if docente_asignado else None))
-
-    materias_ids = [a.materia.id for a in asignaciones]
-    notas_qs = Nota.objects.filter(estudiante=estudiante, materia_id__in=materias_ids, periodo__in=periodos)
-    logros_qs = LogroPeriodo.objects.filter(curso=curso, materia_id__in=materias_ids, periodo__in=periodos)
-    comentarios_qs = ComentarioDocente.objects.filter(estudiante=estudiante, materia_id__in=materias_ids, periodo__in=periodos).select_related('periodo')
-    convivencia_qs = Convivencia.objects.filter(estudiante=estudiante, curso=curso, periodo__in=periodos)
-
-    materias_data = []
-
-    for asignacion in asignaciones:
-        materia_obj = asignacion.materia 
-        materia_info = {
-            'nombre': materia_obj.nombre,
-            'docente': asignacion.docente.get_full_name() or asignacion.docente.username if asignacion.docente else "Docente no asignado",
-            'periodos_data': [],
-            'promedio_final_materia': Decimal('0.0')
-        }
+    periodos_por_curso = {curso_id: [] for curso_id in cursos}
+    periodos_qs = Periodo.objects.filter(curso_id__in=cursos, activo=True)
+    if periodo_id:
+        periodos_qs = periodos_qs.filter(id=periodo_id)
+    for periodo in periodos_qs.order_by('id'):
+        periodos_por_curso[periodo.curso_id].append(periodo)
 
-        promedios_periodo_existentes = []
+    # Lógica de asignaciones por año escolar (un prefijo por curso, normalmente el mismo)
+    cursos_por_prefijo = {}
+    for curso in cursos.values():
+        anio_prefix = curso.anio_escolar.split('-')[0] if curso.anio_escolar else ""
+        cursos_por_prefijo.setdefault(anio_prefix, []).append(curso.id)
+    filtro_asignaciones = Q()
+    for anio_prefix, ids in cursos_por_prefijo.items():
+        filtro_asignaciones |= Q(curso_id__in=ids, periodo_academico__startswith=anio_prefix)
 
-        for periodo in periodos:
-            # Filtrado en memoria
-            notas_periodo = [n for n in notas_qs if n.materia_id == materia_obj.id and n.periodo_id == periodo.id]
-            logros_periodo = [l.descripcion for l in logros_qs if l.materia_id == materia_obj.id and l.periodo_id == periodo.id]
-            comentarios_periodo = [c.comentario for c in comentarios_qs if c.materia_id == materia_obj.id and c.periodo_id == periodo.id]
+    asignaciones_por_curso = {curso_id: [] for curso_id in cursos}
+    for asignacion in AsignacionMateria.objects.filter(
+        filtro_asignaciones, activo=True
+    ).select_related('materia', 'docente').order_by('id'):
+        asignaciones_por_curso[asignacion.curso_id].append(asignacion)
 
-            nota_promedio_obj = next((n for n in notas_periodo if n.numero_nota == 5), None)
-            promedio_periodo_actual = nota_promedio_obj.valor if nota_promedio_obj else None
+    # Cursos sin asignaciones del año: materias del curso con el último docente asignado
+    cursos_sin_asignaciones = [curso_id for curso_id, lista in asignaciones_por_curso.items() if not lista]
+    if cursos_sin_asignaciones:
+        materias_fallback = list(Materia.objects.filter(curso_id__in=cursos_sin_asignaciones).order_by('id'))
+        ultimo_docente = {}
+        for asignacion in AsignacionMateria.objects.filter(
+            materia__in=materias_fallback
+        ).select_related('docente').order_by('id'):
+            ultimo_docente[asignacion.materia_id] = asignacion.docente
+        for mat in materias_fallback:
+            asignaciones_por_curso[mat.curso_id].append(
+                AsignacionMateria(materia=mat, docente=ultimo_docente.get(mat.id))
+            )
 
-            if promedio_periodo_actual is not None or logros_periodo or comentarios_periodo:
-                if promedio_periodo_actual is not None:
-                    promedios_periodo_existentes.append(promedio_periodo_actual)
+    materias_ids = {a.materia.id for lista in asignaciones_por_curso.values() for a in lista}
+    periodos_ids = {p.id for lista in periodos_por_curso.values() for p in lista}
 
-                materia_info['periodos_data'].append({
-                    'nombre_periodo': periodo.nombre,
-                    'promedio_periodo': promedio_periodo_actual,
-                    'logros': logros_periodo,
-                    'comentarios': comentarios_periodo,
-                })
+    notas_por_llave = {}
+    for nota in Nota.objects.filter(
+        estudiante_id__in=estudiantes_ids, materia_id__in=materias_ids, periodo_id__in=periodos_ids
+    ):
+        notas_por_llave.setdefault((nota.estudiante_id, nota.materia_id, nota.periodo_id), []).append(nota)
 
-        if promedios_periodo_existentes:
-            materia_info['promedio_final_materia'] = (sum(promedios_periodo_existentes) / len(promedios_periodo_existentes)).quantize(Decimal('0.01'))
+    logros_por_llave = {}
+    for logro in LogroPeriodo.objects.filter(
+        curso_id__in=cursos, materia_id__in=materias_ids, periodo_id__in=periodos_ids
+    ):
+        logros_por_llave.setdefault((logro.curso_id, logro.materia_id, logro.periodo_id), []).append(logro.descripcion)
 
-        if materia_info['periodos_data']:
-            materias_data.append(materia_info)
+    comentarios_por_llave = {}
+    for comentario in ComentarioDocente.objects.filter(
+        estudiante_id__in=estudiantes_ids, materia_id__in=materias_ids, periodo_id__in=periodos_ids
+    ):
+        comentarios_por_llave.setdefault(
+            (comentario.estudiante_id, comentario.materia_id, comentario.periodo_id), []
+        ).append(comentario.comentario)
 
-    return {
-        'institucion': institucion,
-        'estudiante': estudiante,
-        'acudiente': acudiente,
-        'curso': curso,
-        'matricula': matricula,
-        'materias_data': materias_data,
-        'convivencia_data': list(convivencia_qs.values('periodo__nombre', 'valor', 'comentario')),
-        'fecha_emision': date.today(),
-        'periodos': periodos,
-        'GRADOS_CHOICES': dict(GRADOS_CHOICES)
-    }
+    convivencia_por_llave = {}
+    for fila in Convivencia.objects.filter(
+        estudiante_id__in=estudiantes_ids, curso_id__in=cursos, periodo_id__in=periodos_ids
+    ).values('estudiante_id', 'curso_id', 'periodo__nombre', 'valor', 'comentario'):
+        llave = (fila.pop('estudiante_id'), fila.pop('curso_id'))
+        convivencia_por_llave.setdefault(llave, []).append(fila)
+
+    contextos = {}
+    for matricula in matriculas:
+        estudiante = matricula.estudiante
+        curso = matricula.curso
+        periodos = periodos_por_curso[curso.id]
+
+        materias_data = []
+        for asignacion in asignaciones_por_curso[curso.id]:
+            materia_obj = asignacion.materia
+            materia_info = {
+                'nombre': materia_obj.nombre,
+                'docente': asignacion.docente.get_full_name() or asignacion.docente.username if asignacion.docente else "Docente no asignado",
+                'periodos_data': [],
+                'promedio_final_materia': Decimal('0.0')
+            }
+
+            promedios_periodo_existentes = []
+
+            for periodo in periodos:
+                notas_periodo = notas_por_llave.get((estudiante.id, materia_obj.id, periodo.id), [])
+                logros_periodo = logros_por_llave.get((curso.id, materia_obj.id, periodo.id), [])
+                comentarios_periodo = comentarios_por_llave.get((estudiante.id, materia_obj.id, periodo.id), [])
+
+                nota_promedio_obj = next((n for n in notas_periodo if n.numero_nota == 5), None)
+                promedio_periodo_actual = nota_promedio_obj.valor if nota_promedio_obj else None
+
+                if promedio_periodo_actual is not None or logros_periodo or comentarios_periodo:
+                    if promedio_periodo_actual is not None:
+                        promedios_periodo_existentes.append(promedio_periodo_actual)
+
+                    materia_info['periodos_data'].append({
+                        'nombre_periodo': periodo.nombre,
+                        'promedio_periodo': promedio_periodo_actual,
+                        'logros': list(logros_periodo),
+                        'comentarios': list(comentarios_periodo),
+                    })
+
+            if promedios_periodo_existentes:
+                materia_info['promedio_final_materia'] = (sum(promedios_periodo_existentes) / len(promedios_periodo_existentes)).quantize(Decimal('0.01'))
+
+            if materia_info['periodos_data']:
+                materias_data.append(materia_info)
+
+        contextos[matricula.id] = {
+            'institucion': institucion,
+            'estudiante': estudiante,
+            'acudiente': acudiente_por_estudiante.get(estudiante.id),
+            'curso': curso,
+            'matricula': matricula,
+            'materias_data': materias_data,
+            'convivencia_data': [dict(fila) for fila in convivencia_por_llave.get((estudiante.id, curso.id), [])],
+            'fecha_emision': date.today(),
+            'periodos': periodos,
+            'GRADOS_CHOICES': dict(GRADOS_CHOICES)
+        }
 
+    return contextos
@@ -0,0 +1,155 @@
+# tasks/services/risk_prediction.py
+import logging
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+
+from tasks.models import Nota
+from tasks.services.academic_summary import NOTA_MINIMA_APROBATORIA
+
+logger = logging.getLogger(__name__)
+
+# Pesos definidos en el sistema
+PESOS = {1: 0.20, 2: 0.30, 3: 0.30, 4: 0.20}
+NOTA_APROBATORIA = float(NOTA_MINIMA_APROBATORIA)
+PESO_RESTANTE_MINIMO = 0.05  # Si falta menos del 5% por evaluar, ya no hay tiempo
+NECESARIA_IMPOSIBLE = 100.0  # Marcador de "nota infinita necesaria"
+
+# Niveles de riesgo: (umbral sobre la nota necesaria, probabilidad, clase CSS, nivel)
+NIVELES_RIESGO = [
+    (5.0, "100% (Irrecuperable)", "bg-dark text-white", "CRÍTICO"),
+    (4.0, "85% (Muy Alta)", "bg-danger text-white", "ALTO"),
+    (3.0, "50% (Media)", "bg-warning text-dark", "MEDIO"),
+]
+NIVEL_BAJO = ("20% (Baja)", "bg-info text-dark", "BAJO")
+
+COLUMNAS = [
+    'id', 'estudiante_id', 'materia_id', 'periodo_id', 'numero_nota', 'valor',
+    'materia__nombre', 'materia__curso__nombre', 'periodo__nombre',
+]
+
+
+class MotorPrediccionRiesgo:
+    """
+    🔮 MOTOR DE PREDICCIÓN DE RIESGO ACADÉMICO (VECTORIZADO)
+
+    Trae en UNA consulta todas las notas (parciales 1-4 y definitiva 5) de los
+    cursos activos a un DataFrame y calcula peso evaluado, nota necesaria y
+    nivel de riesgo con operaciones columnares sobre toda la institución.
+    KPIs y gráficos salen del mismo DataFrame, sin re-consultar.
+    """
+
+    def __init__(self, queryset=None):
+        self.queryset = queryset if queryset is not None else Nota.objects.filter(
+            materia__curso__activo=True
+        )
+
+    def _cargar(self):
+        filas = self.queryset.filter(numero_nota__in=[1, 2, 3, 4, 5]).values_list(*COLUMNAS)
+        df = pd.DataFrame.from_records(list(filas), columns=COLUMNAS)
+        if not df.empty:
+            df['valor'] = df['valor'].astype(float)
+        return df
+
+    @staticmethod
+    def _proyectar(definitivas, parciales):
+        """Agrega peso evaluado, nota necesaria y nivel de riesgo a las definitivas perdidas."""
+        llave = ['estudiante_id', 'materia_id', 'periodo_id']
+        reprobadas = definitivas[definitivas['valor'] < NOTA_APROBATORIA].copy()
+        if reprobadas.empty:
+            return reprobadas
+
+        peso_evaluado = (
+            parciales.assign(peso=parciales['numero_nota'].map(PESOS))
+            .groupby(llave)['peso'].sum()
+            .rename('peso_evaluado')
+        )
+        reprobadas = reprobadas.join(peso_evaluado, on=llave)
+        reprobadas['peso_evaluado'] = reprobadas['peso_evaluado'].fillna(0.0)
+
+        # Proyección: Nota promedio necesaria = Puntos Faltantes / Peso Restante
+        # (la definitiva ya es la SUMA PONDERADA de lo evaluado; la meta total es 3.0)
+        peso_restante = 1.0 - reprobadas['peso_evaluado'].to_numpy()
+        faltante = NOTA_APROBATORIA - reprobadas['valor'].to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            necesaria = np.where(
+                peso_restante > PESO_RESTANTE_MINIMO,
+                faltante / np.where(peso_restante > 0, peso_restante, 1.0),
+                NECESARIA_IMPOSIBLE,
+            )
+        reprobadas['nota_necesaria'] = necesaria
+
+        condiciones = [necesaria > umbral for umbral, *_ in NIVELES_RIESGO]
+        for i, campo in enumerate(('probabilidad', 'clase_riesgo', 'nivel_riesgo'), start=1):
+            reprobadas[campo] = np.select(
+                condiciones, [nivel[i] for nivel in NIVELES_RIESGO], default=NIVEL_BAJO[i - 1]
+            )
+        return reprobadas
+
+    @staticmethod
+    def _lista_riesgo(reprobadas):
+        """Construye la estructura por estudiante que espera la plantilla."""
+        if reprobadas.empty:
+            return []
+
+        estudiantes = User.objects.in_bulk(reprobadas['estudiante_id'].unique().tolist())
+        riesgo_map = {}
+        for fila in reprobadas.sort_values('id').itertuples(index=False):
+            entrada = riesgo_map.get(fila.estudiante_id)
+            if entrada is None:
+                entrada = riesgo_map[fila.estudiante_id] = {
+                    'estudiante': estudiantes.get(fila.estudiante_id),
+                    'curso': fila.materia__curso__nombre,
+                    'total_perdidas': 0,
+                    'materias': []
+                }
+            entrada['total_perdidas'] += 1
+            entrada['materias'].append({
+                'nombre': fila.materia__nombre,
+                'nota_actual': fila.valor,
+                'nota_necesaria': round(float(fila.nota_necesaria), 2) if fila.nota_necesaria < 10 else "> 5.0",
+                'probabilidad': fila.probabilidad,
+                'clase_riesgo': fila.clase_riesgo,
+                'periodo': fila.periodo__nombre
+            })
+
+        # Ordenar: Primero los que tienen más materias perdidas
+        return sorted(riesgo_map.values(), key=lambda x: x['total_perdidas'], reverse=True)
+
+    def calcular(self):
+        """
+        Retorna {'lista_riesgo', 'kpi', 'cursos', 'materias'} con la misma
+        estructura que consumía el tablero (cursos/materias como pares label/data).
+        """
+        df = self._cargar()
+        if df.empty:
+            definitivas = parciales = df
+        else:
+            definitivas = df[df['numero_nota'] == 5]
+            parciales = df[df['numero_nota'] != 5]
+
+        reprobadas = self._proyectar(definitivas, parciales) if not definitivas.empty else definitivas
+
+        total_evaluaciones = int(len(definitivas))
+        conteo_reprobadas = int(len(reprobadas))
+        promedio_global = float(definitivas['valor'].mean()) if total_evaluaciones else 0
+        tasa_reprobacion = (conteo_reprobadas / total_evaluaciones * 100) if total_evaluaciones > 0 else 0
+
+        if total_evaluaciones:
+            por_curso = definitivas.groupby('materia__curso__nombre')['valor'].mean().sort_index()
+            por_materia = definitivas.groupby('materia__nombre')['valor'].mean().sort_values().head(10)
+        else:
+            por_curso = por_materia = pd.Series(dtype=float)
+
+        return {
+            'lista_riesgo': self._lista_riesgo(reprobadas),
+            'kpi': {
+                'promedio': round(promedio_global, 2),
+                'tasa_reprobacion': round(tasa_reprobacion, 1),
+                'total_evaluaciones': total_evaluaciones,
+                'reprobadas': conteo_reprobadas
+            },
+            'cursos': (por_curso.index.tolist(), [round(float(v), 2) for v in por_curso.tolist()]),
+            'materias': (por_materia.index.tolist(), [round(float(v), 2) for v in por_materia.tolist()]),
+        }
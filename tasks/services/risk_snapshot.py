@@ -0,0 +1,239 @@
+# tasks/services/risk_snapshot.py
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections
+from django.db.models import Avg, Count, Sum
+from django.utils import timezone
+
+from tasks.models import (
+    AIUsageLog, Asistencia, Nota, NotaDetallada, Observacion, Seguimiento, SnapshotRiesgo
+)
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+# ==========================================
+# 📊 CONFIGURACIÓN DE BUSINESS INTELLIGENCE
+# ==========================================
+VALOR_PENSIÓN_MENSUAL = 450000  # COP
+MESES_PERDIDA_PROMEDIO = 6      # Tiempo promedio que tarda en llenarse un cupo
+COSTO_LITIGIO_BASE = 5000000    # Costo estimado de una demanda/tutela
+PROBABILIDAD_ESCALAMIENTO = 0.20
+
+# ==========================================
+# 🤖 ECONOMÍA DE APIS (MICRO-COSTOS)
+# ==========================================
+# Precios basados en el estándar de DeepSeek/OpenAI (ajustar según proveedor)
+COSTO_INPUT_1M = 0.14   # USD por 1M tokens entrada
+COSTO_OUTPUT_1M = 0.28  # USD por 1M tokens salida
+
+UMBRAL_ACADEMICO = 3.2
+TIPOS_FALTA_GRAVE = ['CONVIVENCIA', '2', '3']
+MIN_FALLAS_AUSENTISMO = 5
+DIAS_MITIGACION = 15
+HISTORIAL_DEFECTO = 30
+
+
+class SnapshotRiesgoService:
+    """
+    🛡️ MOTOR DE SNAPSHOTS DE RIESGO
+
+    Ejecuta una sola vez los GROUP BY pesados (Nota, NotaDetallada, Observacion,
+    Asistencia, AIUsageLog) y guarda el resultado en SnapshotRiesgo. El Command
+    Center lee la última foto y su historial en lugar de recalcular por petición.
+    """
+
+    @staticmethod
+    def calcular():
+        """Calcula conjuntos y KPIs. Retorna un dict con los campos de SnapshotRiesgo."""
+        # 1. MOTOR DE RIESGO (DETECCIÓN TEMPRANA)
+        ids_legacy = set(
+            Nota.objects.values('estudiante')
+            .annotate(promedio=Avg('valor'))
+            .filter(promedio__lt=UMBRAL_ACADEMICO)
+            .values_list('estudiante', flat=True)
+        )
+        ids_modern = set(
+            NotaDetallada.objects.values('estudiante')
+            .annotate(promedio=Avg('valor'))
+            .filter(promedio__lt=UMBRAL_ACADEMICO)
+            .values_list('estudiante', flat=True)
+        )
+        ids_academico = ids_legacy | ids_modern
+
+        ids_legal = set(
+            Observacion.objects.filter(tipo__in=TIPOS_FALTA_GRAVE)
+            .values_list('estudiante', flat=True).distinct()
+        )
+        ids_ausentismo = set(
+            Asistencia.objects.filter(estado='FALLA')
+            .values('estudiante')
+            .annotate(total_fallas=Count('id'))
+            .filter(total_fallas__gte=MIN_FALLAS_AUSENTISMO)
+            .values_list('estudiante', flat=True)
+        )
+
+        # 2. FILTRO DE GESTIÓN (NETEO DE RIESGO)
+        fecha_limite = timezone.now() - timedelta(days=DIAS_MITIGACION)
+        ids_atendidos = set(
+            Seguimiento.objects.filter(fecha__gte=fecha_limite)
+            .values_list('estudiante', flat=True).distinct()
+        )
+        total_riesgo_ids = ids_academico | ids_legal | ids_ausentismo
+        riesgo_neto_ids = total_riesgo_ids - ids_atendidos
+
+        # 3. IMPACTO FINANCIERO (FORECASTING)
+        count_riesgo_neto = len(riesgo_neto_ids)
+        kpi_dinero = count_riesgo_neto * VALOR_PENSIÓN_MENSUAL * MESES_PERDIDA_PROMEDIO
+        casos_legales_abiertos = len(ids_legal - ids_atendidos)
+        kpi_legal = (casos_legales_abiertos * PROBABILIDAD_ESCALAMIENTO) * COSTO_LITIGIO_BASE
+
+        total_alumnos = User.objects.filter(perfil__rol='ESTUDIANTE').count()
+        tasa_riesgo = round((count_riesgo_neto / (total_alumnos or 1)) * 100, 1)
+
+        # 4. AUDITORÍA DE COSTOS IA (MES CALENDARIO EN CURSO)
+        ahora = timezone.now()
+        metricas_ia = AIUsageLog.objects.filter(
+            fecha__year=ahora.year, fecha__month=ahora.month
+        ).aggregate(total_in=Sum('tokens_entrada'), total_out=Sum('tokens_salida'))
+        tokens_in = metricas_ia['total_in'] or 0
+        tokens_out = metricas_ia['total_out'] or 0
+        costo_mes_ia = (
+            (tokens_in / 1_000_000) * COSTO_INPUT_1M +
+            (tokens_out / 1_000_000) * COSTO_OUTPUT_1M
+        )
+
+        academico = sorted(i for i in ids_academico if i is not None)
+        legal = sorted(i for i in ids_legal if i is not None)
+        ausentismo = sorted(i for i in ids_ausentismo if i is not None)
+        return {
+            'ids_academico': academico,
+            'ids_legal': legal,
+            'ids_ausentismo': ausentismo,
+            'ids_atendidos': sorted(i for i in ids_atendidos if i is not None),
+            'total_alumnos': total_alumnos,
+            'conteo_academico': len(academico),
+            'conteo_legal': len(legal),
+            'conteo_ausentismo': len(ausentismo),
+            'total_riesgo': count_riesgo_neto,
+            'riesgo_mitigado': len(total_riesgo_ids) - count_riesgo_neto,
+            'tasa_riesgo': tasa_riesgo,
+            'kpi_dinero': int(kpi_dinero),
+            'kpi_legal': int(kpi_legal),
+            'tokens_entrada_mes': tokens_in,
+            'tokens_salida_mes': tokens_out,
+            'costo_ia_mes': round(costo_mes_ia, 4),
+        }
+
+    @staticmethod
+    def generar(usuario=None):
+        """Calcula y persiste un snapshot nuevo."""
+        inicio = time.monotonic()
+        datos = SnapshotRiesgoService.calcular()
+        snapshot = SnapshotRiesgo.objects.create(
+            generado_por=usuario,
+            duracion_ms=int((time.monotonic() - inicio) * 1000),
+            **datos
+        )
+        logger.info(f"🛡️ Snapshot de riesgo #{snapshot.id}: {snapshot.total_riesgo} en riesgo ({snapshot.duracion_ms} ms)")
+        return snapshot
+
+    @staticmethod
+    def ultimo(generar_si_no_existe=True):
+        """
+        Última foto; si nunca se ha generado una, la crea (arranque en frío).
+        Los JSON de ids quedan diferidos: el dashboard usa las columnas conteo_*.
+        """
+        snapshot = SnapshotRiesgo.objects.defer(
+            'ids_academico', 'ids_legal', 'ids_ausentismo', 'ids_atendidos'
+        ).order_by('-fecha').first()
+        if snapshot is None and generar_si_no_existe:
+            snapshot = SnapshotRiesgoService.generar()
+        return snapshot
+
+    @staticmethod
+    def historial(limite=HISTORIAL_DEFECTO):
+        """Serie cronológica (antigua → reciente) de KPIs para gráficos de tendencia."""
+        filas = list(
+            SnapshotRiesgo.objects.order_by('-fecha').values(
+                'fecha', 'total_riesgo', 'riesgo_mitigado', 'tasa_riesgo', 'kpi_dinero', 'costo_ia_mes'
+            )[:limite]
+        )
+        filas.reverse()
+        return filas
+
+    @staticmethod
+    def purgar(dias):
+        """Elimina snapshots más antiguos que `dias`. Retorna cuántos borró."""
+        limite = timezone.now() - timedelta(days=dias)
+        borrados, _ = SnapshotRiesgo.objects.filter(fecha__lt=limite).delete()
+        return borrados
+
+
+# ===================================================================
+# ⏱️ PROGRAMADOR EN PROCESO (OPCIONAL)
+# ===================================================================
+
+# Ejecutables que atienden peticiones (Procfile/Dockerfile usan daphne)
+SERVIDORES = ('daphne', 'gunicorn', 'uvicorn', 'hypercorn')
+
+
+def es_proceso_servidor(argv=None, entorno=None):
+    """
+    True si este proceso atiende peticiones. `manage.py migrate`, `test`, `shell`,
+    los comandos de cron y el proceso vigía del autoreloader de runserver no
+    deben arrancar hilos de fondo.
+    """
+    argv = sys.argv if argv is None else argv
+    entorno = os.environ if entorno is None else entorno
+    if not argv:
+        return False
+    if len(argv) > 1 and argv[1] == 'runserver':
+        # Con autoreload el que atiende es el hijo (RUN_MAIN); el padre solo vigila archivos
+        return entorno.get('RUN_MAIN') == 'true' or '--noreload' in argv
+    programa = os.path.basename(os.path.dirname(argv[0]) if argv[0].endswith('__main__.py') else argv[0])
+    return programa.lower() in SERVIDORES
+
+
+class ProgramadorSnapshotRiesgo(threading.Thread):
+    """
+    Hilo daemon que genera un snapshot cada `intervalo_min` minutos.
+    Se activa con settings.RISK_SNAPSHOT_INTERVALO_MIN y solo en el proceso que
+    atiende peticiones (ver TasksConfig.ready y `es_proceso_servidor`); en
+    producción con varios workers es preferible el comando en cron.
+    """
+
+    _instancia = None
+    _lock = threading.Lock()
+
+    def __init__(self, intervalo_min):
+        super().__init__(name='ProgramadorSnapshotRiesgo', daemon=True)
+        self.intervalo = max(1, int(intervalo_min)) * 60
+        self._detener = threading.Event()
+
+    @classmethod
+    def iniciar(cls, intervalo_min):
+        """Arranca un único programador por proceso."""
+        with cls._lock:
+            if cls._instancia is None or not cls._instancia.is_alive():
+                cls._instancia = cls(intervalo_min)
+                cls._instancia.start()
+            return cls._instancia
+
+    def detener(self):
+        self._detener.set()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                SnapshotRiesgoService.generar()
+            except Exception as e:
+                logger.error(f"❌ Error generando snapshot de riesgo: {e}")
+            finally:
+                close_old_connections()
@@ -7,15 +7,25 @@ from django.db import transaction
 from django.conf import settings
 from django.core.management import call_command
 from django.core.files.base import ContentFile # Necesario para guardar el PDF en memoria
-from tasks.models import User, Perfil, Curso, Nota, Asistencia, HistorialAcademico, CierreAnualLog, Periodo
+from tasks.models import User, Perfil, Curso, Nota, Asistencia, HistorialAcademico, CierreAnualLog, Periodo, Matricula
+from tasks.services.academic_summary import NOTA_MINIMA_APROBATORIA
+from tasks.services.boletin_batch import LoteBoletinesService
+
+# Filas por DELETE en la limpieza: Nota y Asistencia tienen receptores post_delete
+# (resumen académico, cachés), así que Django carga cada lote en memoria antes de borrarlo
+LOTE_BORRADO = 5000
+
+
+def borrar_en_lotes(modelo):
+    """Vacía la tabla en lotes de LOTE_BORRADO filas. Retorna el total borrado (con cascadas)."""
+    total = 0
+    while True:
+        ids = list(modelo.objects.order_by('id').values_list('id', flat=True)[:LOTE_BORRADO])
+        if not ids:
+            return total
+        borrados, _ = modelo.objects.filter(id__in=ids).delete()
+        total += borrados
 
-# IMPORTANTE: Asegúrate de haber creado este archivo puente como acordamos
-# Si tu función se llama diferente, ajusta esta línea.
-try:
-    from tasks.utils.pdf_bridge import generar_pdf_binario
-except ImportError:
-    # Fallback para que no rompa si aún no creas el archivo puente
-    def generar_pdf_binario(*args): return b""
 
 class YearRolloverService:
     """
@@ -90,15 +100,23 @@ class YearRolloverService:
     def _fase_congelamiento(self):
         self._log("🧊 Iniciando snapshot y generación masiva de boletines...")
         
-        perfiles = Perfil.objects.filter(rol='ESTUDIANTE').select_related('user')
+        perfiles = list(Perfil.objects.filter(rol='ESTUDIANTE').select_related('user'))
         count_procesados = 0
-        
+
+        # Notas de todos los estudiantes en una consulta (antes: una por estudiante)
+        notas_por_estudiante = {}
+        for nota in Nota.objects.filter(
+            estudiante_id__in=[p.user_id for p in perfiles]
+        ).select_related('materia').order_by('id'):
+            notas_por_estudiante.setdefault(nota.estudiante_id, []).append(nota)
+
+        historiales = {}
         for perfil in perfiles:
             # 1. Obtener datos académicos
             curso_actual = getattr(perfil, 'curso', None)
             nombre_curso = curso_actual.nombre if curso_actual else "Sin Asignar"
             
-            notas = Nota.objects.filter(estudiante=perfil.user).select_related('materia')
+            notas = notas_por_estudiante.get(perfil.user_id, [])
             
             calificaciones_map = {}
             suma_notas = 0.0
@@ -114,7 +132,7 @@ class YearRolloverService:
                 calificaciones_map[nota.materia.nombre] = valor
                 suma_notas += valor
                 conteo_notas += 1
-                if valor < 3.0: 
+                if valor < NOTA_MINIMA_APROBATORIA:
                     materias_perdidas += 1
             
             promedio = round(suma_notas / conteo_notas, 2) if conteo_notas > 0 else 0.0
@@ -136,26 +154,53 @@ class YearRolloverService:
                 estado_final="PENDIENTE"
             )
 
-            # 3. 🔥 GENERACIÓN DE PDF (BOLETÍN) 🔥
-            # Esto debe ocurrir AQUI, mientras las notas existen en la DB
-            try:
-                # Llamada al puente que reutiliza tu lógica actual
-                pdf_bytes = generar_pdf_binario(perfil.user.id, self.anio_actual)
-                
-                if pdf_bytes:
-                    filename = f"Boletin_{self.anio_actual}_{perfil.user.username}.pdf"
-                    # Guardamos el archivo en el campo FileField
-                    historial.archivo_boletin.save(filename, ContentFile(pdf_bytes), save=False)
-            except Exception as e:
-                self._log(f"⚠️ Error generando boletín para {perfil.user}: {e}")
-                # No detenemos el cierre por un PDF fallido, pero lo registramos
+            historiales[perfil.user_id] = historial
+
+        # 🔥 GENERACIÓN MASIVA DE BOLETINES 🔥
+        # Esto debe ocurrir AQUI, mientras las notas existen en la DB: un solo lote
+        # (contextos agrupados + render en paralelo) en lugar de uno por estudiante.
+        self._adjuntar_boletines(historiales)
 
+        for historial in historiales.values():
             # Guardamos el registro (con o sin PDF)
             historial.save()
             count_procesados += 1
         
         self._log(f"✅ {count_procesados} historiales y documentos archivados.")
 
+    def _adjuntar_boletines(self, historiales):
+        """
+        Adjunta a cada historial ({estudiante_id: HistorialAcademico}) el boletín
+        de su matrícula activa, armado con los datos actuales de la BD (sin
+        cachés: es la copia inmutable del año). Cada PDF se escribe en MEDIA en cuanto termina
+        su render y se suelta: el cierre de todo el colegio no acumula los bytes
+        de todos los boletines en memoria.
+        """
+        matricula_por_estudiante = {}
+        for matricula_id, estudiante_id in Matricula.objects.filter(
+            estudiante_id__in=list(historiales), activo=True
+        ).order_by('id').values_list('id', 'estudiante_id'):
+            matricula_por_estudiante.setdefault(estudiante_id, matricula_id)
+
+        estudiante_por_matricula = {m: e for e, m in matricula_por_estudiante.items()}
+        adjuntos = 0
+        try:
+            for matricula_id, _, pdf_bytes in LoteBoletinesService(
+                list(estudiante_por_matricula), base_url=str(settings.BASE_DIR), usar_cache=False
+            ).iterar():
+                historial = historiales[estudiante_por_matricula[matricula_id]]
+                filename = f"Boletin_{self.anio_actual}_{historial.estudiante.user.username}.pdf"
+                # Guardamos el archivo en el campo FileField (el registro se guarda después)
+                historial.archivo_boletin.save(filename, ContentFile(pdf_bytes), save=False)
+                adjuntos += 1
+        except Exception as e:
+            # No detenemos el cierre por los PDFs, pero lo registramos
+            self._log(f"⚠️ Error generando boletines: {e}")
+
+        omitidos = len(historiales) - adjuntos
+        if omitidos:
+            self._log(f"⚠️ {omitidos} estudiantes sin boletín (sin matrícula activa o con error de render).")
+
     # ---------------------------------------------------------
     # ⚖️ FASE 2: MOTOR DE DECISIÓN
     # ---------------------------------------------------------
@@ -183,7 +228,7 @@ class YearRolloverService:
             nombre_curso = curso_actual.nombre.strip().upper()
             es_grado_once = "11" in nombre_curso or "ONCE" in nombre_curso or "UNDECIMO" in nombre_curso
             
-            aprueba_anio = (promedio >= 3.0) and (materias_perdidas <= 2)
+            aprueba_anio = (promedio >= NOTA_MINIMA_APROBATORIA) and (materias_perdidas <= 2)
             
             if aprueba_anio:
                 if es_grado_once:
@@ -211,10 +256,10 @@ class YearRolloverService:
         self._log("🧹 Iniciando limpieza de tablas operativas...")
         
         # Como ya generamos los PDFs en Fase 1, es seguro borrar esto
-        n_notas, _ = Nota.objects.all().delete()
+        n_notas = borrar_en_lotes(Nota)
         self._log(f"🗑️ {n_notas} notas eliminadas.")
         
-        n_asist, _ = Asistencia.objects.all().delete()
+        n_asist = borrar_en_lotes(Asistencia)
         self._log(f"🗑️ {n_asist} registros de asistencia eliminados.")
         
         Periodo.objects.update(activo=False)
@@ -320,8 +365,8 @@ class ReverseProtocolService:
                 ).delete()
                 
                 print("🔥 Limpiando tablas operativas para restauración...")
-                Nota.objects.all().delete()
-                Asistencia.objects.all().delete()
+                borrar_en_lotes(Nota)
+                borrar_en_lotes(Asistencia)
                 
                 backup_path = self.log_cierre.archivo_backup.path
                 if not os.path.exists(backup_path):
@@ -0,0 +1,346 @@
+# tasks/services/sabana.py
+import csv
+import io
+import itertools
+import logging
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.db.models import F
+
+from tasks.models import AsignacionMateria, Materia, Matricula, Nota, Periodo
+from tasks.services.academic_summary import NOTA_MINIMA_APROBATORIA
+
+logger = logging.getLogger(__name__)
+
+NOTA_MINIMA = float(NOTA_MINIMA_APROBATORIA)
+ENCABEZADOS_FIJOS = ['Estudiante', 'Usuario']
+ENCABEZADOS_TOTALES = ['Promedio', 'Perdidas']
+
+
+class Sabana:
+    """
+    📋 SÁBANA DE NOTAS DE UN CURSO/PERIODO
+
+    Matriz densa estudiantes × materias de definitivas (numero_nota=5).
+    Las celdas sin nota son NaN; `filas()` la adapta al formato que
+    consumen las plantillas (`datos_reporte`).
+    """
+
+    def __init__(self, curso, periodo, estudiantes, materias, matriz):
+        self.curso = curso
+        self.periodo = periodo
+        self.estudiantes = estudiantes
+        self.materias = materias
+        self.matriz = matriz
+
+    def filas(self, decimales=None, promedio_sobre_todas=True):
+        """
+        Construye `datos_reporte`: una fila por estudiante con sus notas, promedio y perdidas.
+        - decimales: redondeo de cada celda (None = valor tal cual).
+        - promedio_sobre_todas: True divide entre todas las materias (celdas vacías cuentan 0);
+          False promedia solo las materias con nota.
+        """
+        valores = np.nan_to_num(self.matriz, nan=0.0)
+        if decimales is not None:
+            valores = np.round(valores, decimales)
+
+        con_nota = valores > 0
+        perdidas = (con_nota & (valores < NOTA_MINIMA)).sum(axis=1)
+        sumas = valores.sum(axis=1)
+        if promedio_sobre_todas:
+            divisor = np.full(len(self.estudiantes), len(self.materias), dtype=float)
+        else:
+            divisor = con_nota.sum(axis=1).astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            promedios = np.where(divisor > 0, sumas / np.where(divisor > 0, divisor, 1), 0.0)
+
+        datos_reporte = []
+        for i, estudiante in enumerate(self.estudiantes):
+            datos_reporte.append({
+                'estudiante': estudiante,
+                'notas': [
+                    {'materia_id': materia.id, 'valor': float(valores[i, j])}
+                    for j, materia in enumerate(self.materias)
+                ],
+                'promedio': round(float(promedios[i]), 2),
+                'perdidas': int(perdidas[i])
+            })
+        return datos_reporte
+
+    def encabezados(self):
+        return ENCABEZADOS_FIJOS + [m.nombre for m in self.materias] + ENCABEZADOS_TOTALES
+
+    def filas_planas(self, decimales=1):
+        """Filas listas para CSV/XLSX (nombres + notas + totales). Celdas vacías como ''."""
+        for dato in self.filas(decimales=decimales, promedio_sobre_todas=False):
+            estudiante = dato['estudiante']
+            yield (
+                [estudiante.get_full_name() or estudiante.username, estudiante.username]
+                + [n['valor'] if n['valor'] > 0 else '' for n in dato['notas']]
+                + [dato['promedio'], dato['perdidas']]
+            )
+
+
+class SabanaService:
+    """
+    🧮 MOTOR DE SÁBANAS DE NOTAS
+
+    Construye una o muchas sábanas con un número fijo de consultas
+    (matrículas, materias, asignaciones y definitivas), sin importar cuántos
+    cursos, estudiantes o materias entren: todo se agrupa en memoria y se
+    pivota a una matriz densa por curso.
+    """
+
+    @staticmethod
+    def construir(curso, periodo):
+        """Sábana de un único curso/periodo."""
+        return SabanaService.construir_varios([(curso, periodo)])[0]
+
+    @staticmethod
+    def construir_todos(nombre_periodo, cursos):
+        """
+        Modo institucional: una sábana por curso para el periodo con ese nombre
+        (los periodos son por curso, se emparejan por nombre).
+        """
+        periodos = list(
+            Periodo.objects.filter(curso__in=cursos, nombre=nombre_periodo)
+            .select_related('curso').order_by('curso__grado', 'curso__seccion', 'id')
+        )
+        # Un periodo por curso (el primero, como `.first()`)
+        vistos = set()
+        periodos = [p for p in periodos if not (p.curso_id in vistos or vistos.add(p.curso_id))]
+        return SabanaService.construir_varios([(p.curso, p) for p in periodos])
+
+    @staticmethod
+    def construir_varios(pares):
+        """Construye las sábanas de una lista de pares (curso, periodo)."""
+        pares = list(pares)
+        if not pares:
+            return []
+        cursos_ids = [curso.id for curso, _ in pares]
+        par_por_curso = {curso.id: (curso, periodo) for curso, periodo in pares}
+        curso_por_periodo = {periodo.id: curso.id for curso, periodo in pares}
+
+        # 1. Estudiantes matriculados por curso
+        estudiantes_por_curso = {}
+        for matricula in Matricula.objects.filter(
+            curso_id__in=cursos_ids, activo=True
+        ).select_related('estudiante').order_by('estudiante__last_name', 'id'):
+            estudiantes_por_curso.setdefault(matricula.curso_id, []).append(matricula.estudiante)
+        todos_estudiantes = [e.id for lista in estudiantes_por_curso.values() for e in lista]
+
+        # 2. Definitivas de todos los cursos/periodos en una sola consulta
+        notas = list(
+            Nota.objects.filter(
+                periodo_id__in=curso_por_periodo.keys(), numero_nota=5,
+                estudiante_id__in=todos_estudiantes
+            ).values_list('periodo_id', 'estudiante_id', 'materia_id', 'valor')
+        )
+
+        # 3. Materias: del curso ∪ asignadas al curso ∪ con notas en el periodo
+        materias_ids_por_curso = {cid: set() for cid in cursos_ids}
+        for curso_id, materia_id in Materia.objects.filter(
+            curso_id__in=cursos_ids
+        ).values_list('curso_id', 'id'):
+            materias_ids_por_curso[curso_id].add(materia_id)
+        for curso_id, materia_id in AsignacionMateria.objects.filter(
+            curso_id__in=cursos_ids
+        ).values_list('curso_id', 'materia_id'):
+            materias_ids_por_curso[curso_id].add(materia_id)
+        for periodo_id, _, materia_id, _ in notas:
+            materias_ids_por_curso[curso_por_periodo[periodo_id]].add(materia_id)
+        todas = set().union(*materias_ids_por_curso.values())
+        materias_por_id = Materia.objects.in_bulk(todas)
+
+        # 4. Pivot a matriz densa por curso
+        sabanas = {}
+        indices = {}
+        for curso_id in cursos_ids:
+            estudiantes = estudiantes_por_curso.get(curso_id, [])
+            materias = sorted(
+                (materias_por_id[mid] for mid in materias_ids_por_curso[curso_id]),
+                key=lambda m: (m.nombre, m.id)
+            )
+            curso, periodo = par_por_curso[curso_id]
+            sabanas[curso_id] = Sabana(
+                curso, periodo, estudiantes, materias,
+                np.full((len(estudiantes), len(materias)), np.nan)
+            )
+            indices[curso_id] = (
+                {e.id: i for i, e in enumerate(estudiantes)},
+                {m.id: j for j, m in enumerate(materias)},
+            )
+
+        for periodo_id, est_id, materia_id, valor in notas:
+            curso_id = curso_por_periodo[periodo_id]
+            idx_est, idx_mat = indices[curso_id]
+            if est_id in idx_est and valor is not None:
+                sabanas[curso_id].matriz[idx_est[est_id], idx_mat[materia_id]] = float(valor)
+
+        return [sabanas[cid] for cid in cursos_ids]
+
+    # ---------------------------------------------------------
+    # 📤 EXPORTACIÓN
+    # ---------------------------------------------------------
+    @staticmethod
+    def exportar_csv(sabanas):
+        """CSV con una columna de curso para poder mezclar varios cursos."""
+        buffer = io.StringIO()
+        buffer.write('\ufeff')  # BOM para que Excel respete tildes
+        writer = csv.writer(buffer)
+        for sabana in sabanas:
+            writer.writerow(['Curso', 'Periodo'] + sabana.encabezados())
+            for fila in sabana.filas_planas():
+                writer.writerow([sabana.curso.nombre, sabana.periodo.nombre] + fila)
+        return buffer.getvalue()
+
+    @staticmethod
+    def exportar_xlsx(sabanas):
+        """Libro XLSX con una hoja por curso."""
+        from openpyxl import Workbook
+
+        wb = Workbook(write_only=True)
+        for sabana in sabanas:
+            ws = wb.create_sheet(title=_titulo_hoja(sabana.curso.nombre))
+            ws.append(sabana.encabezados())
+            for fila in sabana.filas_planas():
+                ws.append(fila)
+        if not sabanas:
+            wb.create_sheet(title='Sin datos')
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        return buffer.getvalue()
+
+
+
+class _Eco:
+    """Pseudo-buffer: `csv.writer` escribe y la línea se devuelve tal cual para streaming."""
+
+    def write(self, valor):
+        return valor
+
+
+class SabanaInstitucionalExport:
+    """
+    🏫 EXPORTACIÓN INSTITUCIONAL POR STREAMING
+
+    Recorre las definitivas de todo un año escolar y periodo con un cursor del
+    lado del servidor (`iterator(chunk_size=...)`), ordenadas por curso y
+    estudiante, y escribe fila a fila: CSV en formato largo o XLSX en modo
+    `write_only` con una hoja por curso. La memoria no crece con el tamaño
+    del colegio. Solo aparecen estudiantes con matrícula activa en el curso
+    y con al menos una definitiva en el periodo.
+    """
+
+    CHUNK_SIZE = 2000
+    ENCABEZADOS_CSV = ['Curso', 'Periodo', 'Estudiante', 'Usuario', 'Materia', 'Definitiva']
+
+    def __init__(self, anio_escolar, nombre_periodo):
+        self.anio_escolar = anio_escolar
+        self.nombre_periodo = nombre_periodo
+
+    def _notas(self):
+        # Mismos joins que sabana_notas: Nota ↔ Materia ↔ Matricula activa del curso del periodo
+        return Nota.objects.filter(
+            numero_nota=5,
+            periodo__nombre=self.nombre_periodo,
+            periodo__curso__anio_escolar=self.anio_escolar,
+            estudiante__matriculas__curso=F('periodo__curso'),
+            estudiante__matriculas__activo=True,
+        )
+
+    def _filas(self):
+        return self._notas().order_by(
+            'periodo__curso__grado', 'periodo__curso__seccion', 'periodo__curso_id',
+            'estudiante__last_name', 'estudiante_id', 'materia__nombre'
+        ).values_list(
+            'periodo__curso_id', 'periodo__curso__nombre', 'periodo__nombre',
+            'estudiante_id', 'estudiante__first_name', 'estudiante__last_name', 'estudiante__username',
+            'materia__nombre', 'valor'
+        ).iterator(chunk_size=self.CHUNK_SIZE)
+
+    def iterar_csv(self):
+        """Genera las líneas del CSV (formato largo: una fila por estudiante × materia)."""
+        writer = csv.writer(_Eco())
+        yield '\ufeff' + writer.writerow(self.ENCABEZADOS_CSV)
+        for _, curso, periodo, _, nombre, apellido, usuario, materia, valor in self._filas():
+            nombre_completo = f"{nombre} {apellido}".strip() or usuario
+            yield writer.writerow([curso, periodo, nombre_completo, usuario, materia, _formato_nota(valor)])
+
+    async def aiterar_csv(self, lineas_por_bloque=500):
+        """
+        `iterar_csv` para ASGI. Con un iterador síncrono, StreamingHttpResponse
+        bajo Daphne lo consume entero con sync_to_async(list) antes de enviar
+        el primer byte; aquí cada bloque se pide al generador con
+        sync_to_async (siempre el mismo hilo: el cursor sigue en su conexión).
+        """
+        lineas = self.iterar_csv()
+        siguiente_bloque = sync_to_async(lambda: ''.join(itertools.islice(lineas, lineas_por_bloque)))
+        try:
+            while True:
+                bloque = await siguiente_bloque()
+                if not bloque:
+                    break
+                yield bloque
+        finally:
+            # Cierra el cursor del servidor aunque el cliente corte la descarga
+            await sync_to_async(lineas.close)()
+
+    def escribir_xlsx(self, destino):
+        """Escribe en `destino` (ruta o archivo) un libro con una hoja por curso, formato matriz."""
+        from openpyxl import Workbook
+
+        # Columnas por curso (pocas filas: materias distintas con definitivas)
+        materias_por_curso = {}
+        for curso_id, materia in self._notas().values_list(
+            'periodo__curso_id', 'materia__nombre'
+        ).distinct():
+            materias_por_curso.setdefault(curso_id, set()).add(materia)
+        materias_por_curso = {cid: sorted(nombres) for cid, nombres in materias_por_curso.items()}
+
+        wb = Workbook(write_only=True)
+        hoja = None
+        curso_actual = None
+        columnas = {}
+        fila = None
+        estudiante_actual = None
+
+        def volcar():
+            if fila is not None:
+                notas = [v for v in fila[2:] if v != '']
+                promedio = round(sum(notas) / len(notas), 2) if notas else ''
+                perdidas = sum(1 for v in notas if v < NOTA_MINIMA)
+                hoja.append(fila + [promedio, perdidas])
+
+        for curso_id, curso, _, est_id, nombre, apellido, usuario, materia, valor in self._filas():
+            if curso_id != curso_actual:
+                volcar()
+                fila, estudiante_actual = None, None
+                curso_actual = curso_id
+                materias = materias_por_curso.get(curso_id, [])
+                columnas = {nombre_materia: i for i, nombre_materia in enumerate(materias)}
+                hoja = wb.create_sheet(title=_titulo_hoja(curso))
+                hoja.append(ENCABEZADOS_FIJOS + materias + ENCABEZADOS_TOTALES)
+            if est_id != estudiante_actual:
+                volcar()
+                estudiante_actual = est_id
+                fila = [f"{nombre} {apellido}".strip() or usuario, usuario] + [''] * len(columnas)
+            nota = _formato_nota(valor)
+            if materia in columnas and nota != '':
+                fila[2 + columnas[materia]] = nota
+        volcar()
+
+        if hoja is None:
+            wb.create_sheet(title='Sin datos')
+        wb.save(destino)
+
+
+def _formato_nota(valor):
+    return round(float(valor), 1) if valor is not None else ''
+
+def _titulo_hoja(nombre):
+    """Excel limita los títulos de hoja a 31 caracteres y prohíbe algunos símbolos."""
+    for simbolo in '[]:*?/\\':
+        nombre = nombre.replace(simbolo, '-')
+    return nombre[:31] or 'Curso'
@@ -0,0 +1,301 @@
+# tasks/services/student_dashboard.py
+import json
+import logging
+
+from django.db.models import Count
+
+from tasks.models import (
+    Matricula, Periodo, AsignacionMateria, Materia, Nota, ComentarioDocente,
+    ActividadSemanal, LogroPeriodo, Convivencia, Asistencia
+)
+from tasks.services.academic_summary import NOTA_MINIMA_APROBATORIA, ResumenAcademicoService
+
+logger = logging.getLogger(__name__)
+
+
+def _panel_vacio():
+    return {
+        'curso': None,
+        'matricula': None,
+        'periodos_disponibles': [],
+        'materias_con_notas': {},
+        'comentarios_docente': {},
+        'actividades_semanales': {},
+        'logros_por_materia_por_periodo': {},
+        'convivencia_notas': {},
+        'stats': _empaquetar_stats([], [], [], [], 0, 0, 0.0, 100.0, 0, []),
+        'docentes': [],
+    }
+
+
+def _empaquetar_stats(materias_labels, materias_promedios, periodos_labels, periodos_data,
+                      ganadas, perdidas, promedio_general, asistencia_pct, total_fallas, detalle_fallas):
+    return {
+        'materias_labels': json.dumps(materias_labels),
+        'materias_data': json.dumps(materias_promedios),
+        'periodos_labels': json.dumps(periodos_labels),
+        'periodos_data': json.dumps(periodos_data),
+        'ganadas': ganadas,
+        'perdidas': perdidas,
+        'promedio_general': round(promedio_general, 2),
+        'distribucion_data': json.dumps([ganadas, perdidas]),
+        'asistencia_pct': asistencia_pct,
+        'total_fallas': total_fallas,
+        'detalle_fallas': detalle_fallas,
+    }
+
+
+def _directorio_docentes(asignaciones):
+    docentes_directorio = []
+    docentes_vistos = set()
+    for asig in asignaciones:
+        if asig.docente_id and asig.docente_id not in docentes_vistos:
+            docente = asig.docente
+            # Foto segura (sin romper si el docente no tiene perfil)
+            foto_url = None
+            try:
+                if hasattr(docente, 'perfil') and docente.perfil.foto:
+                    foto_url = docente.perfil.foto.url
+            except Exception:
+                foto_url = None
+
+            docentes_directorio.append({
+                'id': docente.id,
+                'nombre': docente.get_full_name() or docente.username,
+                'materia_principal': asig.materia.nombre,
+                'foto_url': foto_url
+            })
+            docentes_vistos.add(docente.id)
+    return docentes_directorio
+
+
+def cargar_panel_estudiante(estudiante):
+    """
+    🎒 CARGADOR DEL PANEL ACADÉMICO DE UN ESTUDIANTE
+
+    Compartido por `dashboard_estudiante` y `dashboard_acudiente`.
+    Atajo de `cargar_paneles_estudiantes` para un único estudiante.
+    """
+    return cargar_paneles_estudiantes([estudiante])[estudiante.id]
+
+
+def cargar_paneles_estudiantes(estudiantes):
+    """
+    👨‍👩‍👧 CARGADOR POR LOTES DE PANELES ACADÉMICOS
+
+    Trae cada fuente (notas, comentarios, actividades, logros, convivencia,
+    asistencia) con UNA consulta para todos los estudiantes usando filtros
+    `__in` por estudiante y curso, y agrupa en Python con índices por
+    estudiante/curso/materia/periodo. El número de consultas no crece con el
+    número de materias ni con el número de hijos de un acudiente.
+    Retorna {estudiante_id: panel}.
+    """
+    estudiantes = list(estudiantes)
+    if not estudiantes:
+        return {}
+    ids_estudiantes = [e.id for e in estudiantes]
+
+    # Matrícula activa de cada estudiante (la primera, como en `.first()`)
+    matriculas = {}
+    for m in Matricula.objects.filter(
+        estudiante_id__in=ids_estudiantes, activo=True
+    ).select_related('curso').order_by('id'):
+        matriculas.setdefault(m.estudiante_id, m)
+    cursos_por_estudiante = {est_id: m.curso for est_id, m in matriculas.items()}
+    ids_cursos = {c.id for c in cursos_por_estudiante.values()}
+
+    if not matriculas:
+        return {est_id: _panel_vacio() for est_id in ids_estudiantes}
+
+    periodos_por_curso = {}
+    for periodo in Periodo.objects.filter(curso_id__in=ids_cursos, activo=True).order_by('id'):
+        periodos_por_curso.setdefault(periodo.curso_id, []).append(periodo)
+
+    asignaciones_por_curso = {}
+    for asig in AsignacionMateria.objects.filter(
+        curso_id__in=ids_cursos, activo=True
+    ).select_related('materia', 'docente', 'docente__perfil'):
+        asignaciones_por_curso.setdefault(asig.curso_id, []).append(asig)
+
+    # Todas las notas de todos los estudiantes en una sola consulta
+    notas_por_estudiante = {}
+    for nota in Nota.objects.filter(
+        estudiante_id__in=ids_estudiantes
+    ).select_related('periodo').order_by('periodo__id', 'numero_nota'):
+        notas_por_estudiante.setdefault(nota.estudiante_id, []).append(nota)
+
+    # Materias reales = con docente asignado ∪ con notas en el curso (Convivencia/transversales)
+    ids_materias_por_estudiante = {}
+    for est_id, curso in cursos_por_estudiante.items():
+        ids = {a.materia_id for a in asignaciones_por_curso.get(curso.id, [])}
+        ids |= {
+            n.materia_id for n in notas_por_estudiante.get(est_id, [])
+            if n.periodo.curso_id == curso.id
+        }
+        ids_materias_por_estudiante[est_id] = ids
+    ids_materias = set().union(*ids_materias_por_estudiante.values())
+    materias_por_id = {m.id: m for m in Materia.objects.filter(id__in=ids_materias)}
+
+    # -----------------------------------------------------------
+    # 1. ÍNDICES EN MEMORIA
+    # -----------------------------------------------------------
+    comentarios_idx = {}
+    for c in ComentarioDocente.objects.filter(
+        estudiante_id__in=ids_estudiantes, materia_id__in=ids_materias
+    ).order_by('-fecha_creacion'):
+        comentarios_idx.setdefault((c.estudiante_id, c.materia_id), []).append(c)
+
+    actividades_idx = {}
+    for act in ActividadSemanal.objects.filter(
+        curso_id__in=ids_cursos, materia_id__in=ids_materias
+    ).order_by('-fecha_creacion'):
+        actividades_idx.setdefault((act.curso_id, act.materia_id), []).append(act)
+
+    logros_idx = {}
+    for logro in LogroPeriodo.objects.filter(
+        curso_id__in=ids_cursos, materia_id__in=ids_materias
+    ).order_by('periodo__id', '-fecha_creacion'):
+        logros_idx.setdefault((logro.curso_id, logro.materia_id), {}) \
+            .setdefault(logro.periodo_id, []).append(logro)
+
+    # Estadísticas por periodo (desde el resumen materializado)
+    resumenes = ResumenAcademicoService.obtener_lote(cursos_por_estudiante, periodos_por_curso)
+
+    # Asistencia: totales agrupados + detalle de fallas
+    total_clases_idx = {
+        (fila['estudiante_id'], fila['curso_id']): fila['total']
+        for fila in Asistencia.objects.filter(
+            estudiante_id__in=ids_estudiantes, curso_id__in=ids_cursos
+        ).values('estudiante_id', 'curso_id').annotate(total=Count('id'))
+    }
+    fallas_idx = {}
+    for falla in Asistencia.objects.filter(
+        estudiante_id__in=ids_estudiantes, curso_id__in=ids_cursos, estado='FALLA'
+    ).select_related('materia').order_by('-fecha'):
+        fallas_idx.setdefault((falla.estudiante_id, falla.curso_id), []).append(falla)
+
+    convivencia_idx = {}
+    for conv in Convivencia.objects.filter(
+        estudiante_id__in=ids_estudiantes, curso_id__in=ids_cursos
+    ):
+        convivencia_idx.setdefault((conv.estudiante_id, conv.curso_id), {})[conv.periodo_id] = {
+            'valor': conv.valor, 'comentario': conv.comentario
+        }
+
+    # -----------------------------------------------------------
+    # 2. ENSAMBLAJE POR ESTUDIANTE
+    # -----------------------------------------------------------
+    paneles = {}
+    for est_id in ids_estudiantes:
+        matricula = matriculas.get(est_id)
+        if not matricula:
+            paneles[est_id] = _panel_vacio()
+            continue
+        curso = matricula.curso
+        ids_mat = ids_materias_por_estudiante[est_id]
+        materias = sorted(
+            (materias_por_id[mid] for mid in ids_mat if mid in materias_por_id),
+            key=lambda m: m.nombre
+        )
+        paneles[est_id] = _ensamblar_panel(
+            matricula=matricula,
+            periodos_disponibles=periodos_por_curso.get(curso.id, []),
+            asignaciones=asignaciones_por_curso.get(curso.id, []),
+            materias=materias,
+            notas=[n for n in notas_por_estudiante.get(est_id, []) if n.materia_id in ids_mat],
+            comentarios={mid: comentarios_idx[(est_id, mid)] for mid in ids_mat if (est_id, mid) in comentarios_idx},
+            actividades={mid: actividades_idx[(curso.id, mid)] for mid in ids_mat if (curso.id, mid) in actividades_idx},
+            logros={mid: logros_idx[(curso.id, mid)] for mid in ids_mat if (curso.id, mid) in logros_idx},
+            resumenes=resumenes.get(est_id, {}),
+            total_clases=total_clases_idx.get((est_id, curso.id), 0),
+            fallas_detalladas=fallas_idx.get((est_id, curso.id), []),
+            convivencia_notas=convivencia_idx.get((est_id, curso.id), {}),
+        )
+    return paneles
+
+
+def _ensamblar_panel(matricula, periodos_disponibles, asignaciones, materias, notas,
+                     comentarios, actividades, logros, resumenes, total_clases,
+                     fallas_detalladas, convivencia_notas):
+    """Arma el contexto de un estudiante a partir de los índices ya cargados (sin consultas)."""
+    notas_por_materia = {}
+    for nota in notas:
+        notas_por_materia.setdefault(nota.materia_id, []).append(nota)
+
+    # -----------------------------------------------------------
+    # ESTADÍSTICAS ACADÉMICAS Y DATOS DETALLADOS
+    # -----------------------------------------------------------
+    materias_con_notas = {}
+    comentarios_docente = {}
+    actividades_semanales = {}
+    logros_por_materia_por_periodo = {}
+    stats_materias_labels = []
+    stats_materias_promedios = []
+    conteo_ganadas = 0
+    conteo_perdidas = 0
+
+    for materia in materias:
+        notas_mat = notas_por_materia.get(materia.id, [])
+
+        definitivas = [n.valor for n in notas_mat if n.numero_nota == 5]
+        promedio_materia = 0.0
+        if definitivas:
+            promedio_materia = float(sum(definitivas)) / len(definitivas)
+            if promedio_materia >= NOTA_MINIMA_APROBATORIA:
+                conteo_ganadas += 1
+            else:
+                conteo_perdidas += 1
+        stats_materias_labels.append(materia.nombre)
+        stats_materias_promedios.append(round(promedio_materia, 2))
+
+        notas_por_periodo = {}
+        for nota in notas_mat:
+            notas_por_periodo.setdefault(nota.periodo_id, {})[nota.numero_nota] = nota
+        if notas_por_periodo:
+            materias_con_notas[materia] = notas_por_periodo
+
+        if materia.id in comentarios:
+            comentarios_docente[materia.id] = comentarios[materia.id]
+        if materia.id in actividades:
+            actividades_semanales[materia.id] = actividades[materia.id]
+        if materia.id in logros:
+            logros_por_materia_por_periodo[materia] = logros[materia.id]
+
+    promedio_general = 0.0
+    promedios_validos = [p for p in stats_materias_promedios if p > 0]
+    if promedios_validos:
+        promedio_general = sum(promedios_validos) / len(promedios_validos)
+
+    stats_periodos_labels = []
+    stats_periodos_data = []
+    for periodo in periodos_disponibles:
+        stats_periodos_labels.append(periodo.nombre)
+        resumen = resumenes.get(periodo.id)
+        stats_periodos_data.append(float(resumen.promedio) if resumen and resumen.promedio is not None else 0)
+
+    # -----------------------------------------------------------
+    # ASISTENCIA
+    # -----------------------------------------------------------
+    total_fallas = len(fallas_detalladas)
+    porcentaje_asistencia = 100.0
+    if total_clases > 0:
+        porcentaje_asistencia = ((total_clases - total_fallas) / total_clases) * 100
+    porcentaje_asistencia = round(porcentaje_asistencia, 1)
+
+    return {
+        'curso': matricula.curso,
+        'matricula': matricula,
+        'periodos_disponibles': periodos_disponibles,
+        'materias_con_notas': materias_con_notas,
+        'comentarios_docente': comentarios_docente,
+        'actividades_semanales': actividades_semanales,
+        'logros_por_materia_por_periodo': logros_por_materia_por_periodo,
+        'convivencia_notas': convivencia_notas,
+        'stats': _empaquetar_stats(
+            stats_materias_labels, stats_materias_promedios,
+            stats_periodos_labels, stats_periodos_data,
+            conteo_ganadas, conteo_perdidas, promedio_general,
+            porcentaje_asistencia, total_fallas, fallas_detalladas
+        ),
+        'docentes': _directorio_docentes(asignaciones),
+    }
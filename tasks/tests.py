@@ -0,0 +1,1381 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, models, transaction
+from django.db.models.fields.files import FieldFile
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.academics import models as academicos
+from apps.wellbeing import models as bienestar
+from apps.wellbeing.services.expediente_batch import DOCUMENTOS_LOTE, ExpedientesCursoService
+from tasks.ai.cache import PedagogicCache, ai_cache
+from tasks.ai.constants import ACCION_CUMPLIMIENTO_PEI, ACCION_MEJORAS_ESTUDIANTE, DOC_ANALISIS_BOLETIN
+from tasks.ai.deepseek_client import CircuitBreaker, DeepSeekClient
+from tasks.ai.single_flight import SingleFlight, _BackendArchivos
+from tasks.models import (
+    AIDocumento, AIRespuestaCache, AIUsageLog, Acudiente, ActividadSemanal, AsignacionMateria, Asistencia,
+    CachePDF, ComentarioDocente, Convivencia, Curso, DefinicionNota, HistorialAcademico, LogroPeriodo,
+    Materia, Matricula, Nota, NotaDetallada, Perfil, Periodo, PeriodoAcademico, ResumenAcademico,
+    SnapshotRiesgo, TrabajoPDF,
+)
+from tasks.consumers import SocraticAIConsumer
+from tasks.services.academic_summary import ResumenAcademicoService
+from tasks.services.boletin_batch import LoteBoletinesService
+from tasks.services.certificate_service import CertificateService
+from tasks.services.grades import GradePersistenceService
+from tasks.services.pdf_cache import CachePDFService
+from tasks.services.pdf_delivery import servir_archivo
+from tasks.services.pdf_jobs import PDFJobService
+from tasks.services.reports import _llaves_contexto, get_student_report_contexts
+from tasks.views import generar_boletin_pdf_admin
+from tasks.services.risk_prediction import MotorPrediccionRiesgo
+from tasks.services.risk_snapshot import SnapshotRiesgoService, es_proceso_servidor
+from tasks.services.rollover import YearRolloverService
+from tasks.services.sabana import SabanaInstitucionalExport
+from tasks.services.student_dashboard import cargar_panel_estudiante, cargar_paneles_estudiantes
+from tasks.views_shadow import shadow_tenant_dashboard
+
+
+def crear_curso(n_estudiantes, n_materias=1, n_periodos=2, n_cortes=4):
+    """Curso con docente, estudiantes matriculados y plan de evaluación completo."""
+    docente = User.objects.create(username='docente')
+    Perfil.objects.update_or_create(user=docente, defaults={'rol': 'DOCENTE'})
+    curso = Curso.objects.create(nombre='6A', grado='6', seccion='A', anio_escolar='2025-2026')
+    materias = [Materia.objects.create(nombre=f'Materia {i}', curso=curso) for i in range(n_materias)]
+    for materia in materias:
+        AsignacionMateria.objects.create(materia=materia, curso=curso, docente=docente)
+    periodos = [Periodo.objects.create(nombre=f'Periodo {i}', curso=curso) for i in range(1, n_periodos + 1)]
+
+    estudiantes = []
+    for i in range(n_estudiantes):
+        estudiante = User.objects.create(username=f'estudiante{i}', first_name='Est', last_name=f'{i:03d}')
+        Perfil.objects.update_or_create(user=estudiante, defaults={'rol': 'ESTUDIANTE'})
+        Matricula.objects.create(estudiante=estudiante, curso=curso, anio_escolar=curso.anio_escolar)
+        estudiantes.append(estudiante)
+
+    definiciones = {
+        (materia.id, periodo.id): [
+            DefinicionNota.objects.create(
+                materia=materia, periodo=periodo, nombre=f'Corte {orden}',
+                porcentaje=100 // n_cortes, orden=orden
+            )
+            for orden in range(1, n_cortes + 1)
+        ]
+        for materia in materias for periodo in periodos
+    }
+    return docente, curso, materias, periodos, estudiantes, definiciones
+
+
+class GuardarMatrizConsultasTest(TestCase):
+    """El guardado de la sábana hace un número de consultas constante."""
+
+    # Lecturas del diff + un bulk por tabla tocada + resumen académico + invalidación de cachés
+    CONSULTAS_INSERCION = 18
+    CONSULTAS_ACTUALIZACION = 17
+    # Nota y ComentarioDocente tienen receptores post_delete: Django lee las filas antes de borrarlas
+    CONSULTAS_BORRADO = 20
+
+    def setUp(self):
+        # El usuario 'sistema' firma las definitivas; existe en cualquier instalación en uso
+        User.objects.create(username='sistema', is_active=False)
+
+    def _escenario(self, n_estudiantes):
+        docente, curso, materias, periodos, estudiantes, definiciones = crear_curso(n_estudiantes)
+        materia = materias[0]
+        definiciones_map = {p.id: definiciones[(materia.id, p.id)] for p in periodos}
+        data = {}
+        for est in estudiantes:
+            for periodo in periodos:
+                for definicion in definiciones_map[periodo.id]:
+                    data[f'nota_{est.id}_{definicion.id}'] = '4,0'
+                data[f'comentario_{est.id}_{periodo.id}'] = 'Buen trabajo'
+        servicio = GradePersistenceService(materia, docente, periodos, definiciones_map)
+        return servicio, [e.id for e in estudiantes], data
+
+    def _guardar(self, servicio, estudiantes_ids, data):
+        with transaction.atomic():
+            return servicio.guardar_matriz(estudiantes_ids, data)
+
+    def test_consultas_constantes_al_crecer_el_curso(self):
+        # Tamaños bajo el tope de parámetros de SQLite (999), que parte los bulk en lotes
+        for n_estudiantes in (3, 20):
+            with self.subTest(estudiantes=n_estudiantes):
+                servicio, ids, data = self._escenario(n_estudiantes)
+                with self.assertNumQueries(self.CONSULTAS_INSERCION):
+                    stats = self._guardar(servicio, ids, data)
+                # 8 cortes + 2 definitivas + 2 comentarios por estudiante
+                self.assertEqual(stats['creadas'], n_estudiantes * 12)
+                User.objects.exclude(username='sistema').delete()
+                Curso.objects.all().delete()
+
+    def test_actualizacion_y_borrado_por_lotes(self):
+        servicio, ids, data = self._escenario(20)
+        self._guardar(servicio, ids, data)
+
+        for llave in data:
+            if llave.startswith('nota_'):
+                data[llave] = '3.5'
+        servicio.stats = {'creadas': 0, 'actualizadas': 0, 'eliminadas': 0}
+        with self.assertNumQueries(self.CONSULTAS_ACTUALIZACION):
+            stats = self._guardar(servicio, ids, data)
+        self.assertEqual(stats['actualizadas'], 20 * 10)
+        self.assertEqual(set(Nota.objects.filter(numero_nota=5).values_list('valor', flat=True)), {Decimal('3.50')})
+
+        servicio.stats = {'creadas': 0, 'actualizadas': 0, 'eliminadas': 0}
+        with self.assertNumQueries(self.CONSULTAS_BORRADO):
+            stats = self._guardar(servicio, ids, {})
+        self.assertEqual(stats['eliminadas'], 20 * 12)
+        self.assertFalse(NotaDetallada.objects.exists())
+        self.assertFalse(Nota.objects.exists())
+        self.assertFalse(ComentarioDocente.objects.exists())
+
+
+class AutoguardarNotasApiTest(TestCase):
+    """Autoguardado por celda de la sábana."""
+
+    def setUp(self):
+        self.docente, _, materias, periodos, estudiantes, definiciones = crear_curso(2)
+        self.materia = materias[0]
+        self.estudiante = estudiantes[0]
+        self.definicion = definiciones[(self.materia.id, periodos[0].id)][0]
+        self.periodo = periodos[0]
+        self.url = reverse('api_autoguardar_notas', args=[self.materia.id])
+        self.client.force_login(self.docente)
+
+    def _post(self, cuerpo):
+        return self.client.post(self.url, data=json.dumps(cuerpo), content_type='application/json')
+
+    def test_guarda_la_celda_y_devuelve_la_definitiva(self):
+        # Un corte de 25% con 4.0 aporta 1.00 a la definitiva (suma ponderada)
+        respuesta = self._post({'cambios': [{
+            'estudiante_id': self.estudiante.id, 'definicion_id': self.definicion.id, 'valor': '4,0'
+        }]})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['definitivas'], [{
+            'estudiante_id': self.estudiante.id, 'periodo_id': self.periodo.id, 'definitiva': '1.00'
+        }])
+        self.assertEqual(NotaDetallada.objects.get().valor, Decimal('4.00'))
+
+    def test_cuerpo_que_no_es_objeto_responde_400(self):
+        for cuerpo in ([], 'texto', {'cambios': ['x']}, {'cambios': {}}):
+            with self.subTest(cuerpo=cuerpo):
+                self.assertEqual(self._post(cuerpo).status_code, 400)
+        self.assertFalse(NotaDetallada.objects.exists())
+
+
+class ResumenAcademicoInvalidacionTest(TestCase):
+    """Las escrituras fila a fila no dejan el resumen materializado obsoleto."""
+
+    def setUp(self):
+        self.docente, self.curso, materias, periodos, estudiantes, _ = crear_curso(2, n_periodos=1)
+        self.materia, self.periodo, self.estudiante = materias[0], periodos[0], estudiantes[0]
+
+    def _resumen(self):
+        return ResumenAcademicoService.obtener(self.estudiante, self.curso, [self.periodo])[self.periodo.id]
+
+    def _definitiva(self, valor):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Nota.objects.create(
+                estudiante=self.estudiante, materia=self.materia, periodo=self.periodo,
+                numero_nota=5, valor=Decimal(valor), registrado_por=self.docente
+            )
+
+    def test_editar_y_borrar_definitiva_se_refleja(self):
+        nota = self._definitiva('2.50')
+        self.assertEqual(self._resumen().materias_perdidas, 1)
+
+        nota.valor = Decimal('4.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            nota.save()
+        self.assertEqual(self._resumen().promedio, Decimal('4.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            nota.delete()
+        resumen = self._resumen()
+        self.assertIsNone(resumen.promedio)
+        self.assertEqual(resumen.materias_evaluadas, 0)
+
+    def test_asistencia_invalida_solo_al_estudiante(self):
+        otro = Matricula.objects.exclude(estudiante=self.estudiante).get().estudiante
+        ResumenAcademicoService.recalcular(self.curso)
+        with self.captureOnCommitCallbacks(execute=True):
+            Asistencia.objects.create(
+                estudiante=self.estudiante, materia=self.materia, curso=self.curso,
+                fecha=self.periodo.fecha_inicio, estado='FALLA'
+            )
+        self.assertFalse(ResumenAcademico.objects.filter(estudiante=self.estudiante).exists())
+        self.assertTrue(ResumenAcademico.objects.filter(estudiante=otro).exists())
+        self.assertEqual(self._resumen().fallas, 1)
+
+    def test_borrado_masivo_invalida_con_una_consulta_por_cache(self):
+        otra_materia = Materia.objects.create(nombre='Materia extra', curso=self.curso)
+        with self.captureOnCommitCallbacks(execute=True):
+            for matricula in Matricula.objects.all():
+                for materia in (self.materia, otra_materia):
+                    Nota.objects.create(
+                        estudiante=matricula.estudiante, materia=materia, periodo=self.periodo,
+                        numero_nota=5, valor=Decimal('3.00'), registrado_por=self.docente
+                    )
+        ResumenAcademicoService.recalcular(self.curso)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Nota.objects.all().delete()
+        # Un lote por caché afectada (resumen académico, análisis IA y PDFs del boletín)
+        self.assertEqual(len(callbacks), 3)
+        with self.assertNumQueries(4):
+            for callback in callbacks:
+                callback()
+        self.assertFalse(ResumenAcademico.objects.exists())
+
+    def test_panel_y_resumen_usan_la_misma_nota_aprobatoria(self):
+        otra_materia = Materia.objects.create(nombre='Materia extra', curso=self.curso)
+        AsignacionMateria.objects.create(materia=otra_materia, curso=self.curso, docente=self.docente)
+        self._definitiva('3.20')
+        Nota.objects.create(
+            estudiante=self.estudiante, materia=otra_materia, periodo=self.periodo,
+            numero_nota=5, valor=Decimal('2.90'), registrado_por=self.docente
+        )
+        stats = cargar_panel_estudiante(self.estudiante)['stats']
+        self.assertEqual((stats['ganadas'], stats['perdidas']), (1, 1))
+        self.assertEqual(self._resumen().materias_perdidas, 1)
+
+
+class AnalisisBoletinInvalidacionTest(TestCase):
+    """El análisis IA precalculado del boletín se descarta cuando cambian las notas."""
+
+    def setUp(self):
+        User.objects.create(username='sistema', is_active=False)
+        self.docente, self.curso, materias, periodos, self.estudiantes, self.definiciones = crear_curso(2, n_periodos=1)
+        self.materia, self.periodo = materias[0], periodos[0]
+        hoy = timezone.now().date()
+        self.periodo_ia = PeriodoAcademico.objects.create(
+            nombre='2025-1', fecha_inicio=hoy, fecha_fin=hoy + timedelta(days=90), activo=True
+        )
+        for estudiante in self.estudiantes:
+            AIDocumento.objects.create(
+                usuario=estudiante, periodo=self.periodo_ia, tipo=DOC_ANALISIS_BOLETIN, contenido='Análisis'
+            )
+
+    def _con_analisis(self):
+        return set(AIDocumento.objects.filter(tipo=DOC_ANALISIS_BOLETIN).values_list('usuario_id', flat=True))
+
+    def test_editar_y_borrar_nota_descarta_solo_su_analisis(self):
+        estudiante, otro = self.estudiantes
+        with self.captureOnCommitCallbacks(execute=True):
+            nota = Nota.objects.create(
+                estudiante=estudiante, materia=self.materia, periodo=self.periodo,
+                numero_nota=1, valor=Decimal('3.00'), registrado_por=self.docente
+            )
+        self.assertEqual(self._con_analisis(), {otro.id})
+
+        AIDocumento.objects.create(
+            usuario=estudiante, periodo=self.periodo_ia, tipo=DOC_ANALISIS_BOLETIN, contenido='Nuevo'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            nota.delete()
+        self.assertEqual(self._con_analisis(), {otro.id})
+
+    def test_guardado_masivo_descarta_el_analisis(self):
+        definiciones_map = {self.periodo.id: self.definiciones[(self.materia.id, self.periodo.id)]}
+        estudiante = self.estudiantes[0]
+        data = {f'nota_{estudiante.id}_{definiciones_map[self.periodo.id][0].id}': '4.0'}
+        servicio = GradePersistenceService(self.materia, self.docente, [self.periodo], definiciones_map)
+        with transaction.atomic():
+            servicio.guardar_matriz([estudiante.id], data)
+        self.assertEqual(self._con_analisis(), {self.estudiantes[1].id})
+
+
+def poblar_historial(docente, curso, materias, periodos, estudiantes):
+    """Notas, comentarios, actividades, logros, convivencia y asistencia de cada estudiante."""
+    for materia in materias:
+        ActividadSemanal.objects.create(materia=materia, curso=curso, descripcion='Taller', docente=docente)
+        for periodo in periodos:
+            LogroPeriodo.objects.create(
+                docente=docente, curso=curso, materia=materia, periodo=periodo, descripcion='Logro'
+            )
+    for est in estudiantes:
+        for periodo in periodos:
+            Convivencia.objects.create(estudiante=est, curso=curso, periodo=periodo, valor=Decimal('4.5'))
+            for materia in materias:
+                for numero in (1, 2, 5):
+                    Nota.objects.create(
+                        estudiante=est, materia=materia, periodo=periodo, numero_nota=numero,
+                        valor=Decimal('3.8'), registrado_por=docente
+                    )
+                ComentarioDocente.objects.create(
+                    docente=docente, estudiante=est, materia=materia, periodo=periodo, comentario='Bien'
+                )
+        for materia in materias:
+            Asistencia.objects.create(
+                estudiante=est, materia=materia, curso=curso, fecha=periodos[0].fecha_inicio, estado='FALLA'
+            )
+
+
+class PanelEstudianteConsultasTest(TestCase):
+    """Los paneles de estudiante y acudiente no abren una consulta por materia ni por hijo."""
+
+    # Una consulta por fuente (matrícula, periodos, asignaciones, notas, materias, comentarios,
+    # actividades, logros, resumen, asistencia x2, convivencia)
+    CONSULTAS_PANEL = 12
+
+    def _curso(self, n_materias, n_estudiantes=1):
+        docente, curso, materias, periodos, estudiantes, _ = crear_curso(
+            n_estudiantes, n_materias=n_materias, n_periodos=2, n_cortes=1
+        )
+        poblar_historial(docente, curso, materias, periodos, estudiantes)
+        # Resumen ya materializado, como en cualquier visita después de la primera
+        ResumenAcademicoService.recalcular(curso)
+        return estudiantes
+
+    def test_estudiante_consultas_constantes_por_materia(self):
+        for n_materias in (1, 8):
+            with self.subTest(materias=n_materias):
+                estudiante = self._curso(n_materias)[0]
+                with self.assertNumQueries(self.CONSULTAS_PANEL):
+                    panel = cargar_panel_estudiante(estudiante)
+                self.assertEqual(len(panel['materias_con_notas']), n_materias)
+                self.assertEqual(panel['stats']['total_fallas'], n_materias)
+                User.objects.all().delete()
+                Curso.objects.all().delete()
+
+    def test_acudiente_consultas_constantes_por_hijo(self):
+        estudiantes = self._curso(n_materias=4, n_estudiantes=3)
+        for hijos in (estudiantes[:1], estudiantes):
+            with self.subTest(hijos=len(hijos)):
+                with self.assertNumQueries(self.CONSULTAS_PANEL):
+                    paneles = cargar_paneles_estudiantes(hijos)
+                self.assertEqual(set(paneles), {e.id for e in hijos})
+                for panel in paneles.values():
+                    self.assertEqual(len(panel['comentarios_docente']), 4)
+
+    def test_vista_estudiante_no_crece_con_las_materias(self):
+        consultas = []
+        for n_materias in (1, 8):
+            estudiante = self._curso(n_materias)[0]
+            self.client.force_login(estudiante)
+            with mock.patch('tasks.views.render', return_value=HttpResponse()), \
+                    CaptureQueriesContext(connection) as capturadas:
+                self.assertEqual(self.client.get(reverse('dashboard_estudiante')).status_code, 200)
+            consultas.append(len(capturadas))
+            User.objects.all().delete()
+            Curso.objects.all().delete()
+        self.assertEqual(consultas[0], consultas[1], consultas)
+
+    def test_vista_acudiente_no_crece_con_los_hijos(self):
+        estudiantes = self._curso(n_materias=3, n_estudiantes=3)
+        acudiente = User.objects.create(username='acudiente')
+        Perfil.objects.update_or_create(user=acudiente, defaults={'rol': 'ACUDIENTE'})
+        self.client.force_login(acudiente)
+
+        consultas = []
+        for hijo in estudiantes:
+            Acudiente.objects.create(acudiente=acudiente, estudiante=hijo)
+            # Solo se miden las consultas de la vista, no las de la plantilla
+            with mock.patch('tasks.views.render', return_value=HttpResponse()) as render, \
+                    CaptureQueriesContext(connection) as capturadas:
+                respuesta = self.client.get(reverse('dashboard_acudiente'))
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(len(render.call_args.args[2]['estudiantes_data']), len(consultas) + 1)
+            consultas.append(len(capturadas))
+        self.assertEqual(len(set(consultas)), 1, consultas)
+
+
+def riesgo_fila_por_fila():
+    """Cálculo anterior del tablero: una consulta de parciales por cada definitiva perdida."""
+    pesos = {1: 0.20, 2: 0.30, 3: 0.30, 4: 0.20}
+    riesgo_map = {}
+    for nota_final in Nota.objects.filter(numero_nota=5, valor__lt=3.0, materia__curso__activo=True):
+        nota_acumulada = float(nota_final.valor)
+        parciales = Nota.objects.filter(
+            estudiante=nota_final.estudiante, materia=nota_final.materia, periodo=nota_final.periodo,
+            numero_nota__in=[1, 2, 3, 4]
+        ).values_list('numero_nota', flat=True)
+        peso_restante = 1.0 - sum(pesos[n] for n in parciales)
+        promedio_necesario = (3.0 - nota_acumulada) / peso_restante if peso_restante > 0.05 else 100.0
+        if promedio_necesario > 5.0:
+            nivel = ("100% (Irrecuperable)", "bg-dark text-white")
+        elif promedio_necesario > 4.0:
+            nivel = ("85% (Muy Alta)", "bg-danger text-white")
+        elif promedio_necesario > 3.0:
+            nivel = ("50% (Media)", "bg-warning text-dark")
+        else:
+            nivel = ("20% (Baja)", "bg-info text-dark")
+        entrada = riesgo_map.setdefault(nota_final.estudiante_id, {
+            'estudiante': nota_final.estudiante, 'curso': nota_final.materia.curso.nombre,
+            'total_perdidas': 0, 'materias': []
+        })
+        entrada['total_perdidas'] += 1
+        entrada['materias'].append({
+            'nombre': nota_final.materia.nombre,
+            'nota_actual': nota_acumulada,
+            'nota_necesaria': round(promedio_necesario, 2) if promedio_necesario < 10 else "> 5.0",
+            'probabilidad': nivel[0],
+            'clase_riesgo': nivel[1],
+            'periodo': nota_final.periodo.nombre
+        })
+    return sorted(riesgo_map.values(), key=lambda x: x['total_perdidas'], reverse=True)
+
+
+class MotorPrediccionRiesgoTest(TestCase):
+    """El motor vectorizado reproduce el cálculo fila por fila del tablero académico."""
+
+    # (definitiva, parciales evaluados, peso evaluado, nota necesaria, nivel)
+    CASOS = [
+        (Decimal('2.90'), [1, 2, 3], 0.8, 0.5, 'BAJO'),
+        (Decimal('1.50'), [1, 2], 0.5, 3.0, 'BAJO'),
+        (Decimal('1.40'), [1, 2], 0.5, 3.2, 'MEDIO'),
+        (Decimal('0.90'), [1, 2], 0.5, 4.2, 'ALTO'),
+        (Decimal('0.50'), [1, 2, 3], 0.8, 12.5, 'CRÍTICO'),
+        (Decimal('2.00'), [1, 2, 3, 4], 1.0, 100.0, 'CRÍTICO'),
+    ]
+
+    def setUp(self):
+        self.docente, self.curso, self.materias, periodos, self.estudiantes, _ = crear_curso(
+            len(self.CASOS), n_materias=2, n_periodos=1
+        )
+        self.periodo = periodos[0]
+        for estudiante, (definitiva, parciales, *_) in zip(self.estudiantes, self.CASOS):
+            self._nota(estudiante, self.materias[0], 5, definitiva)
+            for numero in parciales:
+                self._nota(estudiante, self.materias[0], numero, Decimal('2.00'))
+            # Segunda materia aprobada: cuenta en los KPIs, no en la lista de riesgo
+            self._nota(estudiante, self.materias[1], 5, Decimal('4.00'))
+        # Un estudiante pierde las dos materias y debe quedar primero en la lista
+        self._nota(self.estudiantes[-1], self.materias[1], 1, Decimal('1.00'))
+        Nota.objects.filter(estudiante=self.estudiantes[-1], materia=self.materias[1], numero_nota=5).update(
+            valor=Decimal('1.00')
+        )
+
+        # Las notas de cursos inactivos no entran al tablero
+        inactivo = Curso.objects.create(nombre='5B', grado='5', seccion='B', anio_escolar='2024-2025', activo=False)
+        materia_inactiva = Materia.objects.create(nombre='Historia', curso=inactivo)
+        periodo_inactivo = Periodo.objects.create(nombre='Periodo 1', curso=inactivo)
+        Nota.objects.create(
+            estudiante=self.estudiantes[0], materia=materia_inactiva, periodo=periodo_inactivo,
+            numero_nota=5, valor=Decimal('1.00'), registrado_por=self.docente
+        )
+
+    def _nota(self, estudiante, materia, numero, valor):
+        Nota.objects.create(
+            estudiante=estudiante, materia=materia, periodo=self.periodo,
+            numero_nota=numero, valor=valor, registrado_por=self.docente
+        )
+
+    def test_proyeccion_por_nota_definitiva(self):
+        motor = MotorPrediccionRiesgo()
+        df = motor._cargar()
+        reprobadas = motor._proyectar(df[df['numero_nota'] == 5], df[df['numero_nota'] != 5])
+        reprobadas = reprobadas[reprobadas['materia_id'] == self.materias[0].id].set_index('estudiante_id')
+        for estudiante, (_, _, peso, necesaria, nivel) in zip(self.estudiantes, self.CASOS):
+            with self.subTest(estudiante=estudiante.username):
+                fila = reprobadas.loc[estudiante.id]
+                self.assertAlmostEqual(fila['peso_evaluado'], peso)
+                self.assertAlmostEqual(fila['nota_necesaria'], necesaria)
+                self.assertEqual(fila['nivel_riesgo'], nivel)
+
+    def test_tablero_igual_al_calculo_fila_por_fila(self):
+        esperado = riesgo_fila_por_fila()
+        with self.assertNumQueries(2):
+            tablero = MotorPrediccionRiesgo().calcular()
+
+        self.assertEqual(tablero['lista_riesgo'], esperado)
+        self.assertEqual(tablero['lista_riesgo'][0]['estudiante'], self.estudiantes[-1])
+        self.assertEqual(tablero['kpi'], {
+            'promedio': 2.52, 'tasa_reprobacion': 58.3, 'total_evaluaciones': 12, 'reprobadas': 7
+        })
+        self.assertEqual(tablero['cursos'], (['6A'], [2.52]))
+        self.assertEqual(tablero['materias'], (['Materia 0', 'Materia 1'], [1.53, 3.5]))
+
+
+class ExportarSabanaTest(TestCase):
+    """Exportación de la sábana."""
+
+    def setUp(self):
+        self.docente, self.curso, materias, periodos, self.estudiantes, _ = crear_curso(3, n_materias=2)
+        self.periodo = periodos[0]
+        for est in self.estudiantes:
+            for materia in materias:
+                Nota.objects.create(
+                    estudiante=est, materia=materia, periodo=self.periodo, numero_nota=5,
+                    valor=Decimal('3.2'), registrado_por=self.docente
+                )
+        coordinador = User.objects.create(username='coordinador')
+        Perfil.objects.update_or_create(user=coordinador, defaults={'rol': 'COORD_ACADEMICO'})
+        self.client.force_login(coordinador)
+
+    def test_ids_no_numericos_responden_400(self):
+        url = reverse('exportar_sabana_notas')
+        for params in (
+            {'curso_id': 'abc', 'periodo_id': self.periodo.id},
+            {'curso_id': self.curso.id, 'periodo_id': 'x'},
+            {'curso_id': self.curso.id},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, {**params, 'formato': 'csv'}).status_code, 400)
+
+    def test_csv_de_un_curso(self):
+        respuesta = self.client.get(reverse('exportar_sabana_notas'), {
+            'curso_id': self.curso.id, 'periodo_id': self.periodo.id, 'formato': 'csv'
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('est', respuesta.content.decode('utf-8-sig'))
+
+    async def test_csv_institucional_en_bloques_bajo_asgi(self):
+        await self.async_client.aforce_login(await User.objects.aget(username='coordinador'))
+        respuesta = await self.async_client.get(reverse('exportar_sabana_institucional'), {
+            'anio_escolar': self.curso.anio_escolar, 'periodo_nombre': self.periodo.nombre
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        # Iterador asíncrono: Django no lo convierte en lista antes de enviarlo
+        self.assertTrue(respuesta.is_async)
+        contenido = b''.join([bloque async for bloque in respuesta.streaming_content]).decode('utf-8-sig')
+        self.assertEqual(len(contenido.strip().splitlines()), 1 + 3 * 2)
+
+    async def test_aiterar_csv_pide_bloques_al_generador(self):
+        exportador = SabanaInstitucionalExport(self.curso.anio_escolar, self.periodo.nombre)
+        bloques = [bloque async for bloque in exportador.aiterar_csv(lineas_por_bloque=2)]
+        self.assertEqual(len(bloques), 4)
+        esperado = await sync_to_async(lambda: ''.join(exportador.iterar_csv()))()
+        self.assertEqual(''.join(bloques), esperado)
+
+
+class SnapshotRiesgoDashboardTest(TestCase):
+    """Command Center de riesgo sobre el último snapshot."""
+
+    def setUp(self):
+        docente, _, materias, periodos, self.estudiantes, _ = crear_curso(3)
+        for est in self.estudiantes[:2]:
+            Nota.objects.create(
+                estudiante=est, materia=materias[0], periodo=periodos[0], numero_nota=5,
+                valor=Decimal('2.0'), registrado_por=docente
+            )
+        self.admin = User.objects.create(username='rector', is_staff=True)
+        self.client.force_login(self.admin)
+
+    def test_conteos_sin_abrir_los_json(self):
+        snapshot = SnapshotRiesgoService.generar()
+        self.assertEqual(snapshot.conteo_academico, len(snapshot.ids_academico))
+        self.assertEqual(snapshot.conteo_academico, 2)
+
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.client.get(reverse(shadow_tenant_dashboard))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['conteos'], {'academico': 2, 'legal': 0, 'ausentismo': 0})
+        consultas_snapshot = [q['sql'] for q in capturadas if 'snapshotriesgo' in q['sql']]
+        # Una para la última foto y otra para la tendencia; ninguna trae los ids diferidos
+        self.assertEqual(len(consultas_snapshot), 2, consultas_snapshot)
+        self.assertFalse(any('ids_academico' in sql for sql in consultas_snapshot))
+
+    def test_boton_actualizar_y_tendencia(self):
+        SnapshotRiesgoService.generar()
+        respuesta = self.client.get(reverse(shadow_tenant_dashboard))
+        self.assertContains(respuesta, f'action="{reverse("shadow_refresh_snapshot")}"')
+        self.assertContains(respuesta, 'graficoTendencia')
+
+        respuesta = self.client.post(reverse('shadow_refresh_snapshot'))
+        self.assertRedirects(respuesta, reverse(shadow_tenant_dashboard))
+        self.assertEqual(SnapshotRiesgo.objects.count(), 2)
+        self.assertEqual(len(json.loads(self.client.get(reverse(shadow_tenant_dashboard)).context['tendencia']['riesgo'])), 2)
+
+    def test_programador_solo_en_el_proceso_servidor(self):
+        casos = [
+            (['manage.py', 'migrate'], {}, False),
+            (['manage.py', 'test', 'tasks'], {}, False),
+            (['manage.py', 'generar_snapshot_riesgo', '--intervalo', '30'], {}, False),
+            (['manage.py', 'runserver'], {}, False),
+            (['manage.py', 'runserver'], {'RUN_MAIN': 'true'}, True),
+            (['manage.py', 'runserver', '--noreload'], {}, True),
+            (['/usr/local/bin/daphne', '-b', '0.0.0.0', 'djangocrud.asgi:application'], {}, True),
+            (['/venv/lib/python3.12/site-packages/daphne/__main__.py', 'djangocrud.asgi:application'], {}, True),
+        ]
+        for argv, entorno, esperado in casos:
+            with self.subTest(argv=argv, entorno=entorno):
+                self.assertIs(es_proceso_servidor(argv, entorno), esperado)
+
+
+@mock.patch('tasks.services.pdf_jobs._obtener_pools')
+class TrabajoPDFColaTest(TestCase):
+    """Deduplicación por solicitante y trabajos abandonados."""
+
+    def setUp(self):
+        _, _, _, _, estudiantes, _ = crear_curso(1)
+        self.matricula = Matricula.objects.get(estudiante=estudiantes[0])
+        self.estudiante = estudiantes[0]
+        self.admin = User.objects.create(username='admin')
+        Perfil.objects.update_or_create(user=self.admin, defaults={'rol': 'ADMINISTRADOR'})
+        self.otro = User.objects.create(username='admin2')
+        Perfil.objects.update_or_create(user=self.otro, defaults={'rol': 'ADMINISTRADOR'})
+
+    def _encolar(self, usuario):
+        return PDFJobService.encolar('BOLETIN', {'matricula_id': self.matricula.id}, usuario=usuario)
+
+    def test_cada_solicitante_tiene_su_trabajo(self, pools):
+        pools.return_value = (None, mock.Mock())
+        with self.captureOnCommitCallbacks(execute=True):
+            primero = self._encolar(self.admin)
+            self.assertEqual(self._encolar(self.admin).id, primero.id)
+            segundo = self._encolar(self.otro)
+        self.assertNotEqual(segundo.id, primero.id)
+        self.assertEqual(segundo.solicitado_por, self.otro)
+        self.assertEqual(pools.return_value[1].submit.call_count, 2)
+
+    def test_se_despacha_al_confirmar_la_transaccion(self, pools):
+        pools.return_value = (None, mock.Mock())
+        submit = pools.return_value[1].submit
+        with self.captureOnCommitCallbacks(execute=True):
+            trabajo = self._encolar(self.admin)
+            submit.assert_not_called()
+        submit.assert_called_once_with(PDFJobService.procesar, trabajo.id)
+
+        # Si la transacción se revierte, el hilo nunca busca una fila que no existe
+        submit.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self._encolar(self.otro)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        submit.assert_not_called()
+
+    def test_trabajo_abandonado_no_absorbe_solicitudes(self, pools):
+        pools.return_value = (None, mock.Mock())
+        huerfano = self._encolar(self.admin)
+        TrabajoPDF.objects.filter(id=huerfano.id).update(
+            estado=TrabajoPDF.ESTADO_PROCESANDO, creado=timezone.now() - timedelta(hours=2)
+        )
+        nuevo = self._encolar(self.admin)
+        self.assertNotEqual(nuevo.id, huerfano.id)
+        huerfano.refresh_from_db()
+        self.assertEqual(huerfano.estado, TrabajoPDF.ESTADO_ERROR)
+
+    def test_estado_de_un_trabajo_abandonado_es_error(self, pools):
+        pools.return_value = (None, mock.Mock())
+        trabajo = self._encolar(self.admin)
+        TrabajoPDF.objects.filter(id=trabajo.id).update(creado=timezone.now() - timedelta(hours=2))
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse('pdf_trabajo_estado', args=[trabajo.id]))
+        self.assertEqual(respuesta.json()['estado'], TrabajoPDF.ESTADO_ERROR)
+
+    def test_enlace_del_boletin_encola_sin_renderizar(self, pools):
+        pools.return_value = (None, mock.Mock())
+        self.client.force_login(self.admin)
+        with mock.patch.object(PDFJobService, 'renderizar') as renderizar:
+            respuesta = self.client.get(reverse('panel_generar_boletin', args=[self.estudiante.id]))
+        renderizar.assert_not_called()
+        self.assertEqual(respuesta.status_code, 202)
+        trabajo = TrabajoPDF.objects.get()
+        self.assertContains(respuesta, reverse('pdf_trabajo_estado', args=[trabajo.id]), status_code=202)
+
+
+class BoletinesEnStreamingTest(TestCase):
+    """Los lotes entregan cada PDF al terminar y el cierre lo guarda de inmediato."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        ajuste = override_settings(MEDIA_ROOT=self.media.name)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        _, _, _, _, self.estudiantes, _ = crear_curso(3)
+        self.matriculas_ids = list(
+            Matricula.objects.filter(estudiante__in=self.estudiantes).order_by('id').values_list('id', flat=True)
+        )
+
+    def test_iterar_entrega_en_orden_de_terminacion(self):
+        futuros = []
+
+        def enviar(html_string, *args, **kwargs):
+            futuros.append(Future())
+            if len(futuros) == len(self.matriculas_ids):
+                futuros[2].set_result(b'%PDF-2')
+            return futuros[-1]
+
+        with mock.patch('tasks.services.boletin_batch.render_to_string', return_value='<html></html>'), \
+                mock.patch.object(PDFJobService, 'enviar', side_effect=enviar):
+            documentos = LoteBoletinesService(self.matriculas_ids).iterar()
+            # Se despachan todos los renders y se entrega el primero que termina
+            self.assertEqual(next(documentos)[::2], (self.matriculas_ids[2], b'%PDF-2'))
+            self.assertEqual(len(futuros), 3)
+            futuros[0].set_result(b'%PDF-0')
+            self.assertEqual(next(documentos)[::2], (self.matriculas_ids[0], b'%PDF-0'))
+            futuros[1].set_result(b'%PDF-1')
+            self.assertEqual(next(documentos)[::2], (self.matriculas_ids[1], b'%PDF-1'))
+            self.assertIsNone(next(documentos, None))
+
+    def test_cierre_guarda_cada_boletin_al_recibirlo(self):
+        carpeta = os.path.join(self.media.name, 'historiales', 'boletines')
+        archivos_al_reanudar = []
+
+        def iterar(lote):
+            for matricula_id in lote.matriculas_ids:
+                yield matricula_id, 'boletin.pdf', f'%PDF-{matricula_id}'.encode()
+                # Al pedir el siguiente, el anterior ya está en disco
+                archivos_al_reanudar.append(sum(len(archivos) for _, _, archivos in os.walk(carpeta)))
+
+        servicio = YearRolloverService(2025, None)
+        with mock.patch.object(LoteBoletinesService, 'iterar', autospec=True, side_effect=iterar):
+            servicio._fase_congelamiento()
+
+        self.assertEqual(archivos_al_reanudar, [1, 2, 3])
+        for matricula in Matricula.objects.filter(id__in=self.matriculas_ids).select_related('estudiante'):
+            historial = HistorialAcademico.objects.get(estudiante__user=matricula.estudiante)
+            with historial.archivo_boletin.open('rb') as f:
+                self.assertEqual(f.read(), f'%PDF-{matricula.id}'.encode())
+
+
+class CertificadoGuardadoTest(TestCase):
+    """El certificado se guarda una vez y lo impreso coincide con lo guardado."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        ajuste = override_settings(MEDIA_ROOT=self.media.name)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        estudiante = User.objects.create(username='graduado')
+        perfil, _ = Perfil.objects.update_or_create(
+            user=estudiante, defaults={'rol': 'ESTUDIANTE', 'numero_documento': '1001'}
+        )
+        self.historial = HistorialAcademico.objects.create(
+            estudiante=perfil, anio_lectivo=2025, curso_snapshot='11A', estado_final='GRADUADO',
+            calificaciones_json={'Matemáticas': 4.5},
+        )
+        self.service = CertificateService()
+        self.contextos = []
+
+        def render(plantilla, contexto):
+            self.contextos.append(contexto)
+            return '<html></html>'
+
+        parche = mock.patch('tasks.services.certificate_service.render_to_string', side_effect=render)
+        parche.start()
+        self.addCleanup(parche.stop)
+        parche = mock.patch.object(PDFJobService, 'renderizar', return_value=b'%PDF')
+        self.renderizar = parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_fecha_impresa_es_la_de_generacion(self):
+        self.service.obtener_certificado(self.historial, 'https://colegio.edu.co/')
+        self.service.obtener_certificado(self.historial, 'https://colegio.edu.co/')
+
+        self.assertEqual(self.renderizar.call_count, 1)
+        self.historial.refresh_from_db()
+        self.assertEqual(self.contextos[0]['fecha_impresion'], self.historial.certificado_generado)
+
+    def test_cambiar_de_host_regenera_el_qr(self):
+        self.service.obtener_certificado(self.historial, 'https://colegio.edu.co/')
+        self.service.obtener_certificado(self.historial, 'https://colegio.edu.co/otra/')
+        self.assertEqual(self.renderizar.call_count, 1)
+
+        self.service.obtener_certificado(self.historial, 'https://nuevo.colegio.edu.co/')
+        self.assertEqual(self.renderizar.call_count, 2)
+        self.assertTrue(self.service.vigente(self.historial, 'https://nuevo.colegio.edu.co/'))
+        self.assertFalse(self.service.vigente(self.historial, 'https://colegio.edu.co/'))
+
+
+class ServirArchivoTest(SimpleTestCase):
+    """Respuestas condicionales y por rangos de los documentos guardados."""
+
+    CONTENIDO = b'%PDF-0123456789abcdef'
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        almacen = FileSystemStorage(location=carpeta.name)
+        nombre = almacen.save('boletin.pdf', ContentFile(self.CONTENIDO))
+        self.archivo = FieldFile(None, models.FileField(storage=almacen), nombre)
+        self.fabrica = RequestFactory()
+
+    def _servir(self, **encabezados):
+        return servir_archivo(self.fabrica.get('/', **encabezados), self.archivo, 'boletin.pdf', huella='abc123')
+
+    def _cuerpo(self, respuesta):
+        if respuesta.streaming:
+            cuerpo = b''.join(respuesta.streaming_content)
+            respuesta.close()
+            return cuerpo
+        return respuesta.content
+
+    def test_archivo_completo_con_validadores(self):
+        respuesta = self._servir()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['ETag'], '"abc123"')
+        self.assertIn('Last-Modified', respuesta)
+        self.assertEqual(respuesta['Accept-Ranges'], 'bytes')
+        self.assertEqual(self._cuerpo(respuesta), self.CONTENIDO)
+
+    def test_304_si_el_cliente_tiene_la_misma_version(self):
+        respuesta = self._servir(HTTP_IF_NONE_MATCH='"abc123"')
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta['ETag'], '"abc123"')
+        modificado = self._servir()['Last-Modified']
+        self.assertEqual(self._servir(HTTP_IF_MODIFIED_SINCE=modificado).status_code, 304)
+        self.assertEqual(self._servir(HTTP_IF_NONE_MATCH='"otra"').status_code, 200)
+
+    def test_rango(self):
+        respuesta = self._servir(HTTP_RANGE='bytes=0-9')
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertEqual(respuesta['Content-Range'], f'bytes 0-9/{len(self.CONTENIDO)}')
+        self.assertEqual(respuesta.content, self.CONTENIDO[:10])
+        # Rango abierto y fin más allá del tamaño: hasta el último byte
+        self.assertEqual(self._servir(HTTP_RANGE='bytes=15-').content, self.CONTENIDO[15:])
+        self.assertEqual(self._servir(HTTP_RANGE='bytes=15-999').content, self.CONTENIDO[15:])
+
+    def test_rango_sufijo(self):
+        tamano = len(self.CONTENIDO)
+        respuesta = self._servir(HTTP_RANGE='bytes=-5')
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertEqual(respuesta['Content-Range'], f'bytes {tamano - 5}-{tamano - 1}/{tamano}')
+        self.assertEqual(respuesta.content, self.CONTENIDO[-5:])
+
+    def test_rango_insatisfacible_es_416(self):
+        respuesta = self._servir(HTTP_RANGE=f'bytes={len(self.CONTENIDO)}-')
+        self.assertEqual(respuesta.status_code, 416)
+        self.assertEqual(respuesta['Content-Range'], f'bytes */{len(self.CONTENIDO)}')
+
+    def test_rango_ignorado_si_if_range_no_coincide_o_es_multiple(self):
+        self.assertEqual(self._servir(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"otra"').status_code, 200)
+        self.assertEqual(self._servir(HTTP_RANGE='bytes=0-1,4-5').status_code, 200)
+        self.assertEqual(self._servir(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"abc123"').status_code, 206)
+
+
+class ExpedientesCursoTest(TestCase):
+    """El lote de expedientes arma todo el curso con consultas fijas."""
+
+    def setUp(self):
+        self.director = User.objects.create(username='director', first_name='Dir', last_name='Curso')
+        Perfil.objects.update_or_create(user=self.director, defaults={'rol': 'DOCENTE'})
+        self.curso = academicos.Curso.objects.create(grado='6', seccion='A', anio_escolar='2025-2026')
+        self.materia = academicos.Materia.objects.create(nombre='Matemáticas', curso=self.curso)
+        self.periodo = academicos.Periodo.objects.create(nombre='Periodo 1')
+        self.n = 0
+
+    def _matricular(self, cantidad):
+        for _ in range(cantidad):
+            estudiante = User.objects.create(username=f'estudiante{self.n}', first_name='Est', last_name=f'{self.n:03d}')
+            self.n += 1
+            Perfil.objects.update_or_create(user=estudiante, defaults={'rol': 'ESTUDIANTE'})
+            academicos.Matricula.objects.create(estudiante=estudiante, curso=self.curso, anio_escolar='2025-2026')
+            academicos.Nota.objects.create(estudiante=estudiante, materia=self.materia, periodo=self.periodo, valor=Decimal('3.5'))
+            bienestar.Asistencia.objects.create(estudiante=estudiante, materia=self.materia, curso=self.curso, estado='FALLA')
+            for tipo in ('CONVIVENCIA', 'ACADEMICA'):
+                bienestar.Observacion.objects.create(
+                    estudiante=estudiante, autor=self.director, periodo=self.periodo, tipo=tipo, descripcion='Obs'
+                )
+            bienestar.Seguimiento.objects.create(estudiante=estudiante, profesional=self.director, tipo='Psicología', descripcion='Seg')
+
+    def _generar(self):
+        def enviar(html_string, *args, **kwargs):
+            futuro = Future()
+            futuro.set_result(b'%PDF-' + html_string[:20].encode())
+            return futuro
+
+        # Sin WeasyPrint: el pool devuelve un PDF falso por cada HTML renderizado
+        with mock.patch.object(PDFJobService, 'enviar', side_effect=enviar), \
+                CaptureQueriesContext(connection) as consultas:
+            documentos = ExpedientesCursoService(self.curso, None, generado_por=self.director).generar()
+        return documentos, len(consultas)
+
+    def test_zip_con_un_documento_por_estudiante_y_tipo(self):
+        self._matricular(4)
+        documentos, _ = self._generar()
+        with zipfile.ZipFile(io.BytesIO(ExpedientesCursoService.empaquetar_zip(documentos))) as zf:
+            nombres = zf.namelist()
+        self.assertEqual(len(nombres), 4 * len(DOCUMENTOS_LOTE))
+        self.assertEqual(len(set(nombres)), len(nombres))
+        for i in range(4):
+            for tipo in DOCUMENTOS_LOTE:
+                self.assertIn(f'{i:03d}_estudiante{i}/{tipo}_estudiante{i}.pdf', nombres)
+
+    def test_consultas_fijas_sin_importar_el_tamano_del_curso(self):
+        self._matricular(2)
+        _, pocas = self._generar()
+        self._matricular(8)
+        documentos, muchas = self._generar()
+        self.assertEqual(len(documentos), 10 * len(DOCUMENTOS_LOTE))
+        # Matrículas, acudientes, observaciones, seguimientos, promedios, fallas, institución
+        self.assertEqual(muchas, 7)
+        self.assertEqual(muchas, pocas)
+
+
+class CachePDFBorradoTest(TestCase):
+    """Borrar datos del boletín descarta su contexto y sus PDFs en caché."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        ajuste = override_settings(MEDIA_ROOT=self.media.name)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        cache.clear()
+        docente, curso, materias, periodos, estudiantes, _ = crear_curso(2, n_periodos=1)
+        # Se confirman aquí: un lote de invalidación pendiente absorbería los ids de las pruebas
+        with self.captureOnCommitCallbacks(execute=True):
+            poblar_historial(docente, curso, materias, periodos, estudiantes)
+        self.estudiante, self.otro = estudiantes
+        self.matriculas = {m.id: m for m in Matricula.objects.all()}
+
+    def _guardar_en_cache(self):
+        """Contexto y PDF en caché para cada matrícula; retorna las llaves de contexto vigentes."""
+        CachePDF.objects.all().delete()
+        for matricula in self.matriculas.values():
+            CachePDFService.guardar(f'huella-{matricula.id}', 'BOLETIN', b'%PDF', matricula=matricula, recortar=False)
+        get_student_report_contexts(list(self.matriculas))
+        return _llaves_contexto(list(self.matriculas), None)
+
+    def _aun_en_cache(self, llaves):
+        """Estudiantes cuyo contexto y PDF siguen sirviéndose desde la caché."""
+        vigentes = _llaves_contexto(list(self.matriculas), None)
+        con_pdf = set(CachePDF.objects.values_list('matricula_id', flat=True))
+        return {
+            matricula.estudiante_id for matricula_id, matricula in self.matriculas.items()
+            if vigentes[matricula_id] == llaves[matricula_id] and matricula_id in con_pdf
+        }
+
+    def test_borrar_datos_del_estudiante_invalida_solo_su_boletin(self):
+        for modelo in (Nota, Convivencia, ComentarioDocente):
+            with self.subTest(modelo=modelo.__name__):
+                llaves = self._guardar_en_cache()
+                with self.captureOnCommitCallbacks(execute=True):
+                    modelo.objects.filter(estudiante=self.estudiante).first().delete()
+                self.assertEqual(self._aun_en_cache(llaves), {self.otro.id})
+
+    def test_borrar_logro_invalida_el_curso(self):
+        llaves = self._guardar_en_cache()
+        with self.captureOnCommitCallbacks(execute=True):
+            LogroPeriodo.objects.first().delete()
+        self.assertEqual(self._aun_en_cache(llaves), set())
+
+
+    def test_documentos_archivados_no_usan_cache(self):
+        ids = list(self.matriculas)
+        llaves = self._guardar_en_cache()
+        # Un contexto guardado que ya no refleja la BD (p. ej. otro worker no se enteró del cambio)
+        vencidos = cache.get_many(list(llaves.values()))
+        cache.set_many({llave: {**context, 'vencido': True} for llave, context in vencidos.items()})
+
+        self.assertTrue(all('vencido' in c for c in get_student_report_contexts(ids).values()))
+        self.assertFalse(any('vencido' in c for c in get_student_report_contexts(ids, usar_cache=False).values()))
+
+        def enviar(html_string, *args, **kwargs):
+            futuro = Future()
+            futuro.set_result(b'%PDF')
+            return futuro
+
+        with mock.patch('tasks.services.boletin_batch.render_to_string', return_value='<html></html>') as render, \
+                mock.patch.object(PDFJobService, 'enviar', side_effect=enviar), \
+                mock.patch.object(CachePDFService, 'obtener_varios') as obtener_varios:
+            documentos = list(LoteBoletinesService(ids, usar_cache=False).iterar())
+
+        self.assertEqual(len(documentos), len(ids))
+        obtener_varios.assert_not_called()
+        self.assertFalse(any('vencido' in llamada.args[1] for llamada in render.call_args_list))
+        # El cierre anual no llena la caché de PDFs con documentos de archivo
+        self.assertEqual(CachePDF.objects.count(), len(ids))
+
+    def test_boletin_de_retiro_se_arma_sin_cache(self):
+        admin = User.objects.create(username='admin')
+        Perfil.objects.update_or_create(user=admin, defaults={'rol': 'ADMINISTRADOR'})
+        request = RequestFactory().get('/')
+        request.user = admin
+        matricula = self.matriculas[min(self.matriculas)]
+
+        with mock.patch('tasks.views.get_student_report_context', return_value={}) as contexto, \
+                mock.patch.object(PDFJobService, 'renderizar_plantilla', return_value=b'%PDF'):
+            archivo = generar_boletin_pdf_admin(request, matricula.estudiante_id, return_file=True)
+
+        self.assertEqual(archivo.read(), b'%PDF')
+        contexto.assert_called_once_with(matricula.id, usar_cache=False)
+
+
+class CacheIAInvalidacionTest(TestCase):
+    """Un registro académico solo descarta las respuestas IA de su estudiante."""
+
+    def setUp(self):
+        _, self.curso, materias, periodos, estudiantes, _ = crear_curso(2, n_periodos=1)
+        self.materia, self.periodo = materias[0], periodos[0]
+        self.estudiante, self.otro = estudiantes
+        ai_cache.guardar(ACCION_MEJORAS_ESTUDIANTE, 'propia', 'Plan', sujeto=self.estudiante)
+        ai_cache.guardar(ACCION_MEJORAS_ESTUDIANTE, 'ajena', 'Plan', sujeto=self.otro)
+        ai_cache.guardar(ACCION_CUMPLIMIENTO_PEI, 'institucional', 'Dictamen')
+
+    def test_pasar_lista_no_borra_respuestas_institucionales(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            for dias in range(3):
+                Asistencia.objects.create(
+                    estudiante=self.estudiante, materia=self.materia, curso=self.curso,
+                    fecha=self.periodo.fecha_inicio + timedelta(days=dias), estado='FALLA'
+                )
+        # Un lote por transacción para la caché IA, sin importar cuántos registros
+        lotes_ia = [c for c in callbacks if getattr(c, 'funcion', None) == PedagogicCache.invalidar_por_datos]
+        self.assertEqual(len(lotes_ia), 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            set(AIRespuestaCache.objects.values_list('huella', flat=True)), {'ajena', 'institucional'}
+        )
+
+
+class ServidorStub:
+    """Servidor HTTP local que imita la API de DeepSeek; cada prueba define `responder(manejador, cuerpo)`."""
+
+    def __init__(self):
+        self.peticiones = []
+        self.puertos = set()
+        self.responder = None
+        stub = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                cuerpo = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.peticiones.append(cuerpo)
+                # Puerto de origen: una conexión reutilizada conserva el mismo
+                stub.puertos.add(self.client_address[1])
+                try:
+                    stub.responder(self, cuerpo)
+                except (BrokenPipeError, ConnectionResetError):
+                    # El cliente abandonó la petición (timeout de lectura)
+                    pass
+
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.servidor.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.servidor.server_port}/chat/completions'
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def cerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def responder_json(manejador, estado=200, datos=None, pausa=0):
+    """Respuesta completa con Content-Length (la conexión queda viva para la siguiente)."""
+    if pausa:
+        time.sleep(pausa)
+    if datos is None:
+        datos = {
+            'id': 'r1', 'choices': [{'message': {'content': 'Hola'}}],
+            'usage': {'prompt_tokens': 3, 'completion_tokens': 2, 'total_tokens': 5},
+        }
+    cuerpo = json.dumps(datos).encode()
+    manejador.send_response(estado)
+    manejador.send_header('Content-Type', 'application/json')
+    manejador.send_header('Content-Length', str(len(cuerpo)))
+    manejador.end_headers()
+    manejador.wfile.write(cuerpo)
+
+
+@override_settings(DEEPSEEK_API_KEY='clave-de-prueba')
+class DeepSeekClientTest(SimpleTestCase):
+    """Reintentos, circuito y conexiones del cliente contra un servidor local."""
+
+    def setUp(self):
+        self.stub = ServidorStub()
+        self.addCleanup(self.stub.cerrar)
+        ajustes = mock.patch.multiple(
+            DeepSeekClient, API_URL=self.stub.url, BACKOFF_BASE=0, MAX_REINTENTOS=2, TIMEOUT_LECTURA=0.3
+        )
+        ajustes.start()
+        self.addCleanup(ajustes.stop)
+        self.cliente = DeepSeekClient(circuito=CircuitBreaker(umbral=2, enfriamiento=0.2))
+        self.mensajes = [{'role': 'user', 'content': 'Hola'}]
+
+    def _responder_en_orden(self, *estados):
+        pendientes = list(estados)
+        self.stub.responder = lambda m, cuerpo: responder_json(m, pendientes.pop(0) if pendientes else 200)
+
+    def test_reintenta_503_hasta_responder(self):
+        self._responder_en_orden(503, 503)
+        resultado = self.cliente.get_completion(self.mensajes)
+        self.assertTrue(resultado['success'])
+        self.assertEqual(resultado['usage']['total_tokens'], 5)
+        self.assertEqual(len(self.stub.peticiones), 3)
+        self.assertEqual(self.cliente.circuito.estado, CircuitBreaker.CERRADO)
+
+    def test_402_no_se_reintenta_ni_abre_el_circuito(self):
+        self.stub.responder = lambda m, cuerpo: responder_json(m, 402, {'error': 'insufficient_balance'})
+        for _ in range(3):
+            resultado = self.cliente.get_completion(self.mensajes)
+            self.assertFalse(resultado['success'])
+            self.assertIn('Saldo insuficiente', resultado['error'])
+        self.assertEqual(len(self.stub.peticiones), 3)
+        self.assertEqual(self.cliente.circuito.estado, CircuitBreaker.CERRADO)
+
+    def test_timeout_de_lectura_no_se_reintenta(self):
+        self.stub.responder = lambda m, cuerpo: responder_json(m, pausa=1)
+        resultado = self.cliente.get_completion(self.mensajes)
+        self.assertFalse(resultado['success'])
+        self.assertIn('Timeout Crítico', resultado['error'])
+        self.assertEqual(len(self.stub.peticiones), 1)
+
+    def test_circuito_abre_y_se_prueba_al_enfriar(self):
+        self.stub.responder = lambda m, cuerpo: responder_json(m, 503)
+        for _ in range(2):
+            self.assertFalse(self.cliente.get_completion(self.mensajes)['success'])
+        self.assertEqual(self.cliente.circuito.estado, CircuitBreaker.ABIERTO)
+        enviadas = len(self.stub.peticiones)
+
+        # Abierto: falla al instante sin tocar la red
+        resultado = self.cliente.get_completion(self.mensajes)
+        self.assertIn('pausa', resultado['error'])
+        self.assertEqual(len(self.stub.peticiones), enviadas)
+
+        # Semiabierto: una llamada de prueba fallida lo vuelve a abrir...
+        time.sleep(0.25)
+        self.assertEqual(self.cliente.circuito.estado, CircuitBreaker.SEMIABIERTO)
+        self.assertFalse(self.cliente.get_completion(self.mensajes)['success'])
+        self.assertEqual(self.cliente.circuito.estado, CircuitBreaker.ABIERTO)
+
+        # ... y una exitosa lo cierra
+        time.sleep(0.25)
+        self._responder_en_orden()
+        self.assertTrue(self.cliente.get_completion(self.mensajes)['success'])
+        self.assertEqual(self.cliente.circuito.estado, CircuitBreaker.CERRADO)
+
+    def test_reutiliza_la_conexion(self):
+        self._responder_en_orden()
+        for _ in range(5):
+            self.assertTrue(self.cliente.get_completion(self.mensajes)['success'])
+        self.assertEqual(len(self.stub.peticiones), 5)
+        self.assertEqual(len(self.stub.puertos), 1)
+
+
+FRAGMENTOS_SSE = ['¿Qué ', 'pasa ', 'si ', 'duplicas ', 'x?']
+
+
+def responder_sse(manejador, fragmentos=FRAGMENTOS_SSE, cortar_en=None):
+    """Respuesta SSE de chat/completions por chunks; `cortar_en` la termina sin [DONE]."""
+    manejador.send_response(200)
+    manejador.send_header('Content-Type', 'text/event-stream')
+    manejador.send_header('Transfer-Encoding', 'chunked')
+    manejador.end_headers()
+
+    def enviar(texto):
+        datos = texto.encode()
+        manejador.wfile.write(b'%x\r\n%s\r\n' % (len(datos), datos))
+        manejador.wfile.flush()
+
+    enviar(': keep-alive\n\n')
+    for indice, fragmento in enumerate(fragmentos):
+        if indice == cortar_en:
+            break
+        enviar('data: ' + json.dumps({'id': 'sse1', 'choices': [{'index': 0, 'delta': {'content': fragmento}}]}) + '\n\n')
+    else:
+        uso = {'prompt_tokens': 11, 'completion_tokens': 7, 'total_tokens': 18}
+        enviar('data: ' + json.dumps({'id': 'sse1', 'choices': [], 'usage': uso}) + '\n\n')
+        enviar('data: [DONE]\n\n')
+    manejador.wfile.write(b'0\r\n\r\n')
+
+
+class StreamDeepSeekMixin:
+    """Servidor SSE local y cliente apuntando a él (sin esperas entre reintentos)."""
+
+    def setUp(self):
+        super().setUp()
+        self.stub = ServidorStub()
+        self.addCleanup(self.stub.cerrar)
+        self.stub.responder = lambda m, cuerpo: responder_sse(m)
+        ajustes = mock.patch.multiple(DeepSeekClient, API_URL=self.stub.url, BACKOFF_BASE=0)
+        ajustes.start()
+        self.addCleanup(ajustes.stop)
+
+
+@override_settings(DEEPSEEK_API_KEY='clave-de-prueba')
+class StreamCompletionTest(StreamDeepSeekMixin, SimpleTestCase):
+    """`stream_completion` entrega los tokens del SSE y cierra con el uso."""
+
+    async def _eventos(self):
+        cliente = DeepSeekClient(circuito=CircuitBreaker())
+        return [evento async for evento in cliente.stream_completion([{'role': 'user', 'content': 'x'}])]
+
+    async def test_tokens_en_orden_y_evento_final(self):
+        eventos = await self._eventos()
+        self.assertEqual([e['content'] for e in eventos[:-1]], FRAGMENTOS_SSE)
+        fin = eventos[-1]
+        self.assertEqual(fin['tipo'], 'fin')
+        self.assertTrue(fin['success'])
+        self.assertEqual(fin['content'], ''.join(FRAGMENTOS_SSE))
+        self.assertEqual(fin['usage']['total_tokens'], 18)
+        self.assertTrue(self.stub.peticiones[0]['stream'])
+        self.assertEqual(self.stub.peticiones[0]['stream_options'], {'include_usage': True})
+
+    async def test_reintenta_503_antes_del_stream(self):
+        pendientes = [503]
+        self.stub.responder = lambda m, cuerpo: (
+            responder_json(m, pendientes.pop()) if pendientes else responder_sse(m)
+        )
+        fin = (await self._eventos())[-1]
+        self.assertTrue(fin['success'])
+        self.assertEqual(len(self.stub.peticiones), 2)
+
+    async def test_stream_cortado_sin_done_falla_con_lo_recibido(self):
+        self.stub.responder = lambda m, cuerpo: responder_sse(m, cortar_en=2)
+        fin = (await self._eventos())[-1]
+        self.assertFalse(fin['success'])
+        self.assertEqual(fin['content'], ''.join(FRAGMENTOS_SSE[:2]))
+        self.assertIn('[DONE]', fin['error'])
+
+
+@override_settings(DEEPSEEK_API_KEY='clave-de-prueba')
+class SocraticAIConsumerTest(StreamDeepSeekMixin, TestCase):
+    """El chat socrático reenvía cada token por el WebSocket y cierra con la respuesta."""
+
+    def setUp(self):
+        super().setUp()
+        _, _, _, _, estudiantes, _ = crear_curso(1, n_periodos=1)
+        self.estudiante = estudiantes[0]
+        hoy = timezone.now().date()
+        PeriodoAcademico.objects.create(
+            nombre='2025-1', fecha_inicio=hoy, fecha_fin=hoy + timedelta(days=90), activo=True
+        )
+
+    async def _conectar(self, usuario):
+        comunicador = WebsocketCommunicator(SocraticAIConsumer.as_asgi(), '/ws/chat/ai/socratic/')
+        comunicador.scope['user'] = usuario
+        conectado, _ = await comunicador.connect()
+        return comunicador, conectado
+
+    async def test_anonimo_es_rechazado(self):
+        comunicador, conectado = await self._conectar(AnonymousUser())
+        self.assertFalse(conectado)
+
+    async def test_pregunta_en_streaming(self):
+        comunicador, conectado = await self._conectar(self.estudiante)
+        self.assertTrue(conectado)
+        self.assertEqual((await comunicador.receive_json_from())['type'], 'system')
+
+        await comunicador.send_json_to({'message': '¿Cómo despejo x?', 'materia': 'Materia 0'})
+        mensajes = []
+        while not mensajes or mensajes[-1]['type'] not in ('ai_response', 'error'):
+            mensajes.append(await comunicador.receive_json_from(timeout=10))
+        await comunicador.disconnect()
+
+        self.assertEqual(mensajes[0], {'type': 'typing', 'status': True})
+        tokens = [m['token'] for m in mensajes if m['type'] == 'ai_token']
+        self.assertEqual(tokens, FRAGMENTOS_SSE)
+        final = mensajes[-1]
+        self.assertEqual(final['type'], 'ai_response', final)
+        self.assertEqual(final['message'], ''.join(FRAGMENTOS_SSE))
+
+        log = await sync_to_async(AIUsageLog.objects.filter(usuario=self.estudiante).latest)('id')
+        self.assertTrue(log.exitoso)
+        self.assertEqual(log.tokens_salida, 7)
+
+
+@mock.patch('tasks.ai.single_flight.INTERVALO_SONDEO', 0.01)
+class SingleFlightTest(SimpleTestCase):
+    """Peticiones idénticas en vuelo pagan una sola llamada a la IA."""
+
+    RESULTADO = {'success': True, 'content': 'Respuesta compartida'}
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.carpeta = carpeta.name
+        self.llamadas = []
+
+    def _llamar_cuando(self, evento):
+        """Llamada a la IA que no responde hasta que `evento` se activa."""
+        def funcion():
+            self.llamadas.append(threading.current_thread().name)
+            self.assertTrue(evento.wait(timeout=5))
+            return dict(self.RESULTADO)
+        return funcion
+
+    def _en_hilos(self, objetivos):
+        resultados = {}
+
+        def correr(nombre, objetivo):
+            resultados[nombre] = objetivo()
+
+        hilos = [threading.Thread(target=correr, args=(n, o), name=n) for n, o in objetivos.items()]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join(timeout=10)
+        return resultados
+
+    def test_hilos_identicos_comparten_una_llamada(self):
+        n = 8
+        vuelo = SingleFlight(backend=_BackendArchivos(self.carpeta))
+        todos_registrados = threading.Event()
+        registrar = vuelo._registrar
+        registros = []
+
+        def contar_registro(clave):
+            respuesta = registrar(clave)
+            registros.append(clave)
+            if len(registros) == n:
+                todos_registrados.set()
+            return respuesta
+
+        funcion = self._llamar_cuando(todos_registrados)
+        with mock.patch.object(vuelo, '_registrar', side_effect=contar_registro):
+            resultados = self._en_hilos({f'hilo{i}': lambda: vuelo.ejecutar('huella', funcion) for i in range(n)})
+
+        self.assertEqual(len(self.llamadas), 1)
+        self.assertEqual(len(resultados), n)
+        self.assertTrue(all(resultado == self.RESULTADO for resultado, _ in resultados.values()))
+        self.assertEqual(sorted(compartido for _, compartido in resultados.values()), [False] + [True] * (n - 1))
+        self.assertEqual(vuelo._vuelos, {})
+
+    def test_dos_procesos_comparten_el_directorio_de_locks(self):
+        # Dos registros independientes (como dos workers) sobre el mismo directorio
+        lider = SingleFlight(backend=_BackendArchivos(self.carpeta))
+        seguidor = SingleFlight(backend=_BackendArchivos(self.carpeta))
+        seguidor_esperando = threading.Event()
+        titular = seguidor._backend_fijo.titular
+
+        def sondear(clave):
+            token = titular(clave)
+            if token:
+                seguidor_esperando.set()
+            return token
+
+        funcion = self._llamar_cuando(seguidor_esperando)
+        lider_adentro = threading.Event()
+
+        def ejecutar_lider():
+            def llamar():
+                lider_adentro.set()
+                return funcion()
+            return lider.ejecutar('huella', llamar)
+
+        def ejecutar_seguidor():
+            self.assertTrue(lider_adentro.wait(timeout=5))
+            return seguidor.ejecutar('huella', funcion)
+
+        with mock.patch.object(seguidor._backend_fijo, 'titular', side_effect=sondear):
+            resultados = self._en_hilos({'lider': ejecutar_lider, 'seguidor': ejecutar_seguidor})
+
+        self.assertEqual(self.llamadas, ['lider'])
+        self.assertEqual(resultados['lider'], (self.RESULTADO, False))
+        self.assertEqual(resultados['seguidor'], (self.RESULTADO, True))
+        # El líder liberó su lock; solo queda el resultado publicado
+        self.assertFalse(any(nombre.endswith('.lock') for nombre in os.listdir(self.carpeta)))
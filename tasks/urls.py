@@ -48,6 +48,39 @@ urlpatterns = [
     path('panel/ex-alumnos/', views.admin_ex_estudiantes, name='admin_ex_estudiantes'),
     path('cuenta/cambiar-clave/', views.cambiar_clave, name='cambiar_clave'),
 
+    # ======================================================
+    # 📝 CALIFICACIONES (AUTOGUARDADO AJAX)
+    # ======================================================
+    path('api/notas/<int:materia_id>/autoguardar/', views.api_autoguardar_notas, name='api_autoguardar_notas'),
+
+    # ======================================================
+    # 📊 REPORTES: SÁBANA DE NOTAS
+    # ======================================================
+    path('reportes/sabana/exportar/', views.exportar_sabana_notas, name='exportar_sabana_notas'),
+    path('reportes/sabana/institucional/', views.exportar_sabana_institucional, name='exportar_sabana_institucional'),
+
+    # ======================================================
+    # 🖨️ PDFs EN SEGUNDO PLANO (TRABAJOS)
+    # ======================================================
+    # Enlaces directos: encolan y muestran la página de espera
+    path('pdf/boletin/<int:estudiante_id>/', views.generar_boletin_pdf_admin, name='panel_generar_boletin'),
+    path('pdf/boletin/<int:estudiante_id>/acudiente/', views.generar_boletin_pdf_acudiente, name='generar_boletin_acudiente'),
+    path('pdf/boletin/<int:estudiante_id>/encolar/', views_pdf.encolar_boletin_pdf, name='encolar_boletin_pdf'),
+    path('pdf/observador/<int:estudiante_id>/encolar/', views_pdf.encolar_observador_pdf, name='encolar_observador_pdf'),
+    path('pdf/expedientes/curso/<int:curso_id>/encolar/', views_pdf.encolar_expedientes_curso, name='encolar_expedientes_curso'),
+    path('pdf/boletines/lote/encolar/', views_pdf.encolar_boletines_lote, name='encolar_boletines_lote'),
+    path('pdf/certificados/graduados/encolar/', views_pdf.encolar_certificados_graduados, name='encolar_certificados_graduados'),
+    path('pdf/trabajos/<uuid:trabajo_id>/', views_pdf.estado_trabajo_pdf, name='pdf_trabajo_estado'),
+    path('pdf/trabajos/<uuid:trabajo_id>/descargar/', views_pdf.descargar_trabajo_pdf, name='pdf_trabajo_descargar'),
+
+    # ======================================================
+    # 📤 DOCUMENTOS GUARDADOS (ETag / 304)
+    # ======================================================
+    path('documentos/boletines-archivados/<int:boletin_id>/', views_pdf.descargar_boletin_archivado, name='descargar_boletin_archivado'),
+    path('documentos/historial/<int:historial_id>/boletin/', views_pdf.descargar_boletin_historial, name='descargar_boletin_historial'),
+    path('documentos/historial/<int:historial_id>/certificado/', views_pdf.download_certificate_view, name='descargar_certificado_historial'),
+    path('documentos/repositorio/<uuid:documento_uuid>/', views_pdf.descargar_documento_historico, name='descargar_documento_historico'),
+
     # ======================================================
     # 🤖 INTELIGENCIA ARTIFICIAL (IA)
     # ======================================================
@@ -76,4 +109,5 @@ urlpatterns = [
     # 🦄 RUTAS SHADOW (TENANT SIMULATION)
     # ==========================================
     path('shadow-demo/', views_shadow.shadow_tenant_dashboard, name='shadow_tenant'),
+    path('shadow-demo/refrescar/', views_shadow.shadow_refresh_snapshot, name='shadow_refresh_snapshot'),
 ]
\ No newline at end of file
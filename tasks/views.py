@@ -19,6 +19,8 @@ from django.template.loader import get_template  # <--- FALTABA ESTO
 from django.template import TemplateDoesNotExist # <--- FALTABA ESTO
 from django.conf import settings                 # <--- FALTABA ESTO
 import os
+import tempfile
+import time
 from django.views.decorators.csrf import csrf_exempt
 #agregando los cambios de deepseek
 from openai import OpenAI    # pip install openai
@@ -33,6 +35,7 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 #Aqui importaciones para hacer el pdf con el reporte de la AI 
 import markdown # <--- NECESARIO
 from django.utils.html import mark_safe
+from django.utils.text import slugify
 #Hasta aqui
 
 from .ai.orchestrator import ai_orchestrator
@@ -58,7 +61,8 @@ from django.db.models import Q, Avg
 # --- FIN DE CIRUGÍA 1 ---
 from django.http import JsonResponse, HttpResponseNotAllowed
 # --- INICIO DE MODIFICACIÓN 1: Añadir Importaciones ---
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, StreamingHttpResponse, FileResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.template.loader import render_to_string
 # --- FIN DE MODIFICACIÓN 1 ---
 from django.contrib import messages
@@ -135,6 +139,16 @@ from .decorators import role_required
 
 # --- INICIO DE MODIFICACIÓN 1 (continuación): Añadir Importaciones ---
 from .services import get_student_report_context # Usamos el nuevo servicio
+from .services.grades import GradePersistenceService
+from .services.academic_summary import NOTA_MINIMA_APROBATORIA
+from .services.student_dashboard import cargar_panel_estudiante, cargar_paneles_estudiantes
+from .services.risk_prediction import MotorPrediccionRiesgo
+from .services.sabana import SabanaService, SabanaInstitucionalExport
+from .services.pdf_jobs import PLANTILLA_BOLETIN, PDFJobService, obtener_boletin_pdf
+from .views_pdf import pagina_espera_trabajo
+from .services.pdf_delivery import servir_archivo
+from .services.certificate_service import qr_png_base64
+from .services.boletin_batch import FORMATO_PDF, FORMATOS
 # --- FIN DE MODIFICACIÓN 1 ---
 
 ####Seguridad 
@@ -179,7 +193,7 @@ DEFAULT_TEMP_PASSWORD = getattr(settings, 'DEFAULT_TEMP_PASSWORD', '123456')
 PESOS_NOTAS = {1: Decimal('0.20'), 2: Decimal('0.30'), 3: Decimal('0.30'), 4: Decimal('0.20')}
 ESCALA_MIN = Decimal('0.0')
 ESCALA_MAX = Decimal('5.0')
-NOTA_APROBACION = Decimal('3.5')
+NOTA_APROBACION = NOTA_MINIMA_APROBATORIA
 NUM_NOTAS = (1, 2, 3, 4)
 TWO_PLACES = Decimal('0.01')
 
@@ -457,208 +471,15 @@ def answer_question(request, question_id):
 def dashboard_estudiante(request):
     """
     Panel del Estudiante con Estadísticas Avanzadas, Asistencia y Directorio.
+    Los datos se cargan con un número fijo de consultas (ver services.student_dashboard).
     """
     estudiante = request.user
     perfil_estudiante = get_object_or_404(Perfil, user=estudiante)
 
-    # Intenta obtener la matrícula activa más reciente
-    matricula = Matricula.objects.filter(estudiante=estudiante, activo=True).select_related('curso').first()
-    curso = matricula.curso if matricula else None
-
-    # Inicializar colecciones
-    materias_con_notas = {}
-    comentarios_docente = {}
-    actividades_semanales = {}
-    convivencia_notas = {}
-    logros_por_materia_por_periodo = {}
-    periodos_disponibles = []
-    
-    # --- VARIABLES PARA ESTADÍSTICAS (NUEVO) ---
-    stats_materias_labels = []    
-    stats_materias_promedios = [] 
-    stats_periodos_labels = []    
-    stats_periodos_data = []      
-    conteo_ganadas = 0
-    conteo_perdidas = 0
-    promedio_general_acumulado = 0.0
-    
-    # Variables de asistencia
-    porcentaje_asistencia = 100.0
-    total_fallas = 0
-    fallas_detalladas = []
-
-    # Directorio Docente
-    docentes_directorio = []
-
-    if curso:
-        # Obtener periodos
-        periodos_disponibles = list(Periodo.objects.filter(curso=curso, activo=True).order_by('id'))
-
-        # Obtener asignaciones (Optimizada para traer datos del docente)
-        asignaciones = AsignacionMateria.objects.filter(curso=curso, activo=True).select_related('materia', 'docente')
-        
-        # -------------------------------------------------------------------------
-        # 🏥 CIRUGÍA MAYOR: CORRECCIÓN DE MATERIAS (INCLUYE CONVIVENCIA)
-        # -------------------------------------------------------------------------
-        # 1. Identificamos materias que tienen profesor asignado (Académicas)
-        ids_materias_asignadas = {a.materia.id for a in asignaciones}
-        
-        # 2. Identificamos materias que tienen NOTAS registradas (Transversales/Convivencia)
-        # Esto fuerza al sistema a reconocer Convivencia si existen notas, aunque no haya Asignación.
-        ids_materias_con_notas = set(Nota.objects.filter(
-            estudiante=estudiante,
-            periodo__curso=curso
-        ).values_list('materia_id', flat=True))
-
-        # 3. Unimos ambos conjuntos para obtener la lista definitiva de materias reales
-        ids_totales = ids_materias_asignadas | ids_materias_con_notas
-        
-        # 4. Recuperamos los objetos Materia
-        materias = Materia.objects.filter(id__in=ids_totales).order_by('nombre')
-        # -------------------------------------------------------------------------
-
-        # --- LÓGICA DIRECTORIO DE DOCENTES ---
-        docentes_vistos = set()
-        for asig in asignaciones:
-            if asig.docente_id and asig.docente_id not in docentes_vistos:
-                docente = asig.docente
-                # Foto segura
-                foto_url = None
-                try:
-                    if hasattr(docente, 'perfil') and docente.perfil.foto:
-                        foto_url = docente.perfil.foto.url
-                except Exception: pass
-
-                docentes_directorio.append({
-                    'id': docente.id,
-                    'nombre': docente.get_full_name() or docente.username,
-                    'materia_principal': asig.materia.nombre,
-                    'foto_url': foto_url
-                })
-                docentes_vistos.add(docente.id)
-
-        # -----------------------------------------------------------
-        # 1. CÁLCULO DE ESTADÍSTICAS ACADÉMICAS
-        # -----------------------------------------------------------
-        notas_definitivas_qs = Nota.objects.filter(
-            estudiante=estudiante, 
-            materia__in=materias,
-            numero_nota=5
-        )
-
-        # A. Estadísticas por Materia
-        for materia in materias:
-            notas_mat = [n.valor for n in notas_definitivas_qs if n.materia_id == materia.id]
-            promedio_materia = 0.0
-
-            if notas_mat:
-                promedio_materia = float(sum(notas_mat)) / len(notas_mat)
-                if promedio_materia >= 3.5: 
-                    conteo_ganadas += 1
-                else:
-                    conteo_perdidas += 1
-            
-            stats_materias_labels.append(materia.nombre)
-            stats_materias_promedios.append(round(promedio_materia, 2))
-
-        # B. Estadísticas por Periodo
-        for periodo in periodos_disponibles:
-            stats_periodos_labels.append(periodo.nombre)
-            notas_per = [n.valor for n in notas_definitivas_qs if n.periodo_id == periodo.id]
-            
-            if notas_per:
-                prom_per = float(sum(notas_per)) / len(notas_per)
-                stats_periodos_data.append(round(prom_per, 2))
-            else:
-                stats_periodos_data.append(0)
-
-        # C. Promedio General
-        if stats_materias_promedios:
-            promedios_validos = [p for p in stats_materias_promedios if p > 0]
-            if promedios_validos:
-                promedio_general_acumulado = sum(promedios_validos) / len(promedios_validos)
-
-        # -----------------------------------------------------------
-        # 2. CÁLCULO DE ASISTENCIA DETALLADA
-        # -----------------------------------------------------------
-        try:
-            from .models import Asistencia 
-            total_clases = Asistencia.objects.filter(estudiante=estudiante, curso=curso).count()
-            fallas_qs = Asistencia.objects.filter(estudiante=estudiante, curso=curso, estado='FALLA').select_related('materia').order_by('-fecha')
-            total_fallas = fallas_qs.count()
-            fallas_detalladas = list(fallas_qs)
-
-            if total_clases > 0:
-                porcentaje_asistencia = ((total_clases - total_fallas) / total_clases) * 100
-            
-            porcentaje_asistencia = round(porcentaje_asistencia, 1)
-        except ImportError: pass
-
-        # -----------------------------------------------------------
-        # 3. DATOS DETALLADOS (LÓGICA ORIGINAL)
-        # -----------------------------------------------------------
-        for materia in materias:
-            # Notas
-            notes = Nota.objects.filter(estudiante=estudiante, materia=materia).select_related('periodo').order_by('periodo__id', 'numero_nota')
-            notas_por_periodo = {}
-            for nota in notes:
-                notas_por_periodo.setdefault(nota.periodo.id, {})[nota.numero_nota] = nota
-
-            if notas_por_periodo:
-                materias_con_notas[materia] = notas_por_periodo
-
-            # Comentarios
-            comentarios = ComentarioDocente.objects.filter(estudiante=estudiante, materia=materia).order_by('-fecha_creacion')
-            if comentarios.exists():
-                comentarios_docente[materia.id] = comentarios
-
-            # Actividades
-            actividades = ActividadSemanal.objects.filter(curso=curso, materia=materia).order_by('-fecha_creacion')
-            if actividades.exists():
-                actividades_semanales[materia.id] = actividades
-
-            # Logros
-            logros_de_la_materia = LogroPeriodo.objects.filter(curso=curso, materia=materia).order_by('periodo__id', '-fecha_creacion')
-            if logros_de_la_materia.exists():
-                logros_por_periodo_temp = {}
-                for logro in logros_de_la_materia:
-                    logros_por_periodo_temp.setdefault(logro.periodo.id, []).append(logro)
-                logros_por_materia_por_periodo[materia] = logros_por_periodo_temp
-
-        # Convivencia
-        convivencia_existente = Convivencia.objects.filter(estudiante=estudiante, curso=curso).select_related('periodo')
-        for convivencia in convivencia_existente:
-            convivencia_notas[convivencia.periodo.id] = {'valor': convivencia.valor, 'comentario': convivencia.comentario}
-
-    # Empaquetar Estadísticas
-    stats = {
-        'materias_labels': json.dumps(stats_materias_labels),
-        'materias_data': json.dumps(stats_materias_promedios),
-        'periodos_labels': json.dumps(stats_periodos_labels),
-        'periodos_data': json.dumps(stats_periodos_data),
-        'ganadas': conteo_ganadas,
-        'perdidas': conteo_perdidas,
-        'promedio_general': round(promedio_general_acumulado, 2),
-        'distribucion_data': json.dumps([conteo_ganadas, conteo_perdidas]),
-        'asistencia_pct': porcentaje_asistencia,
-        'total_fallas': total_fallas,
-        'detalle_fallas': fallas_detalladas
-    }
-
     context = {
         'estudiante': estudiante,
         'perfil': perfil_estudiante,
-        'curso': curso,
-        'matricula': matricula,
-        'periodos_disponibles': periodos_disponibles,
-        'materias_con_notas': materias_con_notas,
-        'comentarios_docente': comentarios_docente,
-        'actividades_semanales': actividades_semanales,
-        'logros_por_materia_por_periodo': logros_por_materia_por_periodo,
-        'convivencia_notas': convivencia_notas,
-        # NUEVOS CONTEXTOS
-        'stats': stats,
-        'docentes': docentes_directorio
+        **cargar_panel_estudiante(estudiante),
     }
 
     return render(request, 'dashboard_estudiante.html', context)
@@ -804,7 +625,7 @@ def dashboard_docente(request):
         if data['num_notas'] > 0:
             promedio_final = data['suma_notas'] / data['num_notas']
         
-        if promedio_final > 0 and promedio_final < 3.0:
+        if promedio_final > 0 and promedio_final < NOTA_MINIMA_APROBATORIA:
             conteo_reprobados_global += 1
 
         lista_final_estudiantes.append({
@@ -1013,99 +834,16 @@ def subir_notas(request, materia_id):
                         logger.error(f"Error procesando JSON de logros: {e_json}")
 
                 # --------------------------------------------------------------
-                # C. NOTAS DINÁMICAS Y SINCRONIZACIÓN LEGACY (CORE)
+                # C. NOTAS DINÁMICAS, SINCRONIZACIÓN LEGACY Y COMENTARIOS (CORE)
                 # --------------------------------------------------------------
-                usuario_sistema, _ = User.objects.get_or_create(username='sistema', defaults={'is_active': False})
-                
-                # Cacheamos notas existentes para detectar borrados sin consultar DB repetidamente
-                notas_existentes = {
-                    (n.estudiante_id, n.definicion_id): n 
-                    for n in NotaDetallada.objects.filter(definicion__materia=materia)
-                }
-
-                for m in estudiantes_matriculados:
-                    est = m.estudiante
-                    for periodo in periodos:
-                        definiciones = definiciones_map.get(periodo.id, [])
-                        
-                        suma_ponderada = Decimal('0.0')
-                        suma_porcentajes = Decimal('0.0')
-
-                        for definicion in definiciones:
-                            # Nombre del input HTML: nota_ESTUDIANTEID_DEFINICIONID
-                            input_name = f'nota_{est.id}_{definicion.id}'
-                            val_str = request.POST.get(input_name)
-                            key_nota = (est.id, definicion.id)
-
-                            # --- LOGICA DE GUARDADO ---
-                            if val_str and val_str.strip():
-                                try:
-                                    val_limpio = val_str.replace(',', '.')
-                                    val_decimal = Decimal(val_limpio)
-                                    
-                                    if 1.0 <= val_decimal <= 5.0:
-                                        # Guardamos o actualizamos la nota real
-                                        NotaDetallada.objects.update_or_create(
-                                            estudiante=est, definicion=definicion,
-                                            defaults={
-                                                'valor': val_decimal,
-                                                'registrado_por': request.user
-                                            }
-                                        )
-                                        
-                                        # Acumulamos para el promedio
-                                        peso = definicion.porcentaje / Decimal('100.0')
-                                        suma_ponderada += val_decimal * peso
-                                        suma_porcentajes += peso
-                                except Exception:
-                                    pass # Ignoramos valores no numéricos
-                            
-                            # --- LOGICA DE BORRADO ---
-                            else:
-                                # Si viene vacío y existía en BD, lo borramos
-                                if key_nota in notas_existentes:
-                                    notas_existentes[key_nota].delete()
-                                    # Al borrar, NO sumamos al promedio
-
-                        # --- SINCRONIZACIÓN CON SISTEMA LEGACY (Nota #5) ---
-                        if suma_porcentajes > 0:
-                            # Calculamos la definitiva (Suma acumulativa)
-                            definitiva = suma_ponderada
-                            
-                            Nota.objects.update_or_create(
-                                estudiante=est, materia=materia, periodo=periodo, numero_nota=5,
-                                defaults={
-                                    'valor': definitiva.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
-                                    'descripcion': 'Promedio Dinámico Auto-generado',
-                                    'registrado_por': usuario_sistema
-                                }
-                            )
-                        else:
-                            # Si no hay notas, borramos también la definitiva
-                            Nota.objects.filter(
-                                estudiante=est, materia=materia, periodo=periodo, numero_nota=5
-                            ).delete()
-
-                # --------------------------------------------------------------
-                # D. COMENTARIOS DEL DOCENTE
-                # --------------------------------------------------------------
-                for m in estudiantes_matriculados:
-                    est = m.estudiante
-                    for periodo in periodos:
-                        com_key = f'comentario_{est.id}_{periodo.id}'
-                        texto_com = request.POST.get(com_key)
-                        
-                        if texto_com and texto_com.strip():
-                            ComentarioDocente.objects.update_or_create(
-                                docente=request.user, estudiante=est, 
-                                materia=materia, periodo=periodo,
-                                defaults={'comentario': texto_com.strip()}
-                            )
-                        else:
-                            ComentarioDocente.objects.filter(
-                                docente=request.user, estudiante=est, 
-                                materia=materia, periodo=periodo
-                            ).delete()
+                # El motor compara la matriz contra las notas existentes y aplica
+                # solo el diferencial por lotes (consultas constantes por guardado).
+                GradePersistenceService(
+                    materia=materia, docente=request.user,
+                    periodos=periodos, definiciones_map=definiciones_map
+                ).guardar_matriz(
+                    [m.estudiante_id for m in estudiantes_matriculados], request.POST
+                )
 
             messages.success(request, 'Plan de evaluación y calificaciones guardados exitosamente.')
             return redirect('subir_notas', materia_id=materia.id)
@@ -1162,6 +900,7 @@ def subir_notas(request, materia_id):
 
     # CONTEXTO FINAL
     context = {
+        'asignacion': asignacion,
         'materia': materia,
         'curso': curso,
         'estudiantes_matriculados': estudiantes_matriculados,
@@ -1187,6 +926,66 @@ def subir_notas(request, materia_id):
 def dates_ok(lista, index):
     return index < len(lista) and lista[index] and lista[index].strip()
 
+
+@role_required('DOCENTE')
+@require_POST
+@csrf_protect
+def api_autoguardar_notas(request, materia_id):
+    """
+    ⚡ AUTOGUARDADO POR CELDA (AJAX).
+    Recibe solo las celdas modificadas de la sábana:
+        {"cambios": [{"estudiante_id": 1, "definicion_id": 7, "valor": "4,5"}, ...]}
+    Un valor vacío borra la nota. Devuelve las definitivas recalculadas para que la
+    página las pinte sin recargar toda la matriz.
+    """
+    asignacion = get_object_or_404(AsignacionMateria, materia_id=materia_id, docente=request.user, activo=True)
+    materia = asignacion.materia
+    curso = asignacion.curso
+
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise ValueError("El cuerpo debe ser un objeto JSON.")
+        cambios = data.get('cambios', [])
+        if not isinstance(cambios, list) or not all(isinstance(c, dict) for c in cambios):
+            raise ValueError("'cambios' debe ser una lista de celdas.")
+
+        periodos = list(Periodo.objects.filter(curso=curso, activo=True).order_by('id'))
+        definiciones_map = {p.id: [] for p in periodos}
+        for d in DefinicionNota.objects.filter(materia=materia, periodo__in=periodos).order_by('orden'):
+            definiciones_map[d.periodo_id].append(d)
+
+        # Solo se aceptan estudiantes con matrícula activa en el curso de la asignación
+        ids_solicitados = {int(c['estudiante_id']) for c in cambios}
+        ids_validos = set(Matricula.objects.filter(
+            curso=curso, activo=True, estudiante_id__in=ids_solicitados
+        ).values_list('estudiante_id', flat=True))
+        if len(ids_validos) != len(ids_solicitados):
+            return JsonResponse({'success': False, 'error': 'Estudiante no matriculado en el curso'}, status=400)
+
+        with transaction.atomic():
+            definitivas = GradePersistenceService(
+                materia=materia, docente=request.user,
+                periodos=periodos, definiciones_map=definiciones_map
+            ).guardar_celdas(cambios)
+
+        return JsonResponse({
+            'success': True,
+            'definitivas': [
+                {
+                    'estudiante_id': est_id,
+                    'periodo_id': periodo_id,
+                    'definitiva': str(valor) if valor is not None else None,
+                }
+                for (est_id, periodo_id), valor in definitivas.items()
+            ]
+        })
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        logger.exception("Error en autoguardado de notas")
+        return JsonResponse({'success': False, 'error': 'Error interno del servidor'}, status=500)
+
 #hasta aqui 
 
 
@@ -1371,7 +1170,20 @@ def generar_boletin(request, curso_id):
                     notas_dict[nota.numero_nota] = nota.valor
                 notas_data[estudiante.id][materia.id][periodo.id] = notas_dict
     if request.method == 'POST':
-        messages.success(request, 'Boletín generado correctamente.')
+        # Boletines de todo el curso en un solo trabajo (PDF combinado o ZIP) en segundo plano
+        formato = request.POST.get('formato', FORMATO_PDF)
+        trabajo = PDFJobService.encolar(
+            'BOLETINES_LOTE',
+            {
+                'curso_id': curso.id,
+                'formato': formato if formato in FORMATOS else FORMATO_PDF,
+                'base_url': request.build_absolute_uri('/'),
+            },
+            usuario=request.user
+        )
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse(PDFJobService.a_dict(trabajo), status=202)
+        messages.success(request, 'Generación de boletines en curso. Te avisaremos al terminar.')
         return redirect('generar_boletin', curso_id=curso_id)
     context = {'curso': curso, 'estudiantes': estudiantes, 'periodos': periodos, 'materias': materias, 'notas_data': notas_data}
     return render(request, 'generar_boletin.html', context)
@@ -2067,200 +1879,16 @@ def dashboard_acudiente(request):
         messages.error(request, "No tienes estudiantes vinculados. Por favor, contacta a la administración.")
         return render(request, 'dashboard_acudiente.html', {'estudiantes_data': []})
 
-    estudiantes_data = []
+    # Un único pase por lotes para todos los hijos vinculados
+    estudiantes = [vinculo.estudiante for vinculo in vinculados]
+    paneles = cargar_paneles_estudiantes(estudiantes)
 
-    for vinculo in vinculados:
-        estudiante = vinculo.estudiante
-        perfil_estudiante = getattr(estudiante, 'perfil', None)
-
-        # Matrícula y curso
-        matricula = Matricula.objects.filter(estudiante=estudiante, activo=True).select_related('curso').first()
-        curso = matricula.curso if matricula else None
-
-        # Colecciones de datos
-        materias_con_notas = {}
-        comentarios_docente = {}
-        actividades_semanales = {}
-        convivencia_notas = {}
-        logros_por_materia_por_periodo = {}
-        periodos_disponibles = []
-        
-        # Variables estadísticas
-        stats_materias_labels = []    
-        stats_materias_promedios = [] 
-        stats_periodos_labels = []    
-        stats_periodos_data = []      
-        conteo_ganadas = 0
-        conteo_perdidas = 0
-        promedio_general_acumulado = 0.0
-        
-        # Variables de asistencia
-        porcentaje_asistencia = 100.0
-        total_fallas = 0
-        fallas_detalladas = []
-
-        # Variable para Directorio Docente
-        docentes_directorio = []
-
-        if curso:
-            # Obtener periodos
-            periodos_disponibles = list(Periodo.objects.filter(curso=curso, activo=True).order_by('id'))
-            
-            # -----------------------------------------------------------
-            # CORRECCIÓN CRÍTICA AQUÍ: 
-            # Quitamos 'docente__perfil' del select_related para evitar que
-            # Django oculte profesores que no tienen perfil configurado.
-            # -----------------------------------------------------------
-            asignaciones = AsignacionMateria.objects.filter(curso=curso, activo=True).select_related('materia', 'docente')
-            materias = [a.materia for a in asignaciones]
-
-            # --- LÓGICA DIRECTORIO DE DOCENTES (BLINDADA) ---
-            docentes_vistos = set()
-            for asig in asignaciones:
-                # Verificamos que la asignación tenga un docente real (ID válido)
-                if asig.docente_id and asig.docente_id not in docentes_vistos:
-                    docente = asig.docente
-                    
-                    # Obtener foto de forma segura (sin romper si no hay perfil)
-                    foto_url = None
-                    try:
-                        if hasattr(docente, 'perfil') and docente.perfil.foto:
-                            foto_url = docente.perfil.foto.url
-                    except Exception:
-                        foto_url = None # Si falla algo con la foto, ponemos None y mostramos la inicial
-
-                    docentes_directorio.append({
-                        'id': docente.id,
-                        'nombre': docente.get_full_name() or docente.username,
-                        'materia_principal': asig.materia.nombre,
-                        'foto_url': foto_url
-                    })
-                    docentes_vistos.add(docente.id)
-
-            # -----------------------------------------------------------
-            # 1. CÁLCULO DE ESTADÍSTICAS ACADÉMICAS
-            # -----------------------------------------------------------
-            notas_definitivas_qs = Nota.objects.filter(
-                estudiante=estudiante, 
-                materia__in=materias,
-                numero_nota=5
-            )
-
-            # A. Estadísticas por Materia
-            for materia in materias:
-                notas_mat = [n.valor for n in notas_definitivas_qs if n.materia_id == materia.id]
-                promedio_materia = 0.0
-
-                if notas_mat:
-                    promedio_materia = float(sum(notas_mat)) / len(notas_mat)
-                    if promedio_materia >= 3.5: 
-                        conteo_ganadas += 1
-                    else:
-                        conteo_perdidas += 1
-                
-                stats_materias_labels.append(materia.nombre)
-                stats_materias_promedios.append(round(promedio_materia, 2))
-
-            # B. Estadísticas por Periodo
-            for periodo in periodos_disponibles:
-                stats_periodos_labels.append(periodo.nombre)
-                notas_per = [n.valor for n in notas_definitivas_qs if n.periodo_id == periodo.id]
-                
-                if notas_per:
-                    prom_per = float(sum(notas_per)) / len(notas_per)
-                    stats_periodos_data.append(round(prom_per, 2))
-                else:
-                    stats_periodos_data.append(0)
-
-            # C. Promedio General
-            if stats_materias_promedios:
-                promedios_validos = [p for p in stats_materias_promedios if p > 0]
-                if promedios_validos:
-                    promedio_general_acumulado = sum(promedios_validos) / len(promedios_validos)
-
-            # -----------------------------------------------------------
-            # 2. CÁLCULO DE ASISTENCIA DETALLADA
-            # -----------------------------------------------------------
-            try:
-                from .models import Asistencia 
-                
-                total_clases = Asistencia.objects.filter(estudiante=estudiante, curso=curso).count()
-                
-                fallas_qs = Asistencia.objects.filter(
-                    estudiante=estudiante, 
-                    curso=curso, 
-                    estado='FALLA'
-                ).select_related('materia').order_by('-fecha')
-                
-                total_fallas = fallas_qs.count()
-                fallas_detalladas = list(fallas_qs)
-
-                if total_clases > 0:
-                    porcentaje_asistencia = ((total_clases - total_fallas) / total_clases) * 100
-                
-                porcentaje_asistencia = round(porcentaje_asistencia, 1)
-
-            except ImportError:
-                pass 
-
-            # -----------------------------------------------------------
-            # 3. CARGA DE DATOS PARA TABLAS (DETALLE)
-            # -----------------------------------------------------------
-            notas_qs = Nota.objects.filter(
-                estudiante=estudiante, materia__in=materias
-            ).select_related('periodo', 'materia').order_by('periodo__id', 'numero_nota')
-
-            for nota in notas_qs:
-                materias_con_notas.setdefault(nota.materia, {}).setdefault(nota.periodo.id, {})[nota.numero_nota] = nota
-
-            # Comentarios
-            comentarios_qs = ComentarioDocente.objects.filter(estudiante=estudiante, materia__in=materias).select_related('materia')
-            for c in comentarios_qs:
-                comentarios_docente.setdefault(c.materia.id, []).append(c)
-
-            # Actividades
-            actividades_qs = ActividadSemanal.objects.filter(curso=curso, materia__in=materias).order_by('-fecha_creacion').select_related('materia')
-            for act in actividades_qs:
-                actividades_semanales.setdefault(act.materia.id, []).append(act)
-
-            # Logros
-            logros_qs = LogroPeriodo.objects.filter(curso=curso, materia__in=materias).select_related('periodo', 'materia')
-            for logro in logros_qs:
-                logros_por_materia_por_periodo.setdefault(logro.materia, {}).setdefault(logro.periodo.id, []).append(logro)
-
-            # Convivencia
-            convivencia_qs = Convivencia.objects.filter(estudiante=estudiante, curso=curso).select_related('periodo')
-            for conv in convivencia_qs:
-                convivencia_notas[conv.periodo.id] = {'valor': conv.valor, 'comentario': conv.comentario}
-
-        # Empaquetado final
+    estudiantes_data = []
+    for estudiante in estudiantes:
         estudiantes_data.append({
             'estudiante': estudiante,
-            'perfil': perfil_estudiante,
-            'curso': curso,
-            'matricula': matricula,
-            'periodos_disponibles': periodos_disponibles,
-            'materias_con_notas': materias_con_notas,
-            'comentarios_docente': comentarios_docente,
-            'actividades_semanales': actividades_semanales,
-            'logros_por_materia_por_periodo': logros_por_materia_por_periodo,
-            'convivencia_notas': convivencia_notas,
-            # ESTADÍSTICAS
-            'stats': {
-                'materias_labels': json.dumps(stats_materias_labels),
-                'materias_data': json.dumps(stats_materias_promedios),
-                'periodos_labels': json.dumps(stats_periodos_labels),
-                'periodos_data': json.dumps(stats_periodos_data),
-                'ganadas': conteo_ganadas,
-                'perdidas': conteo_perdidas,
-                'promedio_general': round(promedio_general_acumulado, 2),
-                'distribucion_data': json.dumps([conteo_ganadas, conteo_perdidas]),
-                'asistencia_pct': porcentaje_asistencia,
-                'total_fallas': total_fallas,
-                'detalle_fallas': fallas_detalladas
-            },
-            # DIRECTORIO DOCENTE (Ahora sí cargará siempre)
-            'docentes': docentes_directorio
+            'perfil': getattr(estudiante, 'perfil', None),
+            **paneles[estudiante.id],
         })
 
     context = {
@@ -2490,50 +2118,30 @@ def admin_db_visual(request):
 def _generar_boletin_pdf_logica(request, matricula_id: int):
     """
     FASE 10: Lógica de renderizado de PDF con INTEGRACIÓN DE IA.
-    Genera el boletín incluyendo el análisis de rendimiento automático.
+    Genera el boletín incluyendo el análisis de rendimiento precalculado
+    (AIDocumento); la IA nunca se llama durante la descarga.
+    Si el contexto académico no cambió, se sirve el PDF guardado en la caché
+    (sin llamar a WeasyPrint).
     """
     if HTML is None:
         raise Exception("El módulo de generación de PDF (WeasyPrint) no está instalado.")
 
-    # 1. Obtener los datos académicos base del estudiante
-    context = get_student_report_context(matricula_id)
-    if not context:
-        raise Http404(f"No se encontró contexto para la matrícula_id: {matricula_id}")
-
-    # 2. INTEGRACIÓN DE IA: Generar análisis pedagógico en tiempo real
-    # Obtenemos el objeto estudiante desde el contexto ya cargado
-    estudiante = context.get('estudiante')
-    
-    if estudiante:
-        # Llamamos al orquestador para obtener las recomendaciones constructivistas
-        # El orquestador ya sabe usar el ContextBuilder para ver las notas de la DB
-        resultado_ia = ai_orchestrator.process_request(
-            user=request.user, 
-            action_type=ACCION_MEJORAS_ESTUDIANTE,
-            target_user=estudiante
+    try:
+        entrada = obtener_boletin_pdf(
+            matricula_id,
+            usuario=request.user,
+            base_url=request.build_absolute_uri('/'),
+            request=request
         )
-        
-        # Inyectamos el contenido de la IA en el contexto del template
-        if resultado_ia.get('success'):
-            context['analisis_ia'] = resultado_ia.get('content')
-            context['ia_meta'] = resultado_ia.get('meta') # Por si quieres mostrar la fecha del análisis
-        else:
-            context['analisis_ia'] = "El análisis pedagógico automático no está disponible en este momento."
-
-    # 3. Preparar el renderizado
-    context['request'] = request
-    html_string = render_to_string('pdf/boletin_template.html', context)
-
-    # 4. Generar el archivo PDF con WeasyPrint
-    base_url = request.build_absolute_uri('/')
-    pdf = HTML(string=html_string, base_url=base_url).write_pdf()
+    except ValueError as e:
+        raise Http404(str(e))
 
-    # 5. Configurar la respuesta de descarga/visualización
-    filename = f"boletin_{estudiante.username}_{context['curso'].anio_escolar}.pdf"
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="{filename}"'
-    
-    return response
+    # Respuesta de visualización desde MEDIA: la huella del contexto es el ETag (304 si no cambió)
+    return servir_archivo(
+        request, entrada.archivo, entrada.nombre_archivo,
+        huella=entrada.huella, modificado=entrada.creado,
+        content_type='application/pdf'
+    )
 
 # ===================================================================
 # 🩺 INICIO DE CIRUGÍA C: (REEMPLAZO) Vistas de PDF actualizadas 
@@ -2544,90 +2152,50 @@ def _generar_boletin_pdf_logica(request, matricula_id: int):
 def generar_boletin_pdf_admin(request, estudiante_id, return_file=False):
     """
     Genera el Boletín Académico.
-    CORRECCIÓN APLICADA: Nombre del template corregido.
+    Usa el mismo contexto que el resto de boletines (`get_student_report_context`).
+    Para verlo se encola en la cola de PDFs (la petición no espera a WeasyPrint);
+    el archivo para archivar (retiro) se genera aquí mismo.
     """
-    # Imports necesarios
-    from .models import Matricula, AsignacionMateria, Nota, Materia, Convivencia, Periodo, Institucion
-    from django.template.loader import render_to_string
     from django.core.files.base import ContentFile
-    try:
-        from weasyprint import HTML
-    except ImportError:
-        HTML = None
 
     try:
         # 1. Obtener Estudiante
         estudiante = get_object_or_404(User, id=estudiante_id)
 
         # 2. Obtener Matrícula (Flexible: Activa o Histórica)
-        matricula = Matricula.objects.filter(estudiante=estudiante, activo=True).select_related('curso').first()
+        matricula = Matricula.objects.filter(estudiante=estudiante, activo=True).first()
         
         if not matricula:
             # Si no hay activa, busca la última histórica
-            matricula = Matricula.objects.filter(estudiante=estudiante).select_related('curso').order_by('-id').first()
+            matricula = Matricula.objects.filter(estudiante=estudiante).order_by('-id').first()
 
         if not matricula:
             if return_file: return None
             messages.error(request, "Este estudiante nunca ha sido matriculado.")
             return redirect('admin_dashboard')
 
-        curso = matricula.curso
-
-        # 3. Datos Académicos
-        periodos = Periodo.objects.filter(curso=curso).order_by('id')
-        
-        materias_ids = set(AsignacionMateria.objects.filter(curso=curso).values_list('materia_id', flat=True))
-        materias_ids.update(Nota.objects.filter(estudiante=estudiante, periodo__curso=curso).values_list('materia_id', flat=True))
-        materias = Materia.objects.filter(id__in=materias_ids).order_by('nombre')
-
-        notas_por_materia = {}
-        for materia in materias:
-            notas_materia = {}
-            for periodo in periodos:
-                qs = Nota.objects.filter(estudiante=estudiante, materia=materia, periodo=periodo).order_by('numero_nota')
-                if qs.exists():
-                    notas_materia[periodo] = qs
-            if notas_materia:
-                notas_por_materia[materia] = notas_materia
-
-        # Convivencia
-        convivencia_data = {}
-        convivencias = Convivencia.objects.filter(estudiante=estudiante, curso=curso).select_related('periodo')
-        for c in convivencias:
-            convivencia_data[c.periodo.id] = {'valor': c.valor, 'comentario': c.comentario}
-
-        # 4. Renderizado
-        context = {
-            'institucion': Institucion.objects.first(),
-            'estudiante': estudiante,
-            'curso': curso,
-            'matricula': matricula,
-            'periodos': periodos,
-            'materias': materias,
-            'notas_por_materia': notas_por_materia,
-            'convivencia_notas': convivencia_data,
-            'fecha_emision': timezone.now(),
-            'request': request
-        }
-
-        # --- AQUÍ ESTABA EL ERROR: CAMBIADO A 'boletin_template.html' ---
-        html_string = render_to_string('pdf/boletin_template.html', context)
-
         if HTML is None:
             if return_file: return None
             return HttpResponse("Error: Librería PDF no instalada.", status=500)
 
-        pdf_bytes = HTML(string=html_string, base_url=request.build_absolute_uri('/')).write_pdf()
+        base_url = request.build_absolute_uri('/')
 
-        # 5. Retorno
-        filename = f"Boletin_{estudiante.username}.pdf"
-        
-        if return_file:
-            return ContentFile(pdf_bytes, name=filename)
-
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
-        response['Content-Disposition'] = f'inline; filename="{filename}"'
-        return response
+        # 3. Visualización: se encola y la página de espera abre el PDF al terminar
+        if not return_file:
+            trabajo = PDFJobService.encolar(
+                'BOLETIN', {'matricula_id': matricula.id, 'base_url': base_url}, usuario=request.user
+            )
+            return pagina_espera_trabajo(request, trabajo, f"Boletín de {estudiante.get_full_name() or estudiante.username}")
+
+        # 4. Archivado (retiro): el archivo se necesita ya y con los datos actuales (sin caché)
+        inicio = time.perf_counter()
+        context = get_student_report_context(matricula.id, usar_cache=False)
+        context['request'] = request
+        tiempo_contexto = time.perf_counter() - inicio
+        pdf_bytes = PDFJobService.renderizar_plantilla(
+            PLANTILLA_BOLETIN, context, base_url, tiempo_contexto=tiempo_contexto
+        )
+        return ContentFile(pdf_bytes, name=f"Boletin_{estudiante.username}.pdf")
 
     except Exception as e:
         print(f"❌ ERROR: {e}") # Dejamos el print por seguridad
@@ -2664,10 +2232,17 @@ def generar_boletin_pdf_acudiente(request, estudiante_id):
         messages.warning(request, "La generación del boletín no está habilitada. Por favor, contacta a la administración.")
         return redirect('dashboard_acudiente')
 
-    # 3. Si todo es correcto, llama a la LÓGICA INTERNA
+    # 3. Si todo es correcto, se encola (la página de espera abre el PDF al terminar)
     try:
-        return _generar_boletin_pdf_logica(request, matricula.id) # 👈 Pasa el matricula_id
-        
+        trabajo = PDFJobService.encolar(
+            'BOLETIN',
+            {'matricula_id': matricula.id, 'base_url': request.build_absolute_uri('/')},
+            usuario=request.user
+        )
+        return pagina_espera_trabajo(
+            request, trabajo, f"Boletín de {vinculo.estudiante.get_full_name() or vinculo.estudiante.username}"
+        )
+
     except Exception as e:
         # 4. Si falla, registra el error y redirige al dashboard de ACUDIENTE
         logger.exception(f"Error al generar boletín PDF (Acudiente) para estudiante {estudiante_id}: {e}")
@@ -2776,8 +2351,7 @@ def admin_eliminar_estudiante(request):
                     if not contexto: continue
 
                     contexto['request'] = request
-                    html = render_to_string('pdf/boletin_template.html', contexto)
-                    pdf_content = HTML(string=html, base_url=base_url).write_pdf()
+                    pdf_content = PDFJobService.renderizar_plantilla(PLANTILLA_BOLETIN, contexto, base_url)
 
                     nombre_archivo = f"boletin_{estudiante_username}_{matricula.anio_escolar.replace('-', '_')}.pdf"
                     
@@ -2815,8 +2389,7 @@ def admin_eliminar_estudiante(request):
                     'request': request
                 }
 
-                html_obs = render_to_string('pdf/observador_template.html', ctx_obs)
-                pdf_obs = HTML(string=html_obs, base_url=base_url).write_pdf()
+                pdf_obs = PDFJobService.renderizar_plantilla('pdf/observador_template.html', ctx_obs, base_url)
 
                 nombre_obs = f"OBS_FINAL_{estudiante_username}_{timezone.now().strftime('%Y%m%d')}.pdf"
 
@@ -2960,126 +2533,22 @@ def api_tomar_asistencia(request):
 def dashboard_academico(request):
     """
     Tablero de Inteligencia Académica con MOTOR DE PREDICCIÓN.
+    El cálculo (proyección, riesgo, KPIs y gráficos) vive en MotorPrediccionRiesgo.
     """
-    # Pesos definidos en el sistema
-    PESOS = {1: 0.20, 2: 0.30, 3: 0.30, 4: 0.20}
-
-    # 1. Obtener notas finales que están perdiendo (< 3.0)
-    # Filtramos solo cursos activos para datos reales
-    notas_reprobadas = Nota.objects.filter(
-        numero_nota=5, 
-        valor__lt=3.0,
-        materia__curso__activo=True
-    ).select_related('estudiante', 'materia', 'materia__curso')
-
-    # 2. PROCESAMIENTO Y PREDICCIÓN
-    riesgo_map = {}
-    
-    for nota_final in notas_reprobadas:
-        est_id = nota_final.estudiante.id
-        
-        # --- ALGORITMO DE PREDICCIÓN ---
-        # 1. ¿Cuánto lleva acumulado?
-        nota_acumulada = float(nota_final.valor)
-        
-        # 2. ¿Qué notas ya se tomaron? (Consultamos las parciales de este estudiante/materia)
-        notas_parciales = Nota.objects.filter(
-            estudiante=nota_final.estudiante,
-            materia=nota_final.materia,
-            periodo=nota_final.periodo,
-            numero_nota__in=[1, 2, 3, 4]
-        ).values_list('numero_nota', flat=True)
-        
-        # 3. Calcular peso evaluado y peso restante
-        peso_evaluado = sum(PESOS[n] for n in notas_parciales)
-        peso_restante = 1.0 - peso_evaluado
-        
-        # 4. Proyección: ¿Qué nota necesita en lo que falta para pasar con 3.0?
-        # Fórmula: (Meta - Acumulado) / Peso_Restante
-        if peso_restante > 0.05: # Si falta más del 5% por evaluar
-            nota_necesaria = (3.0 - nota_acumulada)
-            # Como el acumulado ya está ponderado, la nota necesaria matemática es directa si asumimos 
-            # que nota_acumulada es la suma de (nota * peso).
-            # Ajuste: nota_final.valor en tu sistema es la SUMA PONDERADA.
-            # Meta acumulada total es 3.0.
-            # Puntos que faltan = 3.0 - nota_acumulada.
-            # Esos puntos deben conseguirse en el 'peso_restante'.
-            # Nota promedio necesaria = Puntos Faltantes / Peso Restante.
-            promedio_necesario = (3.0 - nota_acumulada) / peso_restante
-        else:
-            promedio_necesario = 100.0 # Ya no hay tiempo, nota infinita necesaria
-
-        # 5. Clasificar Riesgo / Probabilidad de Pérdida
-        if promedio_necesario > 5.0:
-            probabilidad = "100% (Irrecuperable)"
-            clase_riesgo = "bg-dark text-white" # Ya perdió matemáticamente
-            nivel_riesgo = "CRÍTICO"
-        elif promedio_necesario > 4.0:
-            probabilidad = "85% (Muy Alta)"
-            clase_riesgo = "bg-danger text-white"
-            nivel_riesgo = "ALTO"
-        elif promedio_necesario > 3.0:
-            probabilidad = "50% (Media)"
-            clase_riesgo = "bg-warning text-dark"
-            nivel_riesgo = "MEDIO"
-        else:
-            probabilidad = "20% (Baja)"
-            clase_riesgo = "bg-info text-dark"
-            nivel_riesgo = "BAJO"
-
-        # --- FIN ALGORITMO ---
-
-        if est_id not in riesgo_map:
-            riesgo_map[est_id] = {
-                'estudiante': nota_final.estudiante,
-                'curso': nota_final.materia.curso.nombre,
-                'total_perdidas': 0,
-                'materias': []
-            }
-        
-        riesgo_map[est_id]['total_perdidas'] += 1
-        riesgo_map[est_id]['materias'].append({
-            'nombre': nota_final.materia.nombre,
-            'nota_actual': nota_acumulada,
-            'nota_necesaria': round(promedio_necesario, 2) if promedio_necesario < 10 else "> 5.0",
-            'probabilidad': probabilidad,
-            'clase_riesgo': clase_riesgo,
-            'periodo': nota_final.periodo.nombre
-        })
-
-    # Ordenar: Primero los que tienen más materias perdidas
-    lista_riesgo = sorted(riesgo_map.values(), key=lambda x: x['total_perdidas'], reverse=True)
-
-    # 3. KPIs GLOBALES (Para las tarjetas de arriba)
-    all_notas_finales = Nota.objects.filter(numero_nota=5, materia__curso__activo=True)
-    total_evaluaciones = all_notas_finales.count()
-    promedio_global = all_notas_finales.aggregate(Avg('valor'))['valor__avg'] or 0
-    conteo_reprobadas = notas_reprobadas.count()
-    tasa_reprobacion = (conteo_reprobadas / total_evaluaciones * 100) if total_evaluaciones > 0 else 0
-
-    # 4. GRÁFICOS
-    rendimiento_cursos = all_notas_finales.values('materia__curso__nombre').annotate(prom=Avg('valor')).order_by('materia__curso__nombre')
-    labels_cursos = [x['materia__curso__nombre'] for x in rendimiento_cursos]
-    data_cursos = [float(round(x['prom'], 2)) for x in rendimiento_cursos]
-
-    rendimiento_materias = all_notas_finales.values('materia__nombre').annotate(prom=Avg('valor')).order_by('prom')[:10]
-    labels_materias = [x['materia__nombre'] for x in rendimiento_materias]
-    data_materias = [float(round(x['prom'], 2)) for x in rendimiento_materias]
+    tablero = MotorPrediccionRiesgo().calcular()
+    kpi = tablero['kpi']
+    labels_cursos, data_cursos = tablero['cursos']
+    labels_materias, data_materias = tablero['materias']
 
     context = {
-        'lista_riesgo': lista_riesgo,
-        'kpi': {
-            'promedio': round(promedio_global, 2),
-            'tasa_reprobacion': round(tasa_reprobacion, 1),
-            'total_evaluaciones': total_evaluaciones,
-            'reprobadas': conteo_reprobadas
-        },
+        'lista_riesgo': tablero['lista_riesgo'],
+        'kpi': kpi,
         'chart_cursos_labels': json.dumps(labels_cursos),
         'chart_cursos_data': json.dumps(data_cursos),
         'chart_materias_labels': json.dumps(labels_materias),
         'chart_materias_data': json.dumps(data_materias),
         # Datos para dona (Aprobados vs Reprobados)
-        'chart_distribucion_data': json.dumps([total_evaluaciones - conteo_reprobadas, conteo_reprobadas])
+        'chart_distribucion_data': json.dumps([kpi['total_evaluaciones'] - kpi['reprobadas'], kpi['reprobadas']])
     }
     
     return render(request, 'admin/dashboard_academico.html', context)
@@ -3113,57 +2582,11 @@ def reporte_consolidado(request):
         if periodo_id:
             periodo_seleccionado = get_object_or_404(Periodo, id=periodo_id)
             
-            # 1. Obtener todas las materias del curso
-            materias = Materia.objects.filter(curso=curso_seleccionado).order_by('nombre')
-            
-            # 2. Obtener estudiantes matriculados
-            matriculas = Matricula.objects.filter(curso=curso_seleccionado, activo=True).select_related('estudiante').order_by('estudiante__last_name')
-            
-            # 3. Construir la matriz
-            for mat in matriculas:
-                estudiante = mat.estudiante
-                notas_estudiante = []
-                promedio_acumulado = 0.0
-                materias_perdidas = 0
-                materias_con_nota = 0 # Contador para saber cuántas materias se promedian
-                
-                for materia in materias:
-                    # Buscar la nota final (numero_nota=5) de este estudiante en esta materia y periodo
-                    # Usamos .first() para seguridad
-                    nota_obj = Nota.objects.filter(
-                        estudiante=estudiante, 
-                        materia=materia, 
-                        periodo=periodo_seleccionado,
-                        numero_nota=5
-                    ).first()
-                    
-                    valor = float(nota_obj.valor) if nota_obj else 0.0
-                    
-                    if valor > 0:
-                        materias_con_nota += 1
-                        if valor < 3.0:
-                            materias_perdidas += 1
-                    
-                    notas_estudiante.append({
-                        'materia_id': materia.id,
-                        'valor': valor
-                    })
-                    promedio_acumulado += valor
-
-                # Cálculo seguro del promedio (Evitar división por cero)
-                if len(materias) > 0:
-                    # Opción A: Promedio sobre total de materias (diluye si faltan notas)
-                    promedio_general = promedio_acumulado / len(materias)
-                    # Opción B (Alternativa): promedio_general = promedio_acumulado / materias_con_nota if materias_con_nota > 0 else 0
-                else:
-                    promedio_general = 0.0
-                
-                datos_reporte.append({
-                    'estudiante': estudiante,
-                    'notas': notas_estudiante,
-                    'promedio': round(promedio_general, 2),
-                    'perdidas': materias_perdidas
-                })
+            # Matriz estudiantes × materias en un solo pase (ver SabanaService)
+            sabana = SabanaService.construir(curso_seleccionado, periodo_seleccionado)
+            materias = sabana.materias
+            # Promedio sobre total de materias (diluye si faltan notas)
+            datos_reporte = sabana.filas(promedio_sobre_todas=True)
 
     # 4. CRÍTICO: Obtener la institución para el encabezado del reporte
     institucion = Institucion.objects.first()
@@ -3220,75 +2643,93 @@ def sabana_notas(request):
             context['curso_seleccionado'] = curso_seleccionado
             context['periodo_seleccionado'] = periodo_seleccionado
 
-            # 3. Obtener Estudiantes Matriculados
-            estudiantes_matriculados = Matricula.objects.filter(
-                curso=curso_seleccionado,
-                activo=True
-            ).select_related('estudiante').order_by('estudiante__last_name')
-            
-            estudiante_ids = estudiantes_matriculados.values_list('estudiante_id', flat=True)
-
-            # 4. Obtener Materias (Búsqueda Completa)
-            # Busca: Materias del curso O Materias asignadas O Materias con notas existentes
-            materias = Materia.objects.filter(
-                Q(curso=curso_seleccionado) | 
-                Q(asignaciones__curso=curso_seleccionado) |
-                Q(notas__estudiante_id__in=estudiante_ids, notas__periodo=periodo_seleccionado)
-            ).distinct().order_by('nombre')
-            
-            context['materias'] = materias
-
-            # 5. Obtener Notas y Promediar (para definitivas)
-            notas_qs = Nota.objects.filter(
-                estudiante_id__in=estudiante_ids,
-                periodo=periodo_seleccionado,
-                materia__in=materias
-            ).values('estudiante_id', 'materia_id').annotate(definitiva=Avg('valor'))
-
-            # Mapa rápido para acceso O(1)
-            notas_map = {
-                (n['estudiante_id'], n['materia_id']): n['definitiva'] 
-                for n in notas_qs
-            }
-
-            # 6. Armar la Matriz de Datos
-            datos_reporte = []
-
-            for matricula in estudiantes_matriculados:
-                estudiante = matricula.estudiante
-                lista_notas = []
-                suma_promedios = 0
-                materias_con_nota = 0
-                perdidas = 0
-
-                for materia in materias:
-                    clave = (estudiante.id, materia.id)
-                    valor = notas_map.get(clave, 0)
-                    valor = float(round(valor, 1)) if valor else 0.0
-
-                    if valor > 0:
-                        suma_promedios += valor
-                        materias_con_nota += 1
-                        if valor < 3.0:
-                            perdidas += 1
-                    
-                    lista_notas.append({'valor': valor})
-
-                promedio_general = 0
-                if materias_con_nota > 0:
-                    promedio_general = round(suma_promedios / materias_con_nota, 2)
+            # 3. Matriz de definitivas (materias del curso, asignadas o con notas)
+            sabana = SabanaService.construir(curso_seleccionado, periodo_seleccionado)
+            context['materias'] = sabana.materias
 
-                datos_reporte.append({
-                    'estudiante': estudiante,
-                    'notas': lista_notas,
-                    'promedio': promedio_general,
-                    'perdidas': perdidas
-                })
+            # 4. Promedio solo sobre las materias con nota, celdas a un decimal
+            datos_reporte = sabana.filas(decimales=1, promedio_sobre_todas=False)
 
             context['datos_reporte'] = datos_reporte
 
     return render(request, 'admin/reporte_consolidado.html', context)
 
+
+@role_required(['COORD_ACADEMICO', 'ADMINISTRADOR', 'PSICOLOGO', 'COORD_CONVIVENCIA'])
+def exportar_sabana_notas(request):
+    """
+    Descarga la sábana de notas en CSV o XLSX.
+    - curso_id=<id> + periodo_id=<id>: un curso.
+    - curso_id=todos + periodo_nombre=<nombre>: todos los cursos activos (una hoja por curso).
+    """
+    curso_id = request.GET.get('curso_id')
+    formato = request.GET.get('formato', 'xlsx').lower()
+    if formato not in ('csv', 'xlsx'):
+        return HttpResponse("Formato no soportado. Use csv o xlsx.", status=400)
+
+    if curso_id == 'todos':
+        periodo_nombre = request.GET.get('periodo_nombre')
+        if not periodo_nombre:
+            return HttpResponse("Debe indicar el nombre del periodo.", status=400)
+        cursos = Curso.objects.filter(activo=True)
+        sabanas = SabanaService.construir_todos(periodo_nombre, cursos)
+        nombre_base = f"Sabana_Institucional_{slugify(periodo_nombre)}"
+    else:
+        try:
+            curso_id = int(curso_id)
+            periodo_id = int(request.GET.get('periodo_id'))
+        except (TypeError, ValueError):
+            return HttpResponse("curso_id y periodo_id deben ser números.", status=400)
+        curso = get_object_or_404(Curso, id=curso_id)
+        periodo = get_object_or_404(Periodo, id=periodo_id, curso=curso)
+        sabanas = [SabanaService.construir(curso, periodo)]
+        nombre_base = f"Sabana_{slugify(curso.nombre)}_{slugify(periodo.nombre)}"
+
+    if formato == 'csv':
+        response = HttpResponse(SabanaService.exportar_csv(sabanas), content_type='text/csv; charset=utf-8')
+    else:
+        response = HttpResponse(
+            SabanaService.exportar_xlsx(sabanas),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+    response['Content-Disposition'] = f'attachment; filename="{nombre_base}.{formato}"'
+    return response
+
+
+@role_required(['COORD_ACADEMICO', 'ADMINISTRADOR', 'PSICOLOGO', 'COORD_CONVIVENCIA'])
+def exportar_sabana_institucional(request):
+    """
+    Exporta la sábana de TODA la institución para un año escolar y periodo.
+    CSV: formato largo transmitido fila a fila (StreamingHttpResponse).
+    XLSX: una hoja por curso, escrito en modo write_only a un archivo temporal.
+    """
+    anio_escolar = request.GET.get('anio_escolar')
+    periodo_nombre = request.GET.get('periodo_nombre')
+    formato = request.GET.get('formato', 'csv').lower()
+    if not anio_escolar or not periodo_nombre:
+        return HttpResponse("Debe indicar el año escolar y el nombre del periodo.", status=400)
+    if formato not in ('csv', 'xlsx'):
+        return HttpResponse("Formato no soportado. Use csv o xlsx.", status=400)
+
+    exportador = SabanaInstitucionalExport(anio_escolar, periodo_nombre)
+    nombre_archivo = f"Sabana_{slugify(anio_escolar)}_{slugify(periodo_nombre)}.{formato}"
+
+    if formato == 'csv':
+        # Bajo ASGI (Daphne) un iterador síncrono se materializaría completo en memoria
+        filas = exportador.aiterar_csv() if isinstance(request, ASGIRequest) else exportador.iterar_csv()
+        response = StreamingHttpResponse(filas, content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+        return response
+
+    # El archivo temporal se borra al cerrarse (cuando FileResponse termina de enviarlo)
+    archivo = tempfile.TemporaryFile(suffix='.xlsx')
+    exportador.escribir_xlsx(archivo)
+    archivo.seek(0)
+    return FileResponse(
+        archivo, as_attachment=True, filename=nombre_archivo,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
 ##fase 4 inicio 
 
 # ===================================================================
@@ -3420,11 +2861,12 @@ def descargar_observador_acudiente(request, estudiante_id):
 
     if HTML:
         # Si WeasyPrint está instalado, generamos el PDF real
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'filename="Observador_{estudiante.username}.pdf"'
-        
         # Base url es importante para cargar imágenes estáticas/media
-        HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf(response)
+        pdf_bytes = PDFJobService.renderizar(
+            html_string, request.build_absolute_uri(), plantilla='pdf/observador_template.html'
+        )
+        response = HttpResponse(pdf_bytes, content_type='application/pdf')
+        response['Content-Disposition'] = f'filename="Observador_{estudiante.username}.pdf"'
         return response
     else:
         # Fallback: Si no hay librerías de PDF, mostramos el HTML para imprimir con Ctrl+P
@@ -3644,9 +3086,8 @@ def download_ai_report_pdf(request):
     if HTML is None:
         return HttpResponse("Error: WeasyPrint no está instalado en el servidor.", status=500)
 
-    html_string = render_to_string('pdf/ai_report_template.html', context)
     base_url = request.build_absolute_uri('/')
-    pdf = HTML(string=html_string, base_url=base_url).write_pdf()
+    pdf = PDFJobService.renderizar_plantilla('pdf/ai_report_template.html', context, base_url)
 
     response = HttpResponse(pdf, content_type='application/pdf')
     filename = f"Reporte_IA_{target_user.username}_{timezone.now().strftime('%Y%m%d')}.pdf"
@@ -3800,21 +3241,8 @@ def generar_certificado_estudiantil(request, user_id):
         path_verificacion = reverse('verificar_certificado_publico', args=[estudiante.id])
         url_qr = request.build_absolute_uri(path_verificacion)
 
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=1,
-        )
-        qr.add_data(url_qr)
-        qr.make(fit=True)
-
-        img_buffer = io.BytesIO()
-        img = qr.make_image(fill_color="black", back_color="white")
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        
-        qr_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
+        # Memoizado por URL: la del estudiante no cambia entre descargas
+        qr_base64 = qr_png_base64(url_qr, "black", "white", 1)
         qr_src = f"data:image/png;base64,{qr_base64}"
 
         # --- 2. DATOS DEL DOCUMENTO ---
@@ -3838,9 +3266,10 @@ def generar_certificado_estudiantil(request, user_id):
             'firma_url': 'https://res.cloudinary.com/dukiyxfvn/image/upload/v1769638753/Firma_MILLER_3_jbxux5.png'
         }
 
-        html_string = render_to_string('pdf/certificado_estudiantil_tier.html', context)
-        html = HTML(string=html_string, base_url=request.build_absolute_uri())
-        result = html.write_pdf(stylesheets=[], optimize_images=True)
+        result = PDFJobService.renderizar_plantilla(
+            'pdf/certificado_estudiantil_tier.html', context,
+            request.build_absolute_uri(), {'optimize_images': True}
+        )
 
         response = HttpResponse(result, content_type='application/pdf')
         response['Content-Disposition'] = f'inline; filename="Certificado_{estudiante.username}.pdf"'
@@ -4092,22 +3521,14 @@ def generar_pdf_bienestar(request):
         }
 
         # 4. Renderizar HTML a string
-        html_string = render_to_string('tasks/templates/pdf/ai_report_template.html', contexto, request=request)
-
-        # 5. Generar PDF en Memoria (Buffer)
-        # Esto evita errores de "Broken Pipe" o archivos corruptos
-        pdf_buffer = BytesIO()
-        
+        # 5. Generar PDF en Memoria (bytes desde el pool de renderizado)
         # Base URL es vital para cargar las fuentes de Google y las imágenes
-        HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf(
-            target=pdf_buffer, 
-            presentational_hints=True,
-            zoom=1  # Asegura escala correcta
+        pdf_value = PDFJobService.renderizar_plantilla(
+            'tasks/templates/pdf/ai_report_template.html', contexto,
+            request.build_absolute_uri(), {'presentational_hints': True}, request=request
         )
 
         # 6. Preparar respuesta HTTP
-        pdf_value = pdf_buffer.getvalue()
-        pdf_buffer.close()
 
         response = HttpResponse(pdf_value, content_type='application/pdf')
         filename = f"Informe_Bienestar_{timezone.now().strftime('%Y%m%d_%H%M')}.pdf"
@@ -1,12 +1,12 @@
 # tasks/views_pdf.py
+import os
 import markdown
 import logging # <--- INYECTADO: Necesario para reportar errores
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404 # <--- INYECTADO: Para buscar el historial o dar 404
-from django.template.loader import render_to_string
+from django.http import HttpResponse, JsonResponse, FileResponse, Http404
+from django.shortcuts import get_object_or_404, redirect, render # <--- INYECTADO: Para buscar el historial o dar 404
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from weasyprint import HTML, CSS 
+from django.views.decorators.http import require_POST
 
 # --- Importaciones de tu IA (Existentes - NO TOCAR) ---
 from .ai.orchestrator import ai_orchestrator
@@ -16,6 +16,16 @@ from .ai.constants import ACCION_ANALISIS_GLOBAL_BIENESTAR
 from .models import HistorialAcademico
 from .services.certificate_service import CertificateService
 
+# --- Entrega de documentos guardados (ETag / Last-Modified / 304) ---
+from .models import BoletinArchivado, DocumentoHistorico
+from .services.pdf_delivery import servir_archivo
+
+# --- Cola de renderizado PDF en segundo plano ---
+from .decorators import role_required
+from .models import Acudiente, Curso, Matricula, TrabajoPDF
+from .services.pdf_jobs import PDFJobService
+from .services.boletin_batch import FORMATO_PDF, FORMATOS
+
 # Configuración del logger
 logger = logging.getLogger(__name__)
 
@@ -55,16 +65,16 @@ def generar_pdf_bienestar(request):
     }
 
     # 4. RENDERIZADO CON WEASYPRINT
-    html_string = render_to_string('pdf/ai_report_template.html', contexto, request=request)
+    # Generación del PDF (pool de renderizado compartido)
+    pdf_bytes = PDFJobService.renderizar_plantilla(
+        'pdf/ai_report_template.html', contexto, request.build_absolute_uri(), request=request
+    )
 
     # Configuración de respuesta HTTP como PDF
-    response = HttpResponse(content_type='application/pdf')
+    response = HttpResponse(pdf_bytes, content_type='application/pdf')
     filename = f"Informe_Stratos_Bienestar_{timezone.now().strftime('%Y%m%d')}.pdf"
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
 
-    # Generación del PDF
-    HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf(response)
-    
     return response
 
 
@@ -77,28 +87,264 @@ def generar_pdf_bienestar(request):
 def download_certificate_view(request, historial_id):
     """
     Genera el Certificado Oficial de Notas con QR de seguridad.
+    El historial es un snapshot inmutable: el certificado se renderiza la
+    primera vez, se guarda y después se sirve el archivo (con ETag / 304).
     """
+    # 1. Obtener el historial específico
+    historial = get_object_or_404(HistorialAcademico.objects.select_related('estudiante__user'), id=historial_id)
+    if not _puede_ver_estudiante(request.user, historial.estudiante.user_id):
+        raise Http404
+
     try:
-        # 1. Obtener el historial específico
-        historial = get_object_or_404(HistorialAcademico, id=historial_id)
-        
-        # 2. Instanciar el servicio profesional
+        # 2. Instanciar el servicio profesional y obtener el PDF guardado (o generarlo)
         service = CertificateService()
+        service.obtener_certificado(historial, request.build_absolute_uri('/'))
         
-        # 3. Generar los bytes del PDF
-        pdf_bytes = service.generate_certificate_pdf(historial, request)
-        
-        # 4. Construir respuesta HTTP
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
-        
+        # 3. Construir respuesta HTTP ('inline' para ver en navegador)
         # Nombre del archivo: "Certificado_JuanPerez_2025.pdf"
         filename = f"Certificado_{historial.estudiante.numero_documento}_{historial.anio_lectivo}.pdf"
-        
-        # 'inline' para ver en navegador (cambiar a 'attachment' para forzar descarga)
-        response['Content-Disposition'] = f'inline; filename="{filename}"'
-        
-        return response
+        return servir_archivo(
+            request, historial.archivo_certificado, filename,
+            huella=historial.certificado_huella,
+            modificado=historial.certificado_generado,
+            content_type='application/pdf'
+        )
 
     except Exception as e:
         logger.error(f"Error crítico generando certificado PDF: {e}", exc_info=True)
-        return HttpResponse("Error del servidor generando el documento oficial.", status=500)
\ No newline at end of file
+        return HttpResponse("Error del servidor generando el documento oficial.", status=500)
+
+
+# ========================================================
+#  🖨️ PDFs EN SEGUNDO PLANO (COLA + POOL DE PROCESOS)
+#  La vista encola y responde 202 con el id del trabajo;
+#  el cliente consulta el estado y descarga el archivo guardado.
+# ========================================================
+
+ROLES_OBSERVADOR = ['PSICOLOGO', 'COORD_CONVIVENCIA', 'COORD_ACADEMICO', 'ADMINISTRADOR', 'ACUDIENTE']
+
+
+def _respuesta_trabajo(trabajo):
+    status = 200 if trabajo.terminado_ok else 202
+    return JsonResponse(PDFJobService.a_dict(trabajo), status=status)
+
+
+def pagina_espera_trabajo(request, trabajo, titulo):
+    """
+    Respuesta de los enlaces directos (observador, boletín): en lugar de
+    bloquear la petición mientras WeasyPrint trabaja, muestra una página que
+    consulta el estado del trabajo y abre el archivo cuando está listo.
+    """
+    datos = PDFJobService.a_dict(trabajo)
+    if trabajo.terminado_ok:
+        return redirect(datos['descarga_url'])
+    return render(request, 'pdf/trabajo_espera.html', {'trabajo_json': datos, 'titulo': titulo}, status=202)
+
+
+@role_required(['ADMINISTRADOR', 'ACUDIENTE'])
+@require_POST
+def encolar_boletin_pdf(request, estudiante_id):
+    """Encola el boletín de la matrícula activa del estudiante."""
+    if request.user.perfil.rol == 'ACUDIENTE':
+        if not Acudiente.objects.filter(acudiente=request.user, estudiante_id=estudiante_id).exists():
+            return JsonResponse({'error': 'No tienes permisos sobre este estudiante.'}, status=403)
+
+    matricula = Matricula.objects.filter(estudiante_id=estudiante_id, activo=True).first()
+    if not matricula:
+        return JsonResponse({'error': 'El estudiante no tiene una matrícula activa.'}, status=404)
+    if request.user.perfil.rol == 'ACUDIENTE' and not matricula.puede_generar_boletin:
+        return JsonResponse({'error': 'La generación del boletín no está habilitada.'}, status=403)
+
+    trabajo = PDFJobService.encolar(
+        'BOLETIN',
+        {'matricula_id': matricula.id, 'base_url': request.build_absolute_uri('/')},
+        usuario=request.user
+    )
+    return _respuesta_trabajo(trabajo)
+
+
+@role_required(ROLES_OBSERVADOR)
+@require_POST
+def encolar_observador_pdf(request, estudiante_id):
+    """Encola el observador del estudiante en el colegio de la petición."""
+    from apps.tenancy.utils import get_current_tenant
+
+    tenant = get_current_tenant()
+    if tenant is None:
+        return JsonResponse({'error': 'No hay una institución activa.'}, status=400)
+    if request.user.perfil.rol == 'ACUDIENTE':
+        if not Acudiente.objects.filter(acudiente=request.user, estudiante_id=estudiante_id).exists():
+            return JsonResponse({'error': 'No tienes permisos sobre este estudiante.'}, status=403)
+
+    trabajo = PDFJobService.encolar(
+        'OBSERVADOR',
+        {'estudiante_id': estudiante_id, 'tenant_id': tenant.id, 'base_url': request.build_absolute_uri('/')},
+        usuario=request.user
+    )
+    return _respuesta_trabajo(trabajo)
+
+
+@role_required(['ADMINISTRADOR', 'COORD_CONVIVENCIA', 'PSICOLOGO', 'COORD_ACADEMICO', 'DIRECTOR_CURSO'])
+@require_POST
+def encolar_expedientes_curso(request, curso_id):
+    """
+    ZIP con observador, expediente integral y acta consolidada de cada estudiante
+    del curso (o solo los `documentos` pedidos). El director de curso solo el suyo.
+    """
+    from apps.academics.models import Curso as CursoColegio
+    from apps.tenancy.utils import get_current_tenant
+    from apps.wellbeing.services.expediente_batch import DOCUMENTOS_LOTE
+
+    tenant = get_current_tenant()
+    if tenant is None:
+        return JsonResponse({'error': 'No hay una institución activa.'}, status=400)
+    curso = get_object_or_404(CursoColegio, id=curso_id, tenant=tenant)
+    if request.user.perfil.rol == 'DIRECTOR_CURSO' and curso.director_id != request.user.id:
+        return JsonResponse({'error': 'Solo el director del curso puede exportar sus expedientes.'}, status=403)
+
+    documentos = [d for d in request.POST.getlist('documentos') if d in DOCUMENTOS_LOTE] or list(DOCUMENTOS_LOTE)
+    trabajo = PDFJobService.encolar(
+        'EXPEDIENTES_CURSO',
+        {'curso_id': curso.id, 'tenant_id': tenant.id, 'documentos': documentos,
+         'base_url': request.build_absolute_uri('/')},
+        usuario=request.user
+    )
+    return _respuesta_trabajo(trabajo)
+
+
+@role_required(['ADMINISTRADOR', 'DOCENTE', 'DIRECTOR_CURSO'])
+@require_POST
+def encolar_boletines_lote(request):
+    """
+    Boletines de un curso (`curso_id`) o de un grado (`grado`, `anio_escolar`)
+    como un solo PDF combinado o un ZIP (`formato`). El director de curso
+    solo puede pedir el de su propio curso.
+    """
+    es_admin = request.user.perfil.rol == 'ADMINISTRADOR'
+    curso_id = request.POST.get('curso_id')
+    grado = request.POST.get('grado')
+    formato = request.POST.get('formato', FORMATO_PDF)
+    if formato not in FORMATOS:
+        formato = FORMATO_PDF
+
+    if curso_id:
+        curso = get_object_or_404(Curso, id=curso_id)
+        if not es_admin and curso.director_id != request.user.id:
+            return JsonResponse({'error': 'Solo el director del curso puede generar sus boletines.'}, status=403)
+        parametros = {'curso_id': curso.id}
+    elif grado and es_admin:
+        parametros = {'grado': grado, 'anio_escolar': request.POST.get('anio_escolar') or None}
+    else:
+        return JsonResponse({'error': 'Indica un curso (o un grado, solo administradores).'}, status=400)
+
+    parametros.update({'formato': formato, 'base_url': request.build_absolute_uri('/')})
+    trabajo = PDFJobService.encolar('BOLETINES_LOTE', parametros, usuario=request.user)
+    return _respuesta_trabajo(trabajo)
+
+
+@role_required('ADMINISTRADOR')
+@require_POST
+def encolar_certificados_graduados(request):
+    """Certificados de todos los graduados de `anio_lectivo` (ZIP, render en paralelo)."""
+    try:
+        anio_lectivo = int(request.POST.get('anio_lectivo', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Indica un año lectivo válido.'}, status=400)
+
+    parametros = {'anio_lectivo': anio_lectivo, 'base_url': request.build_absolute_uri('/')}
+    trabajo = PDFJobService.encolar('CERTIFICADOS_GRADUADOS', parametros, usuario=request.user)
+    return _respuesta_trabajo(trabajo)
+
+
+@login_required
+def estado_trabajo_pdf(request, trabajo_id):
+    """Estado del trabajo (JSON) para el polling del cliente."""
+    trabajo = get_object_or_404(TrabajoPDF, id=trabajo_id)
+    if not PDFJobService.puede_ver(trabajo, request.user):
+        raise Http404
+    if not trabajo.terminado and PDFJobService.vencer_abandonados(id=trabajo.id):
+        trabajo.refresh_from_db()
+    return _respuesta_trabajo(trabajo)
+
+
+@login_required
+def descargar_trabajo_pdf(request, trabajo_id):
+    """Sirve el PDF ya renderizado desde MEDIA (sin volver a renderizar)."""
+    trabajo = get_object_or_404(TrabajoPDF, id=trabajo_id)
+    if not PDFJobService.puede_ver(trabajo, request.user) or not trabajo.terminado_ok:
+        raise Http404
+    nombre = trabajo.nombre_archivo or f"{trabajo.id}.pdf"
+    es_zip = nombre.endswith('.zip')
+    return servir_archivo(
+        request, trabajo.archivo, nombre,
+        modificado=trabajo.terminado,
+        as_attachment=es_zip,
+        content_type='application/zip' if es_zip else 'application/pdf'
+    )
+
+
+# ========================================================
+#  📤 DOCUMENTOS GUARDADOS (BOLETINES ARCHIVADOS, HISTORIALES, REPOSITORIO)
+#  Se entregan en streaming con ETag / Last-Modified: al reabrir el mismo
+#  documento el navegador recibe un 304 en lugar del PDF completo.
+# ========================================================
+
+ROLES_DOCUMENTOS = ['ADMINISTRADOR', 'COORD_ACADEMICO', 'COORD_CONVIVENCIA', 'PSICOLOGO']
+ROLES_CONFIDENCIALES = ['ADMINISTRADOR', 'PSICOLOGO']
+
+
+def _puede_ver_estudiante(usuario, estudiante_id):
+    """Staff académico, el propio estudiante o uno de sus acudientes."""
+    if usuario.is_superuser or usuario.id == estudiante_id:
+        return True
+    rol = getattr(getattr(usuario, 'perfil', None), 'rol', None)
+    if rol in ROLES_DOCUMENTOS:
+        return True
+    return rol == 'ACUDIENTE' and Acudiente.objects.filter(acudiente=usuario, estudiante_id=estudiante_id).exists()
+
+
+@role_required('ADMINISTRADOR')
+def descargar_boletin_archivado(request, boletin_id):
+    """Boletín de un exalumno (archivado al retirarlo)."""
+    boletin = get_object_or_404(BoletinArchivado, id=boletin_id)
+    if not boletin.archivo_pdf:
+        raise Http404
+    return servir_archivo(
+        request, boletin.archivo_pdf, os.path.basename(boletin.archivo_pdf.name),
+        content_type='application/pdf'
+    )
+
+
+@login_required
+def descargar_boletin_historial(request, historial_id):
+    """Copia inmutable del boletín guardada en el cierre anual."""
+    historial = get_object_or_404(HistorialAcademico.objects.select_related('estudiante__user'), id=historial_id)
+    if not historial.archivo_boletin or not _puede_ver_estudiante(request.user, historial.estudiante.user_id):
+        raise Http404
+    return servir_archivo(
+        request, historial.archivo_boletin,
+        f"boletin_{historial.estudiante.user.username}_{historial.anio_lectivo}.pdf",
+        content_type='application/pdf'
+    )
+
+
+@login_required
+def descargar_documento_historico(request, documento_uuid):
+    """Activo del repositorio digital. El hash SHA-256 guardado es el ETag."""
+    documento = get_object_or_404(DocumentoHistorico.objects.select_related('estudiante'), uuid=documento_uuid, is_active=True)
+    rol = getattr(getattr(request.user, 'perfil', None), 'rol', None)
+    if documento.es_confidencial:
+        permitido = request.user.is_superuser or rol in ROLES_CONFIDENCIALES
+    elif documento.estudiante_id:
+        permitido = _puede_ver_estudiante(request.user, documento.estudiante.user_id)
+    else:
+        permitido = request.user.is_superuser or rol in ROLES_DOCUMENTOS
+    if not permitido or not documento.archivo:
+        raise Http404
+    return servir_archivo(
+        request, documento.archivo, documento.nombre_original or os.path.basename(documento.archivo.name),
+        huella=documento.hash_sha256 or None,
+        modificado=documento.fecha_actualizacion,
+        # Ejecutables y hojas con macros nunca se abren en el navegador
+        as_attachment=documento.es_riesgoso
+    )
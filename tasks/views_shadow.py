@@ -1,11 +1,11 @@
 # tasks/views_shadow.py
 
 import json
-from datetime import timedelta
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.db.models import Count, Avg, Sum, Q
-from django.utils import timezone
+from django.db.models import Avg
+from django.views.decorators.http import require_POST
 from django.contrib.auth import get_user_model
 
 # Importación explícita de modelos para evitar referencias circulares
@@ -13,23 +13,14 @@ from .models import (
     Nota, NotaDetallada, Observacion, Asistencia, 
     ActaInstitucional, Seguimiento, AIUsageLog, HistorialAcademico
 )
+# Configuración de BI y economía de APIs (compartida con el motor de snapshots)
+from .services.risk_snapshot import (
+    SnapshotRiesgoService, VALOR_PENSIÓN_MENSUAL, MESES_PERDIDA_PROMEDIO,
+    COSTO_INPUT_1M, COSTO_OUTPUT_1M
+)
 
 User = get_user_model()
 
-# ==========================================
-# 📊 CONFIGURACIÓN DE BUSINESS INTELLIGENCE
-# ==========================================
-VALOR_PENSIÓN_MENSUAL = 450000  # COP
-MESES_PERDIDA_PROMEDIO = 6      # Tiempo promedio que tarda en llenarse un cupo
-COSTO_LITIGIO_BASE = 5000000    # Costo estimado de una demanda/tutela
-
-# ==========================================
-# 🤖 ECONOMÍA DE APIS (MICRO-COSTOS)
-# ==========================================
-# Precios basados en el estándar de DeepSeek/OpenAI (ajustar según proveedor)
-COSTO_INPUT_1M = 0.14   # USD por 1M tokens entrada
-COSTO_OUTPUT_1M = 0.28  # USD por 1M tokens salida
-
 def is_staff_or_superuser(user):
     """Verifica privilegios administrativos de alto nivel."""
     return user.is_active and (user.is_staff or user.is_superuser)
@@ -40,120 +31,54 @@ def shadow_tenant_dashboard(request):
     """
     🛡️ COMMAND CENTER: TORRE DE CONTROL DE RIESGO
     Visualización estratégica de riesgos académicos, financieros y operativos.
+    Lee el último SnapshotRiesgo (ver `manage.py generar_snapshot_riesgo`).
     """
-    # ---------------------------------------------------------
-    # 1. MOTOR DE RIESGO (DETECCIÓN TEMPRANA)
-    # ---------------------------------------------------------
-    umbral_academico = 3.2
-    
-    # Detección en sistema de notas antiguo
-    ids_legacy = set(
-        Nota.objects.values('estudiante')
-        .annotate(promedio=Avg('valor'))
-        .filter(promedio__lt=umbral_academico)
-        .values_list('estudiante', flat=True)
-    )
-    
-    # Detección en sistema de notas moderno (Rúbricas)
-    ids_modern = set(
-        NotaDetallada.objects.values('estudiante')
-        .annotate(promedio=Avg('valor'))
-        .filter(promedio__lt=umbral_academico)
-        .values_list('estudiante', flat=True)
-    )
-    ids_academico = ids_legacy | ids_modern
-    
-    # Riesgo Legal: Tipos de falta graves
-    ids_legal = set(
-        Observacion.objects.filter(tipo__in=['CONVIVENCIA', '2', '3'])
-        .values_list('estudiante', flat=True)
-    )
-    
-    # Riesgo Ausentismo: Más de 5 fallas injustificadas
-    ids_ausentismo = set(
-        Asistencia.objects.filter(estado='FALLA')
-        .values('estudiante')
-        .annotate(total_fallas=Count('id'))
-        .filter(total_fallas__gte=5)
-        .values_list('estudiante', flat=True)
-    )
+    snapshot = SnapshotRiesgoService.ultimo()
+    historial = SnapshotRiesgoService.historial()
 
-    # ---------------------------------------------------------
-    # 2. FILTRO DE GESTIÓN (NETEO DE RIESGO)
-    # ---------------------------------------------------------
-    # Si hubo seguimiento en los últimos 15 días, el riesgo está "Mitigado"
-    fecha_limite = timezone.now() - timedelta(days=15)
-    ids_atendidos = set(
-        Seguimiento.objects.filter(fecha__gte=fecha_limite)
-        .values_list('estudiante', flat=True)
-    )
-    
-    total_riesgo_ids = ids_academico | ids_legal | ids_ausentismo
-    riesgo_neto_ids = total_riesgo_ids - ids_atendidos
-    
-    # ---------------------------------------------------------
-    # 3. IMPACTO FINANCIERO (FORECASTING)
-    # ---------------------------------------------------------
-    count_riesgo_neto = len(riesgo_neto_ids)
-    
-    # Dinero en riesgo por posible deserción
-    kpi_dinero = count_riesgo_neto * VALOR_PENSIÓN_MENSUAL * MESES_PERDIDA_PROMEDIO
-    
-    # Riesgo legal latente (casos legales sin atender)
-    casos_legales_abiertos = len(ids_legal - ids_atendidos)
-    kpi_legal = (casos_legales_abiertos * 0.20) * COSTO_LITIGIO_BASE # Asumiendo 20% probabilidad de escalamiento
-
-    # Tasa de Riesgo Global
-    total_alumnos = User.objects.filter(perfil__rol='ESTUDIANTE').count() or 1
-    tasa_riesgo = round((count_riesgo_neto / total_alumnos) * 100, 1)
-
-    # ---------------------------------------------------------
-    # 4. AUDITORÍA DE COSTOS IA (CONTROL FINANCIERO)
-    # ---------------------------------------------------------
-    logs_mes = AIUsageLog.objects.filter(fecha__month=timezone.now().month)
-    
-    # Agregación segura manejando posibles nulos
-    metricas_ia = logs_mes.aggregate(
-        total_in=Sum('tokens_entrada'),
-        total_out=Sum('tokens_salida')
-    )
-    
-    tokens_in = metricas_ia['total_in'] or 0
-    tokens_out = metricas_ia['total_out'] or 0
-    
-    costo_mes_ia = (
-        (tokens_in / 1_000_000) * COSTO_INPUT_1M +
-        (tokens_out / 1_000_000) * COSTO_OUTPUT_1M
-    )
-
-    # ---------------------------------------------------------
-    # 5. CONTEXTO DE OPERACIÓN
-    # ---------------------------------------------------------
     ultimos_casos = ActaInstitucional.objects.select_related('implicado__perfil').order_by('-fecha')[:8]
 
     context = {
         "kpis": {
-            "dinero": kpi_dinero,
-            "legal": kpi_legal,
-            "total_riesgo": count_riesgo_neto,
-            "riesgo_mitigado": len(total_riesgo_ids) - count_riesgo_neto,
-            "tasa_riesgo": tasa_riesgo,
-            "costo_ia_mes": round(costo_mes_ia, 4),
-            "tokens_totales": tokens_in + tokens_out
+            "dinero": snapshot.kpi_dinero,
+            "legal": snapshot.kpi_legal,
+            "total_riesgo": snapshot.total_riesgo,
+            "riesgo_mitigado": snapshot.riesgo_mitigado,
+            "tasa_riesgo": float(snapshot.tasa_riesgo),
+            "costo_ia_mes": float(snapshot.costo_ia_mes),
+            "tokens_totales": snapshot.tokens_entrada_mes + snapshot.tokens_salida_mes
         },
         "conteos": {
-            "academico": len(ids_academico),
-            "legal": len(ids_legal),
-            "ausentismo": len(ids_ausentismo)
+            "academico": snapshot.conteo_academico,
+            "legal": snapshot.conteo_legal,
+            "ausentismo": snapshot.conteo_ausentismo
         },
         "ultimos_casos": ultimos_casos,
         "config": {
             "pension": VALOR_PENSIÓN_MENSUAL, 
             "meses": MESES_PERDIDA_PROMEDIO
         },
-        "fecha_corte": timezone.now()
+        "fecha_corte": snapshot.fecha,
+        "snapshot": snapshot,
+        # Tendencia para gráficos (antiguo → reciente)
+        "tendencia": {
+            "labels": json.dumps([h['fecha'].strftime('%d/%m %H:%M') for h in historial]),
+            "riesgo": json.dumps([h['total_riesgo'] for h in historial]),
+            "mitigado": json.dumps([h['riesgo_mitigado'] for h in historial]),
+            "tasa": json.dumps([float(h['tasa_riesgo']) for h in historial]),
+        },
     }
-    return render(request, 'admin/shadow_dashboard.html', context)
+    return render(request, 'academics/shadow_dashboard.html', context)
+
+@login_required
+@user_passes_test(is_staff_or_superuser)
+@require_POST
+def shadow_refresh_snapshot(request):
+    """🔄 Genera un snapshot de riesgo en el momento ("Actualizar ahora")."""
+    snapshot = SnapshotRiesgoService.generar(usuario=request.user)
+    messages.success(request, f"✅ Snapshot actualizado: {snapshot.total_riesgo} estudiantes en riesgo neto.")
+    # 'shadow_tenant' también nombra al Shadow Monitor del proyecto: se resuelve por la vista
+    return redirect(shadow_tenant_dashboard)
 
 @login_required
 @user_passes_test(is_staff_or_superuser)